@@ -0,0 +1,94 @@
+"""Synthetic course material for benchmarks: lecture-note text, and the same text as PDF or DOCX.
+
+Deterministic for a given seed, so runs are comparable across commits.
+"""
+import io
+import random
+from datetime import date, timedelta
+
+TOPICS = [
+    "supply and demand", "elasticity", "consumer surplus", "market equilibrium", "price controls",
+    "opportunity cost", "comparative advantage", "monetary policy", "fiscal multipliers", "inflation",
+    "cell respiration", "photosynthesis", "mitosis", "gene expression", "natural selection",
+    "thermodynamics", "kinematics", "electric fields", "wave interference", "torque",
+]
+WORDS = (
+    "the model predicts that an increase in input costs shifts the curve while holding other factors "
+    "constant students should note how the assumption changes the result when measured over time and "
+    "compare the short run response with the long run outcome using the worked example from lecture"
+).split()
+
+
+def lecture_text(pages: int, seed: int = 7, lines_per_page: int = 48) -> list[str]:
+    """Lecture notes as a list of pages, each a heading plus `lines_per_page` lines of prose."""
+    rng = random.Random(seed)
+    out = []
+    for page in range(pages):
+        topic = rng.choice(TOPICS)
+        lines = [f"Lecture {page + 1}: {topic.title()}"]
+        for _ in range(lines_per_page):
+            lines.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 16))).capitalize() + ".")
+        out.append("\n".join(lines))
+    return out
+
+
+def syllabus_text(seed: int = 7, weeks: int = 15) -> list[str]:
+    """A one-page course syllabus (course header, policies, weekly schedule with due dates)."""
+    rng = random.Random(seed)
+    lines = ["ECON 202 - Principles of Macroeconomics", "Fall 2026, Mon/Wed 2:00-3:15 PM, Room 110",
+             "Instructor: Dr. Jane Smith, smithj@example.edu, office hours Tue 10-12",
+             "Grading: Exams 40%, Problem sets 30%, Quizzes 20%, Participation 10%",
+             "Late work loses 10% per day. Schedule:"]
+    for week in range(weeks):
+        monday = date(2026, 8, 31) + timedelta(weeks=week)
+        lines.append(f"Week {week + 1} ({monday:%b %d}): {rng.choice(TOPICS)}; "
+                     f"Problem set {week + 1} due {monday + timedelta(days=4):%b %d} 11:59 PM")
+    lines.append("Final exam: December 14, 2026, 8:00 AM")
+    return ["\n".join(lines)]
+
+
+def _pdf_escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: list[str]) -> bytes:
+    """A minimal text PDF (Helvetica, one text line per row), enough for pdfplumber."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "", "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in pages:
+        shown = " ".join(f"({_pdf_escape(line)}) '" for line in page.splitlines())
+        stream = f"BT /F1 10 Tf 13 TL 54 770 Td {shown} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R "
+                       "/Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def make_docx(pages: list[str]) -> bytes:
+    """The pages as a DOCX: a heading per page, its lines as paragraphs, and a small table."""
+    from docx import Document
+
+    doc = Document()
+    for page in pages:
+        heading, *lines = page.splitlines()
+        doc.add_heading(heading, level=2)
+        for line in lines:
+            doc.add_paragraph(line)
+        table = doc.add_table(rows=3, cols=2)
+        for row, (term, value) in zip(table.rows, [("Term", "Definition"), ("Key idea", lines[0][:60]),
+                                                   ("Example", lines[-1][:60])]):
+            row.cells[0].text, row.cells[1].text = term, value
+    buf = io.BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
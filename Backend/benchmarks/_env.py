@@ -0,0 +1,15 @@
+"""Shared setup for benchmark scripts: make main.py importable against a throwaway SQLite DB.
+
+Import this module before ``import main``. Set BENCH_DATABASE_URL to benchmark
+against a real database (e.g. Postgres) instead.
+"""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp(prefix='classmate-bench-')}/bench.db"
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
@@ -0,0 +1,31 @@
+"""The pre-index LMS course matcher, shared by test_course_matching (as the semantic
+reference CourseMatcher must agree with) and bench_course_matching (as the baseline).
+"""
+from classmate.lms import _extract_course_codes, _normalize
+
+
+def reference_match(lms_text, lms_code, user_courses):
+    """The original per-item loop, kept verbatim: re-normalizes every course for every item."""
+    norm_text = _normalize(lms_text)
+    norm_code = _normalize(lms_code)
+    lms_codes = set(_extract_course_codes(lms_text)) | set(_extract_course_codes(lms_code))
+    best_match, best_score = None, 0
+    for uc in user_courses:
+        uc_name = _normalize(uc.name or "")
+        uc_code = _normalize(uc.code or "")
+        uc_extracted = set(_extract_course_codes(uc.code or "")) | set(_extract_course_codes(uc.name or ""))
+        if uc_code and norm_code and uc_code == norm_code:
+            return uc.id
+        if lms_codes and uc_extracted and lms_codes & uc_extracted:
+            return uc.id
+        if uc_code and len(uc_code) > 2:
+            if uc_code in norm_text or uc_code in norm_code:
+                return uc.id
+            if norm_code and norm_code in uc_code:
+                return uc.id
+        if uc_name and len(uc_name) > 3:
+            if uc_name in norm_text or norm_text in uc_name:
+                match_len = min(len(uc_name), len(norm_text))
+                if match_len > best_score:
+                    best_score, best_match = match_len, uc.id
+    return best_match
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark persisting generated quiz questions: per-row ORM db.add() (the previous
+generation code) vs the core bulk insert helper.
+
+Each simulated request creates a Quiz and its 30 questions and commits, the way
+/generate-quiz does. REQUESTS requests run on WORKERS threads with their own sessions.
+"persist" times building and flushing the rows (where the ORM overhead lives);
+commit time is reported separately since on SQLite it is dominated by fsync and the
+single-writer lock. SQLite runs in WAL mode with a long busy timeout so writers queue
+instead of failing; set BENCH_DATABASE_URL=postgresql://... for real write concurrency.
+Run: python benchmarks/bench_bulk_insert.py
+"""
+import json
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import _env  # noqa: F401
+from sqlalchemy import event
+
+from main import Course, Quiz, QuizQuestion, SessionLocal, _safe_db_url, engine, insert_quiz_questions
+
+REQUESTS = 1000
+QUESTIONS = 30
+WORKERS = 8
+
+QUESTION_ITEMS = [
+    {"question": f"Which statement about concept {i} is correct?",
+     "options": ["A) First", "B) Second", "C) Third", "D) Fourth"],
+     "correct_answer": "B", "explanation": f"Concept {i} is defined that way in the lecture."}
+    for i in range(QUESTIONS)
+]
+
+statements = 0
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_concurrency(dbapi_conn, record):
+        dbapi_conn.execute("PRAGMA journal_mode=WAL")
+        dbapi_conn.execute("PRAGMA busy_timeout=60000")
+
+    engine.dispose()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def orm_rows(db, user_id, quiz_id):
+    for i, q in enumerate(QUESTION_ITEMS):
+        db.add(QuizQuestion(user_id=user_id, quiz_id=quiz_id, question=q["question"], options=json.dumps(q["options"]),
+                            correct_answer=q["correct_answer"], explanation=q["explanation"], order_num=str(i)))
+
+
+def bulk_rows(db, user_id, quiz_id):
+    insert_quiz_questions(db, user_id, quiz_id, QUESTION_ITEMS)
+
+
+def one_request(persist, course_id, user_id):
+    db = SessionLocal()
+    try:
+        quiz = Quiz(user_id=user_id, course_id=course_id, name="Lecture quiz")
+        db.add(quiz)
+        db.flush()
+        started = time.perf_counter()
+        persist(db, user_id, quiz.id)
+        db.flush()
+        persisted = time.perf_counter()
+        db.commit()
+        return (persisted - started) * 1000, (time.perf_counter() - persisted) * 1000
+    finally:
+        db.close()
+
+
+def run(label, persist, course_id, user_id):
+    global statements
+    statements = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        timings = list(pool.map(lambda _: one_request(persist, course_id, user_id), range(REQUESTS)))
+    wall = time.perf_counter() - started
+    persist_ms = sorted(t[0] for t in timings)
+    commit_ms = [t[1] for t in timings]
+    print(f"{label:<12} {REQUESTS / wall:6.0f} req/s  {REQUESTS * QUESTIONS / wall:7.0f} rows/s  "
+          f"persist p50 {statistics.median(persist_ms):5.2f}ms p95 {persist_ms[int(len(persist_ms) * 0.95) - 1]:5.2f}ms  "
+          f"commit p50 {statistics.median(commit_ms):5.2f}ms  statements/request {statements / REQUESTS:4.1f}")
+
+
+def main():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    course = Course(user_id=user_id, name="Biology", code="BIO 101")
+    db.add(course)
+    db.commit()
+    course_id = course.id
+    db.close()
+
+    print(f"{_safe_db_url(str(engine.url))}: {REQUESTS} requests x {QUESTIONS} questions on {WORKERS} threads")
+    run("orm db.add", orm_rows, course_id, user_id)
+    run("bulk insert", bulk_rows, course_id, user_id)
+
+
+if __name__ == "__main__":
+    main()
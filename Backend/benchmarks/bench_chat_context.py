@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark per-message chat context cost: full _build_chat_context vs the snapshot.
+
+Seeds one user with a large library (12 courses with syllabi, 600 deadlines, 120
+summaries, 150 flashcard sets x 40 cards, 60 quizzes x 15 questions) and times
+each path over repeated "messages".
+Run: python benchmarks/bench_chat_context.py
+"""
+import json
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+
+import _env  # noqa: F401
+from classmate.chat_context import _build_chat_context, get_chat_context
+from main import Course, Deadline, Flashcard, FlashcardSet, Quiz, QuizQuestion, SessionLocal, Summary
+
+NUM_COURSES = 12
+NUM_DEADLINES = 600
+NUM_SUMMARIES = 120
+NUM_SETS = 150
+CARDS_PER_SET = 40
+NUM_QUIZZES = 60
+QUESTIONS_PER_QUIZ = 15
+MESSAGES = 50
+
+
+def seed(db, user_id):
+    courses = [
+        Course(
+            user_id=user_id, name=f"Course {i}", code=f"DEPT {100 + i}", semester="Fall 2026",
+            course_info={"instructor": f"Prof {i}", "grading": "Exams 60%, homework 40%" * 5},
+            syllabus_text="Policy paragraph. " * 400,
+        )
+        for i in range(NUM_COURSES)
+    ]
+    db.add_all(courses)
+    db.flush()
+    today = date.today()
+    for i in range(NUM_DEADLINES):
+        db.add(Deadline(
+            user_id=user_id, course_id=courses[i % NUM_COURSES].id,
+            date=(today + timedelta(days=i % 200 - 30)).isoformat(), title=f"Assignment {i}", type="assignment",
+        ))
+    for i in range(NUM_SUMMARIES):
+        db.add(Summary(user_id=user_id, course_id=courses[i % NUM_COURSES].id, title=f"Lecture {i}", content="Key idea. " * 600))
+    for i in range(NUM_SETS):
+        fs = FlashcardSet(user_id=user_id, course_id=courses[i % NUM_COURSES].id, name=f"Set {i}")
+        db.add(fs)
+        db.flush()
+        db.add_all(Flashcard(user_id=user_id, flashcard_set_id=fs.id, front=f"Q{j}", back=f"A{j}") for j in range(CARDS_PER_SET))
+    options = json.dumps(["A", "B", "C", "D"])
+    for i in range(NUM_QUIZZES):
+        q = Quiz(user_id=user_id, course_id=courses[i % NUM_COURSES].id, name=f"Quiz {i}")
+        db.add(q)
+        db.flush()
+        db.add_all(
+            QuizQuestion(user_id=user_id, quiz_id=q.id, question=f"Q{j}", options=options, correct_answer="A", order_num=str(j))
+            for j in range(QUESTIONS_PER_QUIZ)
+        )
+    db.commit()
+
+
+def timed(fn, db, user_id):
+    samples = []
+    for _ in range(MESSAGES):
+        started = time.perf_counter()
+        fn(db, user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(label, samples):
+    ordered = sorted(samples)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{label:<24} mean {statistics.mean(samples):7.2f}ms  p50 {statistics.median(samples):7.2f}ms  p95 {p95:7.2f}ms")
+
+
+def main():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        seed(db, user_id)
+        print(f"Library: {NUM_COURSES} courses, {NUM_DEADLINES} deadlines, {NUM_SUMMARIES} summaries, "
+              f"{NUM_SETS * CARDS_PER_SET} cards, {NUM_QUIZZES * QUESTIONS_PER_QUIZ} questions")
+        full = timed(_build_chat_context, db, user_id)
+        get_chat_context(db, user_id)  # warm the snapshot
+        cached = timed(get_chat_context, db, user_id)
+        report("full rebuild", full)
+        report("snapshot hit", cached)
+        print(f"Per-message saving: {statistics.mean(full) - statistics.mean(cached):.2f}ms "
+              f"({statistics.mean(full) / statistics.mean(cached):.1f}x)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
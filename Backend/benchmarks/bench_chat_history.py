@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark history tokens per chat turn: legacy last-20-verbatim vs budgeted history
+with a rolling summary.
+
+Simulates a 40-turn conversation where the student pastes a 20k-char file on turn 3.
+Legacy embeds the file in the message and re-sends it until it leaves the 20-message
+window; the budgeted path sends it once (later turns get relevant excerpts, modelled
+here as 3 passages) and folds overflow into a ~250-token summary.
+Run: python benchmarks/bench_chat_history.py
+"""
+import statistics
+
+import _env  # noqa: F401
+from classmate.chat_context import (
+    ATTACHMENT_EXCERPT_TOP_K, CHAT_HISTORY_MAX_MESSAGES, CHAT_HISTORY_TOKEN_BUDGET, CHAT_RETRIEVAL_CHUNK_SIZE,
+    _estimate_tokens, _split_history,
+)
+from main import MAX_FILE_CONTEXT_LENGTH
+
+TURNS = 40
+FILE_TURN = 3
+USER_CHARS = 240
+ASSISTANT_CHARS = 1400
+SUMMARY_TOKENS = 250
+
+
+def main():
+    file_tokens = _estimate_tokens("x" * MAX_FILE_CONTEXT_LENGTH)
+    excerpt_tokens = _estimate_tokens("x" * CHAT_RETRIEVAL_CHUNK_SIZE * ATTACHMENT_EXCERPT_TOP_K)
+    user_tokens = _estimate_tokens("x" * USER_CHARS)
+    assistant_tokens = _estimate_tokens("x" * ASSISTANT_CHARS)
+
+    legacy_log: list[int] = []  # per-message tokens as stored by the legacy path
+    pending: list[tuple[int, bool]] = []  # (tokens on later turns, is_file) not yet folded
+    has_summary = False
+    legacy_turns, budgeted_turns = [], []
+    summary_calls = 0
+
+    for turn in range(1, TURNS + 1):
+        has_file = turn == FILE_TURN
+        legacy_log.append(user_tokens + (file_tokens if has_file else 0))
+        legacy_turns.append(sum(legacy_log[-CHAT_HISTORY_MAX_MESSAGES:]))
+
+        # Current turn carries the full file; earlier file turns carry excerpts
+        counts = [t + (excerpt_tokens if is_file else 0) for t, is_file in pending]
+        counts.append(user_tokens + (file_tokens if has_file else 0))
+        fold = _split_history(counts)
+        if fold:
+            summary_calls += 1
+            has_summary = True
+            pending = pending[fold:]
+            counts = counts[fold:]
+        budgeted_turns.append(sum(counts) + (SUMMARY_TOKENS if has_summary else 0))
+        pending.append((user_tokens, has_file))
+
+        legacy_log.append(assistant_tokens)
+        pending.append((assistant_tokens, False))
+
+    print(f"History budget: {CHAT_HISTORY_TOKEN_BUDGET} tokens, {TURNS} turns, {file_tokens}-token file on turn {FILE_TURN}")
+    print(f"legacy    mean {statistics.mean(legacy_turns):7.0f}  max {max(legacy_turns):6d}  total {sum(legacy_turns):7d}")
+    print(f"budgeted  mean {statistics.mean(budgeted_turns):7.0f}  max {max(budgeted_turns):6d}  total {sum(budgeted_turns):7d}")
+    print(f"History tokens saved: {(1 - sum(budgeted_turns) / sum(legacy_turns)) * 100:.0f}% "
+          f"with {summary_calls} summarization calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark retrieval-based chat context: prompt size and retrieval latency.
+
+Compares the legacy system prompt (summary excerpts up to MAX_FILE_CONTEXT_LENGTH plus
+syllabus prefixes up to 8,000 chars, on every message) with the snapshot + top-k
+retrieved passages. Facts are planted past the legacy truncation points to measure
+how often each approach can actually see the answer.
+Run: python benchmarks/bench_chat_retrieval.py
+"""
+import json
+import random
+import statistics
+import time
+import uuid
+
+import _env  # noqa: F401
+from classmate.chat_context import ChunkIndex, _collect_chat_chunks, get_chat_context, retrieve_chat_context
+from main import (
+    CHAT_SYSTEM_PROMPT, MAX_FILE_CONTEXT_LENGTH, Course, Flashcard, FlashcardSet, Quiz, QuizQuestion,
+    SessionLocal, Summary,
+)
+
+NUM_COURSES = 6
+SUMMARIES_PER_COURSE = 10
+SETS_PER_COURSE = 5
+CARDS_PER_SET = 30
+QUESTIONS = 20
+LEGACY_SYLLABUS_TOTAL = 8000
+QUERIES = 200
+
+VOCAB = (
+    "analysis theory model equation market cell protein energy history policy culture language "
+    "network variable function system process structure evidence method experiment population "
+    "distribution reaction pressure velocity contract liability inflation revolution empire"
+).split()
+
+
+def prose(rng, words):
+    return " ".join(rng.choice(VOCAB) for _ in range(words)) + "."
+
+
+def seed(db, user_id, rng):
+    facts = []
+    courses = []
+    for i in range(NUM_COURSES):
+        fact = f"The capstone rubric code for course {i} is zephyr{i} weighting."
+        syllabus = "\n\n".join(prose(rng, 60) for _ in range(60)) + "\n\n" + fact
+        c = Course(user_id=user_id, name=f"Course {i}", code=f"DEPT {300 + i}", syllabus_text=syllabus)
+        db.add(c)
+        courses.append(c)
+        facts.append((f"What is the capstone rubric code for course {i}?", f"zephyr{i}"))
+    db.flush()
+    for c_idx, c in enumerate(courses):
+        for j in range(SUMMARIES_PER_COURSE):
+            fact = f"Lecture {j} of course {c_idx} defines the quorvex{c_idx}x{j} constant."
+            body = "\n\n".join(prose(rng, 80) for _ in range(12)) + "\n\n" + fact
+            db.add(Summary(user_id=user_id, course_id=c.id, title=f"Lecture {j}", content=body))
+            facts.append((f"Which constant does lecture {j} of course {c_idx} define?", f"quorvex{c_idx}x{j}"))
+        for j in range(SETS_PER_COURSE):
+            fs = FlashcardSet(user_id=user_id, course_id=c.id, name=f"Set {j}")
+            db.add(fs)
+            db.flush()
+            db.add_all(
+                Flashcard(user_id=user_id, flashcard_set_id=fs.id, front=prose(rng, 8), back=prose(rng, 20))
+                for _ in range(CARDS_PER_SET)
+            )
+        q = Quiz(user_id=user_id, course_id=c.id, name="Midterm review")
+        db.add(q)
+        db.flush()
+        db.add_all(
+            QuizQuestion(user_id=user_id, quiz_id=q.id, question=prose(rng, 12), options=json.dumps([prose(rng, 3)] * 4),
+                         correct_answer="A", explanation=prose(rng, 15), order_num=str(k))
+            for k in range(QUESTIONS)
+        )
+    db.commit()
+    return facts
+
+
+def legacy_material(db, user_id):
+    """The removed summary + syllabus sections, rebuilt with the old truncation rules."""
+    parts = []
+    courses = db.query(Course).filter(Course.user_id == user_id).all()
+    names = {c.id: c.name for c in courses}
+    summaries = db.query(Summary).filter(Summary.user_id == user_id).order_by(Summary.created_at.desc()).limit(8).all()
+    remaining = MAX_FILE_CONTEXT_LENGTH
+    for s in summaries:
+        excerpt = s.content[:min(4000, remaining)]
+        parts.append(f"[Source: {s.title} | Course: {names.get(s.course_id, 'Unknown')}]\n{excerpt}")
+        remaining -= len(excerpt)
+        if remaining <= 0:
+            break
+    budget = LEGACY_SYLLABUS_TOTAL
+    for c in courses:
+        if budget <= 0 or not c.syllabus_text:
+            continue
+        excerpt = c.syllabus_text[:budget]
+        parts.append(f"\n### {c.code} Syllabus\n{excerpt}")
+        budget -= len(excerpt)
+    return "\n".join(parts)
+
+
+def pct(samples, p):
+    ordered = sorted(samples)
+    return ordered[max(0, int(len(ordered) * p) - 1)]
+
+
+def main():
+    rng = random.Random(7)
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        facts = seed(db, user_id, rng)
+        snapshot = get_chat_context(db, user_id)
+        legacy_prompt = CHAT_SYSTEM_PROMPT.format(context=snapshot + "\n" + legacy_material(db, user_id))
+
+        started = time.perf_counter()
+        index = ChunkIndex(_collect_chat_chunks(db, user_id))
+        build_ms = (time.perf_counter() - started) * 1000
+
+        retrieve_ms, new_sizes = [], []
+        legacy_hits = new_hits = 0
+        for i in range(QUERIES):
+            question, answer = facts[i % len(facts)]
+            started = time.perf_counter()
+            section = retrieve_chat_context(db, user_id, question)
+            retrieve_ms.append((time.perf_counter() - started) * 1000)
+            new_sizes.append(len(CHAT_SYSTEM_PROMPT.format(context=snapshot + "\n\n" + section)))
+            legacy_hits += answer in legacy_prompt
+            new_hits += answer in section
+
+        print(f"Index: {len(index)} passages, built in {build_ms:.1f}ms")
+        print(f"System prompt chars  legacy {len(legacy_prompt):>7}  (~{len(legacy_prompt) // 4} tokens)")
+        print(f"System prompt chars  top-k  {statistics.mean(new_sizes):>7.0f}  (~{int(statistics.mean(new_sizes)) // 4} tokens)")
+        print(f"Reduction: {(1 - statistics.mean(new_sizes) / len(legacy_prompt)) * 100:.0f}%")
+        print(f"Retrieval latency    p50 {statistics.median(retrieve_ms):.2f}ms  p95 {pct(retrieve_ms, 0.95):.2f}ms  "
+              f"p99 {pct(retrieve_ms, 0.99):.2f}ms")
+        print(f"Planted fact visible legacy {legacy_hits}/{QUERIES}  top-k {new_hits}/{QUERIES}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Load-test chat streaming: CHATS concurrent SSE conversations against a stub model.
+
+The app runs under uvicorn in a child process, as in production, so the numbers include
+the socket and SSE framing. The model is fake_openai.py in another child process. Each
+chat is its own Pro user with a native JWT and one course, and sends MESSAGES turns one
+after another. Turns are measured from the client side:
+- ttfb: until the first SSE line (the echoed user message)
+- ttft: until the first content chunk
+- total: until the done event
+Then the app's /metrics is scraped, and the chat_stage_ms histograms show where each turn
+spent its time on the server (context_build, history_load, first_chunk, tool_execution,
+second_stream, persist ...).
+
+Model behaviour comes from FAKE_OPENAI_* (see fake_openai.py). By default it streams at
+2ms/token and answers TOOL_RATE of the turns with a create_deadline call, so the tool
+round trip and the second stream show up. MESSAGES stays under the 10/minute chat limit.
+  FAKE_OPENAI_LATENCY_MS=600 FAKE_OPENAI_TOOL_RATE=0.5 python benchmarks/bench_chat_sse.py
+Run: python benchmarks/bench_chat_sse.py
+"""
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from urllib.request import urlopen
+
+import _env
+import fake_openai
+import httpx
+
+CHATS = 20
+MESSAGES = 3
+TOOL_RATE = 0.2
+MS_PER_TOKEN = 2
+QUESTIONS = [
+    "Can you explain price elasticity with an example from lecture?",
+    "What's due this week and what should I start first?",
+    "I have a problem set due next Friday, add it to my calendar",
+]
+
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+os.environ.setdefault("METRICS_TOKEN", "bench-metrics")
+os.environ.setdefault("FAKE_OPENAI_TOOL_RATE", str(TOOL_RATE))
+os.environ.setdefault("FAKE_OPENAI_MS_PER_TOKEN", str(MS_PER_TOKEN))
+
+from classmate.auth import _issue_tokens  # noqa: E402
+from classmate.db import ChatConversation, Course, SessionLocal, User, UserProfile, _safe_db_url, engine  # noqa: E402
+
+
+def start_app(openai_base_url: str) -> tuple[subprocess.Popen, str]:
+    """uvicorn main:app on a free port, once /health answers."""
+    port = fake_openai.free_port()
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=_env.BACKEND_DIR, env=dict(os.environ, OPENAI_BASE_URL=openai_base_url),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urlopen(f"http://127.0.0.1:{port}/health", timeout=1).close()
+            return app, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    app.kill()
+    raise RuntimeError("the app did not come up")
+
+
+def seed_chats() -> list[tuple[str, str]]:
+    """(access token, conversation id) for CHATS fresh Pro users."""
+    db = SessionLocal()
+    try:
+        chats = []
+        for _ in range(CHATS):
+            user_id = str(uuid.uuid4())
+            email = f"{user_id}@example.edu"
+            conv = ChatConversation(user_id=user_id)
+            db.add_all([
+                User(id=user_id, email=email),
+                UserProfile(user_id=user_id, email=email, subscription_tier="pro"),
+                Course(user_id=user_id, name="Principles of Macroeconomics", code="ECON 202"),
+                conv,
+            ])
+            db.flush()
+            chats.append((_issue_tokens(user_id, email)["access_token"], conv.id))
+        db.commit()
+        return chats
+    finally:
+        db.close()
+
+
+async def chat(client, token, conversation_id, turns):
+    headers = {"Authorization": f"Bearer {token}"}
+    for question in QUESTIONS[:MESSAGES]:
+        turn = {"ok": False}
+        started = time.perf_counter()
+        async with client.stream("POST", f"/chat/conversations/{conversation_id}/messages",
+                                 data={"content": question}, headers=headers) as resp:
+            async for line in resp.aiter_lines():
+                elapsed = (time.perf_counter() - started) * 1000
+                turn.setdefault("ttfb", elapsed)
+                if line.startswith('data: {"type": "chunk"'):
+                    turn.setdefault("ttft", elapsed)
+                elif line.startswith('data: {"type": "done"'):
+                    turn["total"], turn["ok"] = elapsed, resp.status_code == 200
+        turns.append(turn)
+
+
+def server_stages(base_url: str) -> dict[str, dict]:
+    """chat_stage_ms from /metrics: stage -> {count, sum, buckets: [(le, cumulative)]}."""
+    resp = httpx.get(f"{base_url}/metrics", headers={"Authorization": f"Bearer {os.environ['METRICS_TOKEN']}"})
+    resp.raise_for_status()
+    stages: dict[str, dict] = {}
+    for name, stage, le, value in re.findall(r'^chat_stage_ms_(\w+)\{stage="(\w+)"(?:,le="([^"]+)")?\} (\S+)$',
+                                             resp.text, re.M):
+        hist = stages.setdefault(stage, {"buckets": []})
+        if name == "bucket":
+            hist["buckets"].append((le, float(value)))
+        else:
+            hist[name] = float(value)
+    return stages
+
+
+def bucket_quantile(hist: dict, q: float) -> str:
+    """Upper bound of the bucket holding the q-quantile, the resolution a histogram gives."""
+    for le, cumulative in hist["buckets"]:
+        if cumulative >= q * hist["count"]:
+            return f"<={le}ms"
+    return "-"
+
+
+def report(label, values):
+    if len(values) < 2:
+        print(f"{label:<6} n={len(values)}")
+        return
+    cuts = statistics.quantiles(values, n=100)
+    print(f"{label:<6} p50 {cuts[49]:6.0f}ms  p95 {cuts[94]:6.0f}ms  p99 {cuts[98]:6.0f}ms  max {max(values):6.0f}ms")
+
+
+async def drive(base_url: str):
+    chats = seed_chats()
+    turns: list[dict] = []
+    started = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=300,
+                                 limits=httpx.Limits(max_connections=CHATS)) as client:
+        await asyncio.gather(*(chat(client, token, conversation_id, turns) for token, conversation_id in chats))
+    wall = time.perf_counter() - started
+    ok = sum(turn["ok"] for turn in turns)
+    print(f"{len(turns)} turns in {wall:.1f}s ({len(turns) / wall:.2f} turns/s), ok {ok}/{len(turns)}")
+    for metric in ("ttfb", "ttft", "total"):
+        report(metric, [turn[metric] for turn in turns if metric in turn])
+
+    print("server stages (chat_stage_ms):")
+    for stage, hist in sorted(server_stages(base_url).items(), key=lambda item: item[1]["sum"] / item[1]["count"]):
+        print(f"  {stage:<15} n {hist['count']:4.0f}  mean {hist['sum'] / hist['count']:7.1f}ms  "
+              f"p95 {bucket_quantile(hist, 0.95)}")
+
+
+def main():
+    fake, openai_base_url = fake_openai.spawn()
+    try:
+        app, base_url = start_app(openai_base_url)
+        try:
+            print(f"{_safe_db_url(str(engine.url))}: {CHATS} concurrent chats x {MESSAGES} turns; "
+                  f"model {fake_openai.config_from_env()}")
+            asyncio.run(drive(base_url))
+        finally:
+            app.terminate()
+    finally:
+        fake.terminate()
+
+
+if __name__ == "__main__":
+    main()
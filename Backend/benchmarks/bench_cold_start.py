@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark worker cold start against an already-migrated database.
+
+"legacy" replays what every boot used to run: create_all, the nine ensure_* column helpers
+(each re-issuing its ALTERs and backfill UPDATEs), create_all again and the index list.
+"runner" is run_migrations() on a current schema. Both report wall time and statements.
+"import main" times the whole module import in fresh interpreters (BOOTS of them) against
+the same database, i.e. what a worker pays before serving its first request.
+Run: python benchmarks/bench_cold_start.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import _env
+from sqlalchemy import event
+
+from main import (
+    Base, _safe_db_url, engine, ensure_chat_columns, ensure_course_syllabus_column, ensure_deadline_columns,
+    ensure_flashcard_grade_column, ensure_flashcard_schedule_columns, ensure_indexes, ensure_quiz_columns,
+    ensure_referral_columns, ensure_study_indexes, ensure_subscription_columns, ensure_unique_user_email_index,
+    ensure_user_auth_columns, ensure_user_columns, run_migrations,
+)
+
+REPEATS = 20
+BOOTS = 5
+
+statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def legacy_boot():
+    Base.metadata.create_all(bind=engine)
+    ensure_user_columns()
+    ensure_deadline_columns()
+    ensure_referral_columns()
+    ensure_subscription_columns()
+    ensure_chat_columns()
+    ensure_course_syllabus_column()
+    ensure_flashcard_grade_column()
+    ensure_flashcard_schedule_columns()
+    ensure_quiz_columns()
+    Base.metadata.create_all(bind=engine)
+    ensure_indexes()
+    ensure_study_indexes()
+    ensure_unique_user_email_index()
+    ensure_user_auth_columns()  # ran from the startup hook
+
+
+def run(label, boot):
+    global statements
+    timings = []
+    statements = 0
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        boot()
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<12} p50 {statistics.median(timings):7.2f}ms  statements/boot {statements / REPEATS:5.1f}")
+
+
+def import_main():
+    timings = []
+    for _ in range(BOOTS):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=_env.BACKEND_DIR, env=os.environ,
+                       check=True, capture_output=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{'import main':<12} p50 {statistics.median(timings):7.2f}ms  over {BOOTS} fresh interpreters")
+
+
+def main():
+    print(f"{_safe_db_url(str(engine.url))}: migrated schema, {REPEATS} boots each")
+    run("legacy", legacy_boot)
+    run("runner", run_migrations)
+    import_main()
+
+
+if __name__ == "__main__":
+    main()
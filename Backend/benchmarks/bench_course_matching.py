@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark LMS course matching: per-item _match_course loop vs a per-sync CourseMatcher.
+
+Simulates an iCal sync of 5,000 events against a user with 30 courses.
+Run: python benchmarks/bench_course_matching.py
+"""
+import random
+import time
+from types import SimpleNamespace
+
+import _env  # noqa: F401
+from classmate.lms import CourseMatcher
+from _legacy_course_matching import reference_match as legacy_match_course
+
+NUM_EVENTS = 5000
+NUM_COURSES = 30
+
+
+def build_fixture():
+    rng = random.Random(42)
+    depts = ["FINC", "BIO", "PSYC", "HIST", "MATH", "CHEM", "ECON", "ENGL", "PHYS", "CSCI"]
+    topics = ["Corporate Finance", "Cell Biology", "Cognitive Psychology", "Modern History",
+              "Linear Algebra", "Organic Chemistry", "Macroeconomics", "British Literature",
+              "Quantum Mechanics", "Data Structures"]
+    courses = [
+        SimpleNamespace(id=f"course-{i}", name=f"{topics[i % 10]} {i // 10 + 1}", code=f"{depts[i % 10]} {200 + i}")
+        for i in range(NUM_COURSES)
+    ]
+    events = []
+    for i in range(NUM_EVENTS):
+        c = rng.choice(courses)
+        kind = rng.random()
+        if kind < 0.4:
+            summary = f"Homework {i} [{c.code.replace(' ', '-')}-001-2026SP]"
+        elif kind < 0.7:
+            summary = f"{c.name} reading quiz {i}"
+        else:
+            summary = f"Campus event {i}: club fair"  # no course
+        description = "Submit via the course portal. " * rng.randint(1, 8)
+        events.append(f"{summary} {description} Room 101  event-{i}@lms.example.edu")
+    return courses, events
+
+
+def main():
+    courses, events = build_fixture()
+
+    start = time.perf_counter()
+    legacy = [legacy_match_course(text, "", courses) for text in events]
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matcher = CourseMatcher(courses)
+    indexed = [matcher.match(text, "") for text in events]
+    indexed_s = time.perf_counter() - start
+
+    assert legacy == indexed, "CourseMatcher diverged from legacy semantics"
+    matched = sum(1 for m in indexed if m)
+
+    print("=" * 60)
+    print(f"Course matching: {NUM_EVENTS} events x {NUM_COURSES} courses ({matched} matched)")
+    print("=" * 60)
+    print(f"  legacy per-item loop : {legacy_s * 1000:8.1f} ms  ({legacy_s / NUM_EVENTS * 1e6:6.1f} us/event)")
+    print(f"  CourseMatcher        : {indexed_s * 1000:8.1f} ms  ({indexed_s / NUM_EVENTS * 1e6:6.1f} us/event)")
+    print(f"  speedup              : {legacy_s / indexed_s:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark the leased nudge job with several workers polling at once, at 50k users.
+
+"unleased" is the previous deployment shape: every worker runs the full check at startup
+(here compute_nudge_flags, so only the duplication is measured, not the old per-user
+loop). "leased" has the same workers call run_nudge_job concurrently; one wins the lease
+and the rest return immediately. Then a run is killed after a few batches and resumed by
+another worker from its checkpoint. Reports duplicate flags, wall time and per-batch
+duration from job_run_batches. SQLite runs in WAL mode with a busy timeout so the
+concurrent writers queue instead of failing.
+Run: python benchmarks/bench_nudge_job.py
+"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import _env  # noqa: F401
+from sqlalchemy import event, func
+
+import main
+from bench_nudges import USERS, seed
+from main import JobRun, JobRunBatch, NudgeFlag, SessionLocal, _safe_db_url, compute_nudge_flags, engine, run_nudge_job
+
+WORKERS = 4
+BATCH_SIZE = 1000
+KILL_AFTER = 3
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_concurrency(dbapi_conn, record):
+        dbapi_conn.execute("PRAGMA journal_mode=WAL")
+        dbapi_conn.execute("PRAGMA busy_timeout=60000")
+
+    engine.dispose()
+
+
+def flag_stats():
+    db = SessionLocal()
+    try:
+        total = db.query(NudgeFlag).count()
+        distinct = db.query(NudgeFlag.user_id, NudgeFlag.reason, NudgeFlag.course_id, NudgeFlag.deadline_id).distinct().count()
+        db.query(NudgeFlag).delete()
+        db.commit()
+        return total, total - distinct
+    finally:
+        db.close()
+
+
+def unleased_worker(_):
+    db = SessionLocal()
+    try:
+        return compute_nudge_flags(db)
+    finally:
+        db.close()
+
+
+def batch_report(run_id):
+    db = SessionLocal()
+    try:
+        durations = sorted(b.duration_ms for b in db.query(JobRunBatch).filter(JobRunBatch.run_id == run_id))
+        holders = db.query(JobRunBatch.holder, func.count()).filter(JobRunBatch.run_id == run_id).group_by(JobRunBatch.holder).all()
+        return (f"{len(durations)} batches, batch p50 {statistics.median(durations)}ms "
+                f"p95 {durations[max(0, int(len(durations) * 0.95) - 1)]}ms, by holder {dict(holders)}")
+    finally:
+        db.close()
+
+
+def main_():
+    seed()
+    print(f"{_safe_db_url(str(engine.url))}: {USERS} users, {WORKERS} workers, batches of {BATCH_SIZE}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(WORKERS) as pool:
+        list(pool.map(unleased_worker, range(WORKERS)))
+    wall = time.perf_counter() - started
+    total, duplicates = flag_stats()
+    print(f"unleased  {wall:6.2f}s  flags {total:6d}  duplicates {duplicates:6d}")
+
+    today = date.today()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(WORKERS) as pool:
+        results = list(pool.map(lambda i: run_nudge_job(f"worker-{i}", today, BATCH_SIZE), range(WORKERS)))
+    wall = time.perf_counter() - started
+    run_id = next(r for r in results if r)
+    total, duplicates = flag_stats()
+    print(f"leased    {wall:6.2f}s  flags {total:6d}  duplicates {duplicates:6d}  runners {sum(map(bool, results))}")
+    print(f"          {batch_report(run_id)}")
+
+    # Kill a run mid-way, then let another worker pick it up from the checkpoint
+    tomorrow = today + timedelta(days=1)
+    real_queue, batches = main._queue_nudge_flags, []
+
+    def dies_mid_run(db, day, user_ids):
+        batches.append(1)
+        if len(batches) > KILL_AFTER:
+            raise RuntimeError("worker killed")
+        return real_queue(db, day, user_ids)
+
+    main._queue_nudge_flags = dies_mid_run
+    try:
+        run_nudge_job("worker-0", tomorrow, BATCH_SIZE)
+    except RuntimeError:
+        pass
+    main._queue_nudge_flags = real_queue
+    started = time.perf_counter()
+    run_id = run_nudge_job("worker-1", tomorrow, BATCH_SIZE)
+    wall = time.perf_counter() - started
+    db = SessionLocal()
+    run = db.query(JobRun).filter(JobRun.id == run_id).one()
+    print(f"resumed   {wall:6.2f}s  status {run.status}  users {run.items_processed}  flags {run.rows_written}")
+    db.close()
+    total, duplicates = flag_stats()
+    print(f"          {batch_report(run_id)}  duplicates {duplicates}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark the daily nudge check at 50k users.
+
+"legacy" replays the previous _run_nudge_check body: load every User, one profile query
+per user, one deadline query per pro user, then up to three material queries and a flag
+query per deadline, all on the event loop. "set-based" is the current _run_nudge_check
+(compute_nudge_flags on a worker thread). Reports wall time, SQL statements and the worst
+event-loop stall seen by a 10ms ticker running alongside. Flags are cleared between runs.
+Run: python benchmarks/bench_nudges.py
+"""
+import asyncio
+import random
+import time
+import uuid
+from datetime import date, timedelta
+
+import _env  # noqa: F401
+from sqlalchemy import event
+
+from main import (
+    Course, Deadline, FlashcardSet, NudgeFlag, Quiz, SessionLocal, Summary, User, UserProfile, _bulk_insert,
+    _effective_tier, _run_nudge_check, _safe_db_url, engine,
+)
+
+USERS = 50_000
+PRO_SHARE = 0.2
+COURSES_PER_USER = 2
+DEADLINES_PER_COURSE = 3
+
+statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def seed():
+    rng = random.Random(7)
+    today = date.today()
+    users, profiles, courses, deadlines, sets = [], [], [], [], []
+    for i in range(USERS):
+        user_id = str(uuid.uuid4())
+        email = f"student{i}@example.edu"
+        users.append({"id": user_id, "email": email})
+        profiles.append({"user_id": user_id, "email": email, "referral_code": uuid.uuid4().hex[:10],
+                         "subscription_tier": "pro" if rng.random() < PRO_SHARE else "free",
+                         "founding_member": False, "ai_generations_used": 0, "has_completed_onboarding": True,
+                         "chat_messages_used": 0})
+        for c in range(COURSES_PER_USER):
+            course_id = str(uuid.uuid4())
+            courses.append({"id": course_id, "user_id": user_id, "name": f"Course {c}", "code": f"C{c}"})
+            if rng.random() < 0.5:
+                sets.append({"user_id": user_id, "course_id": course_id, "name": "Notes"})
+            for _ in range(DEADLINES_PER_COURSE):
+                deadlines.append({"user_id": user_id, "course_id": course_id, "title": "Assignment", "completed": False,
+                                  "date": (today + timedelta(days=rng.randint(-10, 20))).isoformat()})
+    db = SessionLocal()
+    try:
+        for model, rows in ((User, users), (UserProfile, profiles), (Course, courses), (Deadline, deadlines),
+                            (FlashcardSet, sets)):
+            table = model.__table__
+            if model in (User, Course):
+                db.execute(table.insert(), rows)
+            else:
+                _bulk_insert(db, table, rows)
+        db.commit()
+    finally:
+        db.close()
+    return len(deadlines)
+
+
+async def legacy_nudge_check():
+    db = SessionLocal()
+    try:
+        today = date.today()
+        seven_days = today + timedelta(days=7)
+        tomorrow = today + timedelta(days=1)
+        for user in db.query(User).all():
+            profile = db.query(UserProfile).filter(UserProfile.user_id == user.id).first()
+            if not profile or _effective_tier(profile) != "pro":
+                continue
+            deadlines = db.query(Deadline).filter(
+                Deadline.user_id == user.id, Deadline.completed == False,
+                Deadline.date >= today.isoformat(), Deadline.date <= seven_days.isoformat(),
+            ).all()
+            for deadline in deadlines:
+                if date.fromisoformat(deadline.date) == tomorrow:
+                    exists = db.query(NudgeFlag).filter(
+                        NudgeFlag.user_id == user.id, NudgeFlag.deadline_id == deadline.id,
+                        NudgeFlag.reason == "due_tomorrow", NudgeFlag.delivered == False,
+                    ).first()
+                    if not exists:
+                        db.add(NudgeFlag(user_id=user.id, reason="due_tomorrow", course_id=deadline.course_id, deadline_id=deadline.id))
+                if deadline.course_id:
+                    has_materials = (
+                        db.query(FlashcardSet).filter(FlashcardSet.user_id == user.id, FlashcardSet.course_id == deadline.course_id).first()
+                        or db.query(Quiz).filter(Quiz.user_id == user.id, Quiz.course_id == deadline.course_id).first()
+                        or db.query(Summary).filter(Summary.user_id == user.id, Summary.course_id == deadline.course_id).first()
+                    )
+                    if not has_materials:
+                        exists = db.query(NudgeFlag).filter(
+                            NudgeFlag.user_id == user.id, NudgeFlag.course_id == deadline.course_id,
+                            NudgeFlag.reason == "no_materials", NudgeFlag.delivered == False,
+                        ).first()
+                        if not exists:
+                            db.add(NudgeFlag(user_id=user.id, reason="no_materials", course_id=deadline.course_id, deadline_id=deadline.id))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run(label, check):
+    global statements
+    stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal stall
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            stall = max(stall, time.perf_counter() - started - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.05)
+    statements = 0
+    started = time.perf_counter()
+    await check()
+    wall = time.perf_counter() - started
+    running = False
+    await tick
+    db = SessionLocal()
+    flags = db.query(NudgeFlag).count()
+    db.query(NudgeFlag).delete()
+    db.commit()
+    db.close()
+    print(f"{label:<10} {wall:7.2f}s  statements {statements:7d}  flags {flags:6d}  worst loop stall {stall * 1000:8.1f}ms")
+
+
+def main():
+    started = time.perf_counter()
+    deadlines = seed()
+    print(f"{_safe_db_url(str(engine.url))}: {USERS} users ({PRO_SHARE:.0%} pro), {deadlines} deadlines, "
+          f"seeded in {time.perf_counter() - started:.1f}s")
+    asyncio.run(run("legacy", legacy_nudge_check))
+    asyncio.run(run("set-based", _run_nudge_check))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Benchmark the document-to-study-material endpoints end to end without paying OpenAI.
+
+The app runs in this process (httpx over ASGI, no socket in front of it). The model is
+fake_openai.py running in a child process. Each request still goes through upload
+validation, text extraction, prompt assembly, the real OpenAI SDK and HTTP, the fake's
+latency, response parsing and the database.
+
+Each scenario sends REQUESTS uploads, CONCURRENCY at a time, and reports:
+- throughput
+- latency p50/p95/p99
+- successful requests
+- model calls and DB statements per request
+- this process's RSS after the scenario (peak RSS at the end)
+
+The documents are generated by _corpus.py: a syllabus for /upload, a short set of notes
+that fits one model call and a long one that takes the chunked path. Set
+BENCH_CORPUS_DIR to a directory of real .pdf/.docx files to use those everywhere instead.
+FAKE_OPENAI_* variables set the model's behaviour (see fake_openai.py), e.g.
+  FAKE_OPENAI_LATENCY_MS=800 FAKE_OPENAI_ERROR_RATE=0.05 python benchmarks/bench_pipeline.py
+Rate limits are off and the user is on Pro, so neither caps the numbers.
+Run: python benchmarks/bench_pipeline.py
+"""
+import asyncio
+import contextlib
+import glob
+import io
+import logging
+import math
+import os
+import resource
+import sys
+import time
+import uuid
+
+import _env  # noqa: F401
+import _corpus
+import fake_openai
+import httpx
+from sqlalchemy import event
+
+from main import (
+    Course, SessionLocal, User, UserProfile, _safe_db_url, app, engine, get_current_user, limiter, llm_counters,
+)
+
+REQUESTS = 20
+CONCURRENCY = 5
+ENDPOINTS = ["summaries", "flashcards", "generate-quiz"]
+
+
+statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def corpus():
+    """(upload documents, notes documents) as lists of (filename, bytes)."""
+    corpus_dir = os.getenv("BENCH_CORPUS_DIR")
+    if corpus_dir:
+        files = sorted(glob.glob(os.path.join(corpus_dir, "*.pdf")) + glob.glob(os.path.join(corpus_dir, "*.docx")))
+        docs = [(os.path.basename(path), open(path, "rb").read()) for path in files]
+        return docs, docs
+    syllabus, short, long = _corpus.syllabus_text(), _corpus.lecture_text(3), _corpus.lecture_text(14, seed=11)
+    uploads = [("syllabus.pdf", _corpus.make_pdf(syllabus)), ("syllabus.docx", _corpus.make_docx(syllabus))]
+    notes = [("notes-short.pdf", _corpus.make_pdf(short)), ("notes-long.docx", _corpus.make_docx(long))]
+    return uploads, notes
+
+
+def model_calls() -> float:
+    return sum(value for (metric, *_), value in llm_counters.items() if metric == "llm_requests_total")
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as status:
+            return next(int(line.split()[1]) for line in status if line.startswith("VmRSS:")) / 1024
+    except OSError:  # not Linux: fall back to the peak
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def percentile(values: list[float], q: float) -> float:
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence the app's debug prints and info logs while requests run."""
+    root = logging.getLogger()
+    level = root.level
+    root.setLevel(logging.WARNING)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        root.setLevel(level)
+
+
+async def run(client, label, path, filename, content):
+    latencies, ok = [], 0
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    calls, queries = model_calls(), statements
+
+    async def one():
+        nonlocal ok
+        async with semaphore:
+            started = time.perf_counter()
+            resp = await client.post(path, files={"file": (filename, content)})
+            latencies.append((time.perf_counter() - started) * 1000)
+            ok += resp.status_code == 200
+
+    started = time.perf_counter()
+    with quiet():
+        await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    print(f"{label:<36} {REQUESTS / wall:6.2f} req/s  p50 {percentile(latencies, 0.5):6.0f}ms  "
+          f"p95 {percentile(latencies, 0.95):6.0f}ms  p99 {percentile(latencies, 0.99):6.0f}ms  ok {ok:2d}/{REQUESTS}  "
+          f"model calls/req {(model_calls() - calls) / REQUESTS:4.1f}  queries/req {(statements - queries) / REQUESTS:5.1f}  "
+          f"rss {rss_mb():6.1f}MB")
+
+
+def setup_user() -> tuple[User, str]:
+    db = SessionLocal()
+    try:
+        user_id = str(uuid.uuid4())
+        user = User(id=user_id, email=f"{user_id}@example.edu")
+        db.add(user)
+        db.add(UserProfile(user_id=user_id, email=user.email, subscription_tier="pro"))
+        course = Course(user_id=user_id, name="Principles of Macroeconomics", code="ECON 202")
+        db.add(course)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        return user, course.id
+    finally:
+        db.close()
+
+
+async def main():
+    # The OpenAI client is built on first use, so pointing it at the fake now is early enough
+    fake, os.environ["OPENAI_BASE_URL"] = fake_openai.spawn()
+    try:
+        await _run_all()
+    finally:
+        fake.terminate()
+
+
+async def _run_all():
+    user, course_id = setup_user()
+    app.dependency_overrides[get_current_user] = lambda: user
+    limiter.enabled = False
+    uploads, notes = corpus()
+    print(f"{_safe_db_url(str(engine.url))}: {REQUESTS} requests per scenario, {CONCURRENCY} concurrent; "
+          f"model {fake_openai.config_from_env()}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=300) as client:
+        for filename, content in uploads:
+            await run(client, f"/upload {filename}", "/upload", filename, content)
+        for endpoint in ENDPOINTS:
+            for filename, content in notes:
+                await run(client, f"/{endpoint} {filename}", f"/courses/{course_id}/{endpoint}", filename, content)
+    print(f"peak rss {peak_rss_mb():.1f}MB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark the proactive opening message for a student with 30 courses.
+
+"legacy context" replays the previous builder: three material-existence queries per
+course plus a Course lookup per deadline and per nudge flag. "batched context" is
+build_proactive_context (three queries). "repeat opens" hits the endpoint again on the
+same day with a fake model that takes MODEL_LATENCY seconds: the first open pays for the
+model call, later ones are served from the stored briefing.
+Run: python benchmarks/bench_proactive_message.py
+"""
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import _env  # noqa: F401
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from main import (
+    Course, Deadline, FlashcardSet, NudgeFlag, Quiz, SessionLocal, Summary, app, build_proactive_context, engine,
+    get_current_user,
+)
+
+COURSES = 30
+DEADLINES_PER_COURSE = 3
+FLAGS = 10
+RUNS = 200
+OPENS = 20
+MODEL_LATENCY = 0.8
+
+statements = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def legacy_context(db, user_id, today):
+    seven_days = today + timedelta(days=7)
+    deadlines = db.query(Deadline).filter(
+        Deadline.user_id == user_id, Deadline.completed == False,
+        Deadline.date >= today.isoformat(), Deadline.date <= seven_days.isoformat(),
+    ).order_by(Deadline.date).all()
+    courses = db.query(Course).filter(Course.user_id == user_id).all()
+    no_materials = [
+        c for c in courses
+        if not (db.query(FlashcardSet).filter(FlashcardSet.user_id == user_id, FlashcardSet.course_id == c.id).first()
+                or db.query(Quiz).filter(Quiz.user_id == user_id, Quiz.course_id == c.id).first()
+                or db.query(Summary).filter(Summary.user_id == user_id, Summary.course_id == c.id).first())
+    ]
+    flags = db.query(NudgeFlag).filter(NudgeFlag.user_id == user_id, NudgeFlag.delivered == False).all()
+    lines = [c.name for c in courses] + [c.name for c in no_materials]
+    for d in deadlines:
+        course = db.query(Course).filter(Course.id == d.course_id).first() if d.course_id else None
+        lines.append(f"{d.title} {course.name if course else 'General'}")
+    for f in flags:
+        course = db.query(Course).filter(Course.id == f.course_id).first() if f.course_id else None
+        lines.append(f"{f.reason} {course.name if course else ''}")
+    return "\n".join(lines)
+
+
+def seed(user_id, today):
+    db = SessionLocal()
+    try:
+        for i in range(COURSES):
+            course = Course(user_id=user_id, name=f"Course {i}", code=f"C{i}")
+            db.add(course)
+            db.flush()
+            if i % 3 == 0:
+                db.add(FlashcardSet(user_id=user_id, course_id=course.id, name="Notes"))
+            for d in range(DEADLINES_PER_COURSE):
+                db.add(Deadline(user_id=user_id, course_id=course.id, title=f"Homework {i}.{d}", type="assignment",
+                                date=(today + timedelta(days=(i + d) % 10)).isoformat()))
+            if i < FLAGS:
+                db.add(NudgeFlag(user_id=user_id, reason="no_materials", course_id=course.id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def timed(label, fn):
+    global statements
+    latencies = []
+    statements = 0
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<16} p50 {statistics.median(latencies):7.2f}ms  queries {statements / RUNS:5.1f}")
+
+
+def main_():
+    user_id = str(uuid.uuid4())
+    today = date.today()
+    seed(user_id, today)
+    db = SessionLocal()
+    print(f"{COURSES} courses, {COURSES * DEADLINES_PER_COURSE} deadlines, {FLAGS} nudge flags")
+    timed("legacy context", lambda: legacy_context(db, user_id, today))
+    timed("batched context", lambda: build_proactive_context(db, user_id, today))
+    db.close()
+
+    calls = []
+
+    async def slow_model(**kwargs):
+        calls.append(1)
+        await asyncio.sleep(MODEL_LATENCY)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Your briefing."))], usage=None)
+
+    main.client.chat.completions.create = slow_model
+    main.limiter.enabled = False
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="bench@example.com")
+    client = TestClient(app)
+    latencies = []
+    for _ in range(OPENS):
+        started = time.perf_counter()
+        client.post("/chat/proactive-message").raise_for_status()
+        latencies.append((time.perf_counter() - started) * 1000)
+    print(f"first open       {latencies[0]:7.1f}ms")
+    print(f"repeat opens     p50 {statistics.median(latencies[1:]):7.2f}ms  model calls {len(calls)} for {OPENS} opens")
+
+
+if __name__ == "__main__":
+    main_()
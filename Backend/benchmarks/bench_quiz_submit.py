@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark submit_quiz scoring latency for 30-question quizzes.
+
+"legacy" replays the previous handler body: load the quiz, lazy-load quiz.questions,
+sort by the string order_num, json.loads every question's options. "answer key" is
+the current path: one quiz row whose precomputed key is decoded once (the attempt
+insert the endpoint now does is timed separately). Both exclude HTTP overhead.
+Run: python benchmarks/bench_quiz_submit.py
+"""
+import json
+import statistics
+import time
+import uuid
+
+import _env  # noqa: F401
+from sqlalchemy import event
+
+from main import Course, Quiz, QuizAttempt, SessionLocal, engine, insert_quiz_questions, quiz_answer_key
+
+QUESTIONS = 30
+QUIZZES = 50
+SUBMISSIONS = 2000
+
+queries = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global queries
+    queries += 1
+
+
+def legacy_score(db, user_id, quiz_id, answers):
+    quiz = db.query(Quiz).filter(Quiz.id == quiz_id, Quiz.user_id == user_id).first()
+    results, correct = [], 0
+    for q in sorted(quiz.questions, key=lambda x: x.order_num):
+        user_answer = answers.get(q.id, "")
+        ok = user_answer.upper() == q.correct_answer.upper()
+        correct += ok
+        results.append({"question_id": q.id, "options": json.loads(q.options), "is_correct": ok})
+    return correct
+
+
+def key_score(db, user_id, quiz_id, answers):
+    quiz = db.query(Quiz).filter(Quiz.id == quiz_id, Quiz.user_id == user_id).first()
+    key = quiz_answer_key(db, quiz)
+    user_answers = [answers.get(q["id"], "") for q in key]
+    graded = [a.upper() == q["correct_answer"].upper() for a, q in zip(user_answers, key)]
+    return sum(graded)
+
+
+def record_attempt(db, user_id, quiz_id, answers):
+    db.add(QuizAttempt(user_id=user_id, quiz_id=quiz_id, score=0, total=QUESTIONS, percentage=0,
+                       answers=json.dumps(answers)))
+    db.commit()
+
+
+def run(label, fn, user_id, quizzes):
+    global queries
+    latencies = []
+    queries = 0
+    for i in range(SUBMISSIONS):
+        quiz_id, answers = quizzes[i % len(quizzes)]
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            fn(db, user_id, quiz_id, answers)
+            latencies.append((time.perf_counter() - started) * 1000)
+        finally:
+            db.close()
+    ordered = sorted(latencies)
+    print(f"{label:<16} p50 {statistics.median(latencies):6.3f}ms  p95 {ordered[int(len(ordered) * 0.95) - 1]:6.3f}ms  "
+          f"queries/submission {queries / SUBMISSIONS:4.1f}")
+
+
+def main():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    course = Course(user_id=user_id, name="Statistics", code="STAT 101")
+    db.add(course)
+    db.flush()
+    quizzes = []
+    for _ in range(QUIZZES):
+        quiz = Quiz(user_id=user_id, course_id=course.id, name="Quiz")
+        db.add(quiz)
+        db.flush()
+        ids = insert_quiz_questions(db, user_id, quiz.id, [
+            {"question": f"Question {i} about the sampling distribution?", "options": ["A) one", "B) two", "C) three", "D) four"],
+             "correct_answer": "ABCD"[i % 4], "explanation": f"Explanation {i}."}
+            for i in range(QUESTIONS)
+        ])
+        quizzes.append((quiz.id, {qid: "ABCD"[(i * 7) % 4] for i, qid in enumerate(ids)}))
+    db.commit()
+    for quiz_id, _ in quizzes:  # warm the precomputed keys, as the first GET does
+        quiz_answer_key(db, db.query(Quiz).filter(Quiz.id == quiz_id).one())
+    db.close()
+
+    print(f"{SUBMISSIONS} submissions over {QUIZZES} quizzes of {QUESTIONS} questions")
+    run("legacy", legacy_score, user_id, quizzes)
+    run("answer key", key_score, user_id, quizzes)
+    run("attempt insert", record_attempt, user_id, quizzes)
+
+
+if __name__ == "__main__":
+    main()
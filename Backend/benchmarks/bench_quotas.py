@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Load-test quota enforcement: correctness under concurrency, statements and latency.
+
+Each scenario fires ATTEMPTS generation requests (check, then charge on success) for one
+free user on WORKERS threads, with FREE_AI_GENERATION_LIMIT as the cap. "legacy" replays
+the previous check_tier_limit/increment_ai_generation bodies (read the profile, reset the
+month in Python, commit; later read and commit again). "atomic" is the current
+check_tier_limit + increment_ai_generation pair. A pro user's request is timed separately,
+where the cache removes the database from the path. SQLite runs in WAL mode with a busy
+timeout; set BENCH_DATABASE_URL=postgresql://... for real row-level concurrency.
+Run: python benchmarks/bench_quotas.py
+"""
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import _env  # noqa: F401
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from main import (
+    FREE_AI_GENERATION_LIMIT, SessionLocal, UserProfile, _effective_tier, _safe_db_url, check_tier_limit, engine,
+    increment_ai_generation,
+)
+
+ATTEMPTS = 400
+WORKERS = 16
+PRO_REQUESTS = 2000
+
+statements = 0
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_concurrency(dbapi_conn, record):
+        dbapi_conn.execute("PRAGMA journal_mode=WAL")
+        dbapi_conn.execute("PRAGMA busy_timeout=60000")
+
+    engine.dispose()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+
+def legacy_check(db, user_id):
+    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    if _effective_tier(profile) == "pro":
+        return
+    now = datetime.utcnow()
+    if not profile.ai_generations_reset_at or profile.ai_generations_reset_at.month != now.month:
+        profile.ai_generations_used = 0
+        profile.ai_generations_reset_at = now
+        db.commit()
+    if (profile.ai_generations_used or 0) >= FREE_AI_GENERATION_LIMIT:
+        raise HTTPException(status_code=403)
+
+
+def legacy_increment(db, user_id):
+    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    if profile and _effective_tier(profile) != "pro":
+        profile.ai_generations_used = (profile.ai_generations_used or 0) + 1
+        db.commit()
+
+
+def atomic_check(db, user_id):
+    check_tier_limit(db, user_id, "ai_generation")
+
+
+def atomic_increment(db, user_id):
+    increment_ai_generation(db, user_id)
+
+
+def request(check, increment, user_id):
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        check(db, user_id)
+        time.sleep(0.002)  # the generation itself
+        increment(db, user_id)
+        return True, (time.perf_counter() - started) * 1000
+    except HTTPException:
+        return False, (time.perf_counter() - started) * 1000
+    finally:
+        db.close()
+
+
+def new_user(**fields):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    db.add(UserProfile(user_id=user_id, email=f"{user_id}@example.com", ai_generations_reset_at=datetime.utcnow(), **fields))
+    db.commit()
+    db.close()
+    return user_id
+
+
+def used(user_id):
+    db = SessionLocal()
+    try:
+        return db.query(UserProfile).filter(UserProfile.user_id == user_id).one().ai_generations_used
+    finally:
+        db.close()
+
+
+def run(label, check, increment):
+    global statements
+    user_id = new_user()
+    statements = 0
+    with ThreadPoolExecutor(WORKERS) as pool:
+        results = list(pool.map(lambda _: request(check, increment, user_id), range(ATTEMPTS)))
+    granted = sum(ok for ok, _ in results)
+    latencies = sorted(ms for _, ms in results)
+    print(f"{label:<8} granted {granted:4d}/{FREE_AI_GENERATION_LIMIT}  counter {used(user_id):4d}  "
+          f"statements/request {statements / ATTEMPTS:4.2f}  p50 {statistics.median(latencies):6.2f}ms "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:6.2f}ms")
+
+    user_id = new_user(subscription_tier="pro")
+    statements = 0
+    pro = [request(check, increment, user_id)[1] - 2 for _ in range(PRO_REQUESTS)]
+    print(f"{'':<8} pro request: statements {statements / PRO_REQUESTS:4.2f}  p50 {statistics.median(pro):6.3f}ms")
+
+
+def main():
+    print(f"{_safe_db_url(str(engine.url))}: {ATTEMPTS} attempts on {WORKERS} threads, limit {FREE_AI_GENERATION_LIMIT}")
+    run("legacy", legacy_check, legacy_increment)
+    run("atomic", atomic_check, atomic_increment)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark rate limit enforcement across workers: per-process memory counters (the
+previous setup) vs the shared database storage.
+
+WORKERS threads each get their own storage instance, standing in for separate uvicorn
+worker processes, and hammer one user's "10/minute" limit. With per-process counters
+every worker grants its own 10; the shared storage should grant 10 in total. Also
+reports the latency a hit adds per request. SQLite runs in WAL mode with a long busy
+timeout; set BENCH_DATABASE_URL=postgresql://... to measure against a real server.
+Run: python benchmarks/bench_rate_limits.py
+"""
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import _env  # noqa: F401
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import SlidingWindowCounterRateLimiter
+from sqlalchemy import event
+
+from main import DatabaseRateLimitStorage, _safe_db_url, engine
+
+WORKERS = 8
+HITS_PER_WORKER = 250
+LIMIT = parse("10/minute")
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_concurrency(dbapi_conn, record):
+        dbapi_conn.execute("PRAGMA journal_mode=WAL")
+        dbapi_conn.execute("PRAGMA busy_timeout=60000")
+
+    engine.dispose()
+
+
+def worker(storage_cls, key):
+    limiter = SlidingWindowCounterRateLimiter(storage_cls())
+    granted, latencies = 0, []
+    for _ in range(HITS_PER_WORKER):
+        started = time.perf_counter()
+        granted += limiter.hit(LIMIT, key)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return granted, latencies
+
+
+def run(label, storage_cls):
+    key = f"user:{uuid.uuid4()}"
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(lambda _: worker(storage_cls, key), range(WORKERS)))
+    granted = sum(r[0] for r in results)
+    latencies = sorted(ms for r in results for ms in r[1])
+    print(f"{label:<18} granted {granted:3d}/{LIMIT.amount}  "
+          f"hit p50 {statistics.median(latencies):6.3f}ms  p95 {latencies[int(len(latencies) * 0.95) - 1]:6.3f}ms")
+
+
+def main():
+    print(f"{_safe_db_url(str(engine.url))}: {WORKERS} workers x {HITS_PER_WORKER} hits against {LIMIT}")
+    run("per-worker memory", MemoryStorage)
+    run("shared database", DatabaseRateLimitStorage)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark worker startup: import-time breakdown and time to the first healthy /health.
+
+"import profile" runs `python -X importtime -c "import main"` and lists the modules main
+imports directly, by cumulative import time. "first /health" starts uvicorn the way the
+Procfile does and polls /health until it answers 200, BOOTS times, against a database that
+is already migrated (the restart case): once with no JWKS URL, and once with the JWKS URL
+pointed at a local socket that accepts connections but never answers, the way a slow or
+unreachable Supabase would.
+Run: python benchmarks/bench_startup.py
+"""
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import _env
+
+BOOTS = 5
+TOP_IMPORTS = 12
+ENV = dict(os.environ, SUPABASE_JWKS_URL="")
+
+
+def import_profile():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=_env.BACKEND_DIR,
+                            env=ENV, capture_output=True, text=True, check=True)
+    direct, total = [], 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == "main":
+            total = int(cumulative)
+        elif name.startswith("   ") and not name.startswith("    "):  # imported by main itself
+            direct.append((int(cumulative), name.strip()))
+    print(f"import main  {total / 1000:7.1f}ms total; slowest direct imports:")
+    for cumulative, name in sorted(direct, reverse=True)[:TOP_IMPORTS]:
+        print(f"  {name:<32} {cumulative / 1000:7.1f}ms")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_healthy(env):
+    """Milliseconds from spawning uvicorn to a 200 from /health, or None if startup failed."""
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+                              cwd=_env.BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while server.poll() is None and time.perf_counter() - started < 60:
+            try:
+                with urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except (URLError, ConnectionError, TimeoutError):
+                time.sleep(0.01)
+        return None
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run(label, env):
+    timings = [first_healthy(env) for _ in range(BOOTS)]
+    healthy = [ms for ms in timings if ms is not None]
+    if not healthy:
+        print(f"{label:<28} never healthy (startup failed) in {BOOTS} boots")
+        return
+    print(f"{label:<28} p50 {statistics.median(healthy):7.1f}ms  min {min(healthy):7.1f}ms  "
+          f"healthy {len(healthy)}/{BOOTS}")
+
+
+def main():
+    subprocess.run([sys.executable, "-c", "import main"], cwd=_env.BACKEND_DIR, env=ENV,
+                   check=True, capture_output=True)  # migrate once so every boot below is a restart
+    import_profile()
+    run("first /health, no JWKS", ENV)
+    with socket.socket() as hanging:
+        hanging.bind(("127.0.0.1", 0))
+        hanging.listen(64)  # never accepted: connects succeed, reads time out
+        run("first /health, hanging JWKS", dict(ENV, SUPABASE_JWKS_URL=f"http://127.0.0.1:{hanging.getsockname()[1]}/"))
+
+
+if __name__ == "__main__":
+    main()
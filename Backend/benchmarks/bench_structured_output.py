@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Regression benchmark for model-output parsing over a corpus of malformed responses.
+
+malformed_responses.json holds real-world failure shapes: code fences, prose around
+the JSON, trailing commas, output truncated by max_tokens, malformed items, and the
+{"<key>": [...]} wrapper that structured outputs return. Compares the legacy
+parse_json_response (``` split + json.loads, as the call sites used it) with
+parse_json_items / the tolerant parse_json_response: cases fully recovered, items
+recovered, and parse time. test_structured_output.py asserts the same expectations.
+Run: python benchmarks/bench_structured_output.py
+"""
+import json
+import os
+import time
+
+import _env  # noqa: F401
+from main import parse_json_items, parse_json_response
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "malformed_responses.json")
+ROUNDS = 200
+
+
+def legacy_parse(result: str):
+    if result.startswith("```"):
+        result = result.split("```")[1]
+        if result.startswith("json"):
+            result = result[4:]
+    return json.loads(result.strip())
+
+
+def legacy_items(result: str, key: str):
+    try:
+        data = legacy_parse(result)
+    except ValueError:
+        return []
+    if isinstance(data, dict):
+        data = data.get(key, [])
+    return data if isinstance(data, list) else []
+
+
+def legacy_object(result: str):
+    try:
+        return legacy_parse(result)
+    except ValueError:
+        return {}
+
+
+def tolerant_object(result: str):
+    try:
+        return parse_json_response(result)
+    except ValueError:
+        return {}
+
+
+def recovered(case, items_fn, object_fn) -> tuple[bool, int]:
+    if case["key"] is None:
+        value = object_fn(case["text"])
+        ok = isinstance(value, dict) and all(k in value for k in case["expect_keys"])
+        return ok, int(ok)
+    items = items_fn(case["text"], case["key"])
+    return len(items) == case["expect_items"], len(items)
+
+
+def timed(cases, items_fn, object_fn) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for case in cases:
+            recovered(case, items_fn, object_fn)
+    return (time.perf_counter() - started) * 1e6 / (ROUNDS * len(cases))
+
+
+def main():
+    with open(CORPUS) as f:
+        cases = json.load(f)
+
+    print(f"{'case':<36} {'legacy':>7} {'tolerant':>9} {'expected':>9}")
+    totals = {"legacy": [0, 0], "tolerant": [0, 0]}
+    for case in cases:
+        row = []
+        for label, items_fn, object_fn in (("legacy", legacy_items, legacy_object), ("tolerant", parse_json_items, tolerant_object)):
+            ok, count = recovered(case, items_fn, object_fn)
+            totals[label][0] += ok
+            totals[label][1] += count
+            row.append(count)
+        expected = case.get("expect_items", 1)
+        print(f"{case['name']:<36} {row[0]:>7} {row[1]:>9} {expected:>9}")
+
+    for label, items_fn, object_fn in (("legacy", legacy_items, legacy_object), ("tolerant", parse_json_items, tolerant_object)):
+        ok, items = totals[label]
+        print(f"{label:<9} cases recovered {ok}/{len(cases)}  items {items}  "
+              f"mean parse {timed(cases, items_fn, object_fn):.1f}us/response")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark near-duplicate dedup of generated flashcards at 1k candidates.
+
+Builds ~1,000 candidate cards from 350 distinct facts, each generated 1-5 times the way
+overlapping chunks do: reworded fronts ("What is X?" / "Define X." / "X refers to?"),
+lightly reworded backs, spread over 10 chunks. Reports throughput and how many
+duplicates survive for the legacy exact-front dedup and for select_study_items at
+several thresholds. "Extra" = surviving paraphrases of an already-kept fact;
+"lost" = distinct facts wrongly merged away.
+Run: python benchmarks/bench_study_dedup.py
+"""
+import random
+import time
+
+import _env  # noqa: F401
+from main import select_study_items
+
+FACTS = 350
+CHUNKS = 10
+THRESHOLDS = (0.3, 0.4, 0.5, 0.6, 0.7)
+ROUNDS = 5
+
+SUBJECTS = ("glycolysis", "osmosis", "the Krebs cycle", "mitosis", "meiosis", "transcription", "translation",
+            "photosynthesis", "diffusion", "homeostasis", "the electron transport chain", "apoptosis")
+TERMS = ("enzyme", "membrane", "gradient", "receptor", "ligand", "chromosome", "ribosome", "nucleotide",
+         "substrate", "cofactor", "vesicle", "organelle", "pathway", "hormone", "antibody", "isotope")
+FRONTS = ("What is {t}?", "Define {t}.", "{T} refers to what?", "Explain the term {t}.", "What does {t} mean?")
+BACKS = ("The {a} {b} that regulates {c} during {s}.", "A {a} {b} which regulates {c} in {s}.",
+         "During {s}, the {a} {b} regulates {c}.")
+
+
+def build_candidates(rng):
+    facts = []
+    for i in range(FACTS):
+        term = f"{rng.choice(TERMS)} {rng.choice(TERMS)} {i}"
+        facts.append((term, rng.choice(TERMS), rng.choice(TERMS), rng.choice(TERMS), rng.choice(SUBJECTS)))
+    groups = [[] for _ in range(CHUNKS)]
+    labels = {}
+    for fid, (t, a, b, c, s) in enumerate(facts):
+        for _ in range(rng.choice((1, 2, 3, 4, 5))):
+            card = {"front": rng.choice(FRONTS).format(t=t, T=t.capitalize()),
+                    "back": rng.choice(BACKS).format(a=a, b=b, c=c, s=s)}
+            labels[id(card)] = fid
+            groups[rng.randrange(CHUNKS)].append(card)
+    return groups, labels
+
+
+def legacy(groups):
+    seen, kept = set(), []
+    for card in (c for g in groups for c in g):
+        key = card["front"].lower().strip()
+        if key and key not in seen:
+            seen.add(key)
+            kept.append(card)
+    return kept
+
+
+def report(label, fn, groups, labels):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        kept = fn(groups)
+    secs = (time.perf_counter() - started) / ROUNDS
+    total = sum(len(g) for g in groups)
+    facts_kept = {labels[id(c)] for c in kept}
+    extra = len(kept) - len(facts_kept)
+    lost = FACTS - len(facts_kept)
+    print(f"{label:<24} kept {len(kept):>5}  extra {extra:>4}  lost {lost:>3}  "
+          f"{secs * 1000:7.1f}ms  {total / secs:>9,.0f} cards/s")
+
+
+def main():
+    rng = random.Random(11)
+    groups, labels = build_candidates(rng)
+    total = sum(len(g) for g in groups)
+    print(f"{total} candidate cards, {FACTS} distinct facts, {CHUNKS} chunks")
+    report("legacy exact front", legacy, groups, labels)
+    for threshold in THRESHOLDS:
+        report(f"minhash t={threshold}", lambda g, t=threshold: select_study_items("flashcards", g, threshold=t), groups, labels)
+    report("t=0.5 + target 50", lambda g: select_study_items("flashcards", g, 50), groups, labels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cross-set due queue at 100k flashcards per user.
+
+"whole sets" is what a study session used to cost: list the user's sets and load every
+card of every set (the client then filtered by grade). "due, no index" runs the
+/study/due query with idx_flashcards_user_due dropped (only idx_flashcards_user_id), and
+"due, indexed" runs it with the (user_id, due_at) index, which turns it into a range scan
+that stops after `limit` rows. A second user with the same card count shares the table.
+Run: python benchmarks/bench_study_due.py
+"""
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import _env  # noqa: F401
+from sqlalchemy import text
+
+from main import (
+    Course, Flashcard, FlashcardSet, SessionLocal, _bulk_insert, _safe_db_url, engine, get_due_flashcards,
+)
+
+CARDS_PER_USER = 100_000
+SETS_PER_USER = 200
+LIMIT = 20
+RUNS = 50
+WHOLE_SET_RUNS = 3
+
+DUE_QUERY = (
+    "SELECT flashcards.id FROM flashcards JOIN flashcard_sets ON flashcard_sets.id = flashcards.flashcard_set_id "
+    "WHERE flashcards.user_id = :user_id AND flashcards.due_at <= :now ORDER BY flashcards.due_at LIMIT :limit"
+)
+
+
+def seed(user_id):
+    rng = random.Random(user_id)
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Anatomy", code="BIO 300")
+        db.add(course)
+        db.flush()
+        sets = [FlashcardSet(user_id=user_id, course_id=course.id, name=f"Chapter {i}") for i in range(SETS_PER_USER)]
+        db.add_all(sets)
+        db.flush()
+        per_set = CARDS_PER_USER // SETS_PER_USER
+        for fs in sets:
+            # Mostly scheduled into the future, ~5% overdue
+            _bulk_insert(db, Flashcard.__table__, [
+                {"user_id": user_id, "flashcard_set_id": fs.id, "front": f"Term {i}", "back": f"Definition {i}",
+                 "ease": 2.5, "interval_days": 6, "repetitions": 2, "lapses": 0,
+                 "due_at": now + timedelta(hours=rng.uniform(-48, 24 * 40))}
+                for i in range(per_set)
+            ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def whole_sets(user_id):
+    db = SessionLocal()
+    try:
+        for fs in db.query(FlashcardSet).filter(FlashcardSet.user_id == user_id).all():
+            [(fc.id, fc.front, fc.back, fc.grade) for fc in fs.flashcards]
+    finally:
+        db.close()
+
+
+def timed(label, fn, runs):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(latencies)
+    print(f"{label:<16} p50 {statistics.median(latencies):9.2f}ms  p95 {ordered[max(0, int(len(ordered) * 0.95) - 1)]:9.2f}ms")
+
+
+def plan(user_id):
+    params = {"user_id": user_id, "now": datetime.utcnow(), "limit": LIMIT}
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            rows = conn.execute(text("EXPLAIN QUERY PLAN " + DUE_QUERY), params).fetchall()
+            return "; ".join(row[-1] for row in rows)
+        return "\n  ".join(row[0] for row in conn.execute(text("EXPLAIN " + DUE_QUERY), params))
+
+
+def main():
+    users = [str(uuid.uuid4()) for _ in range(2)]
+    started = time.perf_counter()
+    for user_id in users:
+        seed(user_id)
+    print(f"{_safe_db_url(str(engine.url))}: seeded {len(users)} x {CARDS_PER_USER} cards in {time.perf_counter() - started:.1f}s")
+    user_id = users[0]
+    current_user = type("U", (), {"id": user_id})()
+
+    timed("whole sets", lambda: whole_sets(user_id), WHOLE_SET_RUNS)
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS idx_flashcards_user_due"))
+        conn.execute(text("ANALYZE"))
+    print(f"  plan: {plan(user_id)}")
+    timed("due, no index", lambda: get_due_flashcards(limit=LIMIT, current_user=current_user), RUNS)
+
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX IF NOT EXISTS idx_flashcards_user_due ON flashcards(user_id, due_at)"))
+        conn.execute(text("ANALYZE"))
+    print(f"  plan: {plan(user_id)}")
+    timed("due, indexed", lambda: get_due_flashcards(limit=LIMIT, current_user=current_user), RUNS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark /courses/{id}/study-pack against the three separate endpoints
+(/summaries, /flashcards, /generate-quiz) for the same upload.
+
+OpenAI is replaced by a stub that answers each prompt with a plausible payload and
+sleeps a simulated latency (STUB_BASE_S + completion tokens * STUB_PER_TOKEN_S), so the
+comparison reflects call count and token volume, not network noise. Tokens are
+estimated at 4 chars/token; cost uses gpt-4o-mini list prices.
+Run: python benchmarks/bench_study_pack.py
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from types import SimpleNamespace
+
+import _env  # noqa: F401
+from fastapi.testclient import TestClient
+
+import main
+from main import Course, SessionLocal, app, get_current_user
+
+DOC_SIZES = (8_000, 120_000)  # one-pass lecture notes vs a chunked textbook chapter
+NUM_CARDS = 15
+NUM_QUESTIONS = 7
+STUB_BASE_S = 0.05
+STUB_PER_TOKEN_S = 0.0002
+PRICE_IN, PRICE_OUT = 0.15 / 1e6, 0.60 / 1e6
+
+VOCAB = ("enzyme substrate catalyst equilibrium reaction membrane transport gradient protein "
+         "energy pathway regulation feedback inhibition receptor signal").split()
+
+
+def stub_payload(system: str) -> str:
+    cards = [{"front": f"Term {uuid.uuid4().hex[:6]}", "back": "A concise definition of the term."} for _ in range(8)]
+    questions = [{"question": f"Which is true of {uuid.uuid4().hex[:6]}?", "options": ["A) a", "B) b", "C) c", "D) d"],
+                  "correct_answer": "B", "explanation": "Because of the mechanism described."} for _ in range(4)]
+    summary = "Overview of the material.\n" + "\n".join(f"- Key concept {i}: explained briefly." for i in range(6))
+    if '"summary"' in system:
+        return json.dumps({"summary": summary, "flashcards": cards, "questions": questions})
+    if "flashcards" in system:
+        return json.dumps({"flashcards": cards})
+    if "quiz" in system or "multiple-choice" in system:
+        return json.dumps({"questions": questions})
+    return summary
+
+
+class Meter:
+    def __init__(self):
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    async def create(self, **kwargs):
+        system = next((m["content"] for m in kwargs["messages"] if m["role"] == "system"), "")
+        prompt_chars = sum(len(m["content"]) for m in kwargs["messages"] if isinstance(m["content"], str))
+        content = stub_payload(system)
+        completion = len(content) // 4
+        self.calls += 1
+        self.prompt_tokens += prompt_chars // 4
+        self.completion_tokens += completion
+        await asyncio.sleep(STUB_BASE_S + completion * STUB_PER_TOKEN_S)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    def cost(self):
+        return self.prompt_tokens * PRICE_IN + self.completion_tokens * PRICE_OUT
+
+
+def run(client, meter, paths, course_id, doc):
+    main.client.chat.completions.create = meter.create
+    started = time.perf_counter()
+    for path in paths:
+        response = client.post(f"/courses/{course_id}/{path}", files={"file": ("lecture.txt", doc.encode(), "text/plain")})
+        assert response.status_code == 200, response.text
+    return time.perf_counter() - started
+
+
+def main_():
+    rng = random.Random(3)
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    course = Course(user_id=user_id, name="Biochemistry", code="BCH 301")
+    db.add(course)
+    db.commit()
+    course_id = course.id
+    db.close()
+
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="bench@example.com")
+    main.limiter.enabled = False
+    client = TestClient(app)
+    query = f"?num_cards={NUM_CARDS}&num_questions={NUM_QUESTIONS}"
+    separate = ("summaries", f"flashcards{query}", f"generate-quiz{query}")
+    try:
+        for size in DOC_SIZES:
+            words = []
+            while sum(len(w) + 1 for w in words) < size:
+                words.append(rng.choice(VOCAB))
+            doc = ". ".join(" ".join(words[i:i + 12]) for i in range(0, len(words), 12))
+
+            three, pack = Meter(), Meter()
+            three_s = run(client, three, separate, course_id, doc)
+            pack_s = run(client, pack, (f"study-pack{query}",), course_id, doc)
+            print(f"\nDocument {len(doc):,} chars")
+            for label, meter, secs in (("3 separate calls", three, three_s), ("study-pack", pack, pack_s)):
+                print(f"  {label:<17} completions {meter.calls:>3}  prompt tokens {meter.prompt_tokens:>7,}  "
+                      f"completion tokens {meter.completion_tokens:>6,}  cost ${meter.cost():.5f}  wall {secs * 1000:6.0f}ms")
+            print(f"  study-pack saves {(1 - pack.prompt_tokens / three.prompt_tokens) * 100:.0f}% prompt tokens, "
+                  f"{(1 - pack.cost() / three.cost()) * 100:.0f}% cost, {(1 - pack_s / three_s) * 100:.0f}% wall time")
+    finally:
+        app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main_()
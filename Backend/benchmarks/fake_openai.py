@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the OpenAI chat completions API, for benchmarks and load tests.
+
+Answers POST /v1/chat/completions closely enough for the app. A request with a
+json_schema response_format gets a schema-valid object; anything else gets prose.
+stream=true is served as SSE chunks, with a closing usage chunk when
+stream_options.include_usage is set. A request offering tools can be answered with a
+call to the first one (arguments from its parameter schema); the follow-up request
+that carries the tool result gets prose. GET /stats returns request counts.
+
+Behaviour comes from environment variables, or from keyword arguments to serve():
+  FAKE_OPENAI_LATENCY_MS    time to first token (default 200)
+  FAKE_OPENAI_MS_PER_TOKEN  time per output token after the first (default 0)
+  FAKE_OPENAI_TOKENS        output tokens in a prose answer (default 300)
+  FAKE_OPENAI_ITEMS         items per JSON array of objects (default 10)
+  FAKE_OPENAI_ERROR_RATE    fraction of requests answered with an error (default 0)
+  FAKE_OPENAI_ERROR_STATUS  status of those errors (default 429)
+  FAKE_OPENAI_TOOL_RATE     fraction of tool-offering requests answered with a tool call (default 0)
+Errors are retried by the SDK like real ones, so they show up as extra latency before
+they show up as failures.
+
+Run: python benchmarks/fake_openai.py [port]
+Then start the app with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+"""
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+DEFAULTS = {
+    "latency_ms": 200.0,
+    "ms_per_token": 0.0,
+    "tokens": 300,
+    "items": 10,
+    "error_rate": 0.0,
+    "error_status": 429,
+    "tool_rate": 0.0,
+}
+VOCABULARY = (
+    "market supply demand price elasticity surplus equilibrium policy inflation output growth cell enzyme "
+    "membrane protein energy gene mutation force velocity charge field wave torque momentum entropy ratio "
+    "asset liability revenue margin variance sample theorem proof vector matrix limit integral derivative"
+).split()
+CHARS_PER_TOKEN = 4
+
+
+def config_from_env() -> dict:
+    return {key: type(default)(os.getenv(f"FAKE_OPENAI_{key.upper()}", default)) for key, default in DEFAULTS.items()}
+
+
+def _prose(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words)).capitalize() + f" (point {rng.randrange(10**6)})."
+
+
+def fake_value(schema: dict, name: str, rng: random.Random, items: int):
+    """A value satisfying `schema`; property names pick plausible dates and times."""
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        kind = next(k for k in kind if k != "null")
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    if kind == "object":
+        return {key: fake_value(sub, key, rng, items) for key, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = items if schema["items"].get("type") == "object" else 4
+        return [fake_value(schema["items"], name, rng, items) for _ in range(count)]
+    if kind == "boolean":
+        return False
+    if kind in ("integer", "number"):
+        return rng.randint(1, 10)
+    if "date" in name:
+        return (date(2026, 9, 1) + timedelta(days=rng.randrange(100))).isoformat()
+    if name == "time":
+        return "11:59 PM"
+    return _prose(rng, rng.randint(6, 14))
+
+
+def answer(body: dict, config: dict, rng: random.Random) -> str:
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        return json.dumps(fake_value(response_format["json_schema"]["schema"], "", rng, config["items"]))
+    text, words = [], 0
+    target = config["tokens"] * CHARS_PER_TOKEN // 6  # ~6 characters per word
+    while words < target:
+        n = rng.randint(8, 16)
+        text.append(f"- {_prose(rng, n)}")
+        words += n
+    return "\n".join(text)
+
+
+def tool_call(body: dict, config: dict, rng: random.Random) -> dict | None:
+    """A call to the first offered tool, if this request should get one."""
+    tools = body.get("tools") or []
+    answered = any(m.get("role") == "tool" for m in body.get("messages", []))
+    if not tools or answered or rng.random() >= config["tool_rate"]:
+        return None
+    function = tools[0]["function"]
+    return {"id": f"call_fake{rng.randrange(10**9)}", "name": function["name"],
+            "arguments": json.dumps(fake_value(function["parameters"], "", rng, config["items"]))}
+
+
+def usage(body: dict, content: str) -> dict:
+    prompt = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // CHARS_PER_TOKEN
+    completion = max(1, len(content) // CHARS_PER_TOKEN)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+            "prompt_tokens_details": {"cached_tokens": 0}}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status: int, payload: dict, headers: dict | None = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        with self.server.lock:
+            self._json(200, dict(self.server.stats))
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server = self.server
+        config = server.config
+        rng = random.Random()
+        with server.lock:
+            server.stats["requests"] += 1
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": f"{self.path} is not faked", "type": "invalid_request_error"}})
+            return
+        if rng.random() < config["error_rate"]:
+            with server.lock:
+                server.stats["errors"] += 1
+            time.sleep(config["latency_ms"] / 1000 / 4)
+            self._json(config["error_status"], {"error": {"message": "Injected by fake_openai", "type": "fake_error",
+                                                          "code": "rate_limit_exceeded"}})
+            return
+
+        call = tool_call(body, config, rng)
+        content = "" if call else answer(body, config, rng)
+        tokens = [content[i:i + CHARS_PER_TOKEN] for i in range(0, len(content), CHARS_PER_TOKEN)]
+        base = {"id": f"chatcmpl-fake{rng.randrange(10**9)}", "created": int(time.time()),
+                "model": body.get("model", "fake")}
+        time.sleep(config["latency_ms"] / 1000)
+        if not body.get("stream"):
+            time.sleep(config["ms_per_token"] * max(0, len(tokens) - 1) / 1000)
+            message = {"role": "assistant", "content": content or None}
+            if call:
+                message["tool_calls"] = [{"id": call["id"], "type": "function",
+                                          "function": {"name": call["name"], "arguments": call["arguments"]}}]
+            self._json(200, {**base, "object": "chat.completion", "usage": usage(body, content), "choices": [{
+                "index": 0, "message": message, "finish_reason": "tool_calls" if call else "stop"}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(chunk: dict):
+            self.wfile.write(f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', **chunk})}\n\n".encode())
+            self.wfile.flush()
+
+        send({"choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+        for i, token in enumerate(tokens):
+            if i and config["ms_per_token"]:
+                time.sleep(config["ms_per_token"] / 1000)
+            send({"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+        if call:
+            send({"choices": [{"index": 0, "delta": {"tool_calls": [{
+                "index": 0, "id": call["id"], "type": "function",
+                "function": {"name": call["name"], "arguments": call["arguments"]}}]}, "finish_reason": None}]})
+        send({"choices": [{"index": 0, "delta": {}, "finish_reason": "tool_calls" if call else "stop"}]})
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send({"choices": [], "usage": usage(body, content)})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def serve(port: int = 0, **overrides) -> ThreadingHTTPServer:
+    """Start the fake on 127.0.0.1:`port` (0 picks a free one) in a daemon thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.config = {**config_from_env(), **overrides}
+    server.stats = {"requests": 0, "errors": 0}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn(port: int = 0) -> tuple[subprocess.Popen, str]:
+    """Run the fake in a child process, configured by this process's environment.
+    Returns (process, base URL) once it answers; terminate() the process when done."""
+    port = port or free_port()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), str(port)], stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            urlopen(f"http://127.0.0.1:{port}/stats", timeout=1).close()
+            return process, f"http://127.0.0.1:{port}/v1"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("fake_openai.py did not come up")
+
+
+def main():
+    server = serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8001)
+    print(f"fake OpenAI on http://127.0.0.1:{server.server_address[1]}/v1 with {server.config}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+classmate.auth: per-request token verification and user lookup, token minting, and the
+bcrypt work factor paid at login.
+"""
+import uuid
+
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.requests import Request
+
+from classmate.auth import _get_current_user, _hash_password, _issue_tokens, _verify_native_token, _verify_password
+from classmate.db import User
+
+
+def test_issue_tokens(benchmark):
+    tokens = benchmark(_issue_tokens, "bench-user", "bench@example.edu")
+    assert tokens["token_type"] == "bearer"
+
+
+def test_verify_access_token(benchmark):
+    token = _issue_tokens("bench-user", "bench@example.edu")["access_token"]
+    assert benchmark(_verify_native_token, token)["sub"] == "bench-user"
+
+
+def test_current_user_dependency(benchmark, db):
+    user_id = str(uuid.uuid4())
+    db.add(User(id=user_id, email=f"{user_id}@example.edu"))
+    db.commit()
+    token = _issue_tokens(user_id, f"{user_id}@example.edu")["access_token"]
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    request = Request({"type": "http", "headers": []})
+
+    assert benchmark(_get_current_user, request, credentials, db).id == user_id
+
+
+def test_password_hash_and_verify(benchmark):
+    def login():
+        return _verify_password("correct horse battery staple", _hash_password("correct horse battery staple"))
+
+    assert benchmark.pedantic(login, rounds=5, iterations=1)
@@ -0,0 +1,62 @@
+"""
+classmate.chat_context: the per-message chat context (snapshot hit vs rebuild) and BM25
+retrieval over a user's course material.
+"""
+import uuid
+from datetime import date, timedelta
+
+import _corpus
+import pytest
+
+from classmate import chat_context
+from classmate.db import Course, Deadline, Flashcard, FlashcardSet, Summary
+
+QUERY = "how does the long run outcome of monetary policy compare with the short run response?"
+
+
+@pytest.fixture(scope="module")
+def user_id(tables):
+    from classmate.db import SessionLocal
+
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        pages = _corpus.lecture_text(48)
+        for c in range(6):
+            course = Course(user_id=user_id, name=f"Course {c}", code=f"ECON {200 + c}", syllabus_text=pages[c])
+            db.add(course)
+            db.flush()
+            for s in range(4):
+                db.add(Summary(user_id=user_id, course_id=course.id, title=f"Lecture {s} notes",
+                               content=pages[(c * 4 + s) % len(pages)]))
+            cards = FlashcardSet(user_id=user_id, course_id=course.id, name=f"Unit {c} cards")
+            db.add(cards)
+            db.flush()
+            db.add_all([Flashcard(user_id=user_id, flashcard_set_id=cards.id, front=f"Term {n}?",
+                                  back=pages[n % len(pages)][:160]) for n in range(40)])
+            for d in range(8):
+                db.add(Deadline(user_id=user_id, course_id=course.id, title=f"Problem set {d}", type="assignment",
+                                date=(date.today() + timedelta(days=3 * d)).isoformat()))
+        db.commit()
+    finally:
+        db.close()
+    return user_id
+
+
+def test_snapshot_hit(benchmark, db, user_id):
+    chat_context.get_chat_context(db, user_id)
+    assert "Course 5" in benchmark(chat_context.get_chat_context, db, user_id)
+
+
+def test_rebuild(benchmark, db, user_id):
+    assert "Course 5" in benchmark(chat_context._build_chat_context, db, user_id)
+
+
+def test_retrieval_warm_index(benchmark, db, user_id):
+    chat_context.get_chat_context(db, user_id)
+    assert benchmark(chat_context.retrieve_chat_context, db, user_id, QUERY)
+
+
+def test_index_build(benchmark, db, user_id):
+    index = benchmark(lambda: chat_context.ChunkIndex(chat_context._collect_chat_chunks(db, user_id)))
+    assert len(index) > 0
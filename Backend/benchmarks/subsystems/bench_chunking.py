@@ -0,0 +1,19 @@
+"""
+classmate.chunking: splitting a long upload into model-sized chunks, packing short items.
+"""
+import _corpus
+
+from classmate.chunking import _pack_items, split_text_into_chunks
+
+DOCUMENT = "\n\n".join(_corpus.lecture_text(60))  # ~250KB, a long textbook chapter
+ITEMS = [line for page in _corpus.lecture_text(40) for line in page.splitlines()]
+
+
+def test_split_long_document(benchmark):
+    chunks = benchmark(split_text_into_chunks, DOCUMENT)
+    assert "".join(chunks) == DOCUMENT
+
+
+def test_pack_short_items(benchmark):
+    passages = benchmark(_pack_items, ITEMS, 1200)
+    assert sum(p.count("\n") + 1 for p in passages) == len(ITEMS)
@@ -0,0 +1,20 @@
+"""
+classmate.extraction: text out of uploaded PDFs and DOCX files (image OCR is a model call).
+"""
+import _corpus
+
+from classmate.extraction import extract_text_from_docx, extract_text_from_pdf
+
+PAGES = _corpus.lecture_text(20)
+PDF = _corpus.make_pdf(PAGES)
+DOCX = _corpus.make_docx(PAGES)
+
+
+def test_pdf_20_pages(benchmark):
+    text = benchmark(extract_text_from_pdf, PDF)
+    assert "Lecture 20" in text
+
+
+def test_docx_20_pages(benchmark):
+    text = benchmark(extract_text_from_docx, DOCX)
+    assert "Lecture 20" in text
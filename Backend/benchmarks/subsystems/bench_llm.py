@@ -0,0 +1,57 @@
+"""
+classmate.llm: what llm_chat's instrumentation adds on top of the model call, against an
+in-process fake (no network), for a plain and a streamed completion.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from classmate import llm
+
+STREAM_CHUNKS = 200
+USAGE = SimpleNamespace(prompt_tokens=1200, completion_tokens=300,
+                        prompt_tokens_details=SimpleNamespace(cached_tokens=1024))
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for chunk in self._chunks:
+            yield chunk
+
+
+async def fake_create(**kwargs):
+    if kwargs.get("stream"):
+        delta = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="tok"))], usage=None)
+        return FakeStream([delta] * STREAM_CHUNKS + [SimpleNamespace(choices=[], usage=USAGE)])
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=USAGE)
+
+
+@pytest.fixture
+def loop(tables, monkeypatch):
+    monkeypatch.setattr(llm.client.chat.completions, "create", fake_create)
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+    llm.flush_llm_usage()
+
+
+def test_llm_chat(benchmark, loop):
+    response = benchmark(lambda: loop.run_until_complete(
+        llm.llm_chat("bench", user_id="bench-user", model="gpt-4o-mini", messages=[])))
+    assert response.choices[0].message.content == "ok"
+
+
+def test_llm_chat_stream(benchmark, loop):
+    async def consume():
+        stream = await llm.llm_chat("bench", user_id="bench-user", model="gpt-4o-mini", messages=[], stream=True)
+        return [chunk async for chunk in stream]
+
+    chunks = benchmark(lambda: loop.run_until_complete(consume()))
+    assert len(chunks) == STREAM_CHUNKS
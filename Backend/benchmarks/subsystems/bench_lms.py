@@ -0,0 +1,48 @@
+"""
+classmate.lms: course matching for LMS items, and the DB phase of re-syncing an iCal feed
+(fetch replaced by a canned feed, so no network is involved).
+"""
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from classmate import lms
+from classmate.db import Course, LMSConnection
+
+COURSES = [("Principles of Macroeconomics", "ECON 202"), ("Intermediate Accounting", "ACCT 301"),
+           ("Organic Chemistry I", "CHEM 221"), ("Calculus II", "MATH 221"), ("Corporate Finance", "FINC 315"),
+           ("Marketing Strategy", "MKTG 340"), ("Data Structures", "CSCI 230"), ("World History", "HIST 104")]
+FEED_EVENTS = 300
+
+
+def test_course_matcher(benchmark):
+    courses = [SimpleNamespace(id=str(i), name=name, code=code) for i, (name, code) in enumerate(COURSES * 5)]
+    items = [(f"{code.replace(' ', '')}-01 Problem set {n}", "") for n in range(20) for _, code in COURSES]
+    items += [(f"Reading response {n} for {name}", "") for n in range(10) for name, _ in COURSES]
+
+    def match_all():
+        matcher = lms.CourseMatcher(courses)
+        return sum(matcher.match(text, code) is not None for text, code in items)
+
+    assert benchmark(match_all) == len(items)
+
+
+def test_ical_resync(benchmark, db, monkeypatch):
+    user_id = str(uuid.uuid4())
+    db.add_all([Course(user_id=user_id, name=name, code=code) for name, code in COURSES])
+    db.add(LMSConnection(user_id=user_id, provider="ical", ical_url="https://example.edu/feed.ics"))
+    db.commit()
+    start = datetime(2026, 9, 1, 23, 59)
+    events = [{
+        "uid": f"event-{n}@example.edu",
+        "summary": f"{COURSES[n % len(COURSES)][1]} Assignment {n}",
+        "description": "Submit on the course page.",
+        "location": "",
+        "categories": "",
+        "dt": start + timedelta(days=n % 90),
+    } for n in range(FEED_EVENTS)]
+    monkeypatch.setitem(lms.LMS_FETCHERS, "ical", lambda connection: (events, []))
+    lms.sync_all_connections(user_id, db)  # first sync inserts; the benchmark is the steady-state re-sync
+
+    synced, errors, _ = benchmark(lms.sync_all_connections, user_id, db)
+    assert (synced, errors) == (FEED_EVENTS, [])
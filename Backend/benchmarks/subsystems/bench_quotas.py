@@ -0,0 +1,53 @@
+"""
+classmate.quotas: the per-request quota checks, for a free user (one conditional UPDATE)
+and a pro user (served from the in-process tier cache).
+"""
+import uuid
+
+import pytest
+
+from classmate.db import UserProfile
+from classmate.quotas import check_chat_limit, check_tier_limit, consume_chat_message, release_ai_generation_reservation
+
+
+@pytest.fixture
+def profile(db):
+    def make(tier):
+        user_id = str(uuid.uuid4())
+        db.add(UserProfile(user_id=user_id, email=f"{user_id}@example.edu", subscription_tier=tier))
+        db.commit()
+        return user_id
+    return make
+
+
+def test_consume_chat_message(benchmark, db, profile):
+    user_id = profile("free")
+
+    def consume():
+        consume_chat_message(db, user_id)
+        db.rollback()  # keep the user under the weekly limit for every round
+
+    benchmark(consume)
+
+
+def test_check_chat_limit(benchmark, db, profile):
+    user_id = profile("free")
+    benchmark(check_chat_limit, db, user_id)
+
+
+def test_ai_generation_reserve_and_refund(benchmark, db, profile):
+    user_id = profile("free")
+
+    def reserve_and_refund():  # a generation request that failed: charged up front, then refunded
+        check_tier_limit(db, user_id, "ai_generation")
+        release_ai_generation_reservation(user_id, db)
+
+    benchmark(reserve_and_refund)
+    db.expire_all()
+    assert db.query(UserProfile).filter(UserProfile.user_id == user_id).one().ai_generations_used == 0
+
+
+def test_ai_generation_pro_cached(benchmark, db, profile):
+    user_id = profile("pro")
+    check_tier_limit(db, user_id, "ai_generation")  # first sight populates the tier cache
+    benchmark(check_tier_limit, db, user_id, "ai_generation")
@@ -0,0 +1,46 @@
+"""pytest-benchmark suites, one per classmate subsystem.
+
+Each bench module imports only the subsystem under test, never main.py, so a run measures
+that code alone: no app, routes, migrations or background jobs are loaded. The
+database-backed suites get their tables from Base.metadata.create_all on a throwaway
+SQLite database; set BENCH_DATABASE_URL to run them against e.g. Postgres instead.
+
+Needs pytest-benchmark (pip install pytest-benchmark). The files are named bench_*.py so
+the regular test run never collects them; pass them explicitly, from Backend/:
+Run: python -m pytest benchmarks/subsystems/bench_*.py
+     python -m pytest benchmarks/subsystems/bench_chunking.py --benchmark-autosave
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BENCH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.dirname(BENCH_DIR), BENCH_DIR):  # classmate, and the shared _corpus helpers
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ["DATABASE_URL"] = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp(prefix='classmate-bench-')}/bench.db"
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("JWT_SECRET", "bench-secret")
+
+
+@pytest.fixture(scope="session")
+def tables():
+    from classmate.db import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+@pytest.fixture
+def db(tables):
+    from classmate.db import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
@@ -0,0 +1,9 @@
+"""
+ClassMate backend subsystems, importable without main.py's app, routes and migrations.
+
+Each module can be imported (and benchmarked) on its own: none of them connects to the
+database, creates tables or imports an AI/document SDK at import time.
+"""
+from dotenv import load_dotenv
+
+load_dotenv()
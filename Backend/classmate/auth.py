@@ -0,0 +1,286 @@
+"""
+Authentication: password hashing, native JWTs, Supabase token verification and the
+get_current_user dependency.
+"""
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import time
+from urllib.request import urlopen
+
+import bcrypt as _bcrypt
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError, jwk, jwt
+from jose.utils import base64url_decode
+
+from classmate.db import (
+    CalendarEntry, ChatContextSnapshot, Course, Deadline, Flashcard, FlashcardSet, LMSConnection, Quiz, QuizAttempt,
+    QuizQuestion, Summary, User, UserProfile, get_db,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Supabase auth configuration
+SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL") or ""
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else ""
+)
+SUPABASE_ISSUER = os.getenv("SUPABASE_ISSUER") or (
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1" if SUPABASE_URL else ""
+)
+SUPABASE_JWT_AUD = os.getenv("SUPABASE_JWT_AUD", "authenticated")
+SUPABASE_JWKS_CACHE_TTL = int(os.getenv("SUPABASE_JWKS_CACHE_TTL", "3600"))
+
+# Native JWT auth (replaces Supabase auth)
+JWT_SECRET = os.getenv("JWT_SECRET", "")
+NATIVE_JWT_ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+RESET_TOKEN_EXPIRE_MINUTES = 60
+
+def _hash_password(password: str) -> str:
+    return _bcrypt.hashpw(password.encode(), _bcrypt.gensalt()).decode()
+
+def _verify_password(password: str, hashed: str) -> bool:
+    return _bcrypt.checkpw(password.encode(), hashed.encode())
+
+print(f"[Auth] JWT_SECRET={'SET' if JWT_SECRET else 'NOT SET (native auth disabled)'}")
+
+
+bearer_scheme = HTTPBearer(auto_error=True)
+
+
+# Supabase auth helpers
+_jwks_cache: dict[str, object] = {"fetched_at": 0.0, "keys": {}, "last_fetch_error": None}
+
+
+def _fetch_jwks(retries: int = 2) -> dict[str, dict] | None:
+    """Fetch JWKS from Supabase. Returns None on failure instead of raising."""
+    if not SUPABASE_JWKS_URL:
+        print("[Auth] ERROR: SUPABASE_JWKS_URL is not configured")
+        _jwks_cache["last_fetch_error"] = "JWKS URL not configured"
+        return None
+
+    last_error = None
+    for attempt in range(retries):
+        try:
+            print(f"[Auth] Fetching JWKS from {SUPABASE_JWKS_URL} (attempt {attempt + 1}/{retries})")
+            with urlopen(SUPABASE_JWKS_URL, timeout=10) as resp:
+                payload = json.load(resp)
+            keys = {key.get("kid"): key for key in payload.get("keys", []) if key.get("kid")}
+            if not keys:
+                print("[Auth] WARNING: JWKS response contained no valid keys")
+                _jwks_cache["last_fetch_error"] = "JWKS empty"
+                return None
+            _jwks_cache["fetched_at"] = time.time()
+            _jwks_cache["keys"] = keys
+            _jwks_cache["last_fetch_error"] = None
+            print(f"[Auth] Successfully fetched {len(keys)} keys from JWKS")
+            return keys
+        except OSError as e:  # URLError, plus timeouts/resets raised while reading the body
+            last_error = str(e)
+            print(f"[Auth] JWKS fetch attempt {attempt + 1} failed: {e}")
+            if attempt < retries - 1:
+                time.sleep(0.5)  # Brief wait before retry
+        except json.JSONDecodeError as e:
+            print(f"[Auth] ERROR: Failed to parse JWKS response as JSON: {e}")
+            _jwks_cache["last_fetch_error"] = f"JSON parse error: {e}"
+            return None
+
+    print(f"[Auth] WARNING: All {retries} JWKS fetch attempts failed. Last error: {last_error}")
+    _jwks_cache["last_fetch_error"] = last_error
+    return None
+
+
+def _get_jwks() -> dict[str, dict]:
+    """Get JWKS, using stale cache if fresh fetch fails."""
+    cached_keys = _jwks_cache.get("keys", {})
+    fetched_at = float(_jwks_cache.get("fetched_at", 0.0) or 0.0)
+    cache_expired = (time.time() - fetched_at) > SUPABASE_JWKS_CACHE_TTL
+
+    # If cache is fresh, use it
+    if cached_keys and not cache_expired:
+        return cached_keys  # type: ignore[return-value]
+
+    # Try to fetch fresh keys
+    fresh_keys = _fetch_jwks()
+    if fresh_keys:
+        return fresh_keys
+
+    # Fetch failed - use stale cache if available
+    if cached_keys:
+        print("[Auth] WARNING: Using stale JWKS cache due to fetch failure")
+        return cached_keys  # type: ignore[return-value]
+
+    # No cache and fetch failed - return empty (will cause auth to fail gracefully)
+    return {}
+
+
+def _verify_supabase_token(token: str) -> dict:
+    if not SUPABASE_ISSUER or not SUPABASE_JWKS_URL:
+        print("[Auth] ERROR: Supabase auth not configured - ISSUER or JWKS_URL missing")
+        raise HTTPException(status_code=500, detail="Supabase auth not configured. Check SUPABASE_URL env var.")
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token header")
+    kid = header.get("kid")
+    if not kid:
+        raise HTTPException(status_code=401, detail="Invalid token - missing key ID")
+
+    keys = _get_jwks()
+    if not keys:
+        # No keys available at all - this is an auth infrastructure issue
+        last_error = _jwks_cache.get("last_fetch_error", "Unknown")
+        print(f"[Auth] ERROR: No JWKS keys available. Last fetch error: {last_error}")
+        raise HTTPException(status_code=503, detail=f"Auth service temporarily unavailable: {last_error}")
+
+    key_data = keys.get(kid)
+    if not key_data:
+        # Key not in cache - try one more fresh fetch
+        fresh_keys = _fetch_jwks()
+        if fresh_keys:
+            key_data = fresh_keys.get(kid)
+    if not key_data:
+        raise HTTPException(status_code=401, detail="Invalid token - unknown key ID")
+    public_key = jwk.construct(key_data)
+    message, encoded_sig = token.rsplit(".", 1)
+    decoded_sig = base64url_decode(encoded_sig.encode("utf-8"))
+    if not public_key.verify(message.encode("utf-8"), decoded_sig):
+        raise HTTPException(status_code=401, detail="Invalid token signature")
+    try:
+        return jwt.decode(
+            token,
+            key_data,
+            algorithms=[header.get("alg", "RS256")],
+            audience=SUPABASE_JWT_AUD,
+            issuer=SUPABASE_ISSUER,
+        )
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+# Native JWT helpers
+def _issue_tokens(user_id: str, email: str) -> dict:
+    """Mint a short-lived access token and a long-lived refresh token."""
+    if not JWT_SECRET:
+        raise HTTPException(status_code=500, detail="JWT_SECRET not configured")
+    now = datetime.utcnow()
+    access_payload = {
+        "sub": user_id,
+        "email": email,
+        "type": "access",
+        "iat": now,
+        "exp": now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    }
+    refresh_payload = {
+        "sub": user_id,
+        "type": "refresh",
+        "iat": now,
+        "exp": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    }
+    access_token = jwt.encode(access_payload, JWT_SECRET, algorithm=NATIVE_JWT_ALGORITHM)
+    refresh_token = jwt.encode(refresh_payload, JWT_SECRET, algorithm=NATIVE_JWT_ALGORITHM)
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "user_id": user_id,
+        "email": email,
+    }
+
+
+def _verify_native_token(token: str, token_type: str = "access") -> dict:
+    if not JWT_SECRET:
+        raise HTTPException(status_code=500, detail="JWT_SECRET not configured")
+    try:
+        claims = jwt.decode(token, JWT_SECRET, algorithms=[NATIVE_JWT_ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if claims.get("type") != token_type:
+        raise HTTPException(status_code=401, detail="Invalid token type")
+    return claims
+
+
+def _get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials | None,
+    db,
+) -> User:
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    token = credentials.credentials
+
+    # Try native HS256 token first; fall back to Supabase RS256 for existing users
+    claims = None
+    try:
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") == NATIVE_JWT_ALGORITHM and JWT_SECRET:
+            claims = _verify_native_token(token, token_type="access")
+    except (JWTError, HTTPException):
+        claims = None
+
+    if claims is None:
+        if SUPABASE_ISSUER and SUPABASE_JWKS_URL:
+            claims = _verify_supabase_token(token)
+        else:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+    user_id = claims.get("sub")
+    email = claims.get("email")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        # Check if a user with this email already exists (e.g. Supabase user was recreated)
+        if email:
+            existing_by_email = db.query(User).filter(User.email == email).first()
+            if existing_by_email:
+                old_id = existing_by_email.id
+                # Migrate all related data to the new user_id
+                for tbl in [Course, Deadline, LMSConnection, FlashcardSet,
+                            Flashcard, Summary, CalendarEntry, Quiz, QuizQuestion, QuizAttempt]:
+                    db.query(tbl).filter(tbl.user_id == old_id).update(
+                        {"user_id": user_id}, synchronize_session=False
+                    )
+                db.query(ChatContextSnapshot).filter(ChatContextSnapshot.user_id == old_id).delete(
+                    synchronize_session=False
+                )
+                db.query(UserProfile).filter(UserProfile.user_id == old_id).update(
+                    {"user_id": user_id}, synchronize_session=False
+                )
+                # Update the user record itself
+                existing_by_email.id = user_id
+                db.commit()
+                db.refresh(existing_by_email)
+                logger.info(f"[Auth] Migrated user {old_id} -> {user_id} (email: {email})")
+                user = existing_by_email
+            else:
+                user = User(id=user_id, email=email)
+                db.add(user)
+                db.commit()
+                db.refresh(user)
+        else:
+            user = User(id=user_id, email=f"{user_id}@supabase.local")
+            db.add(user)
+            db.commit()
+            db.refresh(user)
+    elif email and user.email != email:
+        user.email = email
+        db.commit()
+        db.refresh(user)
+
+    request.state.user_id = user.id
+    return user
+
+
+def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db=Depends(get_db),
+) -> User:
+    return _get_current_user(request, credentials, db)
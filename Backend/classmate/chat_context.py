@@ -0,0 +1,440 @@
+"""
+Chat context: the cached per-user system context, BM25 retrieval over course material,
+attachments and rolling history summaries.
+"""
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import time
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from classmate.chunking import _pack_items, split_text_into_chunks
+from classmate.db import (
+    ChatAttachment, ChatContextSnapshot, Course, Deadline, Flashcard, FlashcardSet, Quiz, QuizQuestion, Summary,
+)
+from classmate.llm import llm_chat
+
+logger = logging.getLogger(__name__)
+
+
+def _build_chat_context(db, user_id: str) -> str:
+    """Build system context from user's courses, study library, and deadlines.
+    Course material content (summaries, syllabi, cards, questions) is retrieved per message instead.
+
+    Sections are ordered from least to most volatile (deadlines embed today's date) and every
+    query has a total order, so the rendered prompt prefix is byte-stable between mutations
+    and provider-side prompt caching can hit.
+    """
+    parts: list[str] = []
+
+    # Courses (build shared lookup once)
+    courses = db.query(Course).filter(Course.user_id == user_id).order_by(Course.created_at, Course.id).all()
+    course_map = {c.id: c for c in courses}
+    if courses:
+        parts.append("## Student's Courses")
+        for c in courses:
+            info = f"- {c.name}"
+            if c.code:
+                info += f" ({c.code})"
+            if c.semester:
+                info += f" — {c.semester}"
+            parts.append(info)
+            if c.course_info and isinstance(c.course_info, dict):
+                for key, val in c.course_info.items():
+                    if val:
+                        parts.append(f"  {key}: {str(val)[:500]}")
+
+    # Recent summaries — titles only; their content is served per question by retrieve_chat_context
+    summaries = (
+        db.query(Summary)
+        .filter(Summary.user_id == user_id)
+        .order_by(Summary.created_at.desc(), Summary.id)
+        .limit(8)
+        .all()
+    )
+
+    # Study materials metadata — names/counts/dates only, no content
+    # Lets the model know what already exists and proactively notice gaps
+    flashcard_sets = (
+        db.query(FlashcardSet)
+        .filter(FlashcardSet.user_id == user_id)
+        .order_by(FlashcardSet.created_at.desc(), FlashcardSet.id)
+        .all()
+    )
+    all_quizzes = (
+        db.query(Quiz)
+        .filter(Quiz.user_id == user_id)
+        .order_by(Quiz.created_at.desc(), Quiz.id)
+        .all()
+    )
+    fc_counts = dict(
+        db.query(Flashcard.flashcard_set_id, func.count(Flashcard.id))
+        .filter(Flashcard.user_id == user_id)
+        .group_by(Flashcard.flashcard_set_id)
+        .all()
+    )
+    q_counts = dict(
+        db.query(QuizQuestion.quiz_id, func.count(QuizQuestion.id))
+        .filter(QuizQuestion.user_id == user_id)
+        .group_by(QuizQuestion.quiz_id)
+        .all()
+    )
+
+    study_by_course = {
+        c.id: {"label": c.code or c.name, "fcs": [], "quizzes": [], "summaries": []}
+        for c in courses
+    }
+    for fs in flashcard_sets:
+        if fs.course_id in study_by_course:
+            cnt = fc_counts.get(fs.id, 0)
+            d = fs.created_at.strftime("%b %d") if fs.created_at else ""
+            study_by_course[fs.course_id]["fcs"].append(f'"{fs.name}" ({cnt} cards, {d})')
+    for q in all_quizzes:
+        if q.course_id in study_by_course:
+            cnt = q_counts.get(q.id, 0)
+            d = q.created_at.strftime("%b %d") if q.created_at else ""
+            study_by_course[q.course_id]["quizzes"].append(f'"{q.name}" ({cnt} questions, {d})')
+    for s in summaries:
+        if s.course_id in study_by_course:
+            d = s.created_at.strftime("%b %d") if s.created_at else ""
+            study_by_course[s.course_id]["summaries"].append(f'"{s.title}" ({d})')
+
+    if courses:
+        parts.append("\n## Study Library (existing materials — no content, just metadata)")
+        for c in courses:
+            data = study_by_course[c.id]
+            label = data["label"]
+            lines = [f"\n### {label}"]
+            if data["fcs"]:
+                lines.append("Flashcard Sets: " + ", ".join(data["fcs"]))
+            if data["quizzes"]:
+                lines.append("Quizzes: " + ", ".join(data["quizzes"]))
+            if data["summaries"]:
+                lines.append("Summaries: " + ", ".join(data["summaries"]))
+            if not (data["fcs"] or data["quizzes"] or data["summaries"]):
+                lines.append("(no study materials yet)")
+            parts.extend(lines)
+
+    # Deadlines — all incomplete, ordered by date. No lower bound so past-semester deadlines
+    # are still visible to the model. Upper bound prevents far-future noise.
+    today = date.today()
+    one_year_out = today + timedelta(days=365)
+    deadlines = (
+        db.query(Deadline)
+        .filter(
+            Deadline.user_id == user_id,
+            Deadline.completed == False,
+            Deadline.date <= one_year_out.isoformat(),
+        )
+        .order_by(Deadline.date, Deadline.id)
+        .limit(80)
+        .all()
+    )
+    parts.append(f"\n## Deadlines by Course (today: {today.isoformat()})")
+    if deadlines:
+        by_course: dict[str, list] = {}
+        for d in deadlines:
+            c = course_map.get(d.course_id)
+            label = f"{c.code or c.name}" if c else "General"
+            by_course.setdefault(label, []).append(d)
+        for label, items in by_course.items():
+            parts.append(f"\n### {label}")
+            for d in items:
+                time_str = f" at {d.time}" if d.time else ""
+                status = "[past]" if d.date < today.isoformat() else "[upcoming]"
+                parts.append(f"- {d.date}{time_str} {status} — {d.title} ({d.type or 'deadline'}) [id:{d.id}]")
+    else:
+        parts.append("(no deadlines recorded — student has not uploaded a syllabus or added any deadlines)")
+
+    return "\n".join(parts)
+
+
+CHAT_CONTEXT_FORMAT_VERSION = 3  # Bump when _build_chat_context output changes shape
+
+
+def get_chat_context(db, user_id: str) -> str:
+    """Return the user's chat context, served from the materialized snapshot when fresh.
+
+    A hit costs one primary-key lookup. On a miss the context is rebuilt and written back
+    only if no mutation bumped the version while building, so a concurrent write can never
+    be masked by a stale snapshot. Commits the session.
+    """
+    today = date.today().isoformat()
+    snap = db.query(ChatContextSnapshot).filter(ChatContextSnapshot.user_id == user_id).first()
+    if snap is None:
+        # Create the row before reading source data so mutations from here on bump its version
+        try:
+            db.add(ChatContextSnapshot(user_id=user_id, version=0))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        snap = db.query(ChatContextSnapshot).filter(ChatContextSnapshot.user_id == user_id).first()
+
+    if (
+        snap.content is not None
+        and snap.built_version == snap.version
+        and snap.format_version == CHAT_CONTEXT_FORMAT_VERSION
+        and snap.built_on == today
+    ):
+        return snap.content
+
+    version = snap.version
+    started = time.perf_counter()
+    content = _build_chat_context(db, user_id)
+    db.query(ChatContextSnapshot).filter(
+        ChatContextSnapshot.user_id == user_id,
+        ChatContextSnapshot.version == version,
+    ).update({
+        "content": content,
+        "built_version": version,
+        "format_version": CHAT_CONTEXT_FORMAT_VERSION,
+        "built_on": today,
+        "built_at": datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+    logger.info(f"[ChatContext] Rebuilt snapshot for {user_id} in {(time.perf_counter() - started) * 1000:.1f}ms")
+    return content
+
+
+# ── Chat retrieval (BM25 over the user's course material) ────────────────────
+
+CHAT_RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", "6"))
+CHAT_RETRIEVAL_CHUNK_SIZE = 1200  # chars per indexed passage
+MAX_RETRIEVED_CONTEXT_LENGTH = 6000  # Max chars of retrieved passages per message
+CHAT_INDEX_CACHE_SIZE = 256  # users whose index is kept in memory per worker
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it its me my of on or "
+    "so than that the their then there these this to was what when where which who why will with you your".split()
+)
+
+
+def _tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class ChunkIndex:
+    """In-memory BM25 index over a user's course-material passages."""
+
+    def __init__(self, chunks: list[dict]):
+        self.chunks = chunks
+        self._postings: dict[str, list[tuple[int, int]]] = {}
+        self._lengths: list[int] = []
+        for idx, chunk in enumerate(chunks):
+            tokens = _tokenize(chunk["text"])
+            self._lengths.append(len(tokens))
+            tf: dict[str, int] = {}
+            for t in tokens:
+                tf[t] = tf.get(t, 0) + 1
+            for t, n in tf.items():
+                self._postings.setdefault(t, []).append((idx, n))
+        self._avg_len = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query: str, k: int = CHAT_RETRIEVAL_TOP_K) -> list[tuple[float, dict]]:
+        n_docs = len(self.chunks)
+        scores: dict[int, float] = {}
+        for term in set(_tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for idx, tf in postings:
+                norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * self._lengths[idx] / self._avg_len)
+                scores[idx] = scores.get(idx, 0.0) + idf * tf * (_BM25_K1 + 1) / (tf + norm)
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(score, self.chunks[idx]) for idx, score in top]
+
+
+def _collect_chat_chunks(db, user_id: str) -> list[dict]:
+    """Chunk every summary, syllabus, flashcard set, and quiz the user owns into passages."""
+    size = CHAT_RETRIEVAL_CHUNK_SIZE
+    chunks: list[dict] = []
+    courses = db.query(Course.id, Course.name, Course.code, Course.syllabus_text).filter(Course.user_id == user_id).all()
+    labels = {c.id: (c.code or c.name) for c in courses}
+
+    for c in courses:
+        if c.syllabus_text:
+            for part in split_text_into_chunks(c.syllabus_text, size):
+                chunks.append({"source": f"{labels[c.id]} Syllabus", "text": part})
+
+    for s in db.query(Summary.title, Summary.course_id, Summary.content).filter(Summary.user_id == user_id).all():
+        source = f"{s.title} | Course: {labels.get(s.course_id, 'Unknown')}"
+        for part in split_text_into_chunks(s.content or "", size):
+            chunks.append({"source": source, "text": part})
+
+    set_names = dict(db.query(FlashcardSet.id, FlashcardSet.name).filter(FlashcardSet.user_id == user_id).all())
+    set_courses = dict(db.query(FlashcardSet.id, FlashcardSet.course_id).filter(FlashcardSet.user_id == user_id).all())
+    cards_by_set: dict[str, list[str]] = {}
+    for set_id, front, back in (
+        db.query(Flashcard.flashcard_set_id, Flashcard.front, Flashcard.back).filter(Flashcard.user_id == user_id).all()
+    ):
+        cards_by_set.setdefault(set_id, []).append(f"Q: {front}\nA: {back}")
+    for set_id, cards in cards_by_set.items():
+        source = f"Flashcards: {set_names.get(set_id, 'Untitled')} | Course: {labels.get(set_courses.get(set_id), 'Unknown')}"
+        for part in _pack_items(cards, size):
+            chunks.append({"source": source, "text": part})
+
+    quizzes = {q.id: q for q in db.query(Quiz.id, Quiz.name, Quiz.course_id).filter(Quiz.user_id == user_id).all()}
+    questions_by_quiz: dict[str, list[str]] = {}
+    for quiz_id, question, options, answer, explanation in (
+        db.query(QuizQuestion.quiz_id, QuizQuestion.question, QuizQuestion.options,
+                 QuizQuestion.correct_answer, QuizQuestion.explanation)
+        .filter(QuizQuestion.user_id == user_id)
+        .all()
+    ):
+        try:
+            opts = " | ".join(json.loads(options))
+        except (ValueError, TypeError):
+            opts = ""
+        entry = f"Q: {question}\nOptions: {opts}\nAnswer: {answer}"
+        if explanation:
+            entry += f" — {explanation}"
+        questions_by_quiz.setdefault(quiz_id, []).append(entry)
+    for quiz_id, entries in questions_by_quiz.items():
+        q = quizzes.get(quiz_id)
+        source = f"Quiz: {q.name if q else 'Untitled'} | Course: {labels.get(q.course_id if q else None, 'Unknown')}"
+        for part in _pack_items(entries, size):
+            chunks.append({"source": source, "text": part})
+
+    return chunks
+
+
+_chat_index_cache: "OrderedDict[str, tuple[tuple, ChunkIndex]]" = OrderedDict()
+
+
+def get_chat_index(db, user_id: str) -> ChunkIndex:
+    """Return the user's chunk index, rebuilding it when the context snapshot version moves.
+    Shares invalidation with get_chat_context: the same mutations bump the same version.
+    The key includes the row's generation, since a recreated snapshot restarts at version 0."""
+    snap = (
+        db.query(ChatContextSnapshot.generation, ChatContextSnapshot.version)
+        .filter(ChatContextSnapshot.user_id == user_id)
+        .first()
+    )
+    key = tuple(snap) if snap else None
+    cached = _chat_index_cache.get(user_id)
+    if cached and key is not None and cached[0] == key:
+        _chat_index_cache.move_to_end(user_id)
+        return cached[1]
+
+    index = ChunkIndex(_collect_chat_chunks(db, user_id))
+    if key is not None:
+        _chat_index_cache[user_id] = (key, index)
+        _chat_index_cache.move_to_end(user_id)
+        while len(_chat_index_cache) > CHAT_INDEX_CACHE_SIZE:
+            _chat_index_cache.popitem(last=False)
+    return index
+
+
+def retrieve_chat_context(db, user_id: str, query: str) -> str:
+    """Top-k course-material passages relevant to the student's message, as a prompt section."""
+    if not query or not query.strip():
+        return ""
+    hits = get_chat_index(db, user_id).search(query)
+    if not hits:
+        return ""
+    parts = ["## Relevant Course Material (retrieved for this question — use these for specific details)"]
+    remaining = MAX_RETRIEVED_CONTEXT_LENGTH
+    for _, chunk in hits:
+        if remaining <= 0:
+            break
+        excerpt = chunk["text"][:remaining]
+        parts.append(f"[Source: {chunk['source']}]\n{excerpt}")
+        remaining -= len(excerpt)
+    return "\n\n".join(parts)
+
+
+ATTACHMENT_EXCERPT_TOP_K = 3  # passages of an earlier attachment re-sent on later turns
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars per token for English prose) — avoids a tokenizer dependency."""
+    return (len(text) + 3) // 4
+
+
+ATTACHMENT_HISTORY_STUB = " (file text not repeated — relevant excerpts are provided below when needed)"
+
+
+def _attachment_prompt_text(attachment: "ChatAttachment", current: bool) -> str:
+    """File text to send with the message that carries it: everything on the turn it was
+    uploaded, afterwards a fixed stub so the history prefix stays byte-stable across turns."""
+    if current:
+        return "\n" + attachment.text
+    return ATTACHMENT_HISTORY_STUB
+
+
+def _attachment_excerpts(attachment: "ChatAttachment", query: str) -> str:
+    """Passages of an earlier attachment relevant to the latest question, or "" if none."""
+    if not query or not query.strip():
+        return ""
+    index = ChunkIndex([
+        {"source": attachment.file_name, "text": part}
+        for part in split_text_into_chunks(attachment.text, CHAT_RETRIEVAL_CHUNK_SIZE)
+    ])
+    hits = index.search(query, ATTACHMENT_EXCERPT_TOP_K)
+    if not hits:
+        return ""
+    return f"[File: {attachment.file_name}]\n" + "\n...\n".join(chunk["text"] for _, chunk in hits)
+
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "4000"))
+CHAT_HISTORY_MAX_MESSAGES = 20  # verbatim turns sent at most, even when under budget
+CHAT_HISTORY_FETCH_LIMIT = 60  # unsummarized messages considered per turn
+CHAT_SUMMARY_MAX_TOKENS = 600
+
+
+def _split_history(token_counts: list[int], budget: int = CHAT_HISTORY_TOKEN_BUDGET) -> int:
+    """Given per-message token counts (oldest first), return how many of the oldest messages
+    to fold into the rolling summary. The newest message is always kept verbatim.
+
+    Nothing is folded while the newest CHAT_HISTORY_MAX_MESSAGES fit the budget. Once they
+    don't, history is folded down to half the budget (and, when the message cap is what
+    tripped, to half the cap) so the next few turns fit without another summarization call.
+    """
+    n = len(token_counts)
+    kept = 0
+    keep_from = n
+    for i in range(n - 1, -1, -1):
+        if n - i > CHAT_HISTORY_MAX_MESSAGES or (kept + token_counts[i] > budget and i < n - 1):
+            break
+        kept += token_counts[i]
+        keep_from = i
+    if keep_from == 0:
+        return 0
+    max_kept = CHAT_HISTORY_MAX_MESSAGES // 2 if n - keep_from >= CHAT_HISTORY_MAX_MESSAGES else n
+    while keep_from < n - 1 and (kept > budget // 2 or n - keep_from > max_kept):
+        kept -= token_counts[keep_from]
+        keep_from += 1
+    return keep_from
+
+
+async def _summarize_history(previous: Optional[str], turns: list[tuple[str, str]]) -> str:
+    """Fold older chat turns into the conversation's rolling summary."""
+    transcript = "\n\n".join(f"{role.upper()}: {content[:2000]}" for role, content in turns)
+    prompt = """You maintain a running summary of a tutoring chat between a student and ClassMate AI.
+Merge the earlier summary with the new turns into one concise summary (under 250 words).
+Keep topics covered, facts and explanations given, files the student shared, study sets created,
+open questions, and any preferences the student stated. Return only the summary text."""
+    response = await llm_chat("chat_history_summary",
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": f"Earlier summary:\n{previous or '(none)'}\n\nNew turns:\n{transcript}"},
+        ],
+        temperature=0.2,
+        max_tokens=CHAT_SUMMARY_MAX_TOKENS,
+    )
+    return response.choices[0].message.content.strip()
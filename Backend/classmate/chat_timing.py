@@ -0,0 +1,71 @@
+"""
+Per-stage latency of chat turns, as in-process Prometheus-style histograms (/metrics).
+
+send_chat_message times each stage of a turn (setup work before the stream, then the
+model stream, tools and the final save) into chat_stage_ms{stage=...}. The buckets are
+cumulative when rendered, the same way Prometheus histograms are.
+"""
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CHAT_STAGE_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# stage -> [observations per bucket (last one is +Inf)..., count, sum in ms]
+chat_stage_histograms: dict[str, list[float]] = {}
+
+
+def observe_chat_stage(stage: str, elapsed_ms: float) -> None:
+    hist = chat_stage_histograms.get(stage)
+    if hist is None:
+        hist = chat_stage_histograms[stage] = [0] * (len(CHAT_STAGE_BUCKETS_MS) + 3)
+    hist[bisect_left(CHAT_STAGE_BUCKETS_MS, elapsed_ms)] += 1
+    hist[-2] += 1
+    hist[-1] += elapsed_ms
+
+
+def chat_stage_metric_lines() -> list[str]:
+    """The chat_stage_ms histogram in Prometheus text format."""
+    if not chat_stage_histograms:
+        return []
+    lines = ["# TYPE chat_stage_ms histogram"]
+    for stage, hist in sorted(chat_stage_histograms.items()):
+        cumulative = 0
+        for bound, observed in zip([*CHAT_STAGE_BUCKETS_MS, "+Inf"], hist):
+            cumulative += observed
+            lines.append(f'chat_stage_ms_bucket{{stage="{stage}",le="{bound}"}} {cumulative:g}')
+        lines.append(f'chat_stage_ms_sum{{stage="{stage}"}} {hist[-1]:.1f}')
+        lines.append(f'chat_stage_ms_count{{stage="{stage}"}} {hist[-2]:g}')
+    return lines
+
+
+class ChatTurnTimer:
+    """Times the stages of one chat turn, from the moment the request arrived.
+
+    Stages are observed as they finish, so a turn that fails halfway still reports the
+    stages it got through; log() writes the whole turn on one line.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def observe(self, stage: str, started: float) -> None:
+        """Record `stage` as having run from `started` (a perf_counter value) until now."""
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stages[stage] = self.stages.get(stage, 0) + elapsed_ms
+        observe_chat_stage(stage, elapsed_ms)
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, started)
+
+    def log(self, conversation_id: str) -> None:
+        logger.info(f"[Chat] Turn timings for {conversation_id}: "
+                    + ", ".join(f"{stage} {ms:.0f}ms" for stage, ms in self.stages.items()))
@@ -0,0 +1,36 @@
+"""
+Splitting long text into model-sized chunks and packing short items into passages.
+"""
+
+
+def split_text_into_chunks(text: str, chunk_size: int = 12000) -> list[str]:
+    """Split text into chunks at paragraph/sentence boundaries."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            paragraph_break = text.rfind("\n\n", start, end)
+            if paragraph_break > start + chunk_size // 2:
+                end = paragraph_break
+            else:
+                sentence_break = text.rfind(". ", start, end)
+                if sentence_break > start + chunk_size // 2:
+                    end = sentence_break + 1
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+
+def _pack_items(items: list[str], size: int) -> list[str]:
+    """Group short items (cards, questions) into passages of roughly `size` chars."""
+    passages, current, current_len = [], [], 0
+    for item in items:
+        if current and current_len + len(item) > size:
+            passages.append("\n".join(current))
+            current, current_len = [], 0
+        current.append(item)
+        current_len += len(item) + 1
+    if current:
+        passages.append("\n".join(current))
+    return passages
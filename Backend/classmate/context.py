@@ -0,0 +1,10 @@
+"""
+Per-request state for code with no handle on the request (LLM usage attribution, quotas).
+"""
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import Request
+
+
+_current_request: ContextVar[Optional[Request]] = ContextVar("current_request", default=None)
@@ -0,0 +1,473 @@
+"""
+Database engine, session factory and ORM models.
+
+Importing this module opens no connection and creates no tables; main.run_migrations() owns the schema.
+"""
+from datetime import datetime
+import os
+import uuid
+
+from sqlalchemy import (
+    JSON, BigInteger, Boolean, Column, Date, DateTime, Float, ForeignKey, Integer, String, Text, create_engine,
+    event,
+)
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import relationship, sessionmaker
+
+
+# Database setup
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./railway.db")
+# Handle Railway's postgres:// vs postgresql://
+if DATABASE_URL.startswith("postgres://"):
+    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+
+# Use String for UUID to support both SQLite and Postgres
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+def _safe_db_url(url: str) -> str:
+    if "://" not in url:
+        return url
+    scheme, rest = url.split("://", 1)
+    if "@" in rest:
+        return f"{scheme}://****:****@{rest.split('@', 1)[1]}"
+    return url
+
+
+# Create engine with connection pooling to prevent connection exhaustion
+engine = create_engine(
+    DATABASE_URL,
+    connect_args=connect_args,
+    pool_size=20,             # Max 20 persistent connections
+    max_overflow=30,          # Max 30 additional connections (50 total)
+    pool_pre_ping=True,       # Check connections before using (prevents stale connections)
+    pool_recycle=3600,        # Recycle connections after 1 hour
+    echo=False                # Set to True for SQL query logging (debug only)
+)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+Base = declarative_base()
+
+
+def generate_uuid():
+    return str(uuid.uuid4())
+
+
+def generate_referral_code():
+    """Generate a short, unique referral code (8 chars)."""
+    return uuid.uuid4().hex[:8]
+
+
+# Database Models
+class Course(Base):
+    __tablename__ = "courses"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    code = Column(String)  # e.g., "FINC 313"
+    semester = Column(String)
+    start_date = Column(Date)
+    end_date = Column(Date)
+    course_info = Column(JSON, nullable=True)  # Stores extracted syllabus details (instructor, policies, etc.)
+    syllabus_text = Column(Text, nullable=True)  # Raw extracted syllabus text for granular policy/content queries
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    deadlines = relationship("Deadline", back_populates="course", cascade="all, delete-orphan")
+    flashcard_sets = relationship("FlashcardSet", back_populates="course", cascade="all, delete-orphan")
+    quizzes = relationship("Quiz", back_populates="course", cascade="all, delete-orphan")
+    summaries = relationship("Summary", back_populates="course", cascade="all, delete-orphan")
+
+
+class Deadline(Base):
+    __tablename__ = "deadlines"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False)
+    course_id = Column(String, ForeignKey("courses.id"), nullable=True)  # nullable for LMS-synced deadlines
+    date = Column(String)  # YYYY-MM-DD
+    time = Column(String)  # 11:59pm, etc.
+    type = Column(String)  # exam, assignment, quiz, project, reading, deadline
+    title = Column(String)
+    description = Column(Text)
+    recurring = Column(Boolean, default=False)
+    frequency = Column(String)  # weekly, biweekly, monthly, null
+    day_of_week = Column(String)  # Monday, Tuesday, etc.
+    completed = Column(Boolean, default=False)
+    source = Column(String, nullable=True, default="manual")  # "manual", "canvas", "ical"
+    external_id = Column(String, nullable=True)  # dedup key for synced items
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    course = relationship("Course", back_populates="deadlines")
+
+
+class FlashcardSet(Base):
+    __tablename__ = "flashcard_sets"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False)
+    course_id = Column(String, ForeignKey("courses.id"), nullable=False)
+    name = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    course = relationship("Course", back_populates="flashcard_sets")
+    flashcards = relationship("Flashcard", back_populates="flashcard_set", cascade="all, delete-orphan")
+
+
+class Flashcard(Base):
+    __tablename__ = "flashcards"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False)
+    flashcard_set_id = Column(String, ForeignKey("flashcard_sets.id"), nullable=False)
+    front = Column(Text, nullable=False)
+    back = Column(Text, nullable=False)
+    grade = Column(String, nullable=True)  # "known", "learning", or null
+    # Spaced-repetition schedule (see schedule_review); new cards are due immediately
+    ease = Column(Float, nullable=False, default=2.5)
+    interval_days = Column(Float, nullable=False, default=0)
+    repetitions = Column(Integer, nullable=False, default=0)
+    lapses = Column(Integer, nullable=False, default=0)
+    due_at = Column(DateTime, default=datetime.utcnow)
+    last_reviewed_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    flashcard_set = relationship("FlashcardSet", back_populates="flashcards")
+
+
+class Summary(Base):
+    __tablename__ = "summaries"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False)
+    course_id = Column(String, ForeignKey("courses.id"), nullable=False)
+    title = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    course = relationship("Course", back_populates="summaries")
+
+
+class User(Base):
+    __tablename__ = "users"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    email = Column(String, unique=True, nullable=False)
+    password_hash = Column(String, nullable=True)          # null for legacy Supabase-only accounts
+    password_changed_at = Column(DateTime, nullable=True)  # used to invalidate old tokens
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class UserProfile(Base):
+    __tablename__ = "user_profiles"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, unique=True, nullable=False)
+    email = Column(String, unique=True, nullable=False)
+    full_name = Column(String, nullable=True)
+    school_name = Column(String, nullable=True)
+    school_type = Column(String, nullable=True)
+    academic_year = Column(String, nullable=True)
+    major = Column(String, nullable=True)
+    profile_picture = Column(Text, nullable=True)
+    referral_code = Column(String, unique=True, nullable=True, default=generate_referral_code)
+    referred_by = Column(String, nullable=True)  # referral_code of the user who referred them
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Subscription / billing
+    subscription_tier = Column(String, nullable=False, default="free")  # "free" or "pro"
+    stripe_customer_id = Column(String, nullable=True, unique=True)
+    stripe_subscription_id = Column(String, nullable=True)
+    subscription_status = Column(String, nullable=True)  # "active", "canceled", "past_due", etc.
+    subscription_period_end = Column(DateTime, nullable=True)
+    ai_generations_used = Column(Integer, nullable=False, default=0)
+    ai_generations_reset_at = Column(DateTime, nullable=True)
+    has_completed_onboarding = Column(Boolean, nullable=False, default=False)
+    # Founding member: one-time $15 payment, permanent Pro-equivalent entitlements.
+    # Independent of subscription_tier — a founding member is never subscribed to anything.
+    founding_member = Column(Boolean, nullable=False, default=False)
+    # Chat usage tracking
+    chat_messages_used = Column(Integer, nullable=False, default=0)
+    chat_messages_reset_at = Column(DateTime, nullable=True)
+
+
+class CalendarEntry(Base):
+    """Tracks which deadlines have been saved to the user's calendar."""
+    __tablename__ = "calendar_entries"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    deadline_id = Column(String, ForeignKey("deadlines.id"), nullable=False, unique=True)
+    user_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    deadline = relationship("Deadline", backref="calendar_entry")
+
+
+class Quiz(Base):
+    """A quiz generated from study materials."""
+    __tablename__ = "quizzes"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False)
+    course_id = Column(String, ForeignKey("courses.id"), nullable=False)
+    name = Column(String, nullable=False)
+    # JSON list of questions in order with parsed options and answers, so a submission
+    # scores from one row. NULL = stale; rebuilt on next read (see quiz_answer_key)
+    answer_key = Column(Text, nullable=True)
+    # Bumped with every batch of new questions; a key built before the bump is never stored
+    question_version = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    course = relationship("Course", back_populates="quizzes")
+    questions = relationship("QuizQuestion", back_populates="quiz", cascade="all, delete-orphan")
+    attempts = relationship("QuizAttempt", back_populates="quiz", cascade="all, delete-orphan")
+
+
+class QuizQuestion(Base):
+    """A single question in a quiz."""
+    __tablename__ = "quiz_questions"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False)
+    quiz_id = Column(String, ForeignKey("quizzes.id"), nullable=False)
+    question = Column(Text, nullable=False)
+    options = Column(Text, nullable=False)  # JSON array stored as text
+    correct_answer = Column(String, nullable=False)  # A, B, C, or D
+    explanation = Column(Text)
+    order_num = Column(String, default="0")  # legacy string order; sorts "10" before "2"
+    position = Column(Integer, nullable=True)  # 0-based question order
+
+    quiz = relationship("Quiz", back_populates="questions")
+
+
+class QuizAttempt(Base):
+    """A scored quiz submission, kept for score history."""
+    __tablename__ = "quiz_attempts"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False)
+    quiz_id = Column(String, ForeignKey("quizzes.id"), nullable=False)
+    score = Column(Integer, nullable=False)
+    total = Column(Integer, nullable=False)
+    percentage = Column(Integer, nullable=False)
+    answers = Column(Text, nullable=True)  # JSON {question_id: letter}
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    quiz = relationship("Quiz", back_populates="attempts")
+
+
+class LMSConnection(Base):
+    __tablename__ = "lms_connections"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False, index=True)
+    provider = Column(String, nullable=False)  # "canvas" or "ical"
+    instance_url = Column(String, nullable=True)  # Canvas base URL
+    encrypted_token = Column(Text, nullable=True)  # Fernet-encrypted Canvas PAT
+    ical_url = Column(Text, nullable=True)  # raw iCal feed URL
+    last_synced = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Feedback(Base):
+    __tablename__ = "feedback"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_email = Column(String, nullable=False)
+    feedback_type = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ChatConversation(Base):
+    """A chat conversation between a user and the AI assistant."""
+    __tablename__ = "chat_conversations"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False, index=True)
+    title = Column(String, nullable=False, default="New Chat")
+    history_summary = Column(Text, nullable=True)  # rolling summary of turns folded out of the history budget
+    history_summary_until = Column(DateTime, nullable=True)  # created_at of the last folded message
+    briefing_date = Column(String, nullable=True)  # YYYY-MM-DD for the daily proactive briefing, else null
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    messages = relationship("ChatMessage", back_populates="conversation", cascade="all, delete-orphan")
+
+
+class ChatAttachment(Base):
+    """A file uploaded in chat, extracted once and referenced from messages by id.
+    Re-uploading identical bytes (same content_hash) reuses the row without re-extracting."""
+    __tablename__ = "chat_attachments"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False, index=True)
+    file_name = Column(String, nullable=False)
+    content_hash = Column(String, nullable=False)  # sha256 of the uploaded bytes
+    text = Column(Text, nullable=False)  # extracted text, truncated to MAX_FILE_CONTEXT_LENGTH
+    token_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ChatMessage(Base):
+    """A single message in a chat conversation."""
+    __tablename__ = "chat_messages"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    conversation_id = Column(String, ForeignKey("chat_conversations.id"), nullable=False, index=True)
+    role = Column(String, nullable=False)  # "user" or "assistant"
+    content = Column(Text, nullable=False)
+    created_study_set = Column(Text, nullable=True)  # JSON string: {type, id, name, count, course_name}
+    attachment_id = Column(String, ForeignKey("chat_attachments.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    conversation = relationship("ChatConversation", back_populates="messages")
+
+
+class NudgeFlag(Base):
+    """Queued nudge for the proactive opening message."""
+    __tablename__ = "nudge_flags"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=False, index=True)
+    reason = Column(String, nullable=False)  # "due_tomorrow", "no_materials"
+    course_id = Column(String, nullable=True)
+    deadline_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered = Column(Boolean, default=False)
+
+
+class RateLimitWindow(Base):
+    """Shared counter state for one rate limit key (see DatabaseRateLimitStorage)."""
+    __tablename__ = "rate_limit_windows"
+
+    key = Column(String, primary_key=True)
+    window_index = Column(BigInteger, nullable=False, default=0)  # floor(epoch / window length)
+    previous_count = Column(Integer, nullable=False, default=0)
+    current_count = Column(Integer, nullable=False, default=0)
+    expires_at = Column(Float, nullable=False)  # epoch seconds; rows past this are swept
+
+
+class SchemaVersion(Base):
+    """One applied schema migration (see SCHEMA_MIGRATIONS)."""
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobLease(Base):
+    """Time-limited lease electing the single worker that runs a background job."""
+    __tablename__ = "job_leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class JobRun(Base):
+    """One run of a batched background job, checkpointed so a restart resumes after `cursor`."""
+    __tablename__ = "job_runs"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    job = Column(String, nullable=False)
+    run_key = Column(String, nullable=False)  # e.g. the date a daily job is running for
+    status = Column(String, nullable=False, default="running")  # "running" or "complete"
+    cursor = Column(String, nullable=True)  # last key processed
+    batches = Column(Integer, nullable=False, default=0)
+    items_processed = Column(Integer, nullable=False, default=0)
+    rows_written = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    batch_log = relationship("JobRunBatch", back_populates="run", cascade="all, delete-orphan",
+                             order_by="JobRunBatch.batch_num")
+
+
+class JobRunBatch(Base):
+    """Timing and row counts for one checkpointed batch of a JobRun."""
+    __tablename__ = "job_run_batches"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    run_id = Column(String, ForeignKey("job_runs.id"), nullable=False)
+    batch_num = Column(Integer, nullable=False)
+    holder = Column(String, nullable=False)
+    items = Column(Integer, nullable=False, default=0)
+    rows_written = Column(Integer, nullable=False, default=0)
+    duration_ms = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    run = relationship("JobRun", back_populates="batch_log")
+
+
+class ChatContextSnapshot(Base):
+    """Materialized chat context per user (see get_chat_context).
+
+    `version` is bumped in the same transaction as any mutation that changes the context;
+    `built_version` is the version the cached `content` reflects. The snapshot is fresh
+    only while the two match, the format is current, and it was built today. `generation`
+    is new for every row, so a row deleted and recreated (account deletion, auth merge)
+    restarting at version 0 can't be mistaken for the old one by in-process caches.
+    """
+    __tablename__ = "chat_context_snapshots"
+
+    user_id = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    generation = Column(String, nullable=True, default=generate_uuid)
+    built_version = Column(Integer, nullable=True)
+    format_version = Column(Integer, nullable=True)
+    built_on = Column(String, nullable=True)  # YYYY-MM-DD — context embeds today's date
+    content = Column(Text, nullable=True)
+    built_at = Column(DateTime, nullable=True)
+
+
+class LLMUsage(Base):
+    """One OpenAI call: who, which feature, tokens, and latency. Written in batches by llm_chat()."""
+    __tablename__ = "llm_usage"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    user_id = Column(String, nullable=True, index=True)
+    feature = Column(String, nullable=False)  # call site label, e.g. "chat", "flashcards"
+    endpoint = Column(String, nullable=True)  # route path template
+    model = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="ok")  # "ok" or the exception class name
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# Models whose rows are rendered into the chat context — any insert/update/delete invalidates it
+_CHAT_CONTEXT_SOURCES = (Course, Deadline, Summary, FlashcardSet, Quiz)
+# Models that only contribute counts — inserts/deletes invalidate, updates (e.g. grading) don't
+_CHAT_CONTEXT_COUNTED = (Flashcard, QuizQuestion)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _invalidate_chat_context_on_flush(session, flush_context):
+    """Bump the chat context version for every user touched by this flush."""
+    user_ids = set()
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, _CHAT_CONTEXT_SOURCES + _CHAT_CONTEXT_COUNTED):
+            user_ids.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, _CHAT_CONTEXT_SOURCES) and session.is_modified(obj, include_collections=False):
+            user_ids.add(obj.user_id)
+    user_ids.discard(None)
+    if user_ids:
+        invalidate_chat_context(session, *user_ids)
+
+
+def invalidate_chat_context(db, *user_ids: str):
+    """Mark users' chat context snapshots stale. Call after bulk query.update()/delete() on
+    context source tables, which bypass the flush hook. Runs inside the caller's transaction."""
+    db.connection().execute(
+        ChatContextSnapshot.__table__.update()
+        .where(ChatContextSnapshot.user_id.in_(user_ids))
+        .values(version=ChatContextSnapshot.version + 1)
+    )
+
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,150 @@
+"""
+Text extraction from uploaded PDFs, DOCX files and images.
+"""
+import base64
+import io
+import os
+from typing import TYPE_CHECKING
+
+from fastapi import HTTPException
+
+from classmate.llm import llm_chat, _raise_if_openai_error
+
+if TYPE_CHECKING:
+    from docx.document import Document
+
+
+def extract_text_from_pdf(content: bytes) -> str:
+    import pdfplumber
+
+    try:
+        text = ""
+        with pdfplumber.open(io.BytesIO(content)) as pdf:
+            page_count = len(pdf.pages)
+            print(f"[DEBUG] PDF has {page_count} pages")
+            for i, page in enumerate(pdf.pages):
+                # Extract tables first, then remaining text — preserves column structure
+                page_text = ""
+                tables = page.extract_tables()
+                if tables:
+                    for table in tables:
+                        for row in table:
+                            page_text += " | ".join(cell or "" for cell in row) + "\n"
+                        page_text += "\n"
+                # extract_text with layout=True preserves column order better than default
+                prose = page.extract_text(layout=False) or ""
+                page_text += prose
+                text += page_text + "\n"
+                if i < 3:
+                    print(f"[DEBUG] Page {i+1} extracted {len(page_text)} characters")
+
+        if len(text.strip()) < 50:
+            print(f"[WARNING] PDF text extraction yielded only {len(text.strip())} characters")
+            raise HTTPException(
+                status_code=400,
+                detail="Unable to extract text from PDF. The file may be scanned, image-based, or password-protected. Please try a text-based PDF or use an image format instead."
+            )
+
+        print(f"[DEBUG] Total extracted text: {len(text)} characters")
+        return text
+    except HTTPException:
+        raise  # Re-raise our custom exception
+    except Exception as e:
+        print(f"[ERROR] PDF extraction failed: {str(e)}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to process PDF file: {str(e)}"
+        )
+
+
+def _iter_docx_block_items(doc: "Document"):
+    """Yield paragraphs and tables from a docx body in document order.
+    doc.paragraphs and doc.tables (used separately) lose interleaving and,
+    critically, doc.paragraphs skips table cell text entirely."""
+    from docx.oxml.table import CT_Tbl
+    from docx.oxml.text.paragraph import CT_P
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    for child in doc.element.body.iterchildren():
+        if isinstance(child, CT_P):
+            yield Paragraph(child, doc)
+        elif isinstance(child, CT_Tbl):
+            yield Table(child, doc)
+
+
+def extract_text_from_docx(content: bytes) -> str:
+    from docx import Document
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    try:
+        file_stream = io.BytesIO(content)
+        doc = Document(file_stream)
+
+        parts = []
+        table_count = 0
+        for block in _iter_docx_block_items(doc):
+            if isinstance(block, Paragraph):
+                if block.text.strip():
+                    parts.append(block.text)
+            elif isinstance(block, Table):
+                table_count += 1
+                for row in block.rows:
+                    cells = [cell.text.strip() for cell in row.cells]
+                    if any(cells):
+                        parts.append(" | ".join(cells))
+                parts.append("")
+        text = "\n".join(parts)
+
+        print(f"[DEBUG] DOCX has {len(doc.paragraphs)} paragraphs, {table_count} tables")
+        print(f"[DEBUG] Extracted {len(text)} characters from DOCX")
+
+        # Check if extraction was successful
+        if len(text.strip()) < 50:
+            raise HTTPException(
+                status_code=400,
+                detail="Unable to extract sufficient text from DOCX file. The file may be empty or corrupted."
+            )
+
+        return text
+    except HTTPException:
+        raise  # Re-raise our custom exception
+    except Exception as e:
+        print(f"[ERROR] DOCX extraction failed: {str(e)}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Failed to process DOCX file: {str(e)}"
+        )
+
+
+async def extract_text_from_image(content: bytes, filename: str) -> str:
+    """Use GPT-4o-mini vision to extract/transcribe text from an image of study material."""
+    if not os.getenv("OPENAI_API_KEY"):
+        raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured")
+
+    ext = filename.lower().split(".")[-1]
+    if ext == "jpg":
+        ext = "jpeg"
+    data_url = f"data:image/{ext};base64,{base64.b64encode(content).decode('utf-8')}"
+
+    try:
+        response = await llm_chat("image_ocr",
+            model="gpt-4o-mini",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Extract and transcribe ALL text, data, and information from this image of study material. Include all headings, paragraphs, tables, figures, equations, and any other content. Return the full text content as plain text."},
+                        {"type": "image_url", "image_url": {"url": data_url}}
+                    ],
+                }
+            ],
+            temperature=0.1,
+            max_tokens=4000
+        )
+    except Exception as e:
+        _raise_if_openai_error(e)
+        raise
+
+    return response.choices[0].message.content.strip()
@@ -0,0 +1,203 @@
+"""
+OpenAI client and LLM call instrumentation.
+
+The SDK is imported on first use, so importing this module is cheap and side-effect free.
+"""
+import asyncio
+from datetime import datetime
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from fastapi import HTTPException
+
+from classmate.context import _current_request
+from classmate.db import LLMUsage, SessionLocal, generate_uuid
+
+logger = logging.getLogger(__name__)
+
+
+class _LazyOpenAIClient:
+    """AsyncOpenAI built on first use: importing the SDK costs more than the rest of boot's
+    imports that /health needs, so it's deferred until a request (or _warm_imports) needs it."""
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import AsyncOpenAI
+                    self._client = AsyncOpenAI(**self._kwargs)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+
+def _is_openai_error(e: Exception, name: str) -> bool:
+    """isinstance(e, openai.<name>) without importing the SDK: if it was never loaded, no call
+    could have raised one of its errors."""
+    sdk = sys.modules.get("openai")
+    return sdk is not None and isinstance(e, getattr(sdk, name))
+
+
+# Initialize OpenAI client
+client = _LazyOpenAIClient(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def _raise_if_openai_error(e: Exception) -> None:
+    """If *e* is a known OpenAI SDK error, raise an HTTPException with a
+    clear, user-facing message and log it so Railway picks it up.
+    For anything else, do nothing — let the caller handle it."""
+    if _is_openai_error(e, "AuthenticationError"):
+        logger.error("[OpenAI] Authentication error — API key is invalid or revoked: %s", e)
+        raise HTTPException(status_code=503, detail="AI service is temporarily unavailable. Please try again later.")
+    if _is_openai_error(e, "RateLimitError"):
+        logger.warning("[OpenAI] Rate-limit hit: %s", e)
+        raise HTTPException(status_code=503, detail="AI service is busy right now. Please wait a moment and try again.")
+    if _is_openai_error(e, "APIStatusError"):
+        logger.error("[OpenAI] API error (status %s): %s", e.status_code, e)
+        raise HTTPException(status_code=503, detail="AI service returned an error. Please try again later.")
+
+
+# ── LLM call instrumentation ─────────────────────────────────────────────────
+# Every OpenAI call goes through llm_chat(), which records tokens (prompt, completion,
+# cached) and latency per feature into in-process Prometheus-style counters (/metrics)
+# and, batched, into the llm_usage table (/admin/usage).
+
+
+LLM_USAGE_FLUSH_SIZE = 20  # buffered rows per DB write
+LLM_USAGE_FLUSH_INTERVAL = 10.0  # seconds — flush sooner if traffic is light
+_llm_usage_buffer: list[dict] = []
+_llm_usage_lock = threading.Lock()
+_llm_usage_last_flush = time.monotonic()
+# (metric, feature, model, status) -> value
+llm_counters: dict[tuple[str, str, str, str], float] = {}
+
+
+def flush_llm_usage() -> int:
+    """Write buffered LLM usage rows in one executemany. Returns the number written."""
+    global _llm_usage_buffer, _llm_usage_last_flush
+    with _llm_usage_lock:
+        rows, _llm_usage_buffer = _llm_usage_buffer, []
+        _llm_usage_last_flush = time.monotonic()
+    if not rows:
+        return 0
+    db = SessionLocal()
+    try:
+        db.execute(LLMUsage.__table__.insert(), rows)
+        db.commit()
+    except Exception as e:
+        logger.error(f"[LLM] Failed to persist {len(rows)} usage rows: {e}")
+        return 0
+    finally:
+        db.close()
+    return len(rows)
+
+
+def _record_llm_call(feature: str, model: str, usage, latency_ms: float, status: str, user_id: Optional[str]) -> None:
+    prompt = completion = cached = 0
+    if usage is not None:
+        prompt = usage.prompt_tokens or 0
+        completion = usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+    endpoint = None
+    request = _current_request.get()
+    if request is not None:
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", None) or request.url.path
+        user_id = user_id or getattr(request.state, "user_id", None)
+
+    labels = (feature, model, status)
+    for metric, value in (
+        ("llm_requests_total", 1),
+        ("llm_prompt_tokens_total", prompt),
+        ("llm_completion_tokens_total", completion),
+        ("llm_cached_tokens_total", cached),
+        ("llm_latency_ms_sum", latency_ms),
+    ):
+        key = (metric, *labels)
+        llm_counters[key] = llm_counters.get(key, 0) + value
+
+    logger.info(
+        f"[LLM] {feature} {model} {status}: {prompt} prompt ({cached} cached) + {completion} completion tokens "
+        f"in {latency_ms:.0f}ms"
+    )
+    with _llm_usage_lock:
+        _llm_usage_buffer.append({
+            "id": generate_uuid(),
+            "user_id": user_id,
+            "feature": feature,
+            "endpoint": endpoint,
+            "model": model,
+            "status": status,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "cached_tokens": cached,
+            "latency_ms": int(latency_ms),
+            "created_at": datetime.utcnow(),
+        })
+        due = (
+            len(_llm_usage_buffer) >= LLM_USAGE_FLUSH_SIZE
+            or time.monotonic() - _llm_usage_last_flush >= LLM_USAGE_FLUSH_INTERVAL
+        )
+    if due:
+        try:
+            asyncio.get_running_loop().run_in_executor(None, flush_llm_usage)
+        except RuntimeError:
+            flush_llm_usage()
+
+
+class _InstrumentedStream:
+    """Wraps a streaming completion: passes content chunks through, swallows the final
+    usage-only chunk, and records the call once the stream ends (or fails)."""
+
+    def __init__(self, stream, feature: str, model: str, started: float, user_id: Optional[str]):
+        self._stream = stream
+        self._feature = feature
+        self._model = model
+        self._started = started
+        self._user_id = user_id
+
+    async def __aiter__(self):
+        usage = None
+        status = "ok"
+        try:
+            async for chunk in self._stream:
+                if not chunk.choices:
+                    usage = chunk.usage
+                    continue
+                yield chunk
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            latency_ms = (time.perf_counter() - self._started) * 1000
+            _record_llm_call(self._feature, self._model, usage, latency_ms, status, self._user_id)
+
+
+async def llm_chat(feature: str, *, user_id: Optional[str] = None, **kwargs):
+    """Instrumented client.chat.completions.create. `feature` labels the call site for
+    usage rollups; the user is taken from the current request unless passed explicitly."""
+    model = kwargs.get("model", "")
+    if kwargs.get("stream"):
+        kwargs.setdefault("stream_options", {"include_usage": True})
+    started = time.perf_counter()
+    try:
+        response = await client.chat.completions.create(**kwargs)
+    except Exception as e:
+        _record_llm_call(feature, model, None, (time.perf_counter() - started) * 1000, type(e).__name__, user_id)
+        raise
+    if kwargs.get("stream"):
+        return _InstrumentedStream(response, feature, model, started, user_id)
+    _record_llm_call(feature, model, response.usage, (time.perf_counter() - started) * 1000, "ok", user_id)
+    return response
@@ -0,0 +1,446 @@
+"""
+LMS sync: fetching Canvas and iCal feeds and applying them to a user's deadlines.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+import logging
+import os
+import re
+import time
+
+from cryptography.fernet import Fernet
+from fastapi import HTTPException
+import httpx
+
+from classmate.db import Course, Deadline, LMSConnection
+
+logger = logging.getLogger(__name__)
+
+
+ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "")
+fernet = Fernet(ENCRYPTION_KEY.encode()) if ENCRYPTION_KEY else None
+
+
+def encrypt_token(plain: str) -> str:
+    if not fernet:
+        raise HTTPException(status_code=500, detail="Encryption not configured")
+    return fernet.encrypt(plain.encode()).decode()
+
+
+def decrypt_token(encrypted: str) -> str:
+    if not fernet:
+        raise HTTPException(status_code=500, detail="Encryption not configured")
+    return fernet.decrypt(encrypted.encode()).decode()
+
+
+# ── LMS Sync Logic ──────────────────────────────────────────────────────────
+
+def _normalize(text: str) -> str:
+    """Normalize text for course matching: lowercase, strip separators to spaces."""
+    return re.sub(r'[\s\-_.,/]+', ' ', text.lower().strip())
+
+
+def _extract_course_codes(text: str) -> list[str]:
+    """Extract course code patterns like FINC315, FINC-315, FINC 315, etc.
+    Returns normalized codes like 'finc 315'."""
+    # Match 2-4 letter dept code + optional separator + 3-4 digit number
+    patterns = re.findall(r'([a-zA-Z]{2,4})[\s\-_./]*(\d{3,4})', text)
+    return [f"{dept.lower()} {num}" for dept, num in patterns]
+
+
+class CourseMatcher:
+    """Per-sync index over a user's courses for matching LMS items.
+
+    Course names/codes are normalized and their course codes extracted once
+    when the matcher is built, instead of once per LMS item. Exact-code and
+    extracted-code hits are dict lookups; only the substring rules still walk
+    the (precomputed) course list, and only up to the earliest dict hit.
+
+    Match semantics are identical to the original per-item loop: courses are
+    considered in the order given, the first course satisfying an exact code,
+    extracted-code, or code-substring rule wins, and otherwise the longest
+    name-substring match is returned.
+    """
+
+    def __init__(self, user_courses=()):
+        self._entries: list[tuple[str, str, str]] = []  # (course_id, norm_name, norm_code)
+        self._by_code: dict[str, int] = {}              # norm_code -> first course position
+        self._by_extracted: dict[str, int] = {}         # extracted code -> first course position
+        for uc in user_courses:
+            self.add(uc)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, course) -> None:
+        """Index a course (e.g. one auto-created mid-sync) after the existing ones."""
+        pos = len(self._entries)
+        uc_name = _normalize(course.name or "")
+        uc_code = _normalize(course.code or "")
+        self._entries.append((course.id, uc_name, uc_code))
+        if uc_code:
+            self._by_code.setdefault(uc_code, pos)
+        for code in _extract_course_codes(course.code or "") + _extract_course_codes(course.name or ""):
+            self._by_extracted.setdefault(code, pos)
+
+    def match(self, lms_text: str, lms_code: str) -> str | None:
+        """Return the matched course_id for an LMS item, or None."""
+        norm_text = _normalize(lms_text)
+        norm_code = _normalize(lms_code)
+
+        # Score 1 + 2 via the index: earliest course with an exact normalized code
+        # match or an overlapping extracted course code.
+        first_hit = len(self._entries)
+        if norm_code:
+            first_hit = min(first_hit, self._by_code.get(norm_code, first_hit))
+        for code in _extract_course_codes(lms_text) + _extract_course_codes(lms_code):
+            first_hit = min(first_hit, self._by_extracted.get(code, first_hit))
+
+        best_match = None
+        best_score = 0
+
+        # Score 3 can still win for a course that precedes the first indexed hit;
+        # Score 4 only matters when nothing in Score 1-3 matched at all.
+        for course_id, uc_name, uc_code in self._entries[:first_hit]:
+            # Score 3: Normalized code appears in normalized text or vice-versa
+            if uc_code and len(uc_code) > 2:
+                if uc_code in norm_text or uc_code in norm_code:
+                    return course_id
+                if norm_code and norm_code in uc_code:
+                    return course_id
+
+            # Score 4: Course name substring match (both directions, min length to avoid false positives)
+            if uc_name and len(uc_name) > 3:
+                if uc_name in norm_text or norm_text in uc_name:
+                    # Prefer longer matches
+                    match_len = min(len(uc_name), len(norm_text))
+                    if match_len > best_score:
+                        best_score = match_len
+                        best_match = course_id
+
+        if first_hit < len(self._entries):
+            return self._entries[first_hit][0]
+        return best_match
+
+
+def _match_course(lms_text: str, lms_code: str, user_courses) -> str | None:
+    """Try to match LMS course name/code against the user's ClassMate courses.
+    Uses normalized text comparison and course code extraction for robust matching.
+    Returns the matched course_id or None.
+
+    One-off helper — sync loops should build a CourseMatcher once and reuse it."""
+    return CourseMatcher(user_courses).match(lms_text, lms_code)
+
+
+def fetch_canvas(connection) -> tuple[list[dict] | None, list[str]]:
+    """Network phase of a Canvas sync — no DB access, safe to run in a worker thread.
+    Returns ([{"course": <canvas course>, "assignments": [...] | None}], errors)."""
+    errors = []
+    fetched = []
+    token = decrypt_token(connection.encrypted_token)
+    base = connection.instance_url.rstrip("/")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with httpx.Client(timeout=30.0) as client:
+        # Fetch active courses
+        courses_resp = client.get(f"{base}/api/v1/courses", params={"enrollment_state": "active", "per_page": 100}, headers=headers)
+        if courses_resp.status_code != 200:
+            errors.append(f"Failed to fetch Canvas courses: {courses_resp.status_code}")
+            return None, errors
+
+        for course in courses_resp.json():
+            course_name = course.get("name", "Unknown Course")
+            assignments = None
+            try:
+                assignments_resp = client.get(
+                    f"{base}/api/v1/courses/{course.get('id')}/assignments",
+                    params={"order_by": "due_at", "per_page": 100},
+                    headers=headers,
+                )
+                if assignments_resp.status_code != 200:
+                    errors.append(f"Failed to fetch assignments for course {course_name}")
+                else:
+                    assignments = assignments_resp.json()
+            except Exception as e:
+                errors.append(f"Error syncing course {course_name}: {str(e)}")
+            fetched.append({"course": course, "assignments": assignments})
+
+    return fetched, errors
+
+
+def apply_canvas(connection, fetched: list[dict], user_id: str, db, matcher: "CourseMatcher", existing_by_ext: dict) -> tuple[int, list[str]]:
+    """DB phase of a Canvas sync: upsert fetched assignments into deadlines, auto-creating courses.
+    Canvas provides structured course names and codes, so auto-creation is reliable here.
+    Does not commit — the caller owns the transaction."""
+    synced = 0
+    errors = []
+
+    for item in fetched:
+        course = item["course"]
+        course_name = course.get("name", "Unknown Course")
+        course_code = course.get("course_code", "")
+        matched_course_id = matcher.match(course_name, course_code)
+
+        # Auto-create course if no match found
+        if not matched_course_id and course_name != "Unknown Course":
+            # Build a clean code from Canvas course_code (e.g. "FINC-315-001-2025SP" → "FINC 315")
+            extracted = _extract_course_codes(course_code or course_name)
+            clean_code = extracted[0].upper() if extracted else course_code
+            new_course = Course(
+                user_id=user_id,
+                name=course_name,
+                code=clean_code,
+            )
+            db.add(new_course)
+            db.flush()  # Get the generated ID
+            matched_course_id = new_course.id
+            matcher.add(new_course)  # So subsequent matches can find it
+            logger.info(f"[LMS] Auto-created course: {clean_code} — {course_name}")
+
+        if item["assignments"] is None:
+            continue
+
+        try:
+            for assignment in item["assignments"]:
+                due_at = assignment.get("due_at")
+                if not due_at:
+                    continue
+
+                ext_id = f"canvas_{assignment['id']}"
+                # Parse due_at (ISO 8601)
+                try:
+                    dt = datetime.fromisoformat(due_at.replace("Z", "+00:00"))
+                    deadline_date = dt.strftime("%Y-%m-%d")
+                    deadline_time = dt.strftime("%I:%M %p").lstrip("0")
+                except (ValueError, AttributeError):
+                    continue
+
+                # Upsert
+                existing = existing_by_ext.get(ext_id)
+
+                if existing:
+                    existing.title = assignment.get("name", "Untitled")
+                    existing.date = deadline_date
+                    existing.time = deadline_time
+                    existing.description = f"[{course_name}] {assignment.get('description', '') or ''}"[:500]
+                    # Auto-match course if not already assigned
+                    if not existing.course_id and matched_course_id:
+                        existing.course_id = matched_course_id
+                else:
+                    deadline = Deadline(
+                        user_id=user_id,
+                        course_id=matched_course_id,
+                        date=deadline_date,
+                        time=deadline_time,
+                        type="assignment",
+                        title=assignment.get("name", "Untitled"),
+                        description=f"[{course_name}] {assignment.get('description', '') or ''}"[:500],
+                        source="canvas",
+                        external_id=ext_id,
+                    )
+                    db.add(deadline)
+                    existing_by_ext[ext_id] = deadline
+                synced += 1
+
+        except Exception as e:
+            errors.append(f"Error syncing course {course_name}: {str(e)}")
+
+    connection.last_synced = datetime.utcnow()
+    return synced, errors
+
+
+def fetch_ical(connection) -> tuple[list[dict] | None, list[str]]:
+    """Network phase of an iCal sync — fetches and parses the feed without touching the DB.
+    Returns ([{"uid", "summary", "description", "location", "categories", "dt"}], errors)."""
+    from icalendar import Calendar as ICalCalendar
+
+    errors = []
+    events = []
+
+    with httpx.Client(timeout=30.0) as http_client:
+        resp = http_client.get(connection.ical_url)
+    if resp.status_code != 200:
+        errors.append(f"Failed to fetch iCal feed: {resp.status_code}")
+        return None, errors
+
+    cal = ICalCalendar.from_ical(resp.text)
+    for component in cal.walk():
+        if component.name != "VEVENT":
+            continue
+
+        uid = str(component.get("UID", ""))
+        if not uid:
+            continue
+
+        # Parse DTSTART
+        dtstart = component.get("DTSTART")
+        if not dtstart:
+            continue
+
+        events.append({
+            "uid": uid,
+            "summary": str(component.get("SUMMARY", "Untitled")),
+            "description": str(component.get("DESCRIPTION", ""))[:500],
+            "location": str(component.get("LOCATION", "")),
+            "categories": str(component.get("CATEGORIES", "")),
+            "dt": dtstart.dt,
+        })
+
+    return events, errors
+
+
+def apply_ical(connection, events: list[dict], user_id: str, db, matcher: "CourseMatcher", existing_by_ext: dict) -> tuple[int, list[str]]:
+    """DB phase of an iCal sync: upsert parsed events into deadlines, matching against existing courses.
+    Does not commit — the caller owns the transaction."""
+    synced = 0
+
+    for event in events:
+        uid = event["uid"]
+        ext_id = f"ical_{uid}"
+        summary = event["summary"]
+        description = event["description"]
+
+        # Try to match against user's existing courses
+        all_text = f"{summary} {description} {event['location']} {event['categories']} {uid}"
+        matched_course_id = matcher.match(all_text, "")
+
+        dt_val = event["dt"]
+        if isinstance(dt_val, datetime):
+            deadline_date = dt_val.strftime("%Y-%m-%d")
+            deadline_time = dt_val.strftime("%I:%M %p").lstrip("0")
+        elif isinstance(dt_val, date):
+            deadline_date = dt_val.strftime("%Y-%m-%d")
+            deadline_time = None
+        else:
+            continue
+
+        # Upsert
+        existing = existing_by_ext.get(ext_id)
+
+        if existing:
+            existing.title = summary
+            existing.date = deadline_date
+            existing.time = deadline_time
+            existing.description = description
+            # Auto-match course if not already assigned
+            if not existing.course_id and matched_course_id:
+                existing.course_id = matched_course_id
+        else:
+            deadline = Deadline(
+                user_id=user_id,
+                course_id=matched_course_id,
+                date=deadline_date,
+                time=deadline_time,
+                type="assignment",
+                title=summary,
+                description=description,
+                source="ical",
+                external_id=ext_id,
+            )
+            db.add(deadline)
+            existing_by_ext[ext_id] = deadline
+        synced += 1
+
+    connection.last_synced = datetime.utcnow()
+    return synced, []
+
+
+LMS_FETCHERS = {"canvas": fetch_canvas, "ical": fetch_ical}
+LMS_APPLIERS = {"canvas": apply_canvas, "ical": apply_ical}
+LMS_SYNC_MAX_WORKERS = 8
+
+
+def _load_synced_deadlines(db, user_id: str) -> dict:
+    """Map external_id -> Deadline for every LMS-synced deadline the user already has (one query)."""
+    rows = db.query(Deadline).filter(Deadline.user_id == user_id, Deadline.external_id.isnot(None)).all()
+    return {d.external_id: d for d in rows}
+
+
+def _fetch_connection(conn_obj) -> dict:
+    """Run one connection's network fetch, capturing errors and timing instead of raising."""
+    started = time.perf_counter()
+    fetcher = LMS_FETCHERS.get(conn_obj.provider)
+    if not fetcher:
+        data, errors = None, [f"Unknown provider: {conn_obj.provider}"]
+    else:
+        try:
+            data, errors = fetcher(conn_obj)
+        except Exception as e:
+            label = "Canvas" if conn_obj.provider == "canvas" else "iCal"
+            data, errors = None, [f"{label} sync error: {str(e)}"]
+    return {"data": data, "errors": errors, "fetch_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+def _sync_connections(connections: list, user_id: str, db) -> tuple[int, list[str], list[dict]]:
+    """Fetch every connection concurrently, then apply all changes in one transaction.
+
+    Network latency is paid once (the slowest feed) instead of summed across feeds.
+    The DB phase runs sequentially on the request's session so auto-created Canvas
+    courses are visible to later iCal matching, exactly as in a sequential sync.
+    Each connection applies inside a savepoint, so one that fails is rolled back
+    without losing the others.
+    Returns (total_synced, errors, per-connection timing breakdown).
+    """
+    if not connections:
+        return 0, [], []
+
+    if len(connections) == 1:
+        fetched = [_fetch_connection(connections[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(connections), LMS_SYNC_MAX_WORKERS)) as pool:
+            fetched = list(pool.map(_fetch_connection, connections))
+
+    matcher = CourseMatcher(db.query(Course).filter(Course.user_id == user_id).all())
+    existing_by_ext = _load_synced_deadlines(db, user_id)
+
+    total_synced = 0
+    all_errors = []
+    breakdown = []
+    for conn_obj, result in zip(connections, fetched):
+        started = time.perf_counter()
+        count = 0
+        errs = list(result["errors"])
+        if result["data"] is not None:
+            try:
+                # Savepoint per connection: a failing applier loses only its own changes
+                with db.begin_nested():
+                    count, apply_errs = LMS_APPLIERS[conn_obj.provider](conn_obj, result["data"], user_id, db, matcher, existing_by_ext)
+                errs.extend(apply_errs)
+            except Exception as e:
+                count = 0
+                errs.append(f"Error applying {conn_obj.provider} sync: {str(e)}")
+                # The caches may hold rows the rollback just discarded; rebuild them from the DB
+                matcher = CourseMatcher(db.query(Course).filter(Course.user_id == user_id).all())
+                existing_by_ext = _load_synced_deadlines(db, user_id)
+        total_synced += count
+        all_errors.extend(errs)
+        breakdown.append({
+            "connection_id": conn_obj.id,
+            "provider": conn_obj.provider,
+            "synced_count": count,
+            "errors": errs,
+            "fetch_ms": result["fetch_ms"],
+            "apply_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    db.commit()
+    return total_synced, all_errors, breakdown
+
+
+def sync_canvas(connection, user_id: str, db):
+    """Sync assignments from Canvas LMS into deadlines, auto-creating courses."""
+    synced, errors, _ = _sync_connections([connection], user_id, db)
+    return synced, errors
+
+
+def sync_ical(connection, user_id: str, db):
+    """Sync events from an iCal feed into deadlines, matching against existing courses."""
+    synced, errors, _ = _sync_connections([connection], user_id, db)
+    return synced, errors
+
+
+def sync_all_connections(user_id: str, db):
+    """Sync all LMS connections for a user.
+    Returns (total_synced, errors, per-connection timing breakdown)."""
+    connections = db.query(LMSConnection).filter(LMSConnection.user_id == user_id).all()
+    return _sync_connections(connections, user_id, db)
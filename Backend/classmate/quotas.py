@@ -0,0 +1,267 @@
+"""
+Subscription tiers, chat message limits and AI generation quotas.
+"""
+from datetime import datetime, timedelta
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import case, func, or_
+
+from classmate.context import _current_request
+from classmate.db import SessionLocal, UserProfile
+
+
+# ── Subscription tier constants ──
+FREE_AI_GENERATION_LIMIT = 50
+GRANDFATHER_CUTOFF = "2025-01-01T00:00:00"  # Moved to past date - no more grandfathering
+FOUNDING_MEMBER_PRICE_LOOKUP_KEY = "classmate_founding_member"  # one-time $15 Stripe Price
+
+# Emails that always get Pro access regardless of subscription status
+ALWAYS_PRO_EMAILS: set[str] = {
+    "leporatiar@g.cofc.edu",
+    "mccammono1@g.cofc.edu",
+    "bodnari@g.cofc.edu",
+}
+
+
+def _effective_tier(profile) -> str:
+    """Return the effective tier, accounting for always-pro overrides.
+
+    Founding members and ALWAYS_PRO_EMAILS both resolve to "pro" here — this is the
+    single choke point every entitlement check goes through, so treating either as
+    pro here is what makes them pro everywhere (generation limits, chat limits, etc).
+    """
+    if profile and profile.email and profile.email.lower() in ALWAYS_PRO_EMAILS:
+        return "pro"
+    if profile and profile.founding_member:
+        return "pro"
+    return profile.subscription_tier if profile else "free"
+
+
+FREE_CHAT_MESSAGE_LIMIT = 20  # Per week, free tier
+PRO_CHAT_MESSAGE_LIMIT = 50   # Per week, pro tier
+
+
+# ── Quotas ───────────────────────────────────────────────────────────────────
+# Check-and-increment is one conditional UPDATE ... RETURNING per request, with the
+# weekly (chat) / monthly (AI generation) window reset folded into the same statement,
+# so two concurrent requests can't both pass a check at used == limit - 1.
+# AI generations are reserved up front by check_tier_limit() and settled by
+# increment_ai_generation() once something was created; a reservation the request
+# never settles (it failed) is refunded by request_context_middleware.
+# Pro users have no generation limit; once seen they are remembered in-process for
+# PRO_TIER_CACHE_SECONDS and skip the database entirely.
+
+PRO_TIER_CACHE_SECONDS = 60
+_pro_tier_cache: dict[str, float] = {}  # user_id -> monotonic expiry
+
+
+def _is_pro_sql():
+    """SQL twin of `_effective_tier(profile) == "pro"` over user_profiles."""
+    return or_(
+        UserProfile.subscription_tier == "pro",
+        UserProfile.founding_member == True,
+        func.lower(UserProfile.email).in_(ALWAYS_PRO_EMAILS),
+    )
+
+
+def _cached_pro(user_id: str) -> bool:
+    expires = _pro_tier_cache.get(user_id)
+    if expires is None:
+        return False
+    if expires < time.monotonic():
+        _pro_tier_cache.pop(user_id, None)
+        return False
+    return True
+
+
+def remember_tier(user_id: str, tier: str):
+    """Record a user's effective tier in the pro cache (call wherever the tier changes)."""
+    if tier == "pro":
+        _pro_tier_cache[user_id] = time.monotonic() + PRO_TIER_CACHE_SECONDS
+    else:
+        _pro_tier_cache.pop(user_id, None)
+
+
+def _chat_usage(profile, now: datetime) -> tuple[int, int, datetime]:
+    """(used, limit, resets_at) for the user's current weekly chat window."""
+    limit = PRO_CHAT_MESSAGE_LIMIT if _effective_tier(profile) == "pro" else FREE_CHAT_MESSAGE_LIMIT
+    reset_at = profile.chat_messages_reset_at
+    if not reset_at or now - reset_at >= timedelta(days=7):
+        return 0, limit, now + timedelta(days=7)
+    return profile.chat_messages_used or 0, limit, reset_at + timedelta(days=7)
+
+
+def _chat_limit_error(used: int, limit: int, resets_at: datetime) -> HTTPException:
+    return HTTPException(
+        status_code=403,
+        detail={
+            "error": "limit_reached",
+            "limit_type": "chat_messages",
+            "used": used,
+            "max": limit,
+            "resets_at": resets_at.isoformat(),
+            "message": f"You've used all {limit} chat messages this week. Your limit resets on {resets_at.strftime('%B %d, %Y')}.",
+        },
+    )
+
+
+def check_chat_limit(db, user_id: str):
+    """Check if user can send a chat message, without counting one (see consume_chat_message).
+
+    Free users get FREE_CHAT_MESSAGE_LIMIT messages per week.
+    Pro users get PRO_CHAT_MESSAGE_LIMIT messages per week.
+    Raises HTTPException(403) with structured JSON if limit reached.
+    """
+    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="User profile not found")
+    used, limit, resets_at = _chat_usage(profile, datetime.utcnow())
+    if used >= limit:
+        raise _chat_limit_error(used, limit, resets_at)
+
+
+def consume_chat_message(db, user_id: str):
+    """Count one chat message against the weekly limit in a single conditional UPDATE.
+
+    Starts a new window if the last one is over a week old. Does not commit: the increment
+    belongs to the caller's transaction and is rolled back if the message isn't saved.
+    Raises HTTPException(403) at the limit and 404 without a profile.
+    """
+    now = datetime.utcnow()
+    reset_at = UserProfile.chat_messages_reset_at
+    expired = or_(reset_at.is_(None), reset_at <= now - timedelta(days=7))
+    used = func.coalesce(UserProfile.chat_messages_used, 0)
+    limit = case((_is_pro_sql(), PRO_CHAT_MESSAGE_LIMIT), else_=FREE_CHAT_MESSAGE_LIMIT)
+    row = db.execute(
+        UserProfile.__table__.update()
+        .where(UserProfile.user_id == user_id, or_(expired, used < limit))
+        .values(
+            chat_messages_used=case((expired, 1), else_=used + 1),
+            chat_messages_reset_at=case((expired, now), else_=reset_at),
+        )
+        .returning(UserProfile.chat_messages_used)
+    ).first()
+    if row is None:
+        profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="User profile not found")
+        raise _chat_limit_error(*_chat_usage(profile, now))
+
+
+def _charge_ai_generations(db, user_id: str, count: int, limit: int | None = None) -> bool:
+    """Add `count` to a non-pro user's monthly generation counter in one UPDATE ... RETURNING,
+    restarting the counter on the first charge of a new month. With `limit`, charges only if
+    the total stays within it. Commits; returns whether the user was charged."""
+    now = datetime.utcnow()
+    reset_at = UserProfile.ai_generations_reset_at
+    expired = or_(reset_at.is_(None), reset_at < datetime(now.year, now.month, 1))
+    used = func.coalesce(UserProfile.ai_generations_used, 0)
+    conditions = [UserProfile.user_id == user_id, ~_is_pro_sql()]
+    if limit is not None:
+        conditions.append(or_(expired, used + count <= limit))
+    row = db.execute(
+        UserProfile.__table__.update()
+        .where(*conditions)
+        .values(
+            ai_generations_used=case((expired, count), else_=used + count),
+            ai_generations_reset_at=case((expired, now), else_=reset_at),
+        )
+        .returning(UserProfile.ai_generations_used)
+    ).first()
+    db.commit()
+    return row is not None
+
+
+def _refund_ai_generations(db, user_id: str, count: int):
+    used = func.coalesce(UserProfile.ai_generations_used, 0)
+    db.execute(
+        UserProfile.__table__.update()
+        .where(UserProfile.user_id == user_id)
+        .values(ai_generations_used=case((used > count, used - count), else_=0))
+    )
+    db.commit()
+
+
+def _ai_reservation(db) -> tuple[str | None, int]:
+    """(user_id, count) reserved by check_tier_limit() and not yet settled. Kept on the request
+    state so the refund middleware and streaming generators see it, or on the session when
+    called outside a request."""
+    request = _current_request.get()
+    if request is not None:
+        return getattr(request.state, "ai_generation_reservation", (None, 0))
+    return db.info.get("ai_generation_reservation", (None, 0)) if db is not None else (None, 0)
+
+
+def _set_ai_reservation(db, reservation: tuple[str | None, int]):
+    request = _current_request.get()
+    if request is not None:
+        request.state.ai_generation_reservation = reservation
+    elif db is not None:
+        db.info["ai_generation_reservation"] = reservation
+
+
+def _take_ai_reservation(db, user_id: str) -> int:
+    reserved_user, reserved = _ai_reservation(db)
+    if reserved_user != user_id:
+        return 0
+    _set_ai_reservation(db, (None, 0))
+    return reserved
+
+
+def release_ai_generation_reservation(user_id: str, db=None):
+    """Refund a generation reserved by check_tier_limit() that this request won't use."""
+    reserved = _take_ai_reservation(db, user_id)
+    if reserved:
+        refund_db = SessionLocal()
+        try:
+            _refund_ai_generations(refund_db, user_id, reserved)
+        finally:
+            refund_db.close()
+
+
+def check_tier_limit(db, user_id: str, check_type: str, count: int = 1):
+    """Check if user can perform the action under their tier.
+
+    check_type: "course" or "ai_generation"
+    For "ai_generation", `count` of a free user's generations are reserved atomically here
+    (all or none, within the limit) and settled by increment_ai_generation(), which refunds
+    what the request didn't use. Raises HTTPException(403) with structured JSON if limit reached.
+    """
+    if check_type == "course":
+        # Courses are unlimited on all tiers — no limit check needed
+        return
+
+    elif check_type == "ai_generation":
+        # Pro users have no limits
+        if _cached_pro(user_id):
+            return
+        if _charge_ai_generations(db, user_id, count, limit=FREE_AI_GENERATION_LIMIT):
+            _set_ai_reservation(db, (user_id, count))
+            return
+        # Not charged: pro, no profile yet, or at the limit
+        profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+        tier = _effective_tier(profile)
+        remember_tier(user_id, tier)
+        if not profile or tier == "pro":
+            return  # No profile yet = no generations tracked
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "error": "limit_reached",
+                "limit_type": "ai_generations",
+                "current": profile.ai_generations_used,
+                "max": FREE_AI_GENERATION_LIMIT,
+                "message": f"Free plan allows {FREE_AI_GENERATION_LIMIT} AI generations per month. Upgrade to Pro for unlimited.",
+            },
+        )
+
+
+def increment_ai_generation(db, user_id: str, count: int = 1):
+    """Charge `count` AI generations to a non-pro user (raw or effective tier), net of the
+    generation check_tier_limit() already reserved for this request."""
+    reserved = _take_ai_reservation(db, user_id)
+    if count > reserved and not _cached_pro(user_id):
+        _charge_ai_generations(db, user_id, count - reserved)
+    elif count < reserved:
+        _refund_ai_generations(db, user_id, reserved - count)
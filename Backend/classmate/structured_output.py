@@ -0,0 +1,299 @@
+"""
+Structured model output: strict JSON schemas for generation calls and tolerant parsers
+for truncated or unstructured responses.
+"""
+import json
+import os
+
+
+# ── Structured model output ──────────────────────────────────────────────────
+# Generation calls request a strict JSON schema (OpenAI structured outputs) so the
+# model can't emit malformed JSON; the tolerant parsers below still salvage whatever
+# is usable when the output is truncated by max_tokens, or when structured outputs
+# are disabled for a backend that doesn't support them.
+
+STRUCTURED_OUTPUTS_ENABLED = os.getenv("OPENAI_STRUCTURED_OUTPUTS", "true").lower() not in ("0", "false", "no")
+
+
+def _schema_object(properties: dict) -> dict:
+    # Strict mode requires every property listed and no extras; optional fields are nullable
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+_STR = {"type": "string"}
+_NULLABLE_STR = {"type": ["string", "null"]}
+
+FLASHCARDS_SCHEMA = _schema_object({
+    "flashcards": {"type": "array", "items": _schema_object({"front": _STR, "back": _STR})},
+})
+QUIZ_SCHEMA = _schema_object({
+    "questions": {"type": "array", "items": _schema_object({
+        "question": _STR,
+        "options": {"type": "array", "items": _STR},
+        "correct_answer": {"type": "string", "enum": ["A", "B", "C", "D"]},
+        "explanation": _STR,
+    })},
+})
+DEADLINES_SCHEMA = _schema_object({
+    "deadlines": {"type": "array", "items": _schema_object({
+        "date": _STR,
+        "type": _STR,
+        "title": _STR,
+        "context": _NULLABLE_STR,
+        "time": _NULLABLE_STR,
+        "recurring": {"type": "boolean"},
+        "frequency": _NULLABLE_STR,
+        "day_of_week": _NULLABLE_STR,
+    })},
+})
+COURSE_METADATA_SCHEMA = _schema_object({
+    "course_name": _NULLABLE_STR,
+    "semester": _NULLABLE_STR,
+    "start_date": _NULLABLE_STR,
+    "end_date": _NULLABLE_STR,
+    "holidays": {"type": "array", "items": _STR},
+    "instructor": _NULLABLE_STR,
+    "course_info": _schema_object({
+        "instructor": _schema_object({k: _NULLABLE_STR for k in ("name", "email", "office", "office_hours", "phone")}),
+        "logistics": _schema_object({k: _NULLABLE_STR for k in ("meeting_times", "location", "attendance_policy", "late_work_policy")}),
+        "grade_breakdown": {"type": "array", "items": _schema_object({"component": _STR, "weight": _STR})},
+        "policies": _schema_object({k: _NULLABLE_STR for k in ("participation", "extra_credit", "academic_integrity", "prerequisites")}),
+        "materials": _schema_object({
+            "required_textbooks": {"type": "array", "items": _STR},
+            "recommended_readings": {"type": "array", "items": _STR},
+            "course_portal": _NULLABLE_STR,
+            "ta_info": _NULLABLE_STR,
+        }),
+    }),
+})
+
+
+def structured_output(name: str, schema: dict) -> dict:
+    """Extra llm_chat kwargs requesting schema-constrained JSON (empty when disabled)."""
+    if not STRUCTURED_OUTPUTS_ENABLED:
+        return {}
+    return {"response_format": {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}}
+
+
+def _strip_code_fences(text: str) -> str:
+    start = text.find("```")
+    if start == -1:
+        return text
+    body = text[start + 3:]
+    end = body.find("```")
+    if end != -1:
+        body = body[:end]
+    # Drop the language tag line (```json)
+    first_line, _, rest = body.partition("\n")
+    return rest if first_line.strip().isalpha() else body
+
+
+def _strip_trailing_commas(text: str) -> str:
+    """Remove commas directly before a closing bracket (outside strings)."""
+    out: list[str] = []
+    in_string = escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "}]":
+            i = len(out) - 1
+            while i >= 0 and out[i].isspace():
+                i -= 1
+            if i >= 0 and out[i] == ",":
+                del out[i]
+        out.append(ch)
+    return "".join(out)
+
+
+def _close_truncated_json(text: str) -> str | None:
+    """Cut truncated JSON back to its last complete value and close the open brackets.
+
+    e.g. '{"a": 1, "b": [2, 3, {"c": "unfini' -> '{"a": 1, "b": [2, 3]}'
+    """
+    stack: list[str] = []
+    cut: tuple[int, str] | None = None  # (end offset, closers) at the last safe point
+    in_string = escape = False
+    prev = ""
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "[{":
+            # An unfinished object value closes as empty; an unfinished array element is dropped
+            opens_value = not stack or prev == ":"
+            stack.append("]" if ch == "[" else "}")
+            if opens_value:
+                cut = (i + 1, "".join(reversed(stack)))
+        elif ch in "]}":
+            if not stack:
+                return None
+            stack.pop()
+            if not stack:
+                return text[:i + 1]
+            cut = (i + 1, "".join(reversed(stack)))
+        elif ch == "," and stack:
+            cut = (i, "".join(reversed(stack)))
+        if not ch.isspace():
+            prev = ch
+    if cut is None:
+        return None
+    end, closers = cut
+    return text[:end] + closers
+
+
+def _loads_lenient(result: str, allow_truncated: bool = True):
+    text = _strip_code_fences(result).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        raise json.JSONDecodeError("No JSON value in model response", text, 0)
+    text = text[min(starts):]
+    decoder = json.JSONDecoder()
+    try:
+        # raw_decode ignores trailing prose after the value
+        return decoder.raw_decode(text)[0]
+    except json.JSONDecodeError as e:
+        error = e
+    repaired = _strip_trailing_commas(text)
+    try:
+        return decoder.raw_decode(repaired)[0]
+    except json.JSONDecodeError:
+        pass
+    if allow_truncated:
+        closed = _close_truncated_json(repaired)
+        if closed:
+            try:
+                value = json.loads(closed)
+                print(f"[WARN] Recovered truncated JSON response ({len(text)} chars)")
+                return value
+            except json.JSONDecodeError:
+                pass
+    raise error
+
+
+def parse_json_response(result: str):
+    """Parse JSON from an OpenAI response.
+
+    Tolerates markdown code fences, prose around the JSON, trailing commas, and output
+    cut off mid-value (kept up to the last complete value). Raises json.JSONDecodeError
+    when nothing parseable remains.
+    """
+    return _loads_lenient(result)
+
+
+def parse_json_items(result: str, key: str | None = None) -> list[dict]:
+    """Items from a response that should hold a JSON array — bare, or wrapped in an object
+    under `key` (as structured outputs return it). When the whole response doesn't parse,
+    every complete item is salvaged and malformed or truncated ones are dropped."""
+    try:
+        data = _loads_lenient(result, allow_truncated=False)
+    except json.JSONDecodeError:
+        data = None
+    if isinstance(data, dict):
+        wrapped = data.get(key) if key else None
+        if not isinstance(wrapped, list):
+            wrapped = next((v for v in data.values() if isinstance(v, list)), [])
+        data = wrapped
+    if not isinstance(data, list):
+        data = JsonArrayStreamParser(key).feed(_strip_code_fences(result))
+    return [item for item in data if isinstance(item, dict)]
+
+
+class JsonArrayStreamParser:
+    """Incrementally pull complete elements out of a JSON array in a streamed model
+    response, so each item can be used as soon as its closing brace arrives.
+
+    The target is a top-level array, or the array under `key` in a wrapping object like
+    {"questions": [...]} (the first array found when no key is given). Malformed
+    elements are skipped.
+    """
+
+    def __init__(self, key: str | None = None):
+        self._key = key
+        self._buf: list[str] = []
+        self._depth = 0  # 1 = directly inside the target array
+        self._outer_depth = 0  # nesting before the target array is found
+        self._in_array = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._last_string: list[str] = []
+
+    def feed(self, text: str) -> list:
+        items = []
+        for ch in text:
+            if self._done:
+                break
+            if self._in_string:
+                if self._in_array:
+                    self._buf.append(ch)
+                if self._escape:
+                    self._escape = False
+                    if not self._in_array:
+                        self._last_string.append(ch)
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                elif not self._in_array:
+                    self._last_string.append(ch)
+                continue
+            if ch == '"':
+                self._in_string = True
+                if self._in_array:
+                    self._buf.append(ch)
+                else:
+                    self._last_string = []
+                continue
+            if not self._in_array:
+                if ch == "[" and (self._key is None or self._outer_depth == 0 or "".join(self._last_string) == self._key):
+                    self._in_array = True
+                    self._depth = 1
+                elif ch in "[{":
+                    self._outer_depth += 1
+                elif ch in "]}":
+                    self._outer_depth -= 1
+                continue
+            if ch in "[{":
+                self._depth += 1
+                self._buf.append(ch)
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(items)
+                    self._done = True
+                    continue
+                self._buf.append(ch)
+                if self._depth == 1:
+                    self._emit(items)
+            elif ch == "," and self._depth == 1:
+                self._emit(items)
+            else:
+                self._buf.append(ch)
+        return items
+
+    def _emit(self, items: list) -> None:
+        raw = "".join(self._buf).strip()
+        self._buf = []
+        if not raw:
+            return
+        try:
+            items.append(json.loads(raw))
+        except ValueError:
+            try:
+                items.append(json.loads(_strip_trailing_commas(raw)))
+            except ValueError:
+                print(f"[WARN] Skipping malformed streamed item: {raw[:120]}")
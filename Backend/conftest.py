@@ -0,0 +1,10 @@
+"""Pytest setup: point main.py at a throwaway SQLite database before it is imported.
+
+main.py creates tables at import time, so these must be set before any test
+module does ``import main``.
+"""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='classmate-test-')}/test.db"
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
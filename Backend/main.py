@@ -1,45 +1,72 @@
+import time
+
+_BOOT_STARTED = time.perf_counter()  # origin of the startup profile (see _mark_boot)
+
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field, validator
 from typing import Any, Optional
 from dotenv import load_dotenv
-from openai import AsyncOpenAI, AuthenticationError as OAIAuthError, RateLimitError as OAIRateLimitError, APIStatusError as OAIAPIStatusError
-from jose import JWTError, jwt, jwk
-from jose.utils import base64url_decode
-from sqlalchemy import create_engine, Column, String, Boolean, Date, DateTime, ForeignKey, Text, JSON, Integer, text, func
+from jose import jwt
+from sqlalchemy import text, func, case, or_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime, date, timedelta
-from urllib.request import urlopen
-from urllib.error import URLError
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
-import bcrypt as _bcrypt
-import pdfplumber
-from docx import Document
-from docx.oxml.table import CT_Tbl
-from docx.oxml.text.paragraph import CT_P
-from docx.table import Table
-from docx.text.paragraph import Paragraph
+from limits.storage import Storage as RateLimitStorage, SlidingWindowCounterSupport
 import json
 import uuid
-import io
 import os
 import re
 import base64
-import time
+import hashlib
+import hmac
 import asyncio
 import logging
-import stripe as stripe_lib
-import resend
+import socket
+import sys
+import random
+import zlib
+from functools import lru_cache
 import httpx
-from icalendar import Calendar as ICalCalendar
-from cryptography.fernet import Fernet
-import sentry_sdk
+
+from classmate.auth import (
+    JWT_SECRET, NATIVE_JWT_ALGORITHM, RESET_TOKEN_EXPIRE_MINUTES, SUPABASE_ISSUER, SUPABASE_JWKS_URL, SUPABASE_URL,
+    _fetch_jwks, get_current_user, _hash_password, _issue_tokens, _jwks_cache, _verify_native_token,
+    _verify_password,
+)
+from classmate.chat_context import (
+    CHAT_HISTORY_FETCH_LIMIT, CHAT_HISTORY_MAX_MESSAGES, _attachment_excerpts, _attachment_prompt_text,
+    _estimate_tokens, get_chat_context, retrieve_chat_context, _split_history, _summarize_history, _tokenize,
+)
+from classmate.chat_timing import ChatTurnTimer, chat_stage_metric_lines
+from classmate.chunking import split_text_into_chunks
+from classmate.context import _current_request
+from classmate.db import (
+    DATABASE_URL, Base, CalendarEntry, ChatAttachment, ChatContextSnapshot, ChatConversation, ChatMessage, Course,
+    Deadline, Feedback, Flashcard, FlashcardSet, JobLease, JobRun, JobRunBatch, LLMUsage, LMSConnection, NudgeFlag,
+    Quiz, QuizAttempt, QuizQuestion, RateLimitWindow, SchemaVersion, SessionLocal, Summary, User, UserProfile,
+    engine, generate_referral_code, generate_uuid, get_db, invalidate_chat_context, _safe_db_url,
+)
+from classmate.extraction import extract_text_from_docx, extract_text_from_image, extract_text_from_pdf
+from classmate.llm import client, flush_llm_usage, _is_openai_error, llm_chat, llm_counters, _raise_if_openai_error
+from classmate.lms import encrypt_token, fernet, sync_all_connections, sync_canvas, sync_ical
+from classmate.quotas import (
+    FOUNDING_MEMBER_PRICE_LOOKUP_KEY, FREE_AI_GENERATION_LIMIT, FREE_CHAT_MESSAGE_LIMIT, PRO_CHAT_MESSAGE_LIMIT,
+    _chat_usage, check_chat_limit, check_tier_limit, consume_chat_message, _effective_tier, increment_ai_generation,
+    _is_pro_sql, release_ai_generation_reservation, remember_tier,
+)
+from classmate.structured_output import (
+    COURSE_METADATA_SCHEMA, DEADLINES_SCHEMA, FLASHCARDS_SCHEMA, QUIZ_SCHEMA, _STR, JsonArrayStreamParser,
+    parse_json_items, parse_json_response, _schema_object, structured_output,
+)
+
+# Heavy SDKs only some requests need (openai, pdfplumber, docx, stripe, resend, icalendar,
+# sentry_sdk) are imported where they're used, so a restarting worker reaches a healthy
+# /health sooner; _warm_imports() preloads the hot ones in the background after startup.
 
 # Configure logging
 logging.basicConfig(
@@ -48,6 +75,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+BOOT_PROFILE: dict[str, float] = {}  # phase -> milliseconds, logged by startup_event
+
+
+def _mark_boot(phase: str):
+    """Record how long the module took to get from the previous boot phase to `phase`."""
+    elapsed = (time.perf_counter() - _BOOT_STARTED) * 1000
+    BOOT_PROFILE[phase] = round(elapsed - sum(BOOT_PROFILE.values()), 1)
+
+
+_mark_boot("imports")
+
 # Load environment variables
 load_dotenv()
 
@@ -55,6 +93,7 @@ load_dotenv()
 SENTRY_DSN = os.getenv("SENTRY_DSN", "")
 if SENTRY_DSN:
     try:
+        import sentry_sdk
         sentry_sdk.init(
             dsn=SENTRY_DSN,
             traces_sample_rate=0.2,
@@ -66,38 +105,11 @@ if SENTRY_DSN:
 else:
     print("[Sentry] No DSN configured, skipping")
 
-# Supabase auth configuration
-SUPABASE_URL = os.getenv("SUPABASE_URL") or os.getenv("NEXT_PUBLIC_SUPABASE_URL") or ""
-SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL") or (
-    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else ""
-)
-SUPABASE_ISSUER = os.getenv("SUPABASE_ISSUER") or (
-    f"{SUPABASE_URL.rstrip('/')}/auth/v1" if SUPABASE_URL else ""
-)
-SUPABASE_JWT_AUD = os.getenv("SUPABASE_JWT_AUD", "authenticated")
-SUPABASE_JWKS_CACHE_TTL = int(os.getenv("SUPABASE_JWKS_CACHE_TTL", "3600"))
-
-# Native JWT auth (replaces Supabase auth)
-JWT_SECRET = os.getenv("JWT_SECRET", "")
-NATIVE_JWT_ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
-REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
-RESET_TOKEN_EXPIRE_MINUTES = 60
-
-def _hash_password(password: str) -> str:
-    return _bcrypt.hashpw(password.encode(), _bcrypt.gensalt()).decode()
-
-def _verify_password(password: str, hashed: str) -> bool:
-    return _bcrypt.checkpw(password.encode(), hashed.encode())
-
-print(f"[Auth] JWT_SECRET={'SET' if JWT_SECRET else 'NOT SET (native auth disabled)'}")
-
 # Log Supabase auth configuration at startup
 print(f"[Auth] SUPABASE_URL={'SET (' + SUPABASE_URL[:40] + '...)' if SUPABASE_URL else 'NOT SET'}")
 print(f"[Auth] SUPABASE_JWKS_URL={'SET' if SUPABASE_JWKS_URL else 'NOT SET'}")
 print(f"[Auth] SUPABASE_ISSUER={'SET' if SUPABASE_ISSUER else 'NOT SET'}")
-
-bearer_scheme = HTTPBearer(auto_error=True)
+print(f"[DB] Using DATABASE_URL={_safe_db_url(DATABASE_URL)}")
 
 app = FastAPI(
     title="ClassMate API",
@@ -110,7 +122,177 @@ app = FastAPI(
 )
 
 # Rate limiting setup
-limiter = Limiter(key_func=get_remote_address)
+# Limits are keyed on the authenticated user (set on request.state by get_current_user, which
+# FastAPI resolves before slowapi's wrapper runs) so users behind one NAT don't share a budget,
+# falling back to the client address for unauthenticated routes. Counters live in shared
+# storage so every worker enforces the same budget: "database://" (the default) keeps them in
+# the rate_limit_windows table, "redis://host:6379" uses Redis (needs the redis package) and
+# "memory://" keeps per-process counters for local development and tests.
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "database://")
+RATE_LIMIT_CLEANUP_EVERY = 1000  # writes between sweeps of expired window rows
+
+
+def rate_limit_key(request: Request) -> str:
+    user_id = getattr(request.state, "user_id", None)
+    if user_id:
+        return f"user:{user_id}"
+    return f"ip:{get_remote_address(request)}"
+
+
+class DatabaseRateLimitStorage(RateLimitStorage, SlidingWindowCounterSupport):
+    """Rate limit counters in the app database, shared by every worker.
+
+    Each key is one rate_limit_windows row holding the sliding-window-counter state: the
+    index of the current window plus its count and the previous window's count, so memory
+    per key is constant however many hits it takes. A hit is a single conditional UPDATE
+    that rolls the window forward, checks the weighted count and increments it atomically,
+    so concurrent workers can't both take the last slot. Fixed-window limits reuse the
+    same row (current_count/expires_at).
+    """
+
+    STORAGE_SCHEME = ["database"]
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._writes = 0
+
+    @property
+    def base_exceptions(self):
+        return SQLAlchemyError
+
+    @staticmethod
+    def _table():
+        return RateLimitWindow.__table__
+
+    def _wrote(self, conn, now: float) -> None:
+        self._writes += 1
+        if self._writes % RATE_LIMIT_CLEANUP_EVERY == 0:
+            table = self._table()
+            conn.execute(table.delete().where(table.c.expires_at < now))
+
+    def _row(self, key: str):
+        table = self._table()
+        with engine.connect() as conn:
+            return conn.execute(
+                table.select().where(table.c.key == key)
+            ).first()
+
+    # Sliding window counter
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        table = self._table()
+        now = time.time()
+        window = int(now // expiry)
+        weight = 1 - (now % expiry) / expiry  # share of the previous window still inside the sliding window
+        previous = case(
+            (table.c.window_index == window, table.c.previous_count),
+            (table.c.window_index == window - 1, table.c.current_count),
+            else_=0,
+        )
+        current = case((table.c.window_index == window, table.c.current_count), else_=0)
+        advance = (
+            table.update()
+            .where(table.c.key == key, previous * weight + current < limit - amount + 1)
+            .values(window_index=window, previous_count=previous, current_count=current + amount,
+                    expires_at=(window + 2) * expiry)
+        )
+        for _ in range(2):
+            with engine.begin() as conn:
+                if conn.execute(advance).rowcount:
+                    self._wrote(conn, now)
+                    return True
+                exists = table.select().with_only_columns(table.c.key).where(table.c.key == key)
+                if conn.execute(exists).first() is not None:
+                    return False  # the row exists, so the UPDATE was refused by the limit
+            try:
+                with engine.begin() as conn:
+                    conn.execute(table.insert().values(key=key, window_index=window, previous_count=0,
+                                                       current_count=amount, expires_at=(window + 2) * expiry))
+                    self._wrote(conn, now)
+                return True
+            except IntegrityError:
+                continue  # another worker created the row first; retry the UPDATE against it
+        return False
+
+    def get_sliding_window(self, key: str, expiry: int) -> tuple[int, float, int, float]:
+        now = time.time()
+        window = int(now // expiry)
+        remaining = (1 - (now % expiry) / expiry) * expiry
+        row = self._row(key)
+        previous_count = current_count = 0
+        if row is not None and row.window_index == window:
+            previous_count, current_count = row.previous_count, row.current_count
+        elif row is not None and row.window_index == window - 1:
+            previous_count = row.current_count
+        return previous_count, remaining if previous_count else 0.0, current_count, remaining + expiry
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        self.clear(key)
+
+    # Fixed window (used when RATE_LIMIT_STRATEGY selects it)
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        table = self._table()
+        now = time.time()
+        live = table.c.expires_at > now
+        bump = (
+            table.update()
+            .where(table.c.key == key)
+            .values(current_count=case((live, table.c.current_count + amount), else_=amount),
+                    expires_at=case((live, table.c.expires_at), else_=now + expiry))
+            .returning(table.c.current_count)
+        )
+        for _ in range(2):
+            with engine.begin() as conn:
+                count = conn.execute(bump).scalar()
+                if count is not None:
+                    self._wrote(conn, now)
+                    return count
+            try:
+                with engine.begin() as conn:
+                    conn.execute(table.insert().values(key=key, window_index=0, previous_count=0,
+                                                       current_count=amount, expires_at=now + expiry))
+                return amount
+            except IntegrityError:
+                continue
+        raise SQLAlchemyError(f"could not increment rate limit counter {key}")
+
+    def get(self, key: str) -> int:
+        row = self._row(key)
+        return row.current_count if row is not None and row.expires_at > time.time() else 0
+
+    def get_expiry(self, key: str) -> float:
+        row = self._row(key)
+        return row.expires_at if row is not None else time.time()
+
+    # Maintenance
+
+    def check(self) -> bool:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+
+    def reset(self) -> Optional[int]:
+        with engine.begin() as conn:
+            return conn.execute(self._table().delete()).rowcount
+
+    def clear(self, key: str) -> None:
+        table = self._table()
+        with engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.key == key))
+
+
+limiter = Limiter(
+    key_func=rate_limit_key,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy=os.getenv("RATE_LIMIT_STRATEGY", "sliding-window-counter"),
+    swallow_errors=True,  # a storage outage lets requests through rather than failing them
+)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
@@ -168,6 +350,37 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
+# Expose the current request to code that has no handle on it (LLM usage attribution)
+@app.middleware("http")
+async def request_context_middleware(request: Request, call_next):
+    token = _current_request.set(request)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        # Includes CancelledError: a request cancelled mid-generation (timeout, disconnect) still refunds
+        _release_unsettled_reservation(request)
+        raise
+    finally:
+        _current_request.reset(token)
+    # Streaming responses settle (or release) their reservation when the stream ends
+    if not response.headers.get("content-type", "").startswith("text/event-stream"):
+        _release_unsettled_reservation(request)
+    return response
+
+
+def _release_unsettled_reservation(request: Request):
+    """Refund an AI generation reserved by check_tier_limit() that the request never settled."""
+    user_id, reserved = getattr(request.state, "ai_generation_reservation", (None, 0))
+    if user_id and reserved:
+        token = _current_request.set(request)
+        try:
+            release_ai_generation_reservation(user_id)
+        except Exception as e:
+            logger.error(f"[Quota] Failed to refund reserved generation for {user_id}: {e}")
+        finally:
+            _current_request.reset(token)
+
+
 # Request timeout middleware
 @app.middleware("http")
 async def timeout_middleware(request: Request, call_next):
@@ -183,232 +396,8 @@ async def timeout_middleware(request: Request, call_next):
         return JSONResponse({"detail": "Request timeout"}, status_code=504, headers=headers)
 
 
-# Initialize OpenAI client
-client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 RESEND_API_KEY = os.getenv("RESEND_API_KEY", "")
 FEEDBACK_EMAIL = os.getenv("FEEDBACK_EMAIL", "")
-ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY", "")
-fernet = Fernet(ENCRYPTION_KEY.encode()) if ENCRYPTION_KEY else None
-
-
-def encrypt_token(plain: str) -> str:
-    if not fernet:
-        raise HTTPException(status_code=500, detail="Encryption not configured")
-    return fernet.encrypt(plain.encode()).decode()
-
-
-def decrypt_token(encrypted: str) -> str:
-    if not fernet:
-        raise HTTPException(status_code=500, detail="Encryption not configured")
-    return fernet.decrypt(encrypted.encode()).decode()
-
-
-def _raise_if_openai_error(e: Exception) -> None:
-    """If *e* is a known OpenAI SDK error, raise an HTTPException with a
-    clear, user-facing message and log it so Railway picks it up.
-    For anything else, do nothing — let the caller handle it."""
-    if isinstance(e, OAIAuthError):
-        logger.error("[OpenAI] Authentication error — API key is invalid or revoked: %s", e)
-        raise HTTPException(status_code=503, detail="AI service is temporarily unavailable. Please try again later.")
-    if isinstance(e, OAIRateLimitError):
-        logger.warning("[OpenAI] Rate-limit hit: %s", e)
-        raise HTTPException(status_code=503, detail="AI service is busy right now. Please wait a moment and try again.")
-    if isinstance(e, OAIAPIStatusError):
-        logger.error("[OpenAI] API error (status %s): %s", e.status_code, e)
-        raise HTTPException(status_code=503, detail="AI service returned an error. Please try again later.")
-
-
-# Supabase auth helpers
-_jwks_cache: dict[str, object] = {"fetched_at": 0.0, "keys": {}, "last_fetch_error": None}
-
-
-def _fetch_jwks(retries: int = 2) -> dict[str, dict] | None:
-    """Fetch JWKS from Supabase. Returns None on failure instead of raising."""
-    if not SUPABASE_JWKS_URL:
-        print("[Auth] ERROR: SUPABASE_JWKS_URL is not configured")
-        _jwks_cache["last_fetch_error"] = "JWKS URL not configured"
-        return None
-
-    last_error = None
-    for attempt in range(retries):
-        try:
-            print(f"[Auth] Fetching JWKS from {SUPABASE_JWKS_URL} (attempt {attempt + 1}/{retries})")
-            with urlopen(SUPABASE_JWKS_URL, timeout=10) as resp:
-                payload = json.load(resp)
-            keys = {key.get("kid"): key for key in payload.get("keys", []) if key.get("kid")}
-            if not keys:
-                print("[Auth] WARNING: JWKS response contained no valid keys")
-                _jwks_cache["last_fetch_error"] = "JWKS empty"
-                return None
-            _jwks_cache["fetched_at"] = time.time()
-            _jwks_cache["keys"] = keys
-            _jwks_cache["last_fetch_error"] = None
-            print(f"[Auth] Successfully fetched {len(keys)} keys from JWKS")
-            return keys
-        except URLError as e:
-            last_error = str(e)
-            print(f"[Auth] JWKS fetch attempt {attempt + 1} failed: {e}")
-            if attempt < retries - 1:
-                time.sleep(0.5)  # Brief wait before retry
-        except json.JSONDecodeError as e:
-            print(f"[Auth] ERROR: Failed to parse JWKS response as JSON: {e}")
-            _jwks_cache["last_fetch_error"] = f"JSON parse error: {e}"
-            return None
-
-    print(f"[Auth] WARNING: All {retries} JWKS fetch attempts failed. Last error: {last_error}")
-    _jwks_cache["last_fetch_error"] = last_error
-    return None
-
-
-def _get_jwks() -> dict[str, dict]:
-    """Get JWKS, using stale cache if fresh fetch fails."""
-    cached_keys = _jwks_cache.get("keys", {})
-    fetched_at = float(_jwks_cache.get("fetched_at", 0.0) or 0.0)
-    cache_expired = (time.time() - fetched_at) > SUPABASE_JWKS_CACHE_TTL
-
-    # If cache is fresh, use it
-    if cached_keys and not cache_expired:
-        return cached_keys  # type: ignore[return-value]
-
-    # Try to fetch fresh keys
-    fresh_keys = _fetch_jwks()
-    if fresh_keys:
-        return fresh_keys
-
-    # Fetch failed - use stale cache if available
-    if cached_keys:
-        print("[Auth] WARNING: Using stale JWKS cache due to fetch failure")
-        return cached_keys  # type: ignore[return-value]
-
-    # No cache and fetch failed - return empty (will cause auth to fail gracefully)
-    return {}
-
-
-def _verify_supabase_token(token: str) -> dict:
-    if not SUPABASE_ISSUER or not SUPABASE_JWKS_URL:
-        print("[Auth] ERROR: Supabase auth not configured - ISSUER or JWKS_URL missing")
-        raise HTTPException(status_code=500, detail="Supabase auth not configured. Check SUPABASE_URL env var.")
-    try:
-        header = jwt.get_unverified_header(token)
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token header")
-    kid = header.get("kid")
-    if not kid:
-        raise HTTPException(status_code=401, detail="Invalid token - missing key ID")
-
-    keys = _get_jwks()
-    if not keys:
-        # No keys available at all - this is an auth infrastructure issue
-        last_error = _jwks_cache.get("last_fetch_error", "Unknown")
-        print(f"[Auth] ERROR: No JWKS keys available. Last fetch error: {last_error}")
-        raise HTTPException(status_code=503, detail=f"Auth service temporarily unavailable: {last_error}")
-
-    key_data = keys.get(kid)
-    if not key_data:
-        # Key not in cache - try one more fresh fetch
-        fresh_keys = _fetch_jwks()
-        if fresh_keys:
-            key_data = fresh_keys.get(kid)
-    if not key_data:
-        raise HTTPException(status_code=401, detail="Invalid token - unknown key ID")
-    public_key = jwk.construct(key_data)
-    message, encoded_sig = token.rsplit(".", 1)
-    decoded_sig = base64url_decode(encoded_sig.encode("utf-8"))
-    if not public_key.verify(message.encode("utf-8"), decoded_sig):
-        raise HTTPException(status_code=401, detail="Invalid token signature")
-    try:
-        return jwt.decode(
-            token,
-            key_data,
-            algorithms=[header.get("alg", "RS256")],
-            audience=SUPABASE_JWT_AUD,
-            issuer=SUPABASE_ISSUER,
-        )
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-# Native JWT helpers
-def _issue_tokens(user_id: str, email: str) -> dict:
-    """Mint a short-lived access token and a long-lived refresh token."""
-    if not JWT_SECRET:
-        raise HTTPException(status_code=500, detail="JWT_SECRET not configured")
-    now = datetime.utcnow()
-    access_payload = {
-        "sub": user_id,
-        "email": email,
-        "type": "access",
-        "iat": now,
-        "exp": now + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
-    }
-    refresh_payload = {
-        "sub": user_id,
-        "type": "refresh",
-        "iat": now,
-        "exp": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
-    }
-    access_token = jwt.encode(access_payload, JWT_SECRET, algorithm=NATIVE_JWT_ALGORITHM)
-    refresh_token = jwt.encode(refresh_payload, JWT_SECRET, algorithm=NATIVE_JWT_ALGORITHM)
-    return {
-        "access_token": access_token,
-        "refresh_token": refresh_token,
-        "token_type": "bearer",
-        "user_id": user_id,
-        "email": email,
-    }
-
-
-def _verify_native_token(token: str, token_type: str = "access") -> dict:
-    if not JWT_SECRET:
-        raise HTTPException(status_code=500, detail="JWT_SECRET not configured")
-    try:
-        claims = jwt.decode(token, JWT_SECRET, algorithms=[NATIVE_JWT_ALGORITHM])
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-    if claims.get("type") != token_type:
-        raise HTTPException(status_code=401, detail="Invalid token type")
-    return claims
-
-
-# Database setup
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./railway.db")
-# Handle Railway's postgres:// vs postgresql://
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-# Use String for UUID to support both SQLite and Postgres
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-def _safe_db_url(url: str) -> str:
-    if "://" not in url:
-        return url
-    scheme, rest = url.split("://", 1)
-    if "@" in rest:
-        return f"{scheme}://****:****@{rest.split('@', 1)[1]}"
-    return url
-
-
-print(f"[DB] Using DATABASE_URL={_safe_db_url(DATABASE_URL)}")
-
-# Create engine with connection pooling to prevent connection exhaustion
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    pool_size=20,             # Max 20 persistent connections
-    max_overflow=30,          # Max 30 additional connections (50 total)
-    pool_pre_ping=True,       # Check connections before using (prevents stale connections)
-    pool_recycle=3600,        # Recycle connections after 1 hour
-    echo=False                # Set to True for SQL query logging (debug only)
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-
-def generate_uuid():
-    return str(uuid.uuid4())
-
-
-def generate_referral_code():
-    """Generate a short, unique referral code (8 chars)."""
-    return uuid.uuid4().hex[:8]
 
 
 def ensure_user_columns():
@@ -495,235 +484,6 @@ def ensure_user_auth_columns():
             conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS password_changed_at TIMESTAMP"))
 
 
-# Database Models
-class Course(Base):
-    __tablename__ = "courses"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False)
-    name = Column(String, nullable=False)
-    code = Column(String)  # e.g., "FINC 313"
-    semester = Column(String)
-    start_date = Column(Date)
-    end_date = Column(Date)
-    course_info = Column(JSON, nullable=True)  # Stores extracted syllabus details (instructor, policies, etc.)
-    syllabus_text = Column(Text, nullable=True)  # Raw extracted syllabus text for granular policy/content queries
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    deadlines = relationship("Deadline", back_populates="course", cascade="all, delete-orphan")
-    flashcard_sets = relationship("FlashcardSet", back_populates="course", cascade="all, delete-orphan")
-    quizzes = relationship("Quiz", back_populates="course", cascade="all, delete-orphan")
-    summaries = relationship("Summary", back_populates="course", cascade="all, delete-orphan")
-
-
-class Deadline(Base):
-    __tablename__ = "deadlines"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False)
-    course_id = Column(String, ForeignKey("courses.id"), nullable=True)  # nullable for LMS-synced deadlines
-    date = Column(String)  # YYYY-MM-DD
-    time = Column(String)  # 11:59pm, etc.
-    type = Column(String)  # exam, assignment, quiz, project, reading, deadline
-    title = Column(String)
-    description = Column(Text)
-    recurring = Column(Boolean, default=False)
-    frequency = Column(String)  # weekly, biweekly, monthly, null
-    day_of_week = Column(String)  # Monday, Tuesday, etc.
-    completed = Column(Boolean, default=False)
-    source = Column(String, nullable=True, default="manual")  # "manual", "canvas", "ical"
-    external_id = Column(String, nullable=True)  # dedup key for synced items
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    course = relationship("Course", back_populates="deadlines")
-
-
-class FlashcardSet(Base):
-    __tablename__ = "flashcard_sets"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False)
-    course_id = Column(String, ForeignKey("courses.id"), nullable=False)
-    name = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    course = relationship("Course", back_populates="flashcard_sets")
-    flashcards = relationship("Flashcard", back_populates="flashcard_set", cascade="all, delete-orphan")
-
-
-class Flashcard(Base):
-    __tablename__ = "flashcards"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False)
-    flashcard_set_id = Column(String, ForeignKey("flashcard_sets.id"), nullable=False)
-    front = Column(Text, nullable=False)
-    back = Column(Text, nullable=False)
-    grade = Column(String, nullable=True)  # "known", "learning", or null
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    flashcard_set = relationship("FlashcardSet", back_populates="flashcards")
-
-
-class Summary(Base):
-    __tablename__ = "summaries"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False)
-    course_id = Column(String, ForeignKey("courses.id"), nullable=False)
-    title = Column(String, nullable=False)
-    content = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    course = relationship("Course", back_populates="summaries")
-
-
-class User(Base):
-    __tablename__ = "users"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    email = Column(String, unique=True, nullable=False)
-    password_hash = Column(String, nullable=True)          # null for legacy Supabase-only accounts
-    password_changed_at = Column(DateTime, nullable=True)  # used to invalidate old tokens
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-
-class UserProfile(Base):
-    __tablename__ = "user_profiles"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, unique=True, nullable=False)
-    email = Column(String, unique=True, nullable=False)
-    full_name = Column(String, nullable=True)
-    school_name = Column(String, nullable=True)
-    school_type = Column(String, nullable=True)
-    academic_year = Column(String, nullable=True)
-    major = Column(String, nullable=True)
-    profile_picture = Column(Text, nullable=True)
-    referral_code = Column(String, unique=True, nullable=True, default=generate_referral_code)
-    referred_by = Column(String, nullable=True)  # referral_code of the user who referred them
-    created_at = Column(DateTime, default=datetime.utcnow)
-    # Subscription / billing
-    subscription_tier = Column(String, nullable=False, default="free")  # "free" or "pro"
-    stripe_customer_id = Column(String, nullable=True, unique=True)
-    stripe_subscription_id = Column(String, nullable=True)
-    subscription_status = Column(String, nullable=True)  # "active", "canceled", "past_due", etc.
-    subscription_period_end = Column(DateTime, nullable=True)
-    ai_generations_used = Column(Integer, nullable=False, default=0)
-    ai_generations_reset_at = Column(DateTime, nullable=True)
-    has_completed_onboarding = Column(Boolean, nullable=False, default=False)
-    # Founding member: one-time $15 payment, permanent Pro-equivalent entitlements.
-    # Independent of subscription_tier — a founding member is never subscribed to anything.
-    founding_member = Column(Boolean, nullable=False, default=False)
-    # Chat usage tracking
-    chat_messages_used = Column(Integer, nullable=False, default=0)
-    chat_messages_reset_at = Column(DateTime, nullable=True)
-
-
-class CalendarEntry(Base):
-    """Tracks which deadlines have been saved to the user's calendar."""
-    __tablename__ = "calendar_entries"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    deadline_id = Column(String, ForeignKey("deadlines.id"), nullable=False, unique=True)
-    user_id = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    deadline = relationship("Deadline", backref="calendar_entry")
-
-
-class Quiz(Base):
-    """A quiz generated from study materials."""
-    __tablename__ = "quizzes"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False)
-    course_id = Column(String, ForeignKey("courses.id"), nullable=False)
-    name = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    course = relationship("Course", back_populates="quizzes")
-    questions = relationship("QuizQuestion", back_populates="quiz", cascade="all, delete-orphan")
-
-
-class QuizQuestion(Base):
-    """A single question in a quiz."""
-    __tablename__ = "quiz_questions"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False)
-    quiz_id = Column(String, ForeignKey("quizzes.id"), nullable=False)
-    question = Column(Text, nullable=False)
-    options = Column(Text, nullable=False)  # JSON array stored as text
-    correct_answer = Column(String, nullable=False)  # A, B, C, or D
-    explanation = Column(Text)
-    order_num = Column(String, default="0")
-
-    quiz = relationship("Quiz", back_populates="questions")
-
-
-class LMSConnection(Base):
-    __tablename__ = "lms_connections"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False, index=True)
-    provider = Column(String, nullable=False)  # "canvas" or "ical"
-    instance_url = Column(String, nullable=True)  # Canvas base URL
-    encrypted_token = Column(Text, nullable=True)  # Fernet-encrypted Canvas PAT
-    ical_url = Column(Text, nullable=True)  # raw iCal feed URL
-    last_synced = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-
-class Feedback(Base):
-    __tablename__ = "feedback"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_email = Column(String, nullable=False)
-    feedback_type = Column(String, nullable=False)
-    message = Column(Text, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-
-class ChatConversation(Base):
-    """A chat conversation between a user and the AI assistant."""
-    __tablename__ = "chat_conversations"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False, index=True)
-    title = Column(String, nullable=False, default="New Chat")
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    messages = relationship("ChatMessage", back_populates="conversation", cascade="all, delete-orphan")
-
-
-class ChatMessage(Base):
-    """A single message in a chat conversation."""
-    __tablename__ = "chat_messages"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    conversation_id = Column(String, ForeignKey("chat_conversations.id"), nullable=False, index=True)
-    role = Column(String, nullable=False)  # "user" or "assistant"
-    content = Column(Text, nullable=False)
-    created_study_set = Column(Text, nullable=True)  # JSON string: {type, id, name, count, course_name}
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-    conversation = relationship("ChatConversation", back_populates="messages")
-
-
-class NudgeFlag(Base):
-    """Queued nudge for the proactive opening message."""
-    __tablename__ = "nudge_flags"
-
-    id = Column(String, primary_key=True, default=generate_uuid)
-    user_id = Column(String, nullable=False, index=True)
-    reason = Column(String, nullable=False)  # "due_tomorrow", "no_materials"
-    course_id = Column(String, nullable=True)
-    deadline_id = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    delivered = Column(Boolean, default=False)
-
-
 class AuthRegisterRequest(BaseModel):
     email: str = Field(description="User email address")
     password: str = Field(description="Password (min 6 characters)")
@@ -950,116 +710,14 @@ def generate_flashcards_fallback(text: str):
     return cards
 
 
-def extract_text_from_pdf(content: bytes) -> str:
-    try:
-        text = ""
-        with pdfplumber.open(io.BytesIO(content)) as pdf:
-            page_count = len(pdf.pages)
-            print(f"[DEBUG] PDF has {page_count} pages")
-            for i, page in enumerate(pdf.pages):
-                # Extract tables first, then remaining text — preserves column structure
-                page_text = ""
-                tables = page.extract_tables()
-                if tables:
-                    for table in tables:
-                        for row in table:
-                            page_text += " | ".join(cell or "" for cell in row) + "\n"
-                        page_text += "\n"
-                # extract_text with layout=True preserves column order better than default
-                prose = page.extract_text(layout=False) or ""
-                page_text += prose
-                text += page_text + "\n"
-                if i < 3:
-                    print(f"[DEBUG] Page {i+1} extracted {len(page_text)} characters")
-
-        if len(text.strip()) < 50:
-            print(f"[WARNING] PDF text extraction yielded only {len(text.strip())} characters")
-            raise HTTPException(
-                status_code=400,
-                detail="Unable to extract text from PDF. The file may be scanned, image-based, or password-protected. Please try a text-based PDF or use an image format instead."
-            )
-
-        print(f"[DEBUG] Total extracted text: {len(text)} characters")
-        return text
-    except HTTPException:
-        raise  # Re-raise our custom exception
-    except Exception as e:
-        print(f"[ERROR] PDF extraction failed: {str(e)}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Failed to process PDF file: {str(e)}"
-        )
-
-
-def _iter_docx_block_items(doc: Document):
-    """Yield paragraphs and tables from a docx body in document order.
-    doc.paragraphs and doc.tables (used separately) lose interleaving and,
-    critically, doc.paragraphs skips table cell text entirely."""
-    for child in doc.element.body.iterchildren():
-        if isinstance(child, CT_P):
-            yield Paragraph(child, doc)
-        elif isinstance(child, CT_Tbl):
-            yield Table(child, doc)
-
-
-def extract_text_from_docx(content: bytes) -> str:
-    try:
-        file_stream = io.BytesIO(content)
-        doc = Document(file_stream)
-
-        parts = []
-        table_count = 0
-        for block in _iter_docx_block_items(doc):
-            if isinstance(block, Paragraph):
-                if block.text.strip():
-                    parts.append(block.text)
-            elif isinstance(block, Table):
-                table_count += 1
-                for row in block.rows:
-                    cells = [cell.text.strip() for cell in row.cells]
-                    if any(cells):
-                        parts.append(" | ".join(cells))
-                parts.append("")
-        text = "\n".join(parts)
-
-        print(f"[DEBUG] DOCX has {len(doc.paragraphs)} paragraphs, {table_count} tables")
-        print(f"[DEBUG] Extracted {len(text)} characters from DOCX")
-
-        # Check if extraction was successful
-        if len(text.strip()) < 50:
-            raise HTTPException(
-                status_code=400,
-                detail="Unable to extract sufficient text from DOCX file. The file may be empty or corrupted."
-            )
-
-        return text
-    except HTTPException:
-        raise  # Re-raise our custom exception
-    except Exception as e:
-        print(f"[ERROR] DOCX extraction failed: {str(e)}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"Failed to process DOCX file: {str(e)}"
-        )
-
+SUMMARY_MERGE_PROMPT = """You are a study assistant. Below are summaries of different sections from a larger document.
+Create a unified, comprehensive summary that:
+1. Provides a 2-3 sentence overview of the entire document
+2. Lists 6-10 bullet points covering the most important concepts across all sections
+3. Maintains logical flow and removes redundancy
 
-def split_text_into_chunks(text: str, chunk_size: int = 12000) -> list[str]:
-    """Split text into chunks at paragraph/sentence boundaries."""
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        if end < len(text):
-            paragraph_break = text.rfind("\n\n", start, end)
-            if paragraph_break > start + chunk_size // 2:
-                end = paragraph_break
-            else:
-                sentence_break = text.rfind(". ", start, end)
-                if sentence_break > start + chunk_size // 2:
-                    end = sentence_break + 1
-        chunks.append(text[start:end])
-        start = end
-    return chunks
+Focus on the key takeaways a student needs to know for studying.
+"""
 
 
 async def generate_summary_from_text(text: str) -> str:
@@ -1077,7 +735,7 @@ Return 5-8 bullet points plus a short 1-2 sentence overview.
 Focus on key concepts, definitions, and important facts.
 """
         try:
-            response = await client.chat.completions.create(
+            response = await llm_chat("summary",
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": prompt},
@@ -1104,7 +762,7 @@ Summarize this section clearly and concisely, focusing on key concepts, definiti
 Return 3-5 bullet points covering the main ideas in this section.
 """
         try:
-            response = await client.chat.completions.create(
+            response = await llm_chat("summary",
                 model="gpt-4o-mini",
                 messages=[
                     {"role": "system", "content": chunk_prompt},
@@ -1126,20 +784,11 @@ Return 3-5 bullet points covering the main ideas in this section.
     # Combine chunk summaries into final comprehensive summary
     combined_text = "\n\n".join([f"Section {i+1}:\n{summary}" for i, summary in enumerate(chunk_summaries)])
 
-    final_prompt = """You are a study assistant. Below are summaries of different sections from a larger document.
-Create a unified, comprehensive summary that:
-1. Provides a 2-3 sentence overview of the entire document
-2. Lists 6-10 bullet points covering the most important concepts across all sections
-3. Maintains logical flow and removes redundancy
-
-Focus on the key takeaways a student needs to know for studying.
-"""
-
     try:
-        response = await client.chat.completions.create(
+        response = await llm_chat("summary",
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": final_prompt},
+                {"role": "system", "content": SUMMARY_MERGE_PROMPT},
                 {"role": "user", "content": combined_text}
             ],
             temperature=0.3,
@@ -1163,7 +812,7 @@ async def generate_summary_from_image(content: bytes, filename: str) -> str:
     prompt = "Summarize the handwritten notes or study material in this image. Return 5-8 bullet points plus a short 1-2 sentence overview."
 
     try:
-        response = await client.chat.completions.create(
+        response = await llm_chat("image_summary",
             model="gpt-4o-mini",
             messages=[
                 {
@@ -1184,36 +833,12 @@ async def generate_summary_from_image(content: bytes, filename: str) -> str:
     return response.choices[0].message.content.strip()
 
 
-async def extract_text_from_image(content: bytes, filename: str) -> str:
-    """Use GPT-4o-mini vision to extract/transcribe text from an image of study material."""
-    if not os.getenv("OPENAI_API_KEY"):
-        raise HTTPException(status_code=500, detail="OPENAI_API_KEY not configured")
-
-    ext = filename.lower().split(".")[-1]
-    if ext == "jpg":
-        ext = "jpeg"
-    data_url = f"data:image/{ext};base64,{base64.b64encode(content).decode('utf-8')}"
-
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Extract and transcribe ALL text, data, and information from this image of study material. Include all headings, paragraphs, tables, figures, equations, and any other content. Return the full text content as plain text."},
-                        {"type": "image_url", "image_url": {"url": data_url}}
-                    ],
-                }
-            ],
-            temperature=0.1,
-            max_tokens=4000
-        )
-    except Exception as e:
-        _raise_if_openai_error(e)
-        raise
-
-    return response.choices[0].message.content.strip()
+def _already_applied(e: Exception) -> bool:
+    """Whether a DDL error only says the column/index/table is already there (SQLite's
+    "duplicate column name", Postgres's "... already exists"). Anything else is a real failure
+    the migration step must raise, so its version isn't recorded and the next boot retries it."""
+    message = str(getattr(e, "orig", e)).lower()
+    return "already exists" in message or "duplicate column" in message
 
 
 def ensure_deadline_columns():
@@ -1228,16 +853,14 @@ def ensure_deadline_columns():
             with engine.begin() as conn:
                 conn.execute(text(stmt))
             logger.info(f"[Migration] Added '{label}' column to deadlines")
-        except Exception:
-            pass  # Column already exists
+        except Exception as e:
+            if not _already_applied(e):
+                raise
 
     if engine.dialect.name == "postgresql":
-        try:
-            with engine.begin() as conn:
-                conn.execute(text("ALTER TABLE deadlines ALTER COLUMN course_id DROP NOT NULL"))
-            logger.info("[Migration] Made deadlines.course_id nullable")
-        except Exception:
-            pass
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE deadlines ALTER COLUMN course_id DROP NOT NULL"))
+        logger.info("[Migration] Made deadlines.course_id nullable")
 
 
 def ensure_referral_columns():
@@ -1251,51 +874,22 @@ def ensure_referral_columns():
             with engine.begin() as conn:
                 conn.execute(text(stmt))
             logger.info(f"[Migration] Added '{label}' column to user_profiles")
-        except Exception:
-            pass  # Column already exists
-
-    try:
-        with engine.begin() as conn:
-            if engine.dialect.name == "postgresql":
-                conn.execute(text(
-                    "UPDATE user_profiles SET referral_code = LEFT(REPLACE(gen_random_uuid()::text, '-', ''), 8) "
-                    "WHERE referral_code IS NULL"
-                ))
-            else:
-                conn.execute(text(
-                    "UPDATE user_profiles SET referral_code = LOWER(HEX(RANDOMBLOB(4))) "
-                    "WHERE referral_code IS NULL"
-                ))
-        logger.info("[Migration] Backfilled referral codes")
-    except Exception:
-        pass
-
-
-# ── Subscription tier constants ──
-FREE_AI_GENERATION_LIMIT = 50
-GRANDFATHER_CUTOFF = "2025-01-01T00:00:00"  # Moved to past date - no more grandfathering
-FOUNDING_MEMBER_PRICE_LOOKUP_KEY = "classmate_founding_member"  # one-time $15 Stripe Price
-
-# Emails that always get Pro access regardless of subscription status
-ALWAYS_PRO_EMAILS: set[str] = {
-    "leporatiar@g.cofc.edu",
-    "mccammono1@g.cofc.edu",
-    "bodnari@g.cofc.edu",
-}
-
-
-def _effective_tier(profile) -> str:
-    """Return the effective tier, accounting for always-pro overrides.
+        except Exception as e:
+            if not _already_applied(e):
+                raise
 
-    Founding members and ALWAYS_PRO_EMAILS both resolve to "pro" here — this is the
-    single choke point every entitlement check goes through, so treating either as
-    pro here is what makes them pro everywhere (generation limits, chat limits, etc).
-    """
-    if profile and profile.email and profile.email.lower() in ALWAYS_PRO_EMAILS:
-        return "pro"
-    if profile and profile.founding_member:
-        return "pro"
-    return profile.subscription_tier if profile else "free"
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(
+                "UPDATE user_profiles SET referral_code = LEFT(REPLACE(gen_random_uuid()::text, '-', ''), 8) "
+                "WHERE referral_code IS NULL"
+            ))
+        else:
+            conn.execute(text(
+                "UPDATE user_profiles SET referral_code = LOWER(HEX(RANDOMBLOB(4))) "
+                "WHERE referral_code IS NULL"
+            ))
+    logger.info("[Migration] Backfilled referral codes")
 
 
 def ensure_subscription_columns():
@@ -1317,28 +911,23 @@ def ensure_subscription_columns():
             with engine.begin() as conn:
                 conn.execute(text(f"ALTER TABLE user_profiles ADD COLUMN {col_name} {col_def}"))
             logger.info(f"[Migration] Added '{col_name}' column to user_profiles")
-        except Exception:
-            pass  # Column already exists
+        except Exception as e:
+            if not _already_applied(e):
+                raise
 
-    try:
-        with engine.begin() as conn:
-            conn.execute(text(
-                "UPDATE user_profiles SET subscription_tier = 'free' "
-                "WHERE subscription_tier = 'grandfathered'"
-            ))
-        logger.info("[Migration] Reset grandfathered users to free tier")
-    except Exception:
-        pass
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE user_profiles SET subscription_tier = 'free' "
+            "WHERE subscription_tier = 'grandfathered'"
+        ))
+    logger.info("[Migration] Reset grandfathered users to free tier")
 
-    try:
-        with engine.begin() as conn:
-            conn.execute(text(
-                "UPDATE user_profiles SET has_completed_onboarding = TRUE "
-                "WHERE has_completed_onboarding = FALSE OR has_completed_onboarding IS NULL"
-            ))
-        logger.info("[Migration] Marked existing users as onboarded")
-    except Exception:
-        pass
+    with engine.begin() as conn:
+        conn.execute(text(
+            "UPDATE user_profiles SET has_completed_onboarding = TRUE "
+            "WHERE has_completed_onboarding = FALSE OR has_completed_onboarding IS NULL"
+        ))
+    logger.info("[Migration] Marked existing users as onboarded")
 
 
 def ensure_chat_columns():
@@ -1357,25 +946,49 @@ def ensure_chat_columns():
             with engine.begin() as conn:
                 conn.execute(text(f"ALTER TABLE user_profiles ADD COLUMN {col_name} {col_def}"))
                 logger.info(f"[Migration] Added '{col_name}' column to user_profiles")
-        except Exception:
-            pass  # Column already exists
+        except Exception as e:
+            if not _already_applied(e):
+                raise
 
     try:
         with engine.begin() as conn:
             conn.execute(text("ALTER TABLE chat_messages ADD COLUMN created_study_set TEXT"))
             logger.info("[Migration] Added 'created_study_set' column to chat_messages")
-    except Exception:
-        pass  # Column already exists
-
+    except Exception as e:
+        if not _already_applied(e):
+            raise
 
-def ensure_course_syllabus_column():
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE chat_messages ADD COLUMN attachment_id VARCHAR"))
+            logger.info("[Migration] Added 'attachment_id' column to chat_messages")
+    except Exception as e:
+        if not _already_applied(e):
+            raise
+
+    for col_name, col_def in [
+        ("history_summary", "TEXT"),
+        ("history_summary_until", "TIMESTAMP"),
+        ("briefing_date", "VARCHAR"),
+    ]:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE chat_conversations ADD COLUMN {col_name} {col_def}"))
+                logger.info(f"[Migration] Added '{col_name}' column to chat_conversations")
+        except Exception as e:
+            if not _already_applied(e):
+                raise
+
+
+def ensure_course_syllabus_column():
     """Add syllabus_text column to courses table for raw text storage."""
     try:
         with engine.begin() as conn:
             conn.execute(text("ALTER TABLE courses ADD COLUMN syllabus_text TEXT"))
             logger.info("[Migration] Added 'syllabus_text' column to courses")
-    except Exception:
-        pass  # Column already exists
+    except Exception as e:
+        if not _already_applied(e):
+            raise
 
 
 def ensure_flashcard_grade_column():
@@ -1384,118 +997,122 @@ def ensure_flashcard_grade_column():
         with engine.begin() as conn:
             conn.execute(text("ALTER TABLE flashcards ADD COLUMN grade VARCHAR"))
             logger.info("[Migration] Added 'grade' column to flashcards")
-    except Exception:
-        pass  # Column already exists
-
-
-FREE_CHAT_MESSAGE_LIMIT = 20  # Per week, free tier
-PRO_CHAT_MESSAGE_LIMIT = 50   # Per week, pro tier
-
-
-def check_chat_limit(db, user_id: str):
-    """Check if user can send a chat message.
+    except Exception as e:
+        if not _already_applied(e):
+            raise
 
-    Free users get FREE_CHAT_MESSAGE_LIMIT messages per week.
-    Pro users get PRO_CHAT_MESSAGE_LIMIT messages per week.
-    Raises HTTPException(403) with structured JSON if limit reached.
-    """
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
-    if not profile:
-        raise HTTPException(status_code=404, detail="User profile not found")
 
-    tier = _effective_tier(profile)
-    limit = PRO_CHAT_MESSAGE_LIMIT if tier == "pro" else FREE_CHAT_MESSAGE_LIMIT
+def ensure_flashcard_schedule_columns():
+    """Add spaced-repetition scheduling columns to flashcards; existing cards become due now."""
+    columns = [
+        ("ease", "FLOAT NOT NULL DEFAULT 2.5"),
+        ("interval_days", "FLOAT NOT NULL DEFAULT 0"),
+        ("repetitions", "INTEGER NOT NULL DEFAULT 0"),
+        ("lapses", "INTEGER NOT NULL DEFAULT 0"),
+        ("due_at", "TIMESTAMP"),
+        ("last_reviewed_at", "TIMESTAMP"),
+    ]
+    for name, ddl in columns:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE flashcards ADD COLUMN {name} {ddl}"))
+                logger.info(f"[Migration] Added '{name}' column to flashcards")
+        except Exception as e:
+            if not _already_applied(e):
+                raise
+    with engine.begin() as conn:
+        result = conn.execute(text(
+            "UPDATE flashcards SET due_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE due_at IS NULL"
+        ))
+        if result.rowcount:
+            logger.info(f"[Migration] Backfilled due_at for {result.rowcount} flashcards")
 
-    # Weekly reset
-    now = datetime.utcnow()
-    if profile.chat_messages_reset_at:
-        days_since_reset = (now - profile.chat_messages_reset_at).days
-        if days_since_reset >= 7:
-            profile.chat_messages_used = 0
-            profile.chat_messages_reset_at = now
-            db.commit()
-    else:
-        profile.chat_messages_reset_at = now
-        db.commit()
 
-    if (profile.chat_messages_used or 0) >= limit:
-        resets_at = profile.chat_messages_reset_at + timedelta(days=7)
-        raise HTTPException(
-            status_code=403,
-            detail={
-                "error": "limit_reached",
-                "limit_type": "chat_messages",
-                "used": profile.chat_messages_used,
-                "max": limit,
-                "resets_at": resets_at.isoformat(),
-                "message": f"You've used all {limit} chat messages this week. Your limit resets on {resets_at.strftime('%B %d, %Y')}.",
-            },
-        )
+def ensure_quiz_columns():
+    """Add integer question order and the precomputed answer key to quizzes."""
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE quiz_questions ADD COLUMN position INTEGER"))
+            logger.info("[Migration] Added 'position' column to quiz_questions")
+    except Exception as e:
+        if not _already_applied(e):
+            raise
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE quizzes ADD COLUMN answer_key TEXT"))
+            logger.info("[Migration] Added 'answer_key' column to quizzes")
+    except Exception as e:
+        if not _already_applied(e):
+            raise
+    with engine.begin() as conn:
+        result = conn.execute(text(
+            "UPDATE quiz_questions SET position = CAST(order_num AS INTEGER) WHERE position IS NULL"
+        ))
+        if result.rowcount:
+            logger.info(f"[Migration] Backfilled position for {result.rowcount} quiz questions")
 
 
-def check_tier_limit(db, user_id: str, check_type: str):
-    """Check if user can perform the action under their tier.
+def ensure_chat_context_generation_column():
+    """Add generation to chat_context_snapshots; existing rows keep NULL, which no new row reuses."""
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE chat_context_snapshots ADD COLUMN generation VARCHAR"))
+            logger.info("[Migration] Added 'generation' column to chat_context_snapshots")
+    except Exception as e:
+        if not _already_applied(e):
+            raise
 
-    check_type: "course" or "ai_generation"
-    Raises HTTPException(403) with structured JSON if limit reached.
-    """
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
-    tier = _effective_tier(profile)
 
-    # Pro users have no limits
-    if tier == "pro":
-        return
+def ensure_quiz_question_version_column():
+    """Add question_version to quizzes so answer keys built mid-insert aren't cached."""
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE quizzes ADD COLUMN question_version INTEGER NOT NULL DEFAULT 0"))
+            logger.info("[Migration] Added 'question_version' column to quizzes")
+    except Exception as e:
+        if not _already_applied(e):
+            raise
 
-    if check_type == "course":
-        # Courses are unlimited on free tier — no limit check needed
-        return
 
-    elif check_type == "ai_generation":
-        if not profile:
-            return  # No profile yet = no generations tracked
-        # Reset counter if we've rolled into a new month
-        now = datetime.utcnow()
-        if (
-            not profile.ai_generations_reset_at
-            or profile.ai_generations_reset_at.month != now.month
-            or profile.ai_generations_reset_at.year != now.year
-        ):
-            profile.ai_generations_used = 0
-            profile.ai_generations_reset_at = now
-            db.commit()
+# Job leases
+# Unique per process: a restarted worker must not inherit the lease of the one it replaced
+JOB_HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
 
-        if (profile.ai_generations_used or 0) >= FREE_AI_GENERATION_LIMIT:
-            raise HTTPException(
-                status_code=403,
-                detail={
-                    "error": "limit_reached",
-                    "limit_type": "ai_generations",
-                    "current": profile.ai_generations_used,
-                    "max": FREE_AI_GENERATION_LIMIT,
-                    "message": f"Free plan allows {FREE_AI_GENERATION_LIMIT} AI generations per month. Upgrade to Pro for unlimited.",
-                },
-            )
 
+def acquire_job_lease(name: str, holder: str, ttl_seconds: int) -> bool:
+    """Take or renew the lease on `name`. Returns False while another holder's lease is live.
 
-def increment_ai_generation(db, user_id: str):
-    """Increment the AI generation counter for non-pro users (raw or effective tier)."""
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
-    if profile and _effective_tier(profile) != "pro":
-        profile.ai_generations_used = (profile.ai_generations_used or 0) + 1
-        db.commit()
+    A conditional UPDATE claims a lapsed (or our own) lease; the first ever claim inserts the
+    row, and a concurrent insert losing the primary-key race simply fails to acquire.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl_seconds)
+    table = JobLease.__table__
+    with engine.begin() as conn:
+        claimed = conn.execute(
+            table.update()
+            .where(table.c.name == name, or_(table.c.holder == holder, table.c.expires_at < now))
+            .values(holder=holder, expires_at=expires_at)
+        ).rowcount
+    if claimed:
+        return True
+    try:
+        with engine.begin() as conn:
+            conn.execute(table.insert().values(name=name, holder=holder, expires_at=expires_at))
+        return True
+    except IntegrityError:
+        return False
 
 
-# Create tables / migrations
-# Ensure schema exists before running column updates
-Base.metadata.create_all(bind=engine)
-ensure_user_columns()
-ensure_deadline_columns()
-ensure_referral_columns()
-ensure_subscription_columns()
-ensure_chat_columns()
-ensure_course_syllabus_column()
-ensure_flashcard_grade_column()
-Base.metadata.create_all(bind=engine)
+def release_job_lease(name: str, holder: str):
+    """Expire our lease now so the next run doesn't wait out the TTL."""
+    table = JobLease.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            table.update()
+            .where(table.c.name == name, table.c.holder == holder)
+            .values(expires_at=datetime.utcnow())
+        )
 
 
 def ensure_indexes():
@@ -1518,182 +1135,309 @@ def ensure_indexes():
         "CREATE INDEX IF NOT EXISTS idx_summaries_course_id ON summaries(course_id)",
         "CREATE INDEX IF NOT EXISTS idx_quizzes_course_id ON quizzes(course_id)",
         "CREATE INDEX IF NOT EXISTS idx_quiz_questions_quiz_id ON quiz_questions(quiz_id)",
-        # user email uniqueness
-        "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)",
         # chat tables
         "CREATE INDEX IF NOT EXISTS idx_chat_conversations_user_id ON chat_conversations(user_id)",
         "CREATE INDEX IF NOT EXISTS idx_chat_messages_conversation_id ON chat_messages(conversation_id)",
         "CREATE INDEX IF NOT EXISTS idx_nudge_flags_user_id ON nudge_flags(user_id)",
     ]
-    with engine.begin() as conn:
-        for stmt in index_statements:
-            try:
+    # One transaction per index: on Postgres a failed statement aborts the rest of its transaction
+    for stmt in index_statements:
+        try:
+            with engine.begin() as conn:
                 conn.execute(text(stmt))
-            except Exception as e:
-                print(f"[WARN] Failed to apply index: {stmt} ({e})")
+        except Exception as e:
+            logger.warning(f"[Migration] Failed to apply index: {stmt} ({e})")
+
+
+def ensure_study_indexes():
+    """Composite indexes for the due queue, quiz ordering and attempts, nudges, jobs, chat and usage."""
+    index_statements = [
+        "CREATE INDEX IF NOT EXISTS idx_flashcards_user_due ON flashcards(user_id, due_at)",
+        "CREATE INDEX IF NOT EXISTS idx_deadlines_date ON deadlines(date)",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_questions_quiz_position ON quiz_questions(quiz_id, position)",
+        "CREATE INDEX IF NOT EXISTS idx_quiz_attempts_user_quiz ON quiz_attempts(user_id, quiz_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_nudge_flags_user_reason ON nudge_flags(user_id, reason, delivered)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_job_runs_job_key ON job_runs(job, run_key)",
+        "CREATE INDEX IF NOT EXISTS idx_job_run_batches_run_id ON job_run_batches(run_id, batch_num)",
+        "CREATE INDEX IF NOT EXISTS idx_chat_conversations_user_briefing ON chat_conversations(user_id, briefing_date)",
+        "CREATE INDEX IF NOT EXISTS idx_chat_attachments_user_hash ON chat_attachments(user_id, content_hash)",
+        "CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at_feature ON llm_usage(created_at, feature)",
+    ]
+    # IF NOT EXISTS: any error is a real failure. Indexes created before it stay committed,
+    # so the retry on the next boot only redoes the rest.
+    for stmt in index_statements:
+        with engine.begin() as conn:
+            conn.execute(text(stmt))
 
 
-ensure_indexes()
+def ensure_unique_user_email_index():
+    """Enforce one account per email. Skipped with a warning while duplicates exist, since
+    the index can't be built over them; merge those accounts, then call this again."""
+    with engine.begin() as conn:
+        duplicates = conn.execute(text(
+            "SELECT COUNT(*) FROM (SELECT email FROM users WHERE email IS NOT NULL "
+            "GROUP BY email HAVING COUNT(*) > 1) AS dupes"
+        )).scalar()
+        if duplicates:
+            logger.warning(f"[Migration] Skipped idx_users_email: {duplicates} emails belong to more than one user")
+            return
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users(email)"))
+
+
+# Schema migrations
+# Each step runs once per database, in version order, and is recorded in schema_version.
+# Append new steps with the next version number; never edit or renumber one that has
+# shipped. Versions 1-12 are the column/index helpers that used to run on every boot; they
+# tolerate already-applied changes so existing databases adopt the runner without surgery.
+SCHEMA_MIGRATIONS = [
+    (1, "create tables", lambda: Base.metadata.create_all(bind=engine)),
+    (2, "user ownership columns", ensure_user_columns),
+    (3, "native auth columns", ensure_user_auth_columns),
+    (4, "deadline sync columns", ensure_deadline_columns),
+    (5, "referral columns", ensure_referral_columns),
+    (6, "subscription columns", ensure_subscription_columns),
+    (7, "chat columns", ensure_chat_columns),
+    (8, "course syllabus text", ensure_course_syllabus_column),
+    (9, "flashcard grade", ensure_flashcard_grade_column),
+    (10, "flashcard schedule", ensure_flashcard_schedule_columns),
+    (11, "quiz answer keys", ensure_quiz_columns),
+    (12, "indexes", ensure_indexes),
+    (13, "chat context snapshot generation", ensure_chat_context_generation_column),
+    (14, "quiz question version", ensure_quiz_question_version_column),
+    (15, "study indexes", ensure_study_indexes),
+    (16, "unique user email", ensure_unique_user_email_index),
+]
+MIGRATION_LEASE = "schema_migrations"
+MIGRATION_LEASE_SECONDS = 600  # a worker that dies mid-migration blocks the others at most this long
+MIGRATION_POLL_SECONDS = 0.5
 
 
-async def _run_nudge_check():
-    """Scan all pro users for nudge conditions and queue NudgeFlag rows."""
-    db = SessionLocal()
+def current_schema_version() -> int:
+    """Highest applied migration version, or 0 for a database the runner hasn't touched."""
     try:
-        today = date.today()
-        seven_days = today + timedelta(days=7)
-        tomorrow = today + timedelta(days=1)
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except SQLAlchemyError:
+        return 0  # no schema_version table yet
 
-        users = db.query(User).all()
-        flags_created = 0
 
-        for user in users:
-            profile = db.query(UserProfile).filter(UserProfile.user_id == user.id).first()
-            if not profile or _effective_tier(profile) != "pro":
-                continue
+def run_migrations(holder: str = JOB_HOLDER_ID, poll_seconds: float = MIGRATION_POLL_SECONDS) -> int:
+    """Bring the schema up to the latest version. Returns the number of steps applied here.
 
-            deadlines = (
-                db.query(Deadline)
-                .filter(
-                    Deadline.user_id == user.id,
-                    Deadline.completed == False,
-                    Deadline.date >= today.isoformat(),
-                    Deadline.date <= seven_days.isoformat(),
-                )
-                .all()
-            )
+    An up-to-date database costs one query. Otherwise the worker holding the migration lease
+    applies the pending steps, recording each as it completes so a crash resumes from the
+    next one, while other workers poll until the version catches up (or the lease lapses and
+    they take over). A step that raises is not recorded: it is logged, the remaining steps
+    wait, and the next boot retries it.
+    """
+    latest = SCHEMA_MIGRATIONS[-1][0]
+    if current_schema_version() >= latest:
+        return 0
+    Base.metadata.create_all(bind=engine, tables=[SchemaVersion.__table__, JobLease.__table__])
+    applied = 0
+    while True:
+        version = current_schema_version()
+        if version >= latest:
+            return applied
+        if not acquire_job_lease(MIGRATION_LEASE, holder, MIGRATION_LEASE_SECONDS):
+            time.sleep(poll_seconds)
+            continue
+        try:
+            # Re-read under the lease: the previous holder may have finished meanwhile
+            version = current_schema_version()
+            for number, name, migrate in SCHEMA_MIGRATIONS:
+                if number <= version:
+                    continue
+                started = time.perf_counter()
+                try:
+                    migrate()
+                except Exception as e:
+                    # Leave it unrecorded (and later steps unapplied); the next boot retries from here
+                    logger.error(f"[Migration] v{number} {name} failed, schema stays at v{number - 1}: {e}")
+                    return applied
+                with engine.begin() as conn:
+                    conn.execute(SchemaVersion.__table__.insert().values(version=number, name=name))
+                applied += 1
+                logger.info(f"[Migration] Applied v{number} {name} in {(time.perf_counter() - started) * 1000:.0f}ms")
+                acquire_job_lease(MIGRATION_LEASE, holder, MIGRATION_LEASE_SECONDS)  # renew between steps
+        finally:
+            release_job_lease(MIGRATION_LEASE, holder)
+        return applied
 
-            for deadline in deadlines:
-                dl_date = date.fromisoformat(deadline.date)
 
-                if dl_date == tomorrow:
-                    exists = db.query(NudgeFlag).filter(
-                        NudgeFlag.user_id == user.id,
-                        NudgeFlag.deadline_id == deadline.id,
-                        NudgeFlag.reason == "due_tomorrow",
-                        NudgeFlag.delivered == False,
-                    ).first()
-                    if not exists:
-                        db.add(NudgeFlag(user_id=user.id, reason="due_tomorrow", course_id=deadline.course_id, deadline_id=deadline.id))
-                        flags_created += 1
-
-                if deadline.course_id:
-                    has_materials = (
-                        db.query(FlashcardSet).filter(FlashcardSet.user_id == user.id, FlashcardSet.course_id == deadline.course_id).first()
-                        or db.query(Quiz).filter(Quiz.user_id == user.id, Quiz.course_id == deadline.course_id).first()
-                        or db.query(Summary).filter(Summary.user_id == user.id, Summary.course_id == deadline.course_id).first()
-                    )
-                    if not has_materials:
-                        exists = db.query(NudgeFlag).filter(
-                            NudgeFlag.user_id == user.id,
-                            NudgeFlag.course_id == deadline.course_id,
-                            NudgeFlag.reason == "no_materials",
-                            NudgeFlag.delivered == False,
-                        ).first()
-                        if not exists:
-                            db.add(NudgeFlag(user_id=user.id, reason="no_materials", course_id=deadline.course_id, deadline_id=deadline.id))
-                            flags_created += 1
+run_migrations()
+_mark_boot("models_and_migrations")
 
-        db.commit()
-        logger.info(f"[Nudge] Daily check complete — {flags_created} new flags queued")
-    except Exception as e:
-        logger.error(f"[Nudge] Check error: {e}")
-    finally:
-        db.close()
 
+def _pro_user_ids_query(db):
+    """Subquery of user ids whose _effective_tier() is "pro", evaluated in SQL."""
+    return (
+        db.query(UserProfile.user_id)
+        .join(User, User.id == UserProfile.user_id)
+        .filter(_is_pro_sql())
+    )
 
-async def _nudge_background_loop():
-    """Runs the nudge check once immediately then every 24 hours."""
-    await asyncio.sleep(60)  # Brief startup delay
-    while True:
-        await _run_nudge_check()
-        await asyncio.sleep(86400)
 
+def _queue_nudge_flags(db, today: date, user_ids) -> int:
+    """Add NudgeFlag rows for `user_ids` (a list or subquery of pro user ids) in a fixed number
+    of set-based queries. Does not commit; returns the number of flags added.
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    - due_tomorrow: each open deadline due tomorrow, unless an undelivered flag for it exists.
+    - no_materials: each course with an open deadline in the next 7 days but no flashcard
+      set, quiz or summary, unless an undelivered flag for the course exists. One flag per
+      course, pointing at its earliest such deadline.
 
+    Both are SELECTs with NOT EXISTS anti-joins, followed by one bulk insert.
+    """
+    tomorrow = (today + timedelta(days=1)).isoformat()
+    seven_days = (today + timedelta(days=7)).isoformat()
+
+    def undelivered(reason, *match):
+        return ~(
+            db.query(NudgeFlag.id)
+            .filter(NudgeFlag.user_id == Deadline.user_id, NudgeFlag.reason == reason,
+                    NudgeFlag.delivered == False, *match)
+            .exists()
+        )
 
-def _get_current_user(
-    request: Request,
-    credentials: HTTPAuthorizationCredentials | None,
-    db,
-) -> User:
-    if credentials is None:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    def no_rows(model):
+        return ~(
+            db.query(model.id)
+            .filter(model.user_id == Deadline.user_id, model.course_id == Deadline.course_id)
+            .exists()
+        )
 
-    token = credentials.credentials
+    open_deadlines = db.query(Deadline.user_id, Deadline.course_id, Deadline.id).filter(
+        Deadline.user_id.in_(user_ids),
+        Deadline.completed == False,
+    )
+    due_tomorrow = (
+        open_deadlines
+        .filter(Deadline.date == tomorrow, undelivered("due_tomorrow", NudgeFlag.deadline_id == Deadline.id))
+        .all()
+    )
+    no_materials = (
+        open_deadlines
+        .filter(
+            Deadline.date >= today.isoformat(),
+            Deadline.date <= seven_days,
+            Deadline.course_id.isnot(None),
+            no_rows(FlashcardSet), no_rows(Quiz), no_rows(Summary),
+            undelivered("no_materials", NudgeFlag.course_id == Deadline.course_id),
+        )
+        .order_by(Deadline.date)
+        .all()
+    )
 
-    # Try native HS256 token first; fall back to Supabase RS256 for existing users
-    claims = None
-    try:
-        header = jwt.get_unverified_header(token)
-        if header.get("alg") == NATIVE_JWT_ALGORITHM and JWT_SECRET:
-            claims = _verify_native_token(token, token_type="access")
-    except (JWTError, HTTPException):
-        claims = None
-
-    if claims is None:
-        if SUPABASE_ISSUER and SUPABASE_JWKS_URL:
-            claims = _verify_supabase_token(token)
-        else:
-            raise HTTPException(status_code=401, detail="Invalid token")
+    rows = [
+        {"user_id": user_id, "reason": "due_tomorrow", "course_id": course_id, "deadline_id": deadline_id, "delivered": False}
+        for user_id, course_id, deadline_id in due_tomorrow
+    ]
+    seen_courses = set()
+    for user_id, course_id, deadline_id in no_materials:
+        if (user_id, course_id) not in seen_courses:
+            seen_courses.add((user_id, course_id))
+            rows.append({"user_id": user_id, "reason": "no_materials", "course_id": course_id,
+                         "deadline_id": deadline_id, "delivered": False})
+    _bulk_insert(db, NudgeFlag.__table__, rows)
+    return len(rows)
+
+
+def compute_nudge_flags(db, today: date | None = None) -> int:
+    """Queue NudgeFlag rows for every pro user in one pass. Commits; returns flags created."""
+    flags = _queue_nudge_flags(db, today or date.today(), _pro_user_ids_query(db))
+    db.commit()
+    return flags
 
-    user_id = claims.get("sub")
-    email = claims.get("email")
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        # Check if a user with this email already exists (e.g. Supabase user was recreated)
-        if email:
-            existing_by_email = db.query(User).filter(User.email == email).first()
-            if existing_by_email:
-                old_id = existing_by_email.id
-                # Migrate all related data to the new user_id
-                for tbl in [Course, Deadline, LMSConnection, FlashcardSet,
-                            Flashcard, Summary, CalendarEntry, Quiz, QuizQuestion]:
-                    db.query(tbl).filter(tbl.user_id == old_id).update(
-                        {"user_id": user_id}, synchronize_session=False
-                    )
-                db.query(UserProfile).filter(UserProfile.user_id == old_id).update(
-                    {"user_id": user_id}, synchronize_session=False
-                )
-                # Update the user record itself
-                existing_by_email.id = user_id
-                db.commit()
-                db.refresh(existing_by_email)
-                logger.info(f"[Auth] Migrated user {old_id} -> {user_id} (email: {email})")
-                user = existing_by_email
-            else:
-                user = User(id=user_id, email=email)
-                db.add(user)
+NUDGE_JOB = "nudge_check"
+NUDGE_BATCH_SIZE = int(os.getenv("NUDGE_BATCH_SIZE", "1000"))  # pro users per checkpointed batch
+NUDGE_LEASE_SECONDS = 300  # a crashed leader's lease lapses after this; batches renew it
+NUDGE_POLL_SECONDS = 900  # how often each worker checks whether today's run is still pending
+
+
+def run_nudge_job(holder: str = JOB_HOLDER_ID, today: date | None = None, batch_size: int = NUDGE_BATCH_SIZE):
+    """Run (or resume) today's nudge check if this process wins the lease.
+
+    Pro users are processed in user_id order, `batch_size` at a time. Each batch's flags,
+    its JobRunBatch timing row and the run's cursor commit together, so a crash loses at most
+    the in-flight batch and whoever next holds the lease resumes after the cursor. The cursor
+    update is conditional on the cursor we started from, fencing off a stale leader whose
+    lease lapsed mid-batch. Returns the JobRun id, or None if another worker holds the lease
+    or today's run already finished.
+    """
+    today = today or date.today()
+    run_key = today.isoformat()
+    if not acquire_job_lease(NUDGE_JOB, holder, NUDGE_LEASE_SECONDS):
+        return None
+    db = SessionLocal()
+    try:
+        run = db.query(JobRun).filter(JobRun.job == NUDGE_JOB, JobRun.run_key == run_key).first()
+        if run and run.status == "complete":
+            return None
+        if not run:
+            run = JobRun(job=NUDGE_JOB, run_key=run_key)
+            db.add(run)
+            db.commit()
+        elif run.cursor:
+            logger.info(f"[Nudge] Resuming run {run_key} after batch {run.batches}")
+        run_id, cursor, batch_num = run.id, run.cursor, run.batches
+        runs = JobRun.__table__
+
+        while acquire_job_lease(NUDGE_JOB, holder, NUDGE_LEASE_SECONDS):
+            started = time.perf_counter()
+            batch = _pro_user_ids_query(db).order_by(UserProfile.user_id)
+            if cursor:
+                batch = batch.filter(UserProfile.user_id > cursor)
+            user_ids = [row[0] for row in batch.limit(batch_size).all()]
+            if not user_ids:
+                db.execute(runs.update().where(runs.c.id == run_id)
+                           .values(status="complete", finished_at=datetime.utcnow()))
                 db.commit()
-                db.refresh(user)
-        else:
-            user = User(id=user_id, email=f"{user_id}@supabase.local")
-            db.add(user)
+                logger.info(f"[Nudge] Run {run_key} complete after {batch_num} batches")
+                return run_id
+
+            flags = _queue_nudge_flags(db, today, user_ids)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            advanced = db.execute(
+                runs.update()
+                .where(runs.c.id == run_id, (runs.c.cursor == cursor) if cursor else runs.c.cursor.is_(None))
+                .values(cursor=user_ids[-1], batches=runs.c.batches + 1,
+                        items_processed=runs.c.items_processed + len(user_ids),
+                        rows_written=runs.c.rows_written + flags)
+            ).rowcount
+            if not advanced:
+                db.rollback()
+                logger.warning(f"[Nudge] Run {run_key} advanced by another worker; stopping")
+                return None
+            batch_num += 1
+            db.add(JobRunBatch(run_id=run_id, batch_num=batch_num, holder=holder, items=len(user_ids),
+                               rows_written=flags, duration_ms=duration_ms))
             db.commit()
-            db.refresh(user)
-    elif email and user.email != email:
-        user.email = email
-        db.commit()
-        db.refresh(user)
+            cursor = user_ids[-1]
+            logger.info(f"[Nudge] Batch {batch_num}: {len(user_ids)} users, {flags} flags, {duration_ms}ms")
+        logger.warning(f"[Nudge] Lost the lease during run {run_key}; stopping")
+        return None
+    finally:
+        db.close()
+        release_job_lease(NUDGE_JOB, holder)
 
-    return user
 
+async def _run_nudge_check():
+    """Run today's nudge job on a worker thread so the event loop keeps serving requests.
+    Every worker calls this; the lease makes sure only one of them does the work."""
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, run_nudge_job)
+    except Exception as e:
+        logger.error(f"[Nudge] Check error: {e}")
 
-def get_current_user(
-    request: Request,
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
-    db=Depends(get_db),
-) -> User:
-    return _get_current_user(request, credentials, db)
+
+async def _nudge_background_loop():
+    """Polls for a pending daily nudge run; whichever worker holds the lease runs it."""
+    await asyncio.sleep(60)  # Brief startup delay
+    while True:
+        await _run_nudge_check()
+        await asyncio.sleep(NUDGE_POLL_SECONDS)
 
 
 async def validate_file_upload(file: UploadFile, allowed_extensions: list[str], max_size_mb: int = 25):
@@ -1736,15 +1480,6 @@ async def validate_file_upload(file: UploadFile, allowed_extensions: list[str],
     return content
 
 
-def parse_json_response(result: str):
-    """Parse JSON from OpenAI response, handling markdown code blocks."""
-    if result.startswith("```"):
-        result = result.split("```")[1]
-        if result.startswith("json"):
-            result = result[4:]
-    return json.loads(result.strip())
-
-
 async def extract_course_metadata(text: str):
     """PASS 1: Extract course metadata from syllabus."""
     print("[DEBUG] PASS 1: Extracting course metadata...")
@@ -1801,14 +1536,15 @@ If the year is 2026 and semester is Spring, start_date would be around 2026-01-1
 IMPORTANT: For any field where information is not found in the syllabus, use null (for strings) or empty arrays (for lists). Extract as much detail as possible."""
 
     try:
-        response = await client.chat.completions.create(
+        response = await llm_chat("course_metadata",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"Extract metadata from this syllabus:\n\n{text[:15000]}"}
             ],
             temperature=0.1,
-            max_tokens=2000
+            max_tokens=2000,
+            **structured_output("course_metadata", COURSE_METADATA_SCHEMA),
         )
 
         result = response.choices[0].message.content
@@ -1915,20 +1651,21 @@ Examples of GOOD entries:
 Return [] if no deadlines found."""
 
     try:
-        response = await client.chat.completions.create(
+        response = await llm_chat("deadline_extraction",
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"Extract ALL deadlines, quizzes, tests, exams, homework due dates, presentations, and important dates from this syllabus. Pay special attention to 'IMPORTANT DAYS' sections, schedule tables, and any dates with Quiz/Test/Exam/HW/Pitch/Presentation labels:\n\n{text}"}
             ],
             temperature=0.1,
-            max_tokens=6000
+            max_tokens=6000,
+            **structured_output("deadlines", DEADLINES_SCHEMA),
         )
 
         result = response.choices[0].message.content
         print(f"[DEBUG] Deadlines response (first 1000 chars): {result[:1000]}...")
 
-        deadlines = parse_json_response(result)
+        deadlines = parse_json_items(result, "deadlines")
         print(f"[DEBUG] Parsed {len(deadlines)} deadlines before validation")
 
         # Validate and filter deadlines
@@ -2069,9 +1806,43 @@ def validate_deadlines(deadlines: list) -> list:
     return validated
 
 
+@app.on_event("shutdown")
+def shutdown_event():
+    flush_llm_usage()
+
+
+WARM_IMPORTS = ["openai", "pdfplumber", "docx"]  # needed by the first AI/upload request
+
+
+async def _warm_jwks():
+    """Pre-fetch JWKS in a worker thread; failures only mean the first Supabase token fetches it."""
+    keys = await asyncio.get_running_loop().run_in_executor(None, _fetch_jwks)
+    if keys:
+        logger.info(f"[Startup] JWKS pre-fetch successful: {len(keys)} keys cached")
+    else:
+        logger.warning("[Startup] JWKS pre-fetch failed - auth may not work until keys can be fetched")
+        logger.warning(f"[Startup] SUPABASE_URL = {SUPABASE_URL or 'NOT SET'}")
+        logger.warning(f"[Startup] SUPABASE_JWKS_URL = {SUPABASE_JWKS_URL or 'NOT SET'}")
+
+
+async def _warm_imports():
+    """Import the heavy SDKs in a worker thread after startup so the first request that needs
+    one doesn't pay for it, without delaying the first /health."""
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    for module in WARM_IMPORTS:
+        try:
+            await loop.run_in_executor(None, __import__, module)
+        except Exception as e:
+            logger.warning(f"[Startup] Failed to preload {module}: {e}")
+    if "openai" in sys.modules:
+        client._load()
+    logger.info(f"[Startup] Preloaded {', '.join(WARM_IMPORTS)} in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize app: validate env vars, test DB, pre-fetch JWKS, log configuration."""
+    """Initialize app: validate env vars, test DB, log configuration, start background warmups."""
     logger.info("=" * 50)
     logger.info("[Startup] ClassMate Backend API starting...")
     logger.info("=" * 50)
@@ -2097,22 +1868,19 @@ async def startup_event():
             conn.execute(text("SELECT 1"))
         logger.info("[Startup] Database connection successful")
         logger.info(f"[Startup] Database URL: {_safe_db_url(DATABASE_URL)}")
-        ensure_user_auth_columns()
-        logger.info("[Startup] Auth column migration complete")
+        logger.info(f"[Startup] Schema version {current_schema_version()}")
     except Exception as e:
         logger.error(f"[Startup] ERROR: Database connection failed: {e}")
 
-    # Pre-fetch JWKS
-    logger.info("[Startup] Pre-fetching JWKS...")
-    keys = _fetch_jwks()
-    if keys:
-        logger.info(f"[Startup] JWKS pre-fetch successful: {len(keys)} keys cached")
-    else:
-        logger.warning("[Startup] JWKS pre-fetch failed - auth may not work until keys can be fetched")
-        logger.warning(f"[Startup] SUPABASE_URL = {SUPABASE_URL or 'NOT SET'}")
-        logger.warning(f"[Startup] SUPABASE_JWKS_URL = {SUPABASE_JWKS_URL or 'NOT SET'}")
+    # Warm the JWKS cache and the lazily imported SDKs off the startup path: /health answers
+    # as soon as startup returns, and a slow Supabase no longer holds the worker back
+    asyncio.create_task(_warm_jwks())
+    asyncio.create_task(_warm_imports())
 
-    # Launch background nudge checker (runs daily, queues NudgeFlag rows)
+    _mark_boot("startup")
+    logger.info("[Startup] Boot profile (ms): " + ", ".join(f"{phase} {ms}" for phase, ms in BOOT_PROFILE.items()))
+
+    # Launch background nudge checker (every worker polls; the job lease elects one runner per day)
     asyncio.create_task(_nudge_background_loop())
     logger.info("[Startup] Nudge background loop started")
 
@@ -2221,6 +1989,7 @@ def auth_forgot_password(payload: AuthForgotPasswordRequest, db=Depends(get_db))
 
     if RESEND_API_KEY:
         try:
+            import resend
             resend.api_key = RESEND_API_KEY
             resend.Emails.send({
                 "from": "onboarding@resend.dev",
@@ -2290,6 +2059,7 @@ def auth_delete_account(
     if conv_ids:
         db.query(ChatMessage).filter(ChatMessage.conversation_id.in_(conv_ids)).delete(synchronize_session=False)
     db.query(ChatConversation).filter(ChatConversation.user_id == uid).delete(synchronize_session=False)
+    db.query(ChatAttachment).filter(ChatAttachment.user_id == uid).delete(synchronize_session=False)
 
     db.query(NudgeFlag).filter(NudgeFlag.user_id == uid).delete(synchronize_session=False)
     db.query(CalendarEntry).filter(CalendarEntry.user_id == uid).delete(synchronize_session=False)
@@ -2302,6 +2072,7 @@ def auth_delete_account(
 
     quiz_ids = [r[0] for r in db.query(Quiz.id).filter(Quiz.user_id == uid).all()]
     if quiz_ids:
+        db.query(QuizAttempt).filter(QuizAttempt.quiz_id.in_(quiz_ids)).delete(synchronize_session=False)
         db.query(QuizQuestion).filter(QuizQuestion.quiz_id.in_(quiz_ids)).delete(synchronize_session=False)
     db.query(Quiz).filter(Quiz.user_id == uid).delete(synchronize_session=False)
 
@@ -2309,6 +2080,7 @@ def auth_delete_account(
     db.query(Deadline).filter(Deadline.user_id == uid).delete(synchronize_session=False)
     db.query(Course).filter(Course.user_id == uid).delete(synchronize_session=False)
     db.query(UserProfile).filter(UserProfile.user_id == uid).delete(synchronize_session=False)
+    db.query(ChatContextSnapshot).filter(ChatContextSnapshot.user_id == uid).delete(synchronize_session=False)
     db.query(User).filter(User.id == uid).delete(synchronize_session=False)
 
     db.commit()
@@ -2354,6 +2126,119 @@ def api_health():
     return health()
 
 
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+def require_admin(current_user: User = Depends(get_current_user)) -> User:
+    if (current_user.email or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    """Prometheus text exposition of LLM call counters and chat stage timings for this worker.
+    Off (404) unless METRICS_TOKEN is set; scrapers send it as a bearer token."""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    lines = []
+    for metric in sorted({key[0] for key in llm_counters}):
+        lines.append(f"# TYPE {metric} counter")
+        for (name, feature, model, status), value in sorted(llm_counters.items()):
+            if name == metric:
+                lines.append(f'{name}{{feature="{feature}",model="{model}",status="{status}"}} {value:g}')
+    lines += chat_stage_metric_lines()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/usage", tags=["admin"], summary="LLM usage rollup by feature and user")
+def admin_usage(
+    days: int = Query(default=7, ge=1, le=90),
+    top_users: int = Query(default=25, ge=1, le=500),
+    admin: User = Depends(require_admin),
+    db=Depends(get_db),
+):
+    flush_llm_usage()
+    since = datetime.utcnow() - timedelta(days=days)
+    columns = (
+        func.count(LLMUsage.id),
+        func.sum(LLMUsage.prompt_tokens),
+        func.sum(LLMUsage.completion_tokens),
+        func.sum(LLMUsage.cached_tokens),
+        func.avg(LLMUsage.latency_ms),
+        func.sum(case((LLMUsage.status != "ok", 1), else_=0)),
+    )
+
+    def rollup(key, row):
+        requests, prompt, completion, cached, avg_latency, errors = row
+        return {
+            **key,
+            "requests": requests,
+            "prompt_tokens": int(prompt or 0),
+            "completion_tokens": int(completion or 0),
+            "cached_tokens": int(cached or 0),
+            "cache_hit_rate": round((cached or 0) / prompt, 3) if prompt else 0.0,
+            "avg_latency_ms": round(float(avg_latency or 0), 1),
+            "errors": int(errors or 0),
+        }
+
+    by_feature = (
+        db.query(LLMUsage.feature, *columns)
+        .filter(LLMUsage.created_at >= since)
+        .group_by(LLMUsage.feature)
+        .order_by(func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens).desc())
+        .all()
+    )
+    by_user = (
+        db.query(LLMUsage.user_id, User.email, *columns)
+        .outerjoin(User, User.id == LLMUsage.user_id)
+        .filter(LLMUsage.created_at >= since)
+        .group_by(LLMUsage.user_id, User.email)
+        .order_by(func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens).desc())
+        .limit(top_users)
+        .all()
+    )
+    return {
+        "since": since.isoformat() + "Z",
+        "by_feature": [rollup({"feature": r[0]}, r[1:]) for r in by_feature],
+        "by_user": [rollup({"user_id": r[0], "email": r[1]}, r[2:]) for r in by_user],
+    }
+
+
+@app.get("/admin/jobs/{job}", tags=["admin"], summary="Recent runs of a background job with per-batch timings")
+def admin_job_runs(
+    job: str,
+    limit: int = Query(default=7, ge=1, le=90),
+    admin: User = Depends(require_admin),
+    db=Depends(get_db),
+):
+    runs = db.query(JobRun).filter(JobRun.job == job).order_by(JobRun.started_at.desc()).limit(limit).all()
+    lease = db.query(JobLease).filter(JobLease.name == job).first()
+    return {
+        "lease": {"holder": lease.holder, "expires_at": lease.expires_at.isoformat() + "Z"} if lease else None,
+        "runs": [
+            {
+                "run_key": run.run_key,
+                "status": run.status,
+                "batches": run.batches,
+                "items_processed": run.items_processed,
+                "rows_written": run.rows_written,
+                "started_at": run.started_at.isoformat() + "Z" if run.started_at else None,
+                "duration_ms": int((run.finished_at - run.started_at).total_seconds() * 1000) if run.finished_at else None,
+                "batch_log": [
+                    {"batch": b.batch_num, "holder": b.holder, "items": b.items, "rows_written": b.rows_written,
+                     "duration_ms": b.duration_ms}
+                    for b in run.batch_log
+                ],
+            }
+            for run in runs
+        ],
+    }
+
+
 @app.get("/stats", tags=["public"], summary="Public platform stats")
 def get_stats():
     """Returns aggregate platform stats. No auth required."""
@@ -2678,18 +2563,14 @@ def get_subscription(current_user: User = Depends(get_current_user)):
             UserProfile.user_id == current_user.id
         ).first()
         tier = _effective_tier(profile)
+        remember_tier(current_user.id, tier)
 
-        # Monthly reset check for free users
-        if profile and tier == "free":
-            now = datetime.utcnow()
-            if (
-                not profile.ai_generations_reset_at
-                or profile.ai_generations_reset_at.month != now.month
-                or profile.ai_generations_reset_at.year != now.year
-            ):
-                profile.ai_generations_used = 0
-                profile.ai_generations_reset_at = now
-                db.commit()
+        # A counter from a previous month restarts on the next charge; report it as reset
+        now = datetime.utcnow()
+        ai_generations_used = (profile.ai_generations_used or 0) if profile else 0
+        if profile and (not profile.ai_generations_reset_at or profile.ai_generations_reset_at < datetime(now.year, now.month, 1)):
+            ai_generations_used = 0
+        chat_used = _chat_usage(profile, now)[0] if profile else 0
 
         course_count = db.query(Course).filter(
             Course.user_id == current_user.id
@@ -2705,15 +2586,15 @@ def get_subscription(current_user: User = Depends(get_current_user)):
                 if profile and profile.subscription_period_end
                 else None
             ),
-            "ai_generations_used": profile.ai_generations_used if profile else 0,
+            "ai_generations_used": ai_generations_used,
             "ai_generations_max": None if tier == "pro" else FREE_AI_GENERATION_LIMIT,
             "courses_used": course_count,
             "courses_max": None,  # Courses are unlimited on all tiers
-            "chat_messages_used": profile.chat_messages_used if profile else 0,
+            "chat_messages_used": chat_used,
             "chat_messages_max": PRO_CHAT_MESSAGE_LIMIT if tier == "pro" else FREE_CHAT_MESSAGE_LIMIT,
             "chat_messages_reset_at": (
                 profile.chat_messages_reset_at.isoformat()
-                if profile and profile.chat_messages_reset_at
+                if profile and profile.chat_messages_reset_at and chat_used
                 else None
             ),
         }
@@ -2728,6 +2609,8 @@ def create_checkout_session(
 ):
     """Create a Stripe Checkout session for subscribing to Pro, or for the one-time
     founding-member purchase."""
+    import stripe as stripe_lib
+
     stripe_lib.api_key = os.getenv("STRIPE_SECRET_KEY")
     if not stripe_lib.api_key:
         raise HTTPException(status_code=500, detail="Stripe is not configured")
@@ -2821,6 +2704,8 @@ def create_checkout_session(
 @app.post("/create-portal-session")
 def create_portal_session(current_user: User = Depends(get_current_user)):
     """Create a Stripe Customer Portal session for managing subscription."""
+    import stripe as stripe_lib
+
     stripe_lib.api_key = os.getenv("STRIPE_SECRET_KEY")
     if not stripe_lib.api_key:
         raise HTTPException(status_code=500, detail="Stripe is not configured")
@@ -2844,6 +2729,8 @@ def create_portal_session(current_user: User = Depends(get_current_user)):
 @app.post("/stripe-webhook")
 async def stripe_webhook(request: Request):
     """Handle Stripe webhook events (no auth — Stripe calls this directly)."""
+    import stripe as stripe_lib
+
     stripe_lib.api_key = os.getenv("STRIPE_SECRET_KEY")
 
     payload = await request.body()
@@ -2875,6 +2762,7 @@ async def stripe_webhook(request: Request):
                 # One-time founding-member purchase — no subscription object involved.
                 profile.founding_member = True
                 db.commit()
+                remember_tier(profile.user_id, "pro")
                 logger.info(f"[Stripe] User {profile.user_id} became a founding member")
             elif profile:
                 subscription_id = session_obj.get("subscription")
@@ -2882,6 +2770,7 @@ async def stripe_webhook(request: Request):
                 profile.stripe_subscription_id = subscription_id
                 profile.subscription_status = "active"
                 db.commit()
+                remember_tier(profile.user_id, "pro")
                 logger.info(f"[Stripe] User {profile.user_id} upgraded to pro")
 
         elif event["type"] in (
@@ -2905,6 +2794,7 @@ async def stripe_webhook(request: Request):
                 elif status in ("active", "trialing"):
                     profile.subscription_tier = "pro"
                 db.commit()
+                remember_tier(profile.user_id, _effective_tier(profile))
                 logger.info(f"[Stripe] User {profile.user_id} subscription status: {status}")
 
         return {"received": True}
@@ -3618,32 +3508,469 @@ def get_summary(summary_id: str, current_user: User = Depends(get_current_user))
         db.close()
 
 
-# Flashcard endpoints
-@app.post("/courses/{course_id}/flashcards", tags=["study-materials"], summary="Upload study material and generate AI flashcards")
-@limiter.limit("10/minute")
-async def generate_flashcards(request: Request, course_id: str, file: UploadFile = File(...), num_cards: int = Query(default=15, ge=5, le=30), current_user: User = Depends(get_current_user)):
-    """Upload a file and generate AI-powered flashcards (question/answer pairs) for a course.
+# ── Study material generation (shared by the JSON and streaming endpoints) ──
 
-    Accepts PDF, DOCX, TXT, PNG, JPG (max 25 MB). Generates flashcards covering
-    key concepts, definitions, formulas, and facts. Returns the flashcard set ID and all cards.
-    Rate-limited to 10 requests/minute. Requires Pro plan or remaining free-tier generations.
-    """
-    logger.info(f"[DEBUG] /courses/{course_id}/flashcards request received")
-    db = SessionLocal()
-    try:
-        user_id = current_user.id
-        course = db.query(Course).filter(Course.id == course_id, Course.user_id == user_id).first()
-        if not course:
-            raise HTTPException(status_code=404, detail="Course not found")
-        check_tier_limit(db, user_id, "ai_generation")
+GENERATION_CHUNK_LIMIT = 40000  # ~10k tokens — single pass below this, parallel chunks above
+STUDY_STREAM_PERSIST_BATCH = 5  # streamed items committed per DB write
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
-        # Validate and extract text from file
-        content = await validate_file_upload(file, allowed_extensions=['.pdf', '.txt', '.docx', '.png', '.jpg', '.jpeg'], max_size_mb=25)
-        filename = file.filename.lower()
 
-        if filename.endswith('.pdf'):
-            text = extract_text_from_pdf(content)
-        elif filename.endswith('.txt'):
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+def _flashcard_prompt(num_cards: int) -> str:
+    return f"""You are a study assistant. Generate flashcards from the provided study material.
+
+Return ONLY a valid JSON array with exactly {num_cards} flashcards:
+[
+    {{"front": "Question or term", "back": "Answer or definition"}},
+    ...
+]
+
+Focus on:
+- Key concepts and definitions
+- Important facts and dates
+- Formulas and their applications
+- Cause and effect relationships
+- Compare and contrast items
+
+Make questions clear and answers concise but complete."""
+
+
+def _flashcard_chunk_prompt(i: int, total: int, cards_per_chunk: int) -> str:
+    return f"""You are a study assistant. This is section {i+1} of {total} from a larger document.
+Generate {cards_per_chunk}-{cards_per_chunk + 5} flashcards from THIS section only.
+
+Return ONLY a valid JSON array:
+[{{"front": "Question or term", "back": "Answer or definition"}}]
+
+Focus on key concepts, definitions, important facts, and formulas. Make questions clear and answers concise."""
+
+
+def _quiz_prompt(num_questions: int) -> str:
+    return f"""You are a study assistant. Generate a multiple-choice quiz from the provided study material.
+
+Return ONLY a valid JSON object with this structure:
+{{
+    "questions": [
+        {{
+            "question": "Clear question text",
+            "options": ["A) First option", "B) Second option", "C) Third option", "D) Fourth option"],
+            "correct_answer": "B",
+            "explanation": "Brief explanation of why this is correct"
+        }}
+    ]
+}}
+
+Guidelines:
+- Generate exactly {num_questions} questions
+- Each question should have exactly 4 options (A, B, C, D)
+- Questions should test understanding, not just memorization
+- Include a mix of difficulty levels
+- Make distractors (wrong answers) plausible
+- Keep explanations concise (1-2 sentences)"""
+
+
+def _quiz_chunk_prompt(i: int, total: int, qs_per_chunk: int) -> str:
+    return f"""You are a study assistant. This is section {i+1} of {total} from a larger document.
+Generate {qs_per_chunk}-{qs_per_chunk + 2} multiple-choice questions from THIS section only.
+
+Return ONLY a valid JSON object:
+{{"questions": [{{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "B", "explanation": "..."}}]}}
+
+Each question must have exactly 4 options (A, B, C, D). Test understanding, not just memorization."""
+
+
+def _flashcard_jobs(text: str, num_cards: int) -> list[tuple[list[dict], int, float]]:
+    """(messages, max_tokens, temperature) per generation call — one pass, or one per chunk."""
+    if len(text) <= GENERATION_CHUNK_LIMIT:
+        return [([
+            {"role": "system", "content": _flashcard_prompt(num_cards)},
+            {"role": "user", "content": f"Generate flashcards from this material:\n\n{text}"},
+        ], 4000, 0.3)]
+    chunks = split_text_into_chunks(text, chunk_size=12000)
+    per_chunk = max(3, num_cards // len(chunks))
+    return [([
+        {"role": "system", "content": _flashcard_chunk_prompt(i, len(chunks), per_chunk)},
+        {"role": "user", "content": chunk},
+    ], 2000, 0.3) for i, chunk in enumerate(chunks)]
+
+
+def _quiz_jobs(text: str, num_questions: int) -> list[tuple[list[dict], int, float]]:
+    if len(text) <= GENERATION_CHUNK_LIMIT:
+        return [([
+            {"role": "system", "content": _quiz_prompt(num_questions)},
+            {"role": "user", "content": f"Generate a quiz from this material:\n\n{text}"},
+        ], 4000, 0.4)]
+    chunks = split_text_into_chunks(text, chunk_size=12000)
+    per_chunk = max(2, num_questions // len(chunks))
+    return [([
+        {"role": "system", "content": _quiz_chunk_prompt(i, len(chunks), per_chunk)},
+        {"role": "user", "content": chunk},
+    ], 2000, 0.4) for i, chunk in enumerate(chunks)]
+
+
+# ── Near-duplicate detection for generated study items ──────────────────────
+# Overlapping chunks make the model paraphrase the same card many times. Items are
+# shingled into word unigrams + bigrams; MinHash/LSH finds candidate pairs in roughly
+# linear time and exact Jaccard on the shingle sets confirms them.
+
+STUDY_DEDUP_THRESHOLD = float(os.getenv("STUDY_DEDUP_THRESHOLD", "0.5"))  # Jaccard at or above = duplicate
+MINHASH_PERMUTATIONS = 64
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(20240917)
+_MINHASH_PARAMS = [(_minhash_rng.randrange(1, _MINHASH_PRIME), _minhash_rng.randrange(_MINHASH_PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+
+def _shingles(text: str) -> frozenset[str]:
+    tokens = _tokenize(text)
+    return frozenset(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+
+
+@lru_cache(maxsize=65536)
+def _shingle_permutations(shingle: str) -> tuple[int, ...]:
+    # Cached per shingle: generated cards reuse the same vocabulary heavily
+    h = zlib.crc32(shingle.encode())
+    return tuple((a * h + b) % _MINHASH_PRIME for a, b in _MINHASH_PARAMS)
+
+
+def _minhash(shingles: frozenset[str]) -> list[int]:
+    return [min(column) for column in zip(*map(_shingle_permutations, shingles))]
+
+
+def _lsh_rows(threshold: float) -> int:
+    """Rows per LSH band: as many as possible while pairs at `threshold` still almost always collide."""
+    rows = 1
+    for r in (2, 4, 8):
+        if (r / MINHASH_PERMUTATIONS) ** (1 / r) <= threshold * 0.8:
+            rows = r
+    return rows
+
+
+class NearDuplicateFilter:
+    """Incremental near-duplicate filter: add() accepts a text unless it is at least
+    `threshold` Jaccard-similar to one already accepted, or repeats an accepted `key`."""
+
+    def __init__(self, threshold: float = STUDY_DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self._rows = _lsh_rows(threshold)
+        self._buckets: dict[tuple, list[int]] = {}
+        self._kept: list[frozenset[str]] = []
+        self._keys: set[str] = set()
+
+    def add(self, text: str, key: str | None = None) -> bool:
+        key = (key if key is not None else text).lower().strip()
+        if key in self._keys:
+            return False
+        shingles = _shingles(text)
+        if not shingles:
+            self._keys.add(key)  # nothing but stopwords: exact match only
+            return True
+        signature = _minhash(shingles)
+        bands = [(i, tuple(signature[i:i + self._rows])) for i in range(0, MINHASH_PERMUTATIONS, self._rows)]
+        checked: set[int] = set()
+        for band in bands:
+            for idx in self._buckets.get(band, ()):
+                if idx in checked:
+                    continue
+                checked.add(idx)
+                other = self._kept[idx]
+                if len(shingles & other) / len(shingles | other) >= self.threshold:
+                    return False
+        idx = len(self._kept)
+        self._kept.append(shingles)
+        self._keys.add(key)
+        for band in bands:
+            self._buckets.setdefault(band, []).append(idx)
+        return True
+
+
+def _study_item_key(kind: str, item: dict) -> str:
+    return str(item.get("front" if kind == "flashcards" else "question", ""))
+
+
+def _study_item_text(kind: str, item: dict) -> str:
+    """Text compared for near-duplicates: the card, or the question with its correct option
+    (options alone are shared by distinct questions too often to count)."""
+    if kind == "flashcards":
+        return f"{item.get('front', '')} {item.get('back', '')}"
+    options = item.get("options") if isinstance(item.get("options"), list) else []
+    letter = str(item.get("correct_answer", "")).strip().upper()[:1]
+    answer = next((str(o) for o in options if str(o).strip().upper().startswith(letter)), "") if letter else ""
+    answer = re.sub(r"^[A-D][).:]\s*", "", answer.strip())
+    return f"{item.get('question', '')} {answer}"
+
+
+def _study_item_score(kind: str, item: dict) -> int:
+    """Rough quality score used to pick which of several near-duplicates survives."""
+    if kind == "flashcards":
+        front, back = str(item.get("front", "")).strip(), str(item.get("back", "")).strip()
+        return (bool(front) + bool(back) + (3 <= len(back) <= 400) + (len(front) <= 200)
+                + (front.lower() != back.lower()))
+    options = item.get("options")
+    return (bool(str(item.get("question", "")).strip())
+            + (isinstance(options, list) and len(options) == 4)
+            + (str(item.get("correct_answer", "")).strip().upper() in ("A", "B", "C", "D"))
+            + bool(str(item.get("explanation", "")).strip()))
+
+
+def select_study_items(kind: str, groups: list[list[dict]], target: int | None = None,
+                       threshold: float = STUDY_DEDUP_THRESHOLD) -> list[dict]:
+    """Dedup generated flashcards/quiz questions and pick up to `target` of them.
+
+    `groups` are the per-chunk results in document order. Higher-scoring items win over
+    their near-duplicates; when more than `target` survive, chunks are drawn round-robin
+    so the selection covers the whole document. Returned in document order.
+    """
+    candidates = [(gi, pos, item) for gi, group in enumerate(groups) for pos, item in enumerate(group)
+                  if isinstance(item, dict)]
+    candidates.sort(key=lambda c: (-_study_item_score(kind, c[2]), c[1], c[0]))
+    dedup = NearDuplicateFilter(threshold)
+    kept = sorted((c for c in candidates if dedup.add(_study_item_text(kind, c[2]), _study_item_key(kind, c[2]))), key=lambda c: (c[0], c[1]))
+    if target is not None and len(kept) > target:
+        per_group: dict[int, list] = {}
+        for c in kept:
+            per_group.setdefault(c[0], []).append(c)
+        queues = list(per_group.values())
+        chosen = []
+        depth = 0
+        while len(chosen) < target:
+            for queue in queues:
+                if depth < len(queue) and len(chosen) < target:
+                    chosen.append(queue[depth])
+            depth += 1
+        kept = sorted(chosen, key=lambda c: (c[0], c[1]))
+    return [c[2] for c in kept]
+
+
+_STREAM_DONE = object()
+
+
+async def _stream_generated_items(feature: str, jobs: list, errors: list, items_key: str | None = None, **llm_kwargs):
+    """Run generation jobs concurrently as streams and yield each parsed item as soon as it
+    completes, in arrival order. Failed jobs are logged and appended to `errors`."""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(messages, max_tokens, temperature):
+        try:
+            stream = await llm_chat(
+                feature,
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **llm_kwargs,
+            )
+            parser = JsonArrayStreamParser(items_key)
+            async for chunk in stream:
+                for item in parser.feed(chunk.choices[0].delta.content or ""):
+                    await queue.put(item)
+        except Exception as e:
+            errors.append(e)
+            print(f"[WARN] Streaming {feature} generation failed: {e}")
+        finally:
+            await queue.put(_STREAM_DONE)
+
+    tasks = [asyncio.create_task(pump(*job)) for job in jobs]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is _STREAM_DONE:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _bulk_insert(db, table, rows: list[dict]) -> list[str]:
+    """Core executemany insert: no ORM objects, identity-map entries or per-row refresh.
+    Ids are generated client-side so they can be returned without RETURNING."""
+    if not rows:
+        return []
+    now = datetime.utcnow()
+    for row in rows:
+        row["id"] = generate_uuid()
+        if "created_at" in table.c:
+            row["created_at"] = now
+    db.execute(table.insert(), rows)
+    return [row["id"] for row in rows]
+
+
+def insert_flashcards(db, user_id: str, flashcard_set_id: str, items: list[dict]) -> list[str]:
+    """Bulk-insert generated flashcards into a set; returns their ids. Does not commit.
+
+    Core inserts bypass the after_flush hook, so the chat context is invalidated here.
+    """
+    now = datetime.utcnow()
+    ids = _bulk_insert(db, Flashcard.__table__, [
+        {"user_id": user_id, "flashcard_set_id": flashcard_set_id,
+         "front": item.get("front", ""), "back": item.get("back", ""),
+         "ease": SRS_INITIAL_EASE, "interval_days": 0, "repetitions": 0, "lapses": 0, "due_at": now}
+        for item in items
+    ])
+    if ids:
+        invalidate_chat_context(db, user_id)
+    return ids
+
+
+def insert_quiz_questions(db, user_id: str, quiz_id: str, items: list[dict], start: int = 0) -> list[str]:
+    """Bulk-insert generated questions into a quiz, numbered from `start`; returns their ids.
+    Does not commit. Invalidates the chat context (core inserts bypass the flush hook)."""
+    rows = []
+    for i, item in enumerate(items, start):
+        options = item.get("options", [])
+        rows.append({
+            "user_id": user_id,
+            "quiz_id": quiz_id,
+            "question": item.get("question", ""),
+            "options": json.dumps(options if isinstance(options, list) else []),
+            "correct_answer": item.get("correct_answer", "A"),
+            "explanation": item.get("explanation", ""),
+            "order_num": str(i),
+            "position": i,
+        })
+    ids = _bulk_insert(db, QuizQuestion.__table__, rows)
+    if ids:
+        invalidate_chat_context(db, user_id)
+        db.execute(
+            Quiz.__table__.update()
+            .where(Quiz.id == quiz_id)
+            .values(answer_key=None, question_version=Quiz.__table__.c.question_version + 1)
+        )
+    return ids
+
+
+# kind -> how to persist and present streamed items
+_STUDY_STREAMS = {
+    "flashcards": {
+        "parent": FlashcardSet, "parent_key": "flashcard_set", "count_key": "card_count",
+        "insert": lambda db, user_id, parent_id, items, start: insert_flashcards(db, user_id, parent_id, items),
+        "event": "card",
+        "items_key": "flashcards", "schema": FLASHCARDS_SCHEMA,
+        "public": lambda item: {"front": item.get("front", ""), "back": item.get("back", "")},
+    },
+    "quiz": {
+        "parent": Quiz, "parent_key": "quiz", "count_key": "question_count",
+        "insert": insert_quiz_questions, "event": "question",
+        "items_key": "questions", "schema": QUIZ_SCHEMA,
+        # Answers stay server-side, as in GET /quizzes/{id}
+        "public": lambda item: {"question": item.get("question", ""), "options": item.get("options", [])},
+    },
+}
+
+
+async def _with_fallback(source, fallback: list):
+    """Yield from `source`, or from `fallback` if it produced nothing."""
+    produced = False
+    async for item in source:
+        produced = True
+        yield item
+    if not produced:
+        for item in fallback:
+            yield item
+
+
+async def _stream_study_items(kind: str, user_id: str, course_id: str, name: str, jobs: list,
+                              fallback: list | None = None, target: int | None = None):
+    """SSE generator: create the set/quiz, stream each generated item to the client as it
+    is parsed, and persist items in batches of STUDY_STREAM_PERSIST_BATCH.
+
+    Items arrive in completion order, so near-duplicates are dropped first-come rather
+    than by score, and generation stops once `target` items have been sent."""
+    spec = _STUDY_STREAMS[kind]
+    db = SessionLocal()
+    errors: list = []
+    try:
+        parent = spec["parent"](user_id=user_id, course_id=course_id, name=name)
+        db.add(parent)
+        db.commit()
+        yield _sse({"type": "started", spec["parent_key"]: {"id": parent.id, "name": parent.name}})
+
+        dedup = NearDuplicateFilter()
+        pending: list = []
+        count = 0
+        generated = _stream_generated_items(kind, jobs, errors, spec["items_key"], **structured_output(kind, spec["schema"]))
+        items = _with_fallback(generated, fallback or [])
+        try:
+            async for item in items:
+                if not isinstance(item, dict):
+                    continue
+                if not dedup.add(_study_item_text(kind, item), _study_item_key(kind, item)):
+                    continue
+                pending.append(item)
+                yield _sse({"type": spec["event"], "index": count, spec["event"]: spec["public"](item)})
+                count += 1
+                if len(pending) >= STUDY_STREAM_PERSIST_BATCH:
+                    spec["insert"](db, user_id, parent.id, pending, count - len(pending))
+                    db.commit()
+                    pending = []
+                if target is not None and count >= target:
+                    break
+        finally:
+            # Stop any generation still in flight once the target is reached
+            await items.aclose()
+            await generated.aclose()
+
+        if count == 0:
+            db.delete(parent)
+            db.commit()
+            release_ai_generation_reservation(user_id, db)
+            detail = f"Failed to generate {'flashcards' if kind == 'flashcards' else 'quiz questions'}"
+            for e in errors:
+                try:
+                    _raise_if_openai_error(e)
+                except HTTPException as http_exc:
+                    detail = http_exc.detail
+                    break
+            yield _sse({"type": "error", "detail": detail})
+            return
+
+        spec["insert"](db, user_id, parent.id, pending, count - len(pending))
+        db.commit()
+        print(f"[DEBUG] Streamed {count} {kind} items for course {course_id}")
+        increment_ai_generation(db, user_id)
+        yield _sse({"type": "done", spec["parent_key"]: {"id": parent.id, "name": parent.name, spec["count_key"]: count}})
+    except Exception as e:
+        print(f"[ERROR] Error streaming {kind}: {str(e)}")
+        release_ai_generation_reservation(user_id, db)
+        yield _sse({"type": "error", "detail": "An error occurred during generation. Please try again."})
+    finally:
+        db.close()
+
+
+# Flashcard endpoints
+@app.post("/courses/{course_id}/flashcards", tags=["study-materials"], summary="Upload study material and generate AI flashcards")
+@limiter.limit("10/minute")
+async def generate_flashcards(request: Request, course_id: str, file: UploadFile = File(...), num_cards: int = Query(default=15, ge=5, le=30), stream: bool = Query(default=False, description="Stream cards as server-sent events as they are generated"), current_user: User = Depends(get_current_user)):
+    """Upload a file and generate AI-powered flashcards (question/answer pairs) for a course.
+
+    Accepts PDF, DOCX, TXT, PNG, JPG (max 25 MB). Generates flashcards covering
+    key concepts, definitions, formulas, and facts. Returns the flashcard set ID and all cards.
+    With `stream=true` the response is `text/event-stream`: a `started` event with the set,
+    one `card` event per flashcard as soon as it is generated, then `done` (or `error`).
+    Rate-limited to 10 requests/minute. Requires Pro plan or remaining free-tier generations.
+    """
+    logger.info(f"[DEBUG] /courses/{course_id}/flashcards request received")
+    db = SessionLocal()
+    try:
+        user_id = current_user.id
+        course = db.query(Course).filter(Course.id == course_id, Course.user_id == user_id).first()
+        if not course:
+            raise HTTPException(status_code=404, detail="Course not found")
+        check_tier_limit(db, user_id, "ai_generation")
+
+        # Validate and extract text from file
+        content = await validate_file_upload(file, allowed_extensions=['.pdf', '.txt', '.docx', '.png', '.jpg', '.jpeg'], max_size_mb=25)
+        filename = file.filename.lower()
+
+        if filename.endswith('.pdf'):
+            text = extract_text_from_pdf(content)
+        elif filename.endswith('.txt'):
             text = content.decode('utf-8')
         elif filename.endswith(('.png', '.jpg', '.jpeg')):
             print(f"[DEBUG] Extracting text from image ({len(content)} bytes)")
@@ -3662,43 +3989,39 @@ async def generate_flashcards(request: Request, course_id: str, file: UploadFile
 
         flashcards_data = []
         api_key = os.getenv("OPENAI_API_KEY")
+        if stream:
+            name = file.filename.rsplit('.', 1)[0]
+            jobs = _flashcard_jobs(text, num_cards) if api_key else []
+            return StreamingResponse(
+                _stream_study_items("flashcards", user_id, course_id, name, jobs, fallback=generate_flashcards_fallback(text), target=num_cards),
+                media_type="text/event-stream",
+                headers=SSE_HEADERS,
+            )
         if api_key:
-            chunk_limit = 40000  # ~10k tokens — fits well within gpt-4o-mini context
+            chunk_limit = GENERATION_CHUNK_LIMIT
             if len(text) <= chunk_limit:
                 # Single-pass for short/medium documents
-                system_prompt = f"""You are a study assistant. Generate flashcards from the provided study material.
-
-Return ONLY a valid JSON array with exactly {num_cards} flashcards:
-[
-    {{"front": "Question or term", "back": "Answer or definition"}},
-    ...
-]
-
-Focus on:
-- Key concepts and definitions
-- Important facts and dates
-- Formulas and their applications
-- Cause and effect relationships
-- Compare and contrast items
-
-Make questions clear and answers concise but complete."""
+                system_prompt = _flashcard_prompt(num_cards)
 
                 try:
-                    response = await client.chat.completions.create(
+                    response = await llm_chat("flashcards",
                         model="gpt-4o-mini",
                         messages=[
                             {"role": "system", "content": system_prompt},
                             {"role": "user", "content": f"Generate flashcards from this material:\n\n{text}"}
                         ],
                         temperature=0.3,
-                        max_tokens=4000
+                        max_tokens=4000,
+                        **structured_output("flashcards", FLASHCARDS_SCHEMA),
                     )
 
                     result = response.choices[0].message.content
                     print(f"[DEBUG] Flashcard response: {result[:500]}...")
 
-                    flashcards_data = parse_json_response(result)
+                    flashcards_data = select_study_items("flashcards", [parse_json_items(result, "flashcards")], num_cards)
                     print(f"[DEBUG] Generated {len(flashcards_data)} flashcards")
+                    if not flashcards_data:
+                        flashcards_data = generate_flashcards_fallback(text)
                 except Exception as e:
                     _raise_if_openai_error(e)
                     print(f"[WARN] OpenAI flashcard generation failed: {e}")
@@ -3712,28 +4035,21 @@ Make questions clear and answers concise but complete."""
 
                 async def generate_chunk_flashcards(i: int, chunk: str) -> list:
                     """Generate flashcards for a single chunk."""
-                    chunk_prompt = f"""You are a study assistant. This is section {i+1} of {len(chunks)} from a larger document.
-Generate {cards_per_chunk}-{cards_per_chunk + 5} flashcards from THIS section only.
-
-Return ONLY a valid JSON array:
-[{{"front": "Question or term", "back": "Answer or definition"}}]
-
-Focus on key concepts, definitions, important facts, and formulas. Make questions clear and answers concise."""
+                    chunk_prompt = _flashcard_chunk_prompt(i, len(chunks), cards_per_chunk)
                     try:
-                        response = await client.chat.completions.create(
+                        response = await llm_chat("flashcards",
                             model="gpt-4o-mini",
                             messages=[
                                 {"role": "system", "content": chunk_prompt},
                                 {"role": "user", "content": chunk}
                             ],
                             temperature=0.3,
-                            max_tokens=2000
+                            max_tokens=2000,
+                            **structured_output("flashcards", FLASHCARDS_SCHEMA),
                         )
-                        chunk_cards = parse_json_response(response.choices[0].message.content)
-                        if isinstance(chunk_cards, list):
-                            print(f"[DEBUG] Chunk {i+1}/{len(chunks)}: generated {len(chunk_cards)} flashcards")
-                            return chunk_cards
-                        return []
+                        chunk_cards = parse_json_items(response.choices[0].message.content, "flashcards")
+                        print(f"[DEBUG] Chunk {i+1}/{len(chunks)}: generated {len(chunk_cards)} flashcards")
+                        return chunk_cards
                     except Exception as e:
                         _raise_if_openai_error(e)
                         print(f"[WARN] Chunk {i+1} flashcard generation failed: {e}")
@@ -3743,17 +4059,9 @@ Focus on key concepts, definitions, important facts, and formulas. Make question
                 chunk_results = await asyncio.gather(
                     *[generate_chunk_flashcards(i, chunk) for i, chunk in enumerate(chunks)]
                 )
-                all_cards = [card for chunk_cards in chunk_results for card in chunk_cards]
-
-                # Deduplicate: remove cards with very similar fronts
-                seen_fronts = set()
-                for card in all_cards:
-                    front_key = card.get("front", "").lower().strip()
-                    if front_key and front_key not in seen_fronts:
-                        seen_fronts.add(front_key)
-                        flashcards_data.append(card)
-
-                print(f"[DEBUG] Total flashcards after dedup: {len(flashcards_data)}")
+                # Drop paraphrased duplicates from overlapping chunks, then pick the best num_cards
+                flashcards_data = select_study_items("flashcards", list(chunk_results), num_cards)
+                print(f"[DEBUG] Total flashcards after dedup: {len(flashcards_data)} of {sum(map(len, chunk_results))}")
         else:
             print("[WARN] OPENAI_API_KEY not set; using fallback flashcard generator")
             flashcards_data = generate_flashcards_fallback(text)
@@ -3767,16 +4075,7 @@ Focus on key concepts, definitions, important facts, and formulas. Make question
         db.add(flashcard_set)
         db.flush()
 
-        # Create flashcards
-        for fc in flashcards_data:
-            flashcard = Flashcard(
-                user_id=user_id,
-                flashcard_set_id=flashcard_set.id,
-                front=fc.get("front", ""),
-                back=fc.get("back", "")
-            )
-            db.add(flashcard)
-
+        insert_flashcards(db, user_id, flashcard_set.id, flashcards_data)
         db.commit()
         print(f"[DEBUG] Inserted {len(flashcards_data)} flashcards for course {course_id}")
         increment_ai_generation(db, user_id)
@@ -3831,22 +4130,119 @@ def get_flashcard_set(set_id: str, current_user: User = Depends(get_current_user
         db.close()
 
 
+# SM-2 spaced repetition. Ratings map to SM-2 quality scores; anything below 3 is a lapse.
+SRS_INITIAL_EASE = 2.5
+SRS_MIN_EASE = 1.3
+SRS_RELEARN_MINUTES = 10  # a forgotten card comes back later in the same session
+SRS_HARD_FACTOR = 1.2
+SRS_EASY_BONUS = 1.3
+SRS_MAX_INTERVAL_DAYS = 365
+SRS_RATINGS = {"again": 1, "hard": 3, "good": 4, "easy": 5}
+# Legacy two-button grades still accepted from older clients
+SRS_LEGACY_GRADES = {"known": "good", "learning": "again"}
+
+
+def schedule_review(card, rating: str, now: datetime | None = None):
+    """Apply one review to `card` (SM-2 with again/hard/good/easy buttons) and set its next due date.
+
+    Lapses reset the repetition count and come back after SRS_RELEARN_MINUTES. Successful
+    reviews grow the interval by the card's ease (1 day, then 6, then interval * ease); 'hard'
+    only stretches the current interval by SRS_HARD_FACTOR and 'easy' adds SRS_EASY_BONUS. Ease moves per the SM-2 formula, floored at 1.3.
+    """
+    now = now or datetime.utcnow()
+    quality = SRS_RATINGS[rating]
+    ease = card.ease or SRS_INITIAL_EASE
+    interval = card.interval_days or 0
+    repetitions = card.repetitions or 0
+
+    if quality < 3:
+        card.repetitions = 0
+        card.lapses = (card.lapses or 0) + 1
+        card.interval_days = 0
+        card.due_at = now + timedelta(minutes=SRS_RELEARN_MINUTES)
+    else:
+        repetitions += 1
+        if rating == "hard":
+            interval = max(1, interval * SRS_HARD_FACTOR)
+        elif repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = interval * ease
+        if rating == "easy":
+            interval *= SRS_EASY_BONUS
+        interval = round(min(interval, SRS_MAX_INTERVAL_DAYS), 2)
+        card.repetitions = repetitions
+        card.interval_days = interval
+        card.due_at = now + timedelta(days=interval)
+    card.ease = round(max(SRS_MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)), 3)
+    card.last_reviewed_at = now
+    card.grade = "known" if quality >= 4 else "learning"
+    return card
+
+
+def _schedule_out(card) -> dict:
+    return {
+        "due_at": card.due_at.isoformat() if card.due_at else None,
+        "interval_days": card.interval_days,
+        "ease": card.ease,
+        "repetitions": card.repetitions,
+    }
+
+
 class FlashcardGradePayload(BaseModel):
-    grade: str  # "known" or "learning"
+    grade: str  # "again" | "hard" | "good" | "easy", or legacy "known" / "learning"
 
 @app.patch("/flashcards/{card_id}/grade")
 def grade_flashcard(card_id: str, payload: FlashcardGradePayload, current_user: User = Depends(get_current_user)):
-    """Persist a 'known' or 'learning' grade for a single flashcard."""
-    if payload.grade not in ("known", "learning"):
-        raise HTTPException(status_code=400, detail="grade must be 'known' or 'learning'")
+    """Record a review of a single flashcard and reschedule it.
+
+    Accepts the four spaced-repetition ratings, or the legacy 'known' / 'learning' grades
+    (treated as 'good' / 'again'). The card's `grade` field keeps the known/learning summary.
+    """
+    rating = SRS_LEGACY_GRADES.get(payload.grade, payload.grade)
+    if rating not in SRS_RATINGS:
+        raise HTTPException(status_code=400, detail="grade must be one of 'again', 'hard', 'good', 'easy', 'known', 'learning'")
     db = SessionLocal()
     try:
         card = db.query(Flashcard).filter(Flashcard.id == card_id, Flashcard.user_id == current_user.id).first()
         if not card:
             raise HTTPException(status_code=404, detail="Flashcard not found")
-        card.grade = payload.grade
+        schedule_review(card, rating)
         db.commit()
-        return {"id": card_id, "grade": card.grade}
+        return {"id": card_id, "grade": card.grade, **_schedule_out(card)}
+    finally:
+        db.close()
+
+
+@app.get("/study/due", tags=["study-materials"], summary="Next flashcards due for review")
+def get_due_flashcards(limit: int = Query(default=20, ge=1, le=200), current_user: User = Depends(get_current_user)):
+    """Return the user's flashcards that are due now, most overdue first, across all sets.
+
+    One query served by the (user_id, due_at) index: a range scan that stops after `limit`
+    rows, so cost doesn't grow with the size of the user's collection.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        rows = (
+            db.query(Flashcard, FlashcardSet.name, FlashcardSet.course_id)
+            .join(FlashcardSet, FlashcardSet.id == Flashcard.flashcard_set_id)
+            .filter(Flashcard.user_id == current_user.id, Flashcard.due_at <= now)
+            .order_by(Flashcard.due_at)
+            .limit(limit)
+            .all()
+        )
+        return {
+            "now": now.isoformat(),
+            "cards": [
+                {"id": card.id, "front": card.front, "back": card.back, "grade": card.grade,
+                 "flashcard_set_id": card.flashcard_set_id, "set_name": set_name, "course_id": course_id,
+                 **_schedule_out(card)}
+                for card, set_name, course_id in rows
+            ],
+        }
     finally:
         db.close()
 
@@ -4011,12 +4407,14 @@ async def upload_syllabus(request: Request, file: UploadFile = File(...), curren
 
 @app.post("/courses/{course_id}/generate-quiz", tags=["study-materials"], summary="Upload study material and generate an AI quiz")
 @limiter.limit("10/minute")
-async def generate_quiz(request: Request, course_id: str, file: UploadFile = File(...), num_questions: int = Query(default=7, ge=3, le=30), current_user: User = Depends(get_current_user)):
+async def generate_quiz(request: Request, course_id: str, file: UploadFile = File(...), num_questions: int = Query(default=7, ge=3, le=30), stream: bool = Query(default=False, description="Stream questions as server-sent events as they are generated"), current_user: User = Depends(get_current_user)):
     """Upload a file and generate an AI-powered multiple-choice quiz for a course.
 
     Accepts PDF, DOCX, TXT, PNG, JPG (max 25 MB). Generates multiple-choice questions, each with
     4 options (A/B/C/D), a correct answer, and an explanation. Returns the quiz ID and
     question count. Fetch the full quiz via GET /quizzes/{quiz_id}.
+    With `stream=true` the response is `text/event-stream`: `started`, one `question` event per
+    question (without the answer) as soon as it is generated, then `done` (or `error`).
     Rate-limited to 10 requests/minute. Requires Pro plan or remaining free-tier generations.
     """
     db = SessionLocal()
@@ -4052,54 +4450,38 @@ async def generate_quiz(request: Request, course_id: str, file: UploadFile = Fil
         if not api_key:
             raise HTTPException(status_code=500, detail="Quiz generation requires OpenAI API key")
 
-        chunk_limit = 40000
+        if stream:
+            name = file.filename.rsplit('.', 1)[0]
+            return StreamingResponse(
+                _stream_study_items("quiz", user_id, course_id, name, _quiz_jobs(text, num_questions), target=num_questions),
+                media_type="text/event-stream",
+                headers=SSE_HEADERS,
+            )
+
+        chunk_limit = GENERATION_CHUNK_LIMIT
         questions = []
 
         if len(text) <= chunk_limit:
             # Single-pass for short/medium documents
-            system_prompt = f"""You are a study assistant. Generate a multiple-choice quiz from the provided study material.
-
-Return ONLY a valid JSON object with this structure:
-{{
-    "questions": [
-        {{
-            "question": "Clear question text",
-            "options": ["A) First option", "B) Second option", "C) Third option", "D) Fourth option"],
-            "correct_answer": "B",
-            "explanation": "Brief explanation of why this is correct"
-        }}
-    ]
-}}
-
-Guidelines:
-- Generate exactly {num_questions} questions
-- Each question should have exactly 4 options (A, B, C, D)
-- Questions should test understanding, not just memorization
-- Include a mix of difficulty levels
-- Make distractors (wrong answers) plausible
-- Keep explanations concise (1-2 sentences)"""
+            system_prompt = _quiz_prompt(num_questions)
 
             try:
-                response = await client.chat.completions.create(
+                response = await llm_chat("quiz",
                     model="gpt-4o-mini",
                     messages=[
                         {"role": "system", "content": system_prompt},
                         {"role": "user", "content": f"Generate a quiz from this material:\n\n{text}"}
                     ],
                     temperature=0.4,
-                    max_tokens=4000
+                    max_tokens=4000,
+                    **structured_output("quiz", QUIZ_SCHEMA),
                 )
 
                 result = response.choices[0].message.content
                 print(f"[DEBUG] Quiz response: {result[:500]}...")
 
-                quiz_data = parse_json_response(result)
-
-                if isinstance(quiz_data, list):
-                    questions = quiz_data
-                elif isinstance(quiz_data, dict) and "questions" in quiz_data:
-                    questions = quiz_data["questions"]
-                else:
+                questions = select_study_items("quiz", [parse_json_items(result, "questions")], num_questions)
+                if not questions:
                     raise ValueError("Invalid quiz format from AI")
 
                 print(f"[DEBUG] Generated {len(questions)} quiz questions")
@@ -4117,30 +4499,19 @@ Guidelines:
 
             async def generate_chunk_questions(i: int, chunk: str) -> list:
                 """Generate quiz questions for a single chunk."""
-                chunk_prompt = f"""You are a study assistant. This is section {i+1} of {len(chunks)} from a larger document.
-Generate {qs_per_chunk}-{qs_per_chunk + 2} multiple-choice questions from THIS section only.
-
-Return ONLY a valid JSON object:
-{{"questions": [{{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "B", "explanation": "..."}}]}}
-
-Each question must have exactly 4 options (A, B, C, D). Test understanding, not just memorization."""
+                chunk_prompt = _quiz_chunk_prompt(i, len(chunks), qs_per_chunk)
                 try:
-                    response = await client.chat.completions.create(
+                    response = await llm_chat("quiz",
                         model="gpt-4o-mini",
                         messages=[
                             {"role": "system", "content": chunk_prompt},
                             {"role": "user", "content": chunk}
                         ],
                         temperature=0.4,
-                        max_tokens=2000
+                        max_tokens=2000,
+                        **structured_output("quiz", QUIZ_SCHEMA),
                     )
-                    chunk_data = parse_json_response(response.choices[0].message.content)
-                    if isinstance(chunk_data, list):
-                        chunk_qs = chunk_data
-                    elif isinstance(chunk_data, dict) and "questions" in chunk_data:
-                        chunk_qs = chunk_data["questions"]
-                    else:
-                        chunk_qs = []
+                    chunk_qs = parse_json_items(response.choices[0].message.content, "questions")
                     print(f"[DEBUG] Chunk {i+1}/{len(chunks)}: generated {len(chunk_qs)} quiz questions")
                     return chunk_qs
                 except Exception as e:
@@ -4152,69 +4523,299 @@ Each question must have exactly 4 options (A, B, C, D). Test understanding, not
             chunk_results = await asyncio.gather(
                 *[generate_chunk_questions(i, chunk) for i, chunk in enumerate(chunks)]
             )
-            all_questions = [q for chunk_qs in chunk_results for q in chunk_qs]
+            # Drop paraphrased duplicates from overlapping chunks, then pick the best num_questions
+            questions = select_study_items("quiz", list(chunk_results), num_questions)
+            print(f"[DEBUG] Total quiz questions after dedup: {len(questions)} of {sum(map(len, chunk_results))}")
+
+        # Create quiz
+        quiz = Quiz(
+            user_id=user_id,
+            course_id=course_id,
+            name=file.filename.rsplit('.', 1)[0]  # Use filename without extension
+        )
+        db.add(quiz)
+        db.flush()
 
-            # Deduplicate by question text
-            seen = set()
-            for q in all_questions:
-                q_key = q.get("question", "").lower().strip()
-                if q_key and q_key not in seen:
-                    seen.add(q_key)
-                    questions.append(q)
+        insert_quiz_questions(db, user_id, quiz.id, questions)
+        db.commit()
+        print(f"[DEBUG] Created quiz with {len(questions)} questions for course {course_id}")
+        increment_ai_generation(db, user_id)
 
-            print(f"[DEBUG] Total quiz questions after dedup: {len(questions)}")
+        return {
+            "quiz": {
+                "id": quiz.id,
+                "name": quiz.name,
+                "question_count": len(questions)
+            }
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"[ERROR] Error generating quiz: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail="An error occurred while generating the quiz. Please try again.")
+    finally:
+        db.close()
+
+
+# ── Study pack: summary + flashcards + quiz from one upload ──────────────────
+
+STUDY_PACK_SCHEMA = _schema_object({
+    "summary": _STR,
+    "flashcards": FLASHCARDS_SCHEMA["properties"]["flashcards"],
+    "questions": QUIZ_SCHEMA["properties"]["questions"],
+})
+
+
+def _study_pack_prompt(num_cards: int, num_questions: int, section: tuple[int, int] | None = None) -> str:
+    if section is None:
+        scope = "Create a complete study pack from the provided study material."
+        summary_rule = "5-8 bullet points plus a short 1-2 sentence overview, focused on key concepts, definitions, and important facts"
+        counts = f"exactly {num_cards} flashcards", f"exactly {num_questions} multiple-choice questions"
+    else:
+        i, total = section
+        scope = f"This is section {i+1} of {total} from a larger document. Create study materials from THIS section only."
+        summary_rule = "3-5 bullet points covering the main ideas in this section"
+        counts = f"{num_cards}-{num_cards + 5} flashcards", f"{num_questions}-{num_questions + 2} multiple-choice questions"
+    return f"""You are a study assistant. {scope}
+
+Return ONLY a valid JSON object:
+{{
+    "summary": "Markdown summary",
+    "flashcards": [{{"front": "Question or term", "back": "Answer or definition"}}],
+    "questions": [{{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "B", "explanation": "..."}}]
+}}
+
+- summary: {summary_rule}
+- flashcards: {counts[0]} on key concepts, definitions, important facts, and formulas. Make questions clear and answers concise.
+- questions: {counts[1]}, each with exactly 4 options (A, B, C, D) and a 1-2 sentence explanation. Test understanding, not just memorization."""
+
+
+async def generate_study_pack(text: str, num_cards: int, num_questions: int) -> tuple[str, list[dict], list[dict]]:
+    """Summary, flashcards and quiz questions from one completion per chunk.
+
+    Short documents take a single call; long ones take one call per chunk in parallel,
+    plus one call merging the section summaries (as generate_summary_from_text does).
+    """
+    if len(text) <= GENERATION_CHUNK_LIMIT:
+        chunks = [text]
+        jobs = [(_study_pack_prompt(num_cards, num_questions), f"Create a study pack from this material:\n\n{text}", 6000)]
+    else:
+        chunks = split_text_into_chunks(text, chunk_size=12000)
+        cards_per_chunk = max(3, num_cards // len(chunks))
+        qs_per_chunk = max(2, num_questions // len(chunks))
+        jobs = [(_study_pack_prompt(cards_per_chunk, qs_per_chunk, (i, len(chunks))), chunk, 3500) for i, chunk in enumerate(chunks)]
+    print(f"[DEBUG] Generating study pack from {len(text)} characters in {len(chunks)} pass(es)")
+
+    async def generate_part(i: int, system_prompt: str, user_content: str, max_tokens: int) -> dict:
+        try:
+            response = await llm_chat("study_pack",
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content}
+                ],
+                temperature=0.3,
+                max_tokens=max_tokens,
+                **structured_output("study_pack", STUDY_PACK_SCHEMA),
+            )
+            result = response.choices[0].message.content
+            try:
+                part = parse_json_response(result)
+            except json.JSONDecodeError:
+                part = {}
+            if not isinstance(part, dict):
+                part = {}
+            # Salvage items even when the object as a whole was cut off
+            return {
+                "summary": part.get("summary") if isinstance(part.get("summary"), str) else "",
+                "flashcards": parse_json_items(result, "flashcards"),
+                "questions": parse_json_items(result, "questions"),
+            }
+        except Exception as e:
+            _raise_if_openai_error(e)
+            print(f"[WARN] Study pack part {i+1} failed: {e}")
+            return {"summary": "", "flashcards": [], "questions": []}
+
+    parts = await asyncio.gather(*[generate_part(i, *job) for i, job in enumerate(jobs)])
+
+    flashcards = select_study_items("flashcards", [part["flashcards"] for part in parts], num_cards)
+    questions = select_study_items("quiz", [part["questions"] for part in parts], num_questions)
+
+    section_summaries = [part["summary"].strip() for part in parts if part["summary"].strip()]
+    if len(parts) == 1 or len(section_summaries) <= 1:
+        summary_text = section_summaries[0] if section_summaries else ""
+    else:
+        combined_text = "\n\n".join(f"Section {i+1}:\n{summary}" for i, summary in enumerate(section_summaries))
+        try:
+            response = await llm_chat("summary",
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": SUMMARY_MERGE_PROMPT},
+                    {"role": "user", "content": combined_text}
+                ],
+                temperature=0.3,
+                max_tokens=1200
+            )
+            summary_text = response.choices[0].message.content.strip()
+        except Exception as e:
+            _raise_if_openai_error(e)
+            print(f"[WARN] Study pack summary merge failed: {e}")
+            summary_text = combined_text
+    return summary_text, flashcards, questions
+
+
+@app.post("/courses/{course_id}/study-pack", tags=["study-materials"], summary="Upload study material and generate a summary, flashcards and a quiz")
+@limiter.limit("10/minute")
+async def create_study_pack(request: Request, course_id: str, file: UploadFile = File(...), num_cards: int = Query(default=15, ge=5, le=30), num_questions: int = Query(default=7, ge=3, le=30), current_user: User = Depends(get_current_user)):
+    """Upload a file once and generate a summary, a flashcard set and a quiz from it.
+
+    Accepts PDF, DOCX, TXT, PNG, JPG (max 25 MB). The file is read and extracted once and
+    each chunk goes through a single completion that returns all three artifacts, instead of
+    the three uploads and three sets of completions the separate endpoints need.
+    Returns the saved summary, flashcard set and quiz (artifacts the model produced nothing
+    for are null). Counts as one AI generation per artifact created; all three are reserved
+    against the free-tier limit up front and the unused ones refunded.
+    Rate-limited to 10 requests/minute. Requires Pro plan or remaining free-tier generations.
+    """
+    logger.info(f"[DEBUG] /courses/{course_id}/study-pack request received")
+    db = SessionLocal()
+    try:
+        user_id = current_user.id
+        course = db.query(Course).filter(Course.id == course_id, Course.user_id == user_id).first()
+        if not course:
+            raise HTTPException(status_code=404, detail="Course not found")
+        check_tier_limit(db, user_id, "ai_generation", count=3)
+        if not os.getenv("OPENAI_API_KEY"):
+            raise HTTPException(status_code=500, detail="Study pack generation requires OpenAI API key")
 
-        # Create quiz
-        quiz = Quiz(
-            user_id=user_id,
-            course_id=course_id,
-            name=file.filename.rsplit('.', 1)[0]  # Use filename without extension
-        )
-        db.add(quiz)
-        db.flush()
+        content = await validate_file_upload(file, allowed_extensions=['.pdf', '.txt', '.docx', '.png', '.jpg', '.jpeg'], max_size_mb=25)
+        filename = file.filename.lower()
 
-        # Create questions
-        for i, q in enumerate(questions):
-            options = q.get("options", [])
-            if isinstance(options, list):
-                options_json = json.dumps(options)
-            else:
-                options_json = json.dumps([])
+        if filename.endswith('.pdf'):
+            text = extract_text_from_pdf(content)
+        elif filename.endswith('.txt'):
+            text = content.decode('utf-8', errors='ignore')
+        elif filename.endswith(('.png', '.jpg', '.jpeg')):
+            text = await extract_text_from_image(content, filename)
+        elif filename.endswith('.docx'):
+            text = extract_text_from_docx(content)
+        else:
+            raise HTTPException(status_code=400, detail="Supported formats: PDF, TXT, DOCX, PNG, JPG")
 
-            question = QuizQuestion(
-                user_id=user_id,
-                quiz_id=quiz.id,
-                question=q.get("question", ""),
-                options=options_json,
-                correct_answer=q.get("correct_answer", "A"),
-                explanation=q.get("explanation", ""),
-                order_num=str(i)
-            )
-            db.add(question)
+        print(f"[DEBUG] Extracted {len(text)} characters for study pack")
+        if len(text.strip()) < 50:
+            raise HTTPException(status_code=400, detail="Could not extract enough text from file")
 
+        summary_text, flashcards_data, questions = await generate_study_pack(text, num_cards, num_questions)
+        if not (summary_text or flashcards_data or questions):
+            raise HTTPException(status_code=500, detail="Failed to generate study pack")
+
+        name = file.filename.rsplit('.', 1)[0]
+        summary = flashcard_set = quiz = None
+        if summary_text:
+            summary = Summary(user_id=user_id, course_id=course_id, title=name, content=summary_text)
+            db.add(summary)
+        if flashcards_data:
+            flashcard_set = FlashcardSet(user_id=user_id, course_id=course_id, name=name)
+            db.add(flashcard_set)
+        if questions:
+            quiz = Quiz(user_id=user_id, course_id=course_id, name=name)
+            db.add(quiz)
+        db.flush()
+        if flashcard_set:
+            insert_flashcards(db, user_id, flashcard_set.id, flashcards_data)
+        if quiz:
+            insert_quiz_questions(db, user_id, quiz.id, questions)
         db.commit()
-        print(f"[DEBUG] Created quiz with {len(questions)} questions for course {course_id}")
-        increment_ai_generation(db, user_id)
+
+        created = sum(x is not None for x in (summary, flashcard_set, quiz))
+        print(f"[DEBUG] Study pack for course {course_id}: summary={summary is not None}, {len(flashcards_data)} flashcards, {len(questions)} questions")
+        increment_ai_generation(db, user_id, count=created)
 
         return {
+            "summary": {
+                "id": summary.id,
+                "course_id": course_id,
+                "title": summary.title,
+                "content": summary.content,
+                "created_at": summary.created_at.isoformat()
+            } if summary else None,
+            "flashcard_set": {
+                "id": flashcard_set.id,
+                "name": flashcard_set.name,
+                "card_count": len(flashcards_data)
+            } if flashcard_set else None,
+            "flashcards": flashcards_data,
             "quiz": {
                 "id": quiz.id,
                 "name": quiz.name,
                 "question_count": len(questions)
-            }
+            } if quiz else None,
         }
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[ERROR] Error generating quiz: {str(e)}")
+        print(f"[ERROR] Error generating study pack: {str(e)}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=500, detail="An error occurred while generating the quiz. Please try again.")
+        raise HTTPException(status_code=500, detail="An error occurred while generating the study pack. Please try again.")
     finally:
         db.close()
 
 
+def _build_quiz_answer_key(db, quiz_id: str) -> list[dict]:
+    key = []
+    for q in (
+        db.query(QuizQuestion)
+        .filter(QuizQuestion.quiz_id == quiz_id)
+        .order_by(QuizQuestion.position, QuizQuestion.id)
+        .all()
+    ):
+        try:
+            options = json.loads(q.options)
+        except (json.JSONDecodeError, TypeError, ValueError) as e:
+            print(f"[WARNING] Failed to parse options for question {q.id}: {str(e)}")
+            options = []
+        key.append({
+            "id": q.id,
+            "question": q.question,
+            "options": options if isinstance(options, list) else [],
+            "correct_answer": q.correct_answer,
+            "explanation": q.explanation,
+        })
+    return key
+
+
+def quiz_answer_key(db, quiz: Quiz) -> list[dict]:
+    """The quiz's questions in order with parsed options, answers and explanations.
+
+    Read from the precomputed quizzes.answer_key blob; built from quiz_questions and
+    stored the first time it's needed after the questions change. The key is stored only
+    if no batch of questions landed while it was being built (question_version unchanged),
+    so a concurrent insert can't be masked by a key missing its questions.
+    """
+    if quiz.answer_key:
+        try:
+            return json.loads(quiz.answer_key)
+        except ValueError:
+            pass
+    version = quiz.question_version or 0
+    key = _build_quiz_answer_key(db, quiz.id)
+    # Core update: caching the key shouldn't look like a quiz edit to the chat-context hook
+    table = Quiz.__table__
+    db.execute(
+        table.update()
+        .where(table.c.id == quiz.id, table.c.answer_key.is_(None), table.c.question_version == version)
+        .values(answer_key=json.dumps(key))
+    )
+    db.commit()
+    return key
+
+
 @app.get("/quizzes/{quiz_id}", tags=["study-materials"], summary="Get a quiz with all questions", response_model=QuizOut)
 def get_quiz(quiz_id: str, current_user: User = Depends(get_current_user)):
     """Return a quiz and all its multiple-choice questions.
@@ -4230,20 +4831,11 @@ def get_quiz(quiz_id: str, current_user: User = Depends(get_current_user)):
         if not quiz:
             raise HTTPException(status_code=404, detail="Quiz not found")
 
-        questions = []
-        for q in sorted(quiz.questions, key=lambda x: x.order_num):
-            try:
-                options = json.loads(q.options)
-            except (json.JSONDecodeError, TypeError, ValueError) as e:
-                print(f"[WARNING] Failed to parse options for question {q.id}: {str(e)}")
-                options = []
-
-            questions.append({
-                "id": q.id,
-                "question": q.question,
-                "options": options,
-                # Don't include correct_answer or explanation in GET - only after submission
-            })
+        # Don't include correct_answer or explanation in GET - only after submission
+        questions = [
+            {"id": q["id"], "question": q["question"], "options": q["options"]}
+            for q in quiz_answer_key(db, quiz)
+        ]
 
         return {
             "id": quiz.id,
@@ -4270,35 +4862,37 @@ def submit_quiz(quiz_id: str, submission: QuizSubmission, current_user: User = D
         if not quiz:
             raise HTTPException(status_code=404, detail="Quiz not found")
 
-        results = []
-        correct_count = 0
-        total_count = len(quiz.questions)
-
-        for q in sorted(quiz.questions, key=lambda x: x.order_num):
-            user_answer = submission.answers.get(q.id, "")
-            is_correct = user_answer.upper() == q.correct_answer.upper()
-
-            if is_correct:
-                correct_count += 1
-
-            try:
-                options = json.loads(q.options)
-            except (json.JSONDecodeError, TypeError, ValueError) as e:
-                print(f"[WARNING] Failed to parse options for question {q.id}: {str(e)}")
-                options = []
-
-            results.append({
-                "question_id": q.id,
-                "question": q.question,
-                "options": options,
-                "user_answer": user_answer,
-                "correct_answer": q.correct_answer,
-                "is_correct": is_correct,
-                "explanation": q.explanation
-            })
+        key = quiz_answer_key(db, quiz)
+        answers = submission.answers
+        user_answers = [answers.get(q["id"], "") for q in key]
+        graded = [a.upper() == q["correct_answer"].upper() for a, q in zip(user_answers, key)]
+        correct_count = sum(graded)
+        total_count = len(key)
+        results = [
+            {
+                "question_id": q["id"],
+                "question": q["question"],
+                "options": q["options"],
+                "user_answer": a,
+                "correct_answer": q["correct_answer"],
+                "is_correct": ok,
+                "explanation": q["explanation"]
+            }
+            for q, a, ok in zip(key, user_answers, graded)
+        ]
 
         score_percentage = round((correct_count / total_count) * 100) if total_count > 0 else 0
 
+        db.add(QuizAttempt(
+            user_id=user_id,
+            quiz_id=quiz_id,
+            score=correct_count,
+            total=total_count,
+            percentage=score_percentage,
+            answers=json.dumps({q["id"]: a for q, a in zip(key, user_answers) if a}),
+        ))
+        db.commit()
+
         return {
             "quiz_id": quiz_id,
             "quiz_name": quiz.name,
@@ -4311,6 +4905,38 @@ def submit_quiz(quiz_id: str, submission: QuizSubmission, current_user: User = D
         db.close()
 
 
+@app.get("/quizzes/{quiz_id}/attempts", tags=["study-materials"], summary="List past scored attempts of a quiz")
+def get_quiz_attempts(quiz_id: str, limit: int = Query(default=20, ge=1, le=100), current_user: User = Depends(get_current_user)):
+    """Return the most recent scored submissions of a quiz, newest first.
+
+    Each attempt includes `score`, `total`, `percentage` and `created_at`.
+    """
+    db = SessionLocal()
+    try:
+        user_id = current_user.id
+        if not db.query(Quiz.id).filter(Quiz.id == quiz_id, Quiz.user_id == user_id).first():
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        attempts = (
+            db.query(QuizAttempt)
+            .filter(QuizAttempt.user_id == user_id, QuizAttempt.quiz_id == quiz_id)
+            .order_by(QuizAttempt.created_at.desc(), QuizAttempt.id)
+            .limit(limit)
+            .all()
+        )
+        return [
+            {
+                "id": a.id,
+                "score": a.score,
+                "total": a.total,
+                "percentage": a.percentage,
+                "created_at": a.created_at.isoformat() if a.created_at else None
+            }
+            for a in attempts
+        ]
+    finally:
+        db.close()
+
+
 @app.get("/courses/{course_id}/quizzes", tags=["study-materials"], summary="List all quizzes for a course", response_model=list[QuizSummaryOut])
 def get_course_quizzes(course_id: str, current_user: User = Depends(get_current_user)):
     """Return a list of all AI-generated quizzes for a given course (without questions).
@@ -4378,6 +5004,7 @@ def submit_feedback(request: Request, payload: FeedbackRequest, current_user: Us
 
         if RESEND_API_KEY and FEEDBACK_EMAIL:
             try:
+                import resend
                 resend.api_key = RESEND_API_KEY
                 type_label = {"bug": "Bug Report", "feature": "Feature Request", "general": "General Feedback"}.get(payload.feedback_type, payload.feedback_type)
                 resend.Emails.send({
@@ -4400,291 +5027,6 @@ def submit_feedback(request: Request, payload: FeedbackRequest, current_user: Us
         db.close()
 
 
-# ── LMS Sync Logic ──────────────────────────────────────────────────────────
-
-def _normalize(text: str) -> str:
-    """Normalize text for course matching: lowercase, strip separators to spaces."""
-    return re.sub(r'[\s\-_.,/]+', ' ', text.lower().strip())
-
-
-def _extract_course_codes(text: str) -> list[str]:
-    """Extract course code patterns like FINC315, FINC-315, FINC 315, etc.
-    Returns normalized codes like 'finc 315'."""
-    # Match 2-4 letter dept code + optional separator + 3-4 digit number
-    patterns = re.findall(r'([a-zA-Z]{2,4})[\s\-_./]*(\d{3,4})', text)
-    return [f"{dept.lower()} {num}" for dept, num in patterns]
-
-
-def _match_course(lms_text: str, lms_code: str, user_courses) -> str | None:
-    """Try to match LMS course name/code against the user's ClassMate courses.
-    Uses normalized text comparison and course code extraction for robust matching.
-    Returns the matched course_id or None."""
-
-    # Normalize inputs
-    norm_text = _normalize(lms_text)
-    norm_code = _normalize(lms_code)
-
-    # Extract course codes from both LMS fields
-    lms_codes = set()
-    lms_codes.update(_extract_course_codes(lms_text))
-    lms_codes.update(_extract_course_codes(lms_code))
-
-    best_match = None
-    best_score = 0
-
-    for uc in user_courses:
-        uc_name = _normalize(uc.name or "")
-        uc_code = _normalize(uc.code or "")
-        uc_extracted = set(_extract_course_codes(uc.code or ""))
-        uc_extracted.update(_extract_course_codes(uc.name or ""))
-
-        # Score 1: Exact normalized code match (e.g. "finc 315" == "finc 315")
-        if uc_code and norm_code and uc_code == norm_code:
-            return uc.id
-
-        # Score 2: Extracted course codes overlap (e.g. "finc 315" from "FINC-315-001-2025SP")
-        if lms_codes and uc_extracted and lms_codes & uc_extracted:
-            return uc.id
-
-        # Score 3: Normalized code appears in normalized text or vice-versa
-        if uc_code and len(uc_code) > 2:
-            if uc_code in norm_text or uc_code in norm_code:
-                return uc.id
-            if norm_code and norm_code in uc_code:
-                return uc.id
-
-        # Score 4: Course name substring match (both directions, min length to avoid false positives)
-        if uc_name and len(uc_name) > 3:
-            if uc_name in norm_text or norm_text in uc_name:
-                # Prefer longer matches
-                match_len = min(len(uc_name), len(norm_text))
-                if match_len > best_score:
-                    best_score = match_len
-                    best_match = uc.id
-
-    return best_match
-
-
-def sync_canvas(connection, user_id: str, db):
-    """Sync assignments from Canvas LMS into deadlines, auto-creating courses.
-    Canvas provides structured course names and codes, so auto-creation is reliable here."""
-    synced = 0
-    errors = []
-    token = decrypt_token(connection.encrypted_token)
-    base = connection.instance_url.rstrip("/")
-    headers = {"Authorization": f"Bearer {token}"}
-
-    # Load user's ClassMate courses for auto-matching
-    user_courses = db.query(Course).filter(Course.user_id == user_id).all()
-
-    try:
-        with httpx.Client(timeout=30.0) as client:
-            # Fetch active courses
-            courses_resp = client.get(f"{base}/api/v1/courses", params={"enrollment_state": "active", "per_page": 100}, headers=headers)
-            if courses_resp.status_code != 200:
-                errors.append(f"Failed to fetch Canvas courses: {courses_resp.status_code}")
-                return synced, errors
-
-            canvas_courses = courses_resp.json()
-
-            for course in canvas_courses:
-                course_id = course.get("id")
-                course_name = course.get("name", "Unknown Course")
-                course_code = course.get("course_code", "")
-                matched_course_id = _match_course(course_name, course_code, user_courses)
-
-                # Auto-create course if no match found
-                if not matched_course_id and course_name != "Unknown Course":
-                    # Build a clean code from Canvas course_code (e.g. "FINC-315-001-2025SP" → "FINC 315")
-                    extracted = _extract_course_codes(course_code or course_name)
-                    clean_code = extracted[0].upper() if extracted else course_code
-                    new_course = Course(
-                        user_id=user_id,
-                        name=course_name,
-                        code=clean_code,
-                    )
-                    db.add(new_course)
-                    db.flush()  # Get the generated ID
-                    matched_course_id = new_course.id
-                    user_courses.append(new_course)  # So subsequent matches can find it
-                    logger.info(f"[LMS] Auto-created course: {clean_code} — {course_name}")
-
-                try:
-                    assignments_resp = client.get(
-                        f"{base}/api/v1/courses/{course_id}/assignments",
-                        params={"order_by": "due_at", "per_page": 100},
-                        headers=headers,
-                    )
-                    if assignments_resp.status_code != 200:
-                        errors.append(f"Failed to fetch assignments for course {course_name}")
-                        continue
-
-                    for assignment in assignments_resp.json():
-                        due_at = assignment.get("due_at")
-                        if not due_at:
-                            continue
-
-                        ext_id = f"canvas_{assignment['id']}"
-                        # Parse due_at (ISO 8601)
-                        try:
-                            dt = datetime.fromisoformat(due_at.replace("Z", "+00:00"))
-                            deadline_date = dt.strftime("%Y-%m-%d")
-                            deadline_time = dt.strftime("%I:%M %p").lstrip("0")
-                        except (ValueError, AttributeError):
-                            continue
-
-                        # Upsert
-                        existing = db.query(Deadline).filter(
-                            Deadline.user_id == user_id,
-                            Deadline.external_id == ext_id,
-                        ).first()
-
-                        if existing:
-                            existing.title = assignment.get("name", "Untitled")
-                            existing.date = deadline_date
-                            existing.time = deadline_time
-                            existing.description = f"[{course_name}] {assignment.get('description', '') or ''}"[:500]
-                            # Auto-match course if not already assigned
-                            if not existing.course_id and matched_course_id:
-                                existing.course_id = matched_course_id
-                        else:
-                            deadline = Deadline(
-                                user_id=user_id,
-                                course_id=matched_course_id,
-                                date=deadline_date,
-                                time=deadline_time,
-                                type="assignment",
-                                title=assignment.get("name", "Untitled"),
-                                description=f"[{course_name}] {assignment.get('description', '') or ''}"[:500],
-                                source="canvas",
-                                external_id=ext_id,
-                            )
-                            db.add(deadline)
-                        synced += 1
-
-                except Exception as e:
-                    errors.append(f"Error syncing course {course_name}: {str(e)}")
-
-            db.commit()
-            connection.last_synced = datetime.utcnow()
-            db.commit()
-
-    except Exception as e:
-        errors.append(f"Canvas sync error: {str(e)}")
-
-    return synced, errors
-
-
-def sync_ical(connection, user_id: str, db):
-    """Sync events from an iCal feed into deadlines, matching against existing courses."""
-    synced = 0
-    errors = []
-
-    # Load user's existing courses for matching
-    user_courses = db.query(Course).filter(Course.user_id == user_id).all()
-
-    try:
-        with httpx.Client(timeout=30.0) as http_client:
-            resp = http_client.get(connection.ical_url)
-            if resp.status_code != 200:
-                errors.append(f"Failed to fetch iCal feed: {resp.status_code}")
-                return synced, errors
-
-            cal = ICalCalendar.from_ical(resp.text)
-
-            # Sync events into deadlines, matching to existing courses
-            for component in cal.walk():
-                if component.name != "VEVENT":
-                    continue
-
-                uid = str(component.get("UID", ""))
-                if not uid:
-                    continue
-
-                ext_id = f"ical_{uid}"
-                summary = str(component.get("SUMMARY", "Untitled"))
-                description = str(component.get("DESCRIPTION", ""))[:500]
-                location = str(component.get("LOCATION", ""))
-                categories = str(component.get("CATEGORIES", ""))
-
-                # Try to match against user's existing courses
-                all_text = f"{summary} {description} {location} {categories} {uid}"
-                matched_course_id = _match_course(all_text, "", user_courses)
-
-                # Parse DTSTART
-                dtstart = component.get("DTSTART")
-                if not dtstart:
-                    continue
-
-                dt_val = dtstart.dt
-                if isinstance(dt_val, datetime):
-                    deadline_date = dt_val.strftime("%Y-%m-%d")
-                    deadline_time = dt_val.strftime("%I:%M %p").lstrip("0")
-                elif isinstance(dt_val, date):
-                    deadline_date = dt_val.strftime("%Y-%m-%d")
-                    deadline_time = None
-                else:
-                    continue
-
-                # Upsert
-                existing = db.query(Deadline).filter(
-                    Deadline.user_id == user_id,
-                    Deadline.external_id == ext_id,
-                ).first()
-
-                if existing:
-                    existing.title = summary
-                    existing.date = deadline_date
-                    existing.time = deadline_time
-                    existing.description = description
-                    # Auto-match course if not already assigned
-                    if not existing.course_id and matched_course_id:
-                        existing.course_id = matched_course_id
-                else:
-                    deadline = Deadline(
-                        user_id=user_id,
-                        course_id=matched_course_id,
-                        date=deadline_date,
-                        time=deadline_time,
-                        type="assignment",
-                        title=summary,
-                        description=description,
-                        source="ical",
-                        external_id=ext_id,
-                    )
-                    db.add(deadline)
-                synced += 1
-
-            db.commit()
-            connection.last_synced = datetime.utcnow()
-            db.commit()
-
-    except Exception as e:
-        errors.append(f"iCal sync error: {str(e)}")
-
-    return synced, errors
-
-
-def sync_all_connections(user_id: str, db):
-    """Sync all LMS connections for a user."""
-    connections = db.query(LMSConnection).filter(LMSConnection.user_id == user_id).all()
-    total_synced = 0
-    all_errors = []
-
-    for conn_obj in connections:
-        if conn_obj.provider == "canvas":
-            count, errs = sync_canvas(conn_obj, user_id, db)
-        elif conn_obj.provider == "ical":
-            count, errs = sync_ical(conn_obj, user_id, db)
-        else:
-            errs = [f"Unknown provider: {conn_obj.provider}"]
-            count = 0
-        total_synced += count
-        all_errors.extend(errs)
-
-    return total_synced, all_errors
-
-
 # ── LMS Endpoints ───────────────────────────────────────────────────────────
 
 @app.post("/lms/connect/canvas")
@@ -4766,6 +5108,8 @@ def connect_ical(
     if not ical_url.startswith("http://") and not ical_url.startswith("https://"):
         raise HTTPException(status_code=400, detail="iCal URL must start with http:// or https://")
 
+    from icalendar import Calendar as ICalCalendar
+
     # Validate by fetching and parsing
     try:
         with httpx.Client(timeout=15.0) as client:
@@ -4869,8 +5213,14 @@ def manual_lms_sync(
     """Manually trigger a sync of all LMS connections."""
     db = SessionLocal()
     try:
-        synced, errors = sync_all_connections(current_user.id, db)
-        return {"synced_count": synced, "errors": errors}
+        started = time.perf_counter()
+        synced, errors, breakdown = sync_all_connections(current_user.id, db)
+        return {
+            "synced_count": synced,
+            "errors": errors,
+            "connections": breakdown,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+        }
     finally:
         db.close()
 
@@ -4902,159 +5252,6 @@ def _match_course_from_message(db, user_id: str, message: str) -> "Course | None
     return courses[0]
 
 
-MAX_SYLLABUS_CONTEXT_TOTAL = 8000  # Max chars of raw syllabus text across all courses
-
-
-def _build_chat_context(db, user_id: str) -> str:
-    """Build system context from user's courses, deadlines, course materials, and study library."""
-    parts: list[str] = []
-
-    # Courses (build shared lookup once)
-    courses = db.query(Course).filter(Course.user_id == user_id).all()
-    course_map = {c.id: c for c in courses}
-    if courses:
-        parts.append("## Student's Courses")
-        for c in courses:
-            info = f"- {c.name}"
-            if c.code:
-                info += f" ({c.code})"
-            if c.semester:
-                info += f" — {c.semester}"
-            parts.append(info)
-            if c.course_info and isinstance(c.course_info, dict):
-                for key, val in c.course_info.items():
-                    if val:
-                        parts.append(f"  {key}: {str(val)[:500]}")
-
-    # Deadlines — all incomplete, ordered by date. No lower bound so past-semester deadlines
-    # are still visible to the model. Upper bound prevents far-future noise.
-    today = date.today()
-    one_year_out = today + timedelta(days=365)
-    deadlines = (
-        db.query(Deadline)
-        .filter(
-            Deadline.user_id == user_id,
-            Deadline.completed == False,
-            Deadline.date <= one_year_out.isoformat(),
-        )
-        .order_by(Deadline.date)
-        .limit(80)
-        .all()
-    )
-    parts.append(f"\n## Deadlines by Course (today: {today.isoformat()})")
-    if deadlines:
-        by_course: dict[str, list] = {}
-        for d in deadlines:
-            c = course_map.get(d.course_id)
-            label = f"{c.code or c.name}" if c else "General"
-            by_course.setdefault(label, []).append(d)
-        for label, items in by_course.items():
-            parts.append(f"\n### {label}")
-            for d in items:
-                time_str = f" at {d.time}" if d.time else ""
-                status = "[past]" if d.date < today.isoformat() else "[upcoming]"
-                parts.append(f"- {d.date}{time_str} {status} — {d.title} ({d.type or 'deadline'}) [id:{d.id}]")
-    else:
-        parts.append("(no deadlines recorded — student has not uploaded a syllabus or added any deadlines)")
-
-    # Summaries as course material context (truncated to budget)
-    summaries = (
-        db.query(Summary)
-        .filter(Summary.user_id == user_id)
-        .order_by(Summary.created_at.desc())
-        .limit(8)
-        .all()
-    )
-    if summaries:
-        parts.append("\n## Course Material Summaries (Use these to answer questions with specific details)")
-        remaining = MAX_FILE_CONTEXT_LENGTH
-        for s in summaries:
-            c = course_map.get(s.course_id)
-            course_name = c.name if c else "Unknown"
-            excerpt = s.content[:min(4000, remaining)]
-            parts.append(f"[Source: {s.title} | Course: {course_name}]\n{excerpt}")
-            remaining -= len(excerpt)
-            if remaining <= 0:
-                break
-
-    # Raw syllabus text — full policy details, grading rubrics, assignment descriptions
-    courses_with_syllabus = [c for c in courses if c.syllabus_text]
-    if courses_with_syllabus:
-        parts.append("\n## Syllabus Details (Use for exact grading, policies, and assignment-specific questions)")
-        syllabus_budget = MAX_SYLLABUS_CONTEXT_TOTAL
-        for c in courses_with_syllabus:
-            if syllabus_budget <= 0:
-                break
-            label = c.code or c.name
-            excerpt = c.syllabus_text[:syllabus_budget]
-            parts.append(f"\n### {label} Syllabus\n{excerpt}")
-            syllabus_budget -= len(excerpt)
-
-    # Study materials metadata — names/counts/dates only, no content
-    # Lets the model know what already exists and proactively notice gaps
-    flashcard_sets = (
-        db.query(FlashcardSet)
-        .filter(FlashcardSet.user_id == user_id)
-        .order_by(FlashcardSet.created_at.desc())
-        .all()
-    )
-    all_quizzes = (
-        db.query(Quiz)
-        .filter(Quiz.user_id == user_id)
-        .order_by(Quiz.created_at.desc())
-        .all()
-    )
-    fc_counts = dict(
-        db.query(Flashcard.flashcard_set_id, func.count(Flashcard.id))
-        .filter(Flashcard.user_id == user_id)
-        .group_by(Flashcard.flashcard_set_id)
-        .all()
-    )
-    q_counts = dict(
-        db.query(QuizQuestion.quiz_id, func.count(QuizQuestion.id))
-        .filter(QuizQuestion.user_id == user_id)
-        .group_by(QuizQuestion.quiz_id)
-        .all()
-    )
-
-    study_by_course = {
-        c.id: {"label": c.code or c.name, "fcs": [], "quizzes": [], "summaries": []}
-        for c in courses
-    }
-    for fs in flashcard_sets:
-        if fs.course_id in study_by_course:
-            cnt = fc_counts.get(fs.id, 0)
-            d = fs.created_at.strftime("%b %d") if fs.created_at else ""
-            study_by_course[fs.course_id]["fcs"].append(f'"{fs.name}" ({cnt} cards, {d})')
-    for q in all_quizzes:
-        if q.course_id in study_by_course:
-            cnt = q_counts.get(q.id, 0)
-            d = q.created_at.strftime("%b %d") if q.created_at else ""
-            study_by_course[q.course_id]["quizzes"].append(f'"{q.name}" ({cnt} questions, {d})')
-    for s in summaries:
-        if s.course_id in study_by_course:
-            d = s.created_at.strftime("%b %d") if s.created_at else ""
-            study_by_course[s.course_id]["summaries"].append(f'"{s.title}" ({d})')
-
-    if courses:
-        parts.append("\n## Study Library (existing materials — no content, just metadata)")
-        for c in courses:
-            data = study_by_course[c.id]
-            label = data["label"]
-            lines = [f"\n### {label}"]
-            if data["fcs"]:
-                lines.append("Flashcard Sets: " + ", ".join(data["fcs"]))
-            if data["quizzes"]:
-                lines.append("Quizzes: " + ", ".join(data["quizzes"]))
-            if data["summaries"]:
-                lines.append("Summaries: " + ", ".join(data["summaries"]))
-            if not (data["fcs"] or data["quizzes"] or data["summaries"]):
-                lines.append("(no study materials yet)")
-            parts.extend(lines)
-
-    return "\n".join(parts)
-
-
 # ── Chat tool definitions (OpenAI function calling) ──────────────────────────
 
 DEADLINE_TOOLS = [
@@ -5362,6 +5559,13 @@ def get_chat_messages(
             .order_by(ChatMessage.created_at.asc())
             .all()
         )
+        attachment_ids = {m.attachment_id for m in messages if m.attachment_id}
+        attachments = {
+            a.id: {"id": a.id, "file_name": a.file_name, "token_count": a.token_count}
+            for a in db.query(ChatAttachment.id, ChatAttachment.file_name, ChatAttachment.token_count)
+            .filter(ChatAttachment.id.in_(attachment_ids))
+            .all()
+        } if attachment_ids else {}
         return [
             {
                 "id": m.id,
@@ -5369,6 +5573,7 @@ def get_chat_messages(
                 "content": m.content,
                 "created_at": m.created_at.isoformat(),
                 "created_study_set": json.loads(m.created_study_set) if m.created_study_set else None,
+                "attachment": attachments[m.attachment_id] if m.attachment_id in attachments else None,
             }
             for m in messages
         ]
@@ -5386,6 +5591,7 @@ async def send_chat_message(
     current_user: User = Depends(get_current_user),
 ):
     """Send a message and get AI response. Free tier gets FREE_CHAT_MESSAGE_LIMIT msgs/week; pro gets PRO_CHAT_MESSAGE_LIMIT msgs/week."""
+    timer = ChatTurnTimer()
     db = SessionLocal()
     try:
         # Verify conversation ownership
@@ -5396,9 +5602,6 @@ async def send_chat_message(
         if not conv:
             raise HTTPException(status_code=404, detail="Conversation not found")
 
-        # Check chat limit (20/week free, 50/week pro)
-        check_chat_limit(db, current_user.id)
-
         message_content = content or ""
 
         if not message_content and not file:
@@ -5411,6 +5614,7 @@ async def send_chat_message(
         # Handle file upload
         file_text = ""
         file_name = ""
+        attachment = None
         if file and file.filename:
             file_name = file.filename
             file_ext = os.path.splitext(file_name)[1].lower()
@@ -5424,53 +5628,135 @@ async def send_chat_message(
             if len(file_bytes) > 25 * 1024 * 1024:
                 raise HTTPException(status_code=400, detail="File too large (max 25MB)")
 
-            if file_ext == ".pdf":
-                file_text = extract_text_from_pdf(file_bytes)
-            elif file_ext == ".docx":
-                file_text = extract_text_from_docx(file_bytes)
-            elif file_ext == ".txt":
-                file_text = file_bytes.decode("utf-8", errors="ignore")
-
-            # Truncate file text
-            if len(file_text) > MAX_FILE_CONTEXT_LENGTH:
-                file_text = file_text[:MAX_FILE_CONTEXT_LENGTH] + "\n[... truncated]"
-
-        # Build user message
+            # Identical re-uploads reuse the stored extraction
+            content_hash = hashlib.sha256(file_bytes).hexdigest()
+            attachment = db.query(ChatAttachment).filter(
+                ChatAttachment.user_id == current_user.id,
+                ChatAttachment.content_hash == content_hash,
+            ).first()
+            if attachment is None:
+                if file_ext == ".pdf":
+                    file_text = extract_text_from_pdf(file_bytes)
+                elif file_ext == ".docx":
+                    file_text = extract_text_from_docx(file_bytes)
+                elif file_ext == ".txt":
+                    file_text = file_bytes.decode("utf-8", errors="ignore")
+
+                # Truncate file text
+                if len(file_text) > MAX_FILE_CONTEXT_LENGTH:
+                    file_text = file_text[:MAX_FILE_CONTEXT_LENGTH] + "\n[... truncated]"
+
+                # Nothing extracted: no attachment, the message goes out without file context
+                if file_text.strip():
+                    attachment = ChatAttachment(
+                        user_id=current_user.id,
+                        file_name=file_name,
+                        content_hash=content_hash,
+                        text=file_text,
+                        token_count=_estimate_tokens(file_text),
+                    )
+                    db.add(attachment)
+                    db.flush()
+            elif attachment.file_name != file_name:
+                # Same bytes under a new name: study sets made from it should carry the current name
+                attachment.file_name = file_name
+            file_text = attachment.text if attachment else ""
+
+        # Build user message — file text lives on the attachment, the message keeps a marker
         user_content = message_content or ""
         if file_text:
-            user_content += f"\n\n[Uploaded file: {file_name}]\n{file_text}"
+            user_content += f"\n\n[Attached: {file_name}]"
 
         # Save user message
         user_msg = ChatMessage(
             conversation_id=conversation_id,
             role="user",
             content=user_content,
+            attachment_id=attachment.id if file_text else None,
         )
         db.add(user_msg)
 
-        # Increment chat usage in same transaction
-        profile = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
-        if profile:
-            profile.chat_messages_used = (profile.chat_messages_used or 0) + 1
+        # Count against the chat limit (20/week free, 50/week pro) in the same transaction;
+        # raises 403 at the limit, rolling back the message
+        consume_chat_message(db, current_user.id)
         db.commit()
         db.refresh(user_msg)
 
-        # Build context and get last 20 messages
-        context = _build_chat_context(db, current_user.id)
-        system_prompt = CHAT_SYSTEM_PROMPT.format(context=context)
-
-        history = (
-            db.query(ChatMessage)
-            .filter(ChatMessage.conversation_id == conversation_id)
-            .order_by(ChatMessage.created_at.desc())
-            .limit(20)
-            .all()
+        # Prompt layout, most stable first so provider prompt caching can reuse the prefix:
+        #   static instructions + snapshot context (changes on library mutations / daily)
+        #   -> rolling history summary (changes on fold) -> verbatim turns (append-only)
+        #   -> per-question retrieved material -> current user message
+        with timer.span("context_build"):
+            context = get_chat_context(db, current_user.id)
+            system_prompt = CHAT_SYSTEM_PROMPT.format(context=context)
+
+        # Unsummarized turns; older ones already live in conv.history_summary
+        with timer.span("history_load"):
+            history_q = db.query(ChatMessage).filter(ChatMessage.conversation_id == conversation_id)
+            if conv.history_summary_until:
+                history_q = history_q.filter(ChatMessage.created_at > conv.history_summary_until)
+            history = history_q.order_by(ChatMessage.created_at.desc()).limit(CHAT_HISTORY_FETCH_LIMIT).all()
+            history.reverse()
+
+            history_attachment_ids = {m.attachment_id for m in history if m.attachment_id}
+            history_attachments = {
+                a.id: a for a in db.query(ChatAttachment).filter(ChatAttachment.id.in_(history_attachment_ids)).all()
+            } if history_attachment_ids else {}
+
+        history_contents = []
+        for msg in history:
+            msg_content = msg.content
+            att = history_attachments.get(msg.attachment_id)
+            if att:
+                msg_content += _attachment_prompt_text(att, current=msg.id == user_msg.id)
+            history_contents.append(msg_content)
+
+        # Keep recent turns verbatim under the token budget; fold older ones into the rolling summary
+        token_counts = [_estimate_tokens(c) for c in history_contents]
+        fold = _split_history(token_counts)
+        if fold:
+            with timer.span("history_fold"):
+                try:
+                    conv.history_summary = await _summarize_history(
+                        conv.history_summary, [(m.role, m.content) for m in history[:fold]]
+                    )
+                    conv.history_summary_until = history[fold - 1].created_at
+                    db.commit()
+                except Exception as e:
+                    logger.error(f"[Chat] History summarization failed, dropping {fold} oldest turns: {e}")
+        verbatim_tokens = sum(token_counts[-CHAT_HISTORY_MAX_MESSAGES:])
+        sent_tokens = sum(token_counts[fold:]) + _estimate_tokens(conv.history_summary or "")
+        logger.info(
+            f"[Chat] History tokens: {verbatim_tokens} verbatim -> {sent_tokens} sent "
+            f"({len(history) - fold} turns kept, {fold} folded)"
         )
-        history.reverse()
 
         openai_messages = [{"role": "system", "content": system_prompt}]
-        for msg in history:
-            openai_messages.append({"role": msg.role, "content": msg.content})
+        if conv.history_summary:
+            openai_messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier part of this conversation:\n{conv.history_summary}",
+            })
+        for msg, msg_content in zip(history[fold:], history_contents[fold:]):
+            openai_messages.append({"role": msg.role, "content": msg_content})
+
+        # Volatile, question-specific material goes last, just before the current message
+        retrieved_parts = [retrieve_chat_context(db, current_user.id, message_content)]
+        earlier_attachment_ids = dict.fromkeys(
+            m.attachment_id for m in history
+            if m.attachment_id in history_attachments and m.attachment_id != user_msg.attachment_id
+        )
+        retrieved_parts += [_attachment_excerpts(history_attachments[a], message_content) for a in earlier_attachment_ids]
+        retrieved = "\n\n".join(p for p in retrieved_parts if p)
+        if retrieved:
+            openai_messages.insert(-1, {"role": "system", "content": retrieved})
+
+        # Most recent file in the conversation window — source for file-based study tools
+        source_attachment = next(
+            (history_attachments[m.attachment_id] for m in reversed(history)
+             if m.role == "user" and m.attachment_id in history_attachments),
+            None,
+        )
 
         # Detect study tool creation intent and generate from file (current or previous in history)
         created_study_set = None
@@ -5488,18 +5774,13 @@ async def send_chat_message(
         ])
 
         if wants_flashcards or wants_quiz:
-            # Use current message file first; fall back to most recent uploaded file in conversation history
+            # Use current message file first; fall back to most recent attachment in conversation history
             source_text = file_text
             source_name = file_name
 
-            if not source_text:
-                for hist_msg in reversed(history):
-                    if hist_msg.role == "user" and "[Uploaded file:" in hist_msg.content:
-                        match = re.search(r'\[Uploaded file: ([^\]]+)\]\n([\s\S]+)', hist_msg.content)
-                        if match:
-                            source_name = match.group(1).strip()
-                            source_text = match.group(2)[:40000]
-                            break
+            if not source_text and source_attachment:
+                source_name = source_attachment.file_name
+                source_text = source_attachment.text[:40000]
 
             if source_text:
                 user_course = _match_course_from_message(db, current_user.id, message_content or "")
@@ -5518,23 +5799,23 @@ Return ONLY a valid JSON array with exactly {num_cards} flashcards:
 [{{"front": "Question or term", "back": "Answer or definition"}}]
 Focus on key concepts, definitions, important facts, and formulas. Make questions clear and answers concise."""
 
-                            fc_response = await client.chat.completions.create(
+                            fc_response = await llm_chat("chat_flashcards",
                                 model="gpt-4o-mini",
                                 messages=[
                                     {"role": "system", "content": fc_prompt},
                                     {"role": "user", "content": f"Generate flashcards from this material:\n\n{text_for_gen}"}
                                 ],
                                 temperature=0.3,
-                                max_tokens=4000
+                                max_tokens=4000,
+                                **structured_output("flashcards", FLASHCARDS_SCHEMA),
                             )
-                            flashcards_data = parse_json_response(fc_response.choices[0].message.content)
+                            flashcards_data = select_study_items("flashcards", [parse_json_items(fc_response.choices[0].message.content, "flashcards")], num_cards)
 
                             if isinstance(flashcards_data, list) and len(flashcards_data) > 0:
                                 flashcard_set = FlashcardSet(user_id=current_user.id, course_id=user_course.id, name=set_name)
                                 db.add(flashcard_set)
                                 db.flush()
-                                for fc in flashcards_data:
-                                    db.add(Flashcard(user_id=current_user.id, flashcard_set_id=flashcard_set.id, front=fc.get("front", ""), back=fc.get("back", "")))
+                                insert_flashcards(db, current_user.id, flashcard_set.id, flashcards_data)
                                 db.commit()
                                 created_study_set = {"type": "flashcards", "id": flashcard_set.id, "name": flashcard_set.name, "count": len(flashcards_data), "course_name": user_course.name}
                                 try:
@@ -5553,30 +5834,23 @@ Return ONLY a valid JSON object:
 {{"questions": [{{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "B", "explanation": "..."}}]}}
 Generate exactly {num_questions} questions with 4 options each (A, B, C, D). Test understanding, not memorization."""
 
-                            q_response = await client.chat.completions.create(
+                            q_response = await llm_chat("chat_quiz",
                                 model="gpt-4o-mini",
                                 messages=[
                                     {"role": "system", "content": q_prompt},
                                     {"role": "user", "content": f"Generate a quiz from this material:\n\n{text_for_gen}"}
                                 ],
                                 temperature=0.4,
-                                max_tokens=4000
+                                max_tokens=4000,
+                                **structured_output("quiz", QUIZ_SCHEMA),
                             )
-                            quiz_raw = parse_json_response(q_response.choices[0].message.content)
-                            if isinstance(quiz_raw, dict) and "questions" in quiz_raw:
-                                questions = quiz_raw["questions"]
-                            elif isinstance(quiz_raw, list):
-                                questions = quiz_raw
-                            else:
-                                questions = []
+                            questions = select_study_items("quiz", [parse_json_items(q_response.choices[0].message.content, "questions")], num_questions)
 
                             if len(questions) > 0:
                                 quiz = Quiz(user_id=current_user.id, course_id=user_course.id, name=set_name)
                                 db.add(quiz)
                                 db.flush()
-                                for i, q in enumerate(questions):
-                                    opts = q.get("options", [])
-                                    db.add(QuizQuestion(user_id=current_user.id, quiz_id=quiz.id, question=q.get("question", ""), options=json.dumps(opts if isinstance(opts, list) else []), correct_answer=q.get("correct_answer", "A"), explanation=q.get("explanation", ""), order_num=str(i)))
+                                insert_quiz_questions(db, current_user.id, quiz.id, questions)
                                 db.commit()
                                 created_study_set = {"type": "quiz", "id": quiz.id, "name": quiz.name, "count": len(questions), "course_name": user_course.name}
                                 try:
@@ -5623,19 +5897,19 @@ Return ONLY a valid JSON array with exactly {num_cards} flashcards:
 [{{"front": "Question or term", "back": "Answer or definition"}}]
 Focus on key concepts, definitions, important facts, and formulas. Make questions clear and answers concise."""
 
-                            fc_response = await client.chat.completions.create(
+                            fc_response = await llm_chat("chat_flashcards",
                                 model="gpt-4o-mini",
                                 messages=[{"role": "user", "content": fc_prompt}],
                                 temperature=0.3,
                                 max_tokens=4000,
+                                **structured_output("flashcards", FLASHCARDS_SCHEMA),
                             )
-                            flashcards_data = parse_json_response(fc_response.choices[0].message.content)
+                            flashcards_data = select_study_items("flashcards", [parse_json_items(fc_response.choices[0].message.content, "flashcards")], num_cards)
                             if isinstance(flashcards_data, list) and len(flashcards_data) > 0:
                                 flashcard_set = FlashcardSet(user_id=current_user.id, course_id=user_course.id, name=set_name)
                                 db.add(flashcard_set)
                                 db.flush()
-                                for fc in flashcards_data:
-                                    db.add(Flashcard(user_id=current_user.id, flashcard_set_id=flashcard_set.id, front=fc.get("front", ""), back=fc.get("back", "")))
+                                insert_flashcards(db, current_user.id, flashcard_set.id, flashcards_data)
                                 db.commit()
                                 created_study_set = {"type": "flashcards", "id": flashcard_set.id, "name": flashcard_set.name, "count": len(flashcards_data), "course_name": user_course.name}
                                 try:
@@ -5662,26 +5936,19 @@ Return ONLY a valid JSON object:
 {{"questions": [{{"question": "...", "options": ["A) ...", "B) ...", "C) ...", "D) ..."], "correct_answer": "B", "explanation": "..."}}]}}
 Generate exactly {num_questions} questions with 4 options each (A, B, C, D). Test understanding, not memorization."""
 
-                            q_response = await client.chat.completions.create(
+                            q_response = await llm_chat("chat_quiz",
                                 model="gpt-4o-mini",
                                 messages=[{"role": "user", "content": q_prompt}],
                                 temperature=0.4,
                                 max_tokens=4000,
+                                **structured_output("quiz", QUIZ_SCHEMA),
                             )
-                            quiz_raw = parse_json_response(q_response.choices[0].message.content)
-                            if isinstance(quiz_raw, dict) and "questions" in quiz_raw:
-                                questions = quiz_raw["questions"]
-                            elif isinstance(quiz_raw, list):
-                                questions = quiz_raw
-                            else:
-                                questions = []
+                            questions = select_study_items("quiz", [parse_json_items(q_response.choices[0].message.content, "questions")], num_questions)
                             if len(questions) > 0:
                                 quiz = Quiz(user_id=current_user.id, course_id=user_course.id, name=set_name)
                                 db.add(quiz)
                                 db.flush()
-                                for i, q in enumerate(questions):
-                                    opts = q.get("options", [])
-                                    db.add(QuizQuestion(user_id=current_user.id, quiz_id=quiz.id, question=q.get("question", ""), options=json.dumps(opts if isinstance(opts, list) else []), correct_answer=q.get("correct_answer", "A"), explanation=q.get("explanation", ""), order_num=str(i)))
+                                insert_quiz_questions(db, current_user.id, quiz.id, questions)
                                 db.commit()
                                 created_study_set = {"type": "quiz", "id": quiz.id, "name": quiz.name, "count": len(questions), "course_name": user_course.name}
                                 try:
@@ -5701,14 +5968,9 @@ Generate exactly {num_questions} questions with 4 options each (A, B, C, D). Tes
                     source_text = file_text
                     source_name = file_name
 
-                    if not source_text:
-                        for hist_msg in reversed(history):
-                            if hist_msg.role == "user" and "[Uploaded file:" in hist_msg.content:
-                                match = re.search(r'\[Uploaded file: ([^\]]+)\]\n([\s\S]+)', hist_msg.content)
-                                if match:
-                                    source_name = match.group(1).strip()
-                                    source_text = match.group(2)[:40000]
-                                    break
+                    if not source_text and source_attachment:
+                        source_name = source_attachment.file_name
+                        source_text = source_attachment.text[:40000]
 
                     if source_text:
                         # Generate a proper summary from source text
@@ -5746,7 +6008,7 @@ Course context:
 
 Format: 1-2 sentence overview, then 6-10 bullet points covering key concepts, definitions, and important facts. Be specific and detailed enough to study from."""
 
-                                sum_response = await client.chat.completions.create(
+                                sum_response = await llm_chat("chat_summary",
                                     model="gpt-4o-mini",
                                     messages=[{"role": "user", "content": sum_prompt}],
                                     temperature=0.3,
@@ -5829,10 +6091,12 @@ Format: 1-2 sentence overview, then 6-10 bullet points covering key concepts, de
             full_content = ""
             try:
                 # Send user message immediately so frontend can display it
+                timer.observe("ttfb", timer.started)
                 yield f"data: {json.dumps({'type': 'user_message', 'message': user_msg_data})}\n\n"
 
                 try:
-                    stream = await client.chat.completions.create(
+                    model_started = time.perf_counter()
+                    stream = await llm_chat("chat",
                         model="gpt-4o-mini",
                         messages=_openai_messages,
                         tools=DEADLINE_TOOLS,
@@ -5850,8 +6114,12 @@ Format: 1-2 sentence overview, then 6-10 bullet points covering key concepts, de
                         if choice.finish_reason:
                             finish_reason = choice.finish_reason
                         delta = choice.delta
+                        if (delta.content or delta.tool_calls) and "first_chunk" not in timer.stages:
+                            timer.observe("first_chunk", model_started)
 
                         if delta.content:
+                            if not full_content:
+                                timer.observe("ttft", timer.started)
                             full_content += delta.content
                             yield f"data: {json.dumps({'type': 'chunk', 'content': delta.content})}\n\n"
 
@@ -5867,6 +6135,7 @@ Format: 1-2 sentence overview, then 6-10 bullet points covering key concepts, de
                                         tool_calls_acc[idx]["name"] = tc.function.name
                                     if tc.function.arguments:
                                         tool_calls_acc[idx]["arguments"] += tc.function.arguments
+                    timer.observe("model_stream", model_started)
 
                     # Execute tool calls, then stream a second confirmation response
                     if finish_reason == "tool_calls" and tool_calls_acc:
@@ -5883,21 +6152,23 @@ Format: 1-2 sentence overview, then 6-10 bullet points covering key concepts, de
                             ]
                         }
                         tool_result_msgs = []
-                        for _, tc in sorted(tool_calls_acc.items()):
-                            try:
-                                args = json.loads(tc["arguments"])
-                            except Exception:
-                                args = {}
-                            result = _execute_chat_tool(tc["name"], args, _user_id, stream_db)
-                            logger.info(f"[Chat] Tool {tc['name']} result: {result}")
-                            tool_result_msgs.append({
-                                "role": "tool",
-                                "tool_call_id": tc["id"],
-                                "content": json.dumps(result),
-                            })
+                        with timer.span("tool_execution"):
+                            for _, tc in sorted(tool_calls_acc.items()):
+                                try:
+                                    args = json.loads(tc["arguments"])
+                                except Exception:
+                                    args = {}
+                                result = _execute_chat_tool(tc["name"], args, _user_id, stream_db)
+                                logger.info(f"[Chat] Tool {tc['name']} result: {result}")
+                                tool_result_msgs.append({
+                                    "role": "tool",
+                                    "tool_call_id": tc["id"],
+                                    "content": json.dumps(result),
+                                })
 
                         followup_msgs = _openai_messages + [assistant_tool_msg] + tool_result_msgs
-                        stream2 = await client.chat.completions.create(
+                        followup_started = time.perf_counter()
+                        stream2 = await llm_chat("chat_tool_followup",
                             model="gpt-4o-mini",
                             messages=followup_msgs,
                             max_tokens=500,
@@ -5907,21 +6178,24 @@ Format: 1-2 sentence overview, then 6-10 bullet points covering key concepts, de
                         async for chunk in stream2:
                             delta = chunk.choices[0].delta.content or ""
                             if delta:
+                                if not full_content:
+                                    timer.observe("ttft", timer.started)
                                 full_content += delta
                                 yield f"data: {json.dumps({'type': 'chunk', 'content': delta})}\n\n"
+                        timer.observe("second_stream", followup_started)
 
-                except OAIRateLimitError:
-                    full_content = "I'm a little busy right now — please wait a moment and try again!"
-                    yield f"data: {json.dumps({'type': 'chunk', 'content': full_content})}\n\n"
-                except OAIAuthError:
-                    full_content = "I ran into a configuration issue. Please contact support."
-                    yield f"data: {json.dumps({'type': 'chunk', 'content': full_content})}\n\n"
                 except Exception as e:
-                    logger.error(f"[Chat] OpenAI streaming error ({type(e).__name__}): {e}")
-                    full_content = "I ran into a hiccup — please try sending your message again!"
+                    if _is_openai_error(e, "RateLimitError"):
+                        full_content = "I'm a little busy right now — please wait a moment and try again!"
+                    elif _is_openai_error(e, "AuthenticationError"):
+                        full_content = "I ran into a configuration issue. Please contact support."
+                    else:
+                        logger.error(f"[Chat] OpenAI streaming error ({type(e).__name__}): {e}")
+                        full_content = "I ran into a hiccup — please try sending your message again!"
                     yield f"data: {json.dumps({'type': 'chunk', 'content': full_content})}\n\n"
 
                 # Save assistant message to DB
+                persist_started = time.perf_counter()
                 assistant_msg = ChatMessage(
                     conversation_id=_conversation_id,
                     role="assistant",
@@ -5941,6 +6215,8 @@ Format: 1-2 sentence overview, then 6-10 bullet points covering key concepts, de
 
                 stream_db.commit()
                 stream_db.refresh(assistant_msg)
+                timer.observe("persist", persist_started)
+                timer.observe("total", timer.started)
 
                 yield f"data: {json.dumps({'type': 'done', 'message_id': assistant_msg.id, 'created_at': assistant_msg.created_at.isoformat(), 'created_study_set': _created_study_set})}\n\n"
 
@@ -5949,6 +6225,7 @@ Format: 1-2 sentence overview, then 6-10 bullet points covering key concepts, de
                 yield f"data: {json.dumps({'type': 'error', 'content': 'Something went wrong. Please try again.'})}\n\n"
             finally:
                 stream_db.close()
+                timer.log(_conversation_id)
 
         return StreamingResponse(
             event_stream(),
@@ -5986,6 +6263,73 @@ def delete_chat_conversation(
 # Proactive Opening Message
 # ============================================================
 
+def build_proactive_context(db, user_id: str, today: date) -> tuple[str, list[str]]:
+    """Assemble the situation summary for the proactive opening message.
+
+    Three queries regardless of how many courses, deadlines or flags the user has:
+    courses with a correlated has-materials flag, upcoming deadlines joined to their
+    course, and undelivered nudge flags joined to their course. Returns the context
+    text and the ids of the flags it mentions (to be marked delivered).
+    """
+    def has_rows(model):
+        return db.query(model.id).filter(model.user_id == user_id, model.course_id == Course.id).exists()
+
+    courses = (
+        db.query(Course.name, or_(has_rows(FlashcardSet), has_rows(Quiz), has_rows(Summary)))
+        .filter(Course.user_id == user_id)
+        .all()
+    )
+    deadlines = (
+        db.query(Deadline.title, Deadline.date, Deadline.type, Course.name)
+        .outerjoin(Course, Course.id == Deadline.course_id)
+        .filter(
+            Deadline.user_id == user_id,
+            Deadline.completed == False,
+            Deadline.date >= today.isoformat(),
+            Deadline.date <= (today + timedelta(days=7)).isoformat(),
+        )
+        .order_by(Deadline.date)
+        .all()
+    )
+    nudge_flags = (
+        db.query(NudgeFlag.id, NudgeFlag.reason, Course.name)
+        .outerjoin(Course, Course.id == NudgeFlag.course_id)
+        .filter(NudgeFlag.user_id == user_id, NudgeFlag.delivered == False)
+        .all()
+    )
+
+    ctx_lines = []
+
+    if courses:
+        names = ", ".join(name for name, _ in courses)
+        ctx_lines.append(f"Student's courses: {names}")
+    else:
+        ctx_lines.append("Student's courses: (none added yet)")
+
+    if deadlines:
+        ctx_lines.append("\nUpcoming deadlines (next 7 days):")
+        for title, due, kind, course_name in deadlines:
+            days_until = (date.fromisoformat(due) - today).days
+            when = "today" if days_until == 0 else "tomorrow" if days_until == 1 else f"in {days_until} days"
+            ctx_lines.append(f"- {title} ({course_name or 'General'}) — due {when}, type: {kind or 'deadline'}")
+    else:
+        ctx_lines.append("\nNo deadlines in the next 7 days.")
+
+    courses_no_materials = [name for name, has_materials in courses if not has_materials]
+    if courses_no_materials:
+        ctx_lines.append(f"\nCourses with no study materials yet: {', '.join(courses_no_materials)}")
+
+    if nudge_flags:
+        ctx_lines.append("\nPriority flags:")
+        for _, reason, course_name in nudge_flags:
+            if reason == "due_tomorrow" and course_name:
+                ctx_lines.append(f"- {course_name} has something due tomorrow with no study materials")
+            elif reason == "no_materials" and course_name:
+                ctx_lines.append(f"- {course_name} has upcoming deadlines but zero study materials ever created")
+
+    return "\n".join(ctx_lines), [flag_id for flag_id, _, _ in nudge_flags]
+
+
 @app.post("/chat/proactive-message")
 @limiter.limit("10/minute")
 async def generate_proactive_message(
@@ -5996,6 +6340,8 @@ async def generate_proactive_message(
 
     Creates a new conversation, saves the AI message as the first entry, and
     returns the conversation + message so the frontend can open it directly.
+    Repeat opens on the same day return that briefing (`cached: true`) without
+    calling OpenAI, unless new nudge flags have been queued since.
     Does NOT count against the weekly chat usage limit.
     """
     db = SessionLocal()
@@ -6004,81 +6350,42 @@ async def generate_proactive_message(
         # nudging them into a chat they can't use until the week resets.
         profile = db.query(UserProfile).filter(UserProfile.user_id == current_user.id).first()
         if profile:
-            limit = PRO_CHAT_MESSAGE_LIMIT if _effective_tier(profile) == "pro" else FREE_CHAT_MESSAGE_LIMIT
-            used = profile.chat_messages_used or 0
+            used, limit, _ = _chat_usage(profile, datetime.utcnow())
             if used >= limit:
                 return {"skipped": True}
 
         today = date.today()
-        seven_days = today + timedelta(days=7)
 
-        # Upcoming deadlines in the next 7 days
-        deadlines = (
-            db.query(Deadline)
+        # Reuse today's latest briefing unless new nudge flags have been queued since
+        cached = (
+            db.query(ChatMessage, ChatConversation.title)
+            .join(ChatConversation, ChatConversation.id == ChatMessage.conversation_id)
             .filter(
-                Deadline.user_id == current_user.id,
-                Deadline.completed == False,
-                Deadline.date >= today.isoformat(),
-                Deadline.date <= seven_days.isoformat(),
-            )
-            .order_by(Deadline.date)
-            .all()
-        )
-
-        # Courses with zero study materials
-        courses = db.query(Course).filter(Course.user_id == current_user.id).all()
-        courses_no_materials = []
-        for course in courses:
-            has_any = (
-                db.query(FlashcardSet).filter(FlashcardSet.user_id == current_user.id, FlashcardSet.course_id == course.id).first()
-                or db.query(Quiz).filter(Quiz.user_id == current_user.id, Quiz.course_id == course.id).first()
-                or db.query(Summary).filter(Summary.user_id == current_user.id, Summary.course_id == course.id).first()
+                ChatConversation.user_id == current_user.id,
+                ChatConversation.briefing_date == today.isoformat(),
+                ChatMessage.role == "assistant",
             )
-            if not has_any:
-                courses_no_materials.append(course)
-
-        # Undelivered nudge flags
-        nudge_flags = (
-            db.query(NudgeFlag)
-            .filter(NudgeFlag.user_id == current_user.id, NudgeFlag.delivered == False)
-            .all()
+            .order_by(ChatConversation.created_at.desc(), ChatMessage.created_at)
+            .first()
         )
+        if cached and not db.query(
+            db.query(NudgeFlag.id).filter(NudgeFlag.user_id == current_user.id, NudgeFlag.delivered == False).exists()
+        ).scalar():
+            message, title = cached
+            return {
+                "conversation_id": message.conversation_id,
+                "conversation_title": title,
+                "message": {
+                    "id": message.id,
+                    "role": "assistant",
+                    "content": message.content,
+                    "created_at": message.created_at.isoformat(),
+                    "created_study_set": None,
+                },
+                "cached": True,
+            }
 
-        # Build context string for the prompt
-        ctx_lines = []
-
-        if courses:
-            names = ", ".join(c.name for c in courses)
-            ctx_lines.append(f"Student's courses: {names}")
-        else:
-            ctx_lines.append("Student's courses: (none added yet)")
-
-        if deadlines:
-            ctx_lines.append("\nUpcoming deadlines (next 7 days):")
-            for d in deadlines:
-                course = db.query(Course).filter(Course.id == d.course_id).first() if d.course_id else None
-                course_name = course.name if course else "General"
-                days_until = (date.fromisoformat(d.date) - today).days
-                when = "today" if days_until == 0 else "tomorrow" if days_until == 1 else f"in {days_until} days"
-                ctx_lines.append(f"- {d.title} ({course_name}) — due {when}, type: {d.type or 'deadline'}")
-        else:
-            ctx_lines.append("\nNo deadlines in the next 7 days.")
-
-        if courses_no_materials:
-            names = ", ".join(c.name for c in courses_no_materials)
-            ctx_lines.append(f"\nCourses with no study materials yet: {names}")
-
-        if nudge_flags:
-            ctx_lines.append("\nPriority flags:")
-            for f in nudge_flags:
-                course = db.query(Course).filter(Course.id == f.course_id).first() if f.course_id else None
-                course_name = course.name if course else ""
-                if f.reason == "due_tomorrow" and course_name:
-                    ctx_lines.append(f"- {course_name} has something due tomorrow with no study materials")
-                elif f.reason == "no_materials" and course_name:
-                    ctx_lines.append(f"- {course_name} has upcoming deadlines but zero study materials ever created")
-
-        context_str = "\n".join(ctx_lines)
+        context_str, nudge_flag_ids = build_proactive_context(db, current_user.id, today)
 
         user_name = profile.full_name.strip() if profile and profile.full_name and profile.full_name.strip() else None
         name_line = f"Student's name: {user_name}" if user_name else "Student's name: (not set — do not use 'Your Name' or any placeholder)"
@@ -6100,7 +6407,7 @@ Rules:
 - Do NOT start with "Hi", "Hello", or any greeting word
 - Output only the message text, no quotes or formatting"""
 
-        response = await client.chat.completions.create(
+        response = await llm_chat("proactive_message",
             model="gpt-4o-mini",
             messages=[{"role": "user", "content": prompt}],
             max_tokens=200,
@@ -6112,6 +6419,7 @@ Rules:
         conv = ChatConversation(
             user_id=current_user.id,
             title=f"Daily Briefing — {today.strftime('%b %d')}",
+            briefing_date=today.isoformat(),
         )
         db.add(conv)
         db.flush()
@@ -6124,8 +6432,10 @@ Rules:
         db.add(assistant_msg)
 
         # Mark nudge flags as delivered
-        for flag in nudge_flags:
-            flag.delivered = True
+        if nudge_flag_ids:
+            db.query(NudgeFlag).filter(NudgeFlag.id.in_(nudge_flag_ids)).update(
+                {"delivered": True}, synchronize_session=False
+            )
 
         db.commit()
         db.refresh(conv)
@@ -6141,6 +6451,7 @@ Rules:
                 "created_at": assistant_msg.created_at.isoformat(),
                 "created_study_set": None,
             },
+            "cached": False,
         }
     except HTTPException:
         raise
@@ -6150,3 +6461,5 @@ Rules:
     finally:
         db.close()
 
+
+_mark_boot("routes")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Bulk persistence of generated flashcards and quiz questions.
+"""
+import json
+import uuid
+
+from main import (
+    Course, Flashcard, FlashcardSet, Quiz, QuizQuestion, SessionLocal, get_chat_context, insert_flashcards,
+    insert_quiz_questions,
+)
+
+
+def test_bulk_insert_returns_ids_and_invalidates_chat_context():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Organic Chemistry", code="CHEM 210")
+        db.add(course)
+        db.flush()
+        fs = FlashcardSet(user_id=user_id, course_id=course.id, name="Alkenes")
+        quiz = Quiz(user_id=user_id, course_id=course.id, name="Alkenes quiz")
+        db.add_all([fs, quiz])
+        db.commit()
+        assert '"Alkenes" (0 cards' in get_chat_context(db, user_id)
+
+        card_ids = insert_flashcards(db, user_id, fs.id, [{"front": f"Q{i}", "back": f"A{i}"} for i in range(3)])
+        question_ids = insert_quiz_questions(db, user_id, quiz.id, [
+            {"question": "Q?", "options": ["A) x", "B) y"], "correct_answer": "B", "explanation": "e"},
+            {"question": "R?", "options": "not a list"},
+        ], start=5)
+        db.commit()
+
+        assert {c.id for c in db.query(Flashcard).filter(Flashcard.flashcard_set_id == fs.id)} == set(card_ids)
+        rows = db.query(QuizQuestion).filter(QuizQuestion.quiz_id == quiz.id).order_by(QuizQuestion.order_num).all()
+        assert [r.id for r in rows] == question_ids
+        assert [r.order_num for r in rows] == ["5", "6"]
+        assert json.loads(rows[1].options) == [] and rows[1].correct_answer == "A"
+        assert all(r.user_id == user_id for r in rows)
+
+        context = get_chat_context(db, user_id)
+        assert '"Alkenes" (3 cards' in context
+        assert '"Alkenes quiz" (2 questions' in context
+        assert insert_flashcards(db, user_id, fs.id, []) == []
+    finally:
+        db.close()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Chat context snapshot: served from cache until a mutation bumps its version.
+"""
+import uuid
+
+from classmate import chat_context
+from classmate.chat_context import _build_chat_context, get_chat_context
+from main import ChatContextSnapshot, Course, Deadline, Flashcard, FlashcardSet, SessionLocal
+
+
+def _count_builds(monkeypatch):
+    calls = []
+    real = chat_context._build_chat_context
+
+    def counting(db, user_id):
+        calls.append(user_id)
+        return real(db, user_id)
+
+    monkeypatch.setattr(chat_context, "_build_chat_context", counting)
+    return calls
+
+
+def test_snapshot_hits_until_mutation(monkeypatch):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Organic Chemistry", code="CHEM 210")
+        db.add(course)
+        db.commit()
+        fs = FlashcardSet(user_id=user_id, course_id=course.id, name="Alkenes")
+        db.add(fs)
+        db.commit()
+        card = Flashcard(user_id=user_id, flashcard_set_id=fs.id, front="Q", back="A")
+        db.add(card)
+        db.commit()
+
+        builds = _count_builds(monkeypatch)
+        first = get_chat_context(db, user_id)
+        assert get_chat_context(db, user_id) == first
+        assert len(builds) == 1
+
+        # Grading a card changes nothing the context renders
+        card.grade = "known"
+        db.commit()
+        get_chat_context(db, user_id)
+        assert len(builds) == 1
+
+        db.add(Deadline(user_id=user_id, course_id=course.id, date="2026-12-01", title="Midterm", type="exam"))
+        db.commit()
+        updated = get_chat_context(db, user_id)
+        assert len(builds) == 2
+        assert "Midterm" in updated
+        assert updated == _build_chat_context(db, user_id)
+
+        # Snapshot embeds today's date, so a stale day forces a rebuild
+        db.query(ChatContextSnapshot).filter(ChatContextSnapshot.user_id == user_id).update(
+            {"built_on": "2000-01-01"}, synchronize_session=False
+        )
+        db.commit()
+        get_chat_context(db, user_id)
+        assert len(builds) == 3
+    finally:
+        db.close()
+
+
+def test_mutation_during_rebuild_is_not_masked(monkeypatch):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(Course(user_id=user_id, name="Macroeconomics", code="ECON 202"))
+        db.commit()
+
+        real = chat_context._build_chat_context
+
+        def racing(db_, uid):
+            content = real(db_, uid)
+            other = SessionLocal()
+            try:
+                other.add(Deadline(user_id=uid, date="2026-12-05", title="Problem Set 4", type="assignment"))
+                other.commit()
+            finally:
+                other.close()
+            return content
+
+        monkeypatch.setattr(chat_context, "_build_chat_context", racing)
+        assert "Problem Set 4" not in get_chat_context(db, user_id)
+        monkeypatch.setattr(chat_context, "_build_chat_context", real)
+        assert "Problem Set 4" in get_chat_context(db, user_id)
+    finally:
+        db.close()
+
+
+def test_volatile_sections_come_last():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Statistics", code="STAT 101")
+        db.add(course)
+        db.commit()
+        db.add(Deadline(user_id=user_id, course_id=course.id, date="2026-11-02", title="HW 1", type="assignment"))
+        db.commit()
+        context = _build_chat_context(db, user_id)
+        assert context.index("## Student's Courses") < context.index("## Study Library") < context.index("## Deadlines")
+        assert context == _build_chat_context(db, user_id)
+    finally:
+        db.close()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Token-budgeted chat history: which turns stay verbatim and which fold into the summary.
+"""
+from main import CHAT_HISTORY_MAX_MESSAGES, _split_history
+
+
+def test_nothing_folds_under_budget():
+    assert _split_history([100] * 10, budget=4000) == 0
+    assert _split_history([], budget=4000) == 0
+
+
+def test_overflow_folds_down_to_half_budget():
+    counts = [5000] + [100] * 9  # a pasted file early in the conversation
+    fold = _split_history(counts, budget=4000)
+    assert fold >= 1
+    assert sum(counts[fold:]) <= 2000
+
+
+def test_newest_message_always_kept():
+    assert _split_history([100, 100, 9000], budget=4000) == 2
+
+
+def test_message_cap_still_applies():
+    counts = [10] * (CHAT_HISTORY_MAX_MESSAGES + 5)
+    assert len(counts) - _split_history(counts, budget=4000) <= CHAT_HISTORY_MAX_MESSAGES
+
+
+def test_message_cap_fold_leaves_room_for_later_turns():
+    for n in range(CHAT_HISTORY_MAX_MESSAGES + 1, CHAT_HISTORY_MAX_MESSAGES + 6):
+        fold = _split_history([30] * n, budget=4000)
+        assert n - fold <= CHAT_HISTORY_MAX_MESSAGES // 2
+        # The next exchange (user message + reply) and the turn after it don't fold again
+        assert _split_history([30] * (n - fold + 2), budget=4000) == 0
+        assert _split_history([30] * (n - fold + 4), budget=4000) == 0
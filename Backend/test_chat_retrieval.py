@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Per-question retrieval over the user's course material.
+"""
+import uuid
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+from classmate.chat_context import (
+    ATTACHMENT_HISTORY_STUB, ChunkIndex, _attachment_excerpts, _attachment_prompt_text, get_chat_context, get_chat_index,
+    retrieve_chat_context,
+)
+from main import ChatAttachment, ChatContextSnapshot, ChatConversation, ChatMessage, Course, SessionLocal, Summary, UserProfile, app, get_current_user
+
+
+def test_bm25_ranks_matching_passage_first():
+    index = ChunkIndex([
+        {"source": "a", "text": "Mitochondria produce ATP through oxidative phosphorylation."},
+        {"source": "b", "text": "The French Revolution began in 1789 with the storming of the Bastille."},
+        {"source": "c", "text": "Supply and demand determine the equilibrium price in a market."},
+    ])
+    hits = index.search("When did the French Revolution begin?")
+    assert hits[0][1]["source"] == "b"
+    assert index.search("zzz unknown") == []
+
+
+def test_retrieval_reaches_past_old_truncation_and_tracks_mutations():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        course = Course(
+            user_id=user_id, name="Cell Biology", code="BIO 201",
+            syllabus_text=("General course policies apply. " * 400) + "Late lab reports lose ten percent per day.",
+        )
+        db.add(course)
+        db.commit()
+        get_chat_context(db, user_id)
+
+        section = retrieve_chat_context(db, user_id, "What is the penalty for late lab reports?")
+        assert "Late lab reports lose ten percent per day." in section
+        assert "BIO 201 Syllabus" in section
+
+        index = get_chat_index(db, user_id)
+        assert get_chat_index(db, user_id) is index
+
+        db.add(Summary(
+            user_id=user_id, course_id=course.id, title="Lecture 7",
+            content=("Review of prior lectures. " * 300) + "The Krebs cycle yields two ATP per glucose.",
+        ))
+        db.commit()
+        assert get_chat_index(db, user_id) is not index
+        assert "Krebs cycle yields two ATP" in retrieve_chat_context(db, user_id, "How much ATP does the Krebs cycle yield?")
+        assert "Krebs" not in get_chat_context(db, user_id)
+    finally:
+        db.close()
+
+
+
+def test_recreated_snapshot_at_the_same_version_rebuilds_the_index():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(Course(user_id=user_id, name="Organic Chemistry", code="CHEM 210"))
+        db.commit()
+        get_chat_context(db, user_id)
+        index = get_chat_index(db, user_id)
+
+        # Account deletion drops the snapshot; a new one starts over at version 0
+        db.query(ChatContextSnapshot).filter(ChatContextSnapshot.user_id == user_id).delete(synchronize_session=False)
+        db.query(Course).filter(Course.user_id == user_id).delete(synchronize_session=False)
+        db.commit()
+        get_chat_context(db, user_id)
+        assert db.query(ChatContextSnapshot.version).filter(ChatContextSnapshot.user_id == user_id).scalar() == 0
+
+        rebuilt = get_chat_index(db, user_id)
+        assert rebuilt is not index
+        assert "CHEM 210" not in retrieve_chat_context(db, user_id, "Organic Chemistry CHEM 210")
+    finally:
+        db.close()
+
+
+def test_attachment_text_sent_in_full_once_then_only_when_relevant():
+    text = ("Photosynthesis converts light energy into chemical energy. " * 40) + "\n\n" + (
+        "The Calvin cycle fixes carbon dioxide into sugar. " * 40)
+    att = SimpleNamespace(file_name="bio.pdf", text=text)
+
+    assert _attachment_prompt_text(att, current=True) == "\n" + text
+    # Later turns carry a fixed stub so the history prefix doesn't change with the question
+    assert _attachment_prompt_text(att, current=False) == ATTACHMENT_HISTORY_STUB
+    relevant = _attachment_excerpts(att, "How does the Calvin cycle fix carbon?")
+    assert "Calvin cycle" in relevant and len(relevant) < len(text)
+    assert _attachment_excerpts(att, "When is my history essay due?") == ""
+
+
+def test_reupload_takes_the_new_name_and_empty_files_get_no_attachment(monkeypatch):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        conv = ChatConversation(user_id=user_id)
+        db.add_all([UserProfile(user_id=user_id, email=f"{user_id}@example.edu", subscription_tier="pro"), conv])
+        db.commit()
+        conversation_id = conv.id
+    finally:
+        db.close()
+
+    async def fake_create(**kwargs):
+        async def stream():
+            delta = SimpleNamespace(content="Got it.", tool_calls=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason="stop")], usage=None)
+        return stream()
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        client = TestClient(app)
+        notes = b"The Calvin cycle fixes carbon dioxide into sugar."
+        for name, data in (("draft.txt", notes), ("bio-notes.txt", notes), ("blank.txt", b"  \n")):
+            resp = client.post(f"/chat/conversations/{conversation_id}/messages",
+                               data={"content": "Read this"}, files={"file": (name, data, "text/plain")})
+            assert resp.status_code == 200
+    finally:
+        app.dependency_overrides.clear()
+
+    db = SessionLocal()
+    try:
+        attachments = db.query(ChatAttachment).filter(ChatAttachment.user_id == user_id).all()
+        assert [a.file_name for a in attachments] == ["bio-notes.txt"]
+        user_msgs = db.query(ChatMessage).filter(
+            ChatMessage.conversation_id == conversation_id, ChatMessage.role == "user",
+        ).order_by(ChatMessage.created_at).all()
+        assert [m.attachment_id for m in user_msgs] == [attachments[0].id, attachments[0].id, None]
+    finally:
+        db.close()
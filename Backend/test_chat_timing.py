@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Chat turn stage timings: the histogram format and the spans send_chat_message records.
+"""
+import json
+import uuid
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+from classmate.chat_timing import chat_stage_histograms, chat_stage_metric_lines, observe_chat_stage
+from main import ChatConversation, Deadline, SessionLocal, UserProfile, app, get_current_user
+
+
+def test_stage_histogram_buckets_are_cumulative():
+    stage = f"test_{uuid.uuid4().hex[:8]}"
+    for elapsed_ms in (3, 10, 40, 99999):
+        observe_chat_stage(stage, elapsed_ms)
+    lines = [line for line in chat_stage_metric_lines() if f'stage="{stage}"' in line]
+    assert f'chat_stage_ms_bucket{{stage="{stage}",le="10"}} 2' in lines  # le is inclusive
+    assert f'chat_stage_ms_bucket{{stage="{stage}",le="50"}} 3' in lines
+    assert f'chat_stage_ms_bucket{{stage="{stage}",le="30000"}} 3' in lines
+    assert f'chat_stage_ms_bucket{{stage="{stage}",le="+Inf"}} 4' in lines
+    assert f'chat_stage_ms_count{{stage="{stage}"}} 4' in lines
+    assert f'chat_stage_ms_sum{{stage="{stage}"}} 100052.0' in lines
+
+
+def _chunk(content=None, tool_calls=None, finish_reason=None):
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)], usage=None)
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for c in self._chunks:
+            yield c
+
+
+def test_chat_turn_with_tool_call_records_every_stage(monkeypatch):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        conv = ChatConversation(user_id=user_id)
+        db.add_all([UserProfile(user_id=user_id, email=f"{user_id}@example.edu"), conv])
+        db.commit()
+        conversation_id = conv.id
+    finally:
+        db.close()
+
+    arguments = json.dumps({"title": "Lab report", "date": "2026-11-02"})
+    call = SimpleNamespace(index=0, id="call_1", function=SimpleNamespace(name="create_deadline", arguments=arguments))
+    streams = [
+        FakeStream([_chunk(tool_calls=[call]), _chunk(finish_reason="tool_calls")]),
+        FakeStream([_chunk("Added "), _chunk("your lab report.", finish_reason="stop")]),
+    ]
+
+    async def fake_create(**kwargs):
+        return streams.pop(0)
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    before = {stage: hist[-2] for stage, hist in chat_stage_histograms.items()}
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        response = TestClient(app).post(f"/chat/conversations/{conversation_id}/messages",
+                                        data={"content": "Lab report due Nov 2"})
+    finally:
+        app.dependency_overrides.clear()
+
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert events[-1]["type"] == "done"
+    assert "".join(e["content"] for e in events if e["type"] == "chunk") == "Added your lab report."
+    for stage in ("ttfb", "context_build", "history_load", "first_chunk", "ttft", "model_stream",
+                  "tool_execution", "second_stream", "persist", "total"):
+        assert chat_stage_histograms[stage][-2] == before.get(stage, 0) + 1, stage
+    db = SessionLocal()
+    try:
+        assert db.query(Deadline).filter(Deadline.user_id == user_id, Deadline.title == "Lab report").count() == 1
+    finally:
+        db.close()
+
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+    metrics = TestClient(app).get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).text
+    assert 'chat_stage_ms_count{stage="tool_execution"}' in metrics
@@ -1,13 +1,10 @@
 #!/usr/bin/env python3
 """
-Test script to verify the chunked summarization logic works correctly.
+Chunking for long documents: split_text_into_chunks boundaries and _pack_items grouping.
 """
+from classmate.chunking import _pack_items, split_text_into_chunks
 
-def test_text_chunking():
-    """Test that text chunking breaks at appropriate boundaries"""
-
-    # Simulate a long document
-    sample_text = """
+SAMPLE_TEXT = """
 Chapter 1: Introduction to Machine Learning
 
 Machine learning is a subset of artificial intelligence. It focuses on teaching computers to learn from data.
@@ -36,85 +33,43 @@ Convolutional neural networks excel at image tasks. Recurrent neural networks ha
 Training deep networks requires large datasets. GPU acceleration makes this feasible.
 """ * 50  # Repeat to create a large document
 
-    print(f"Total document length: {len(sample_text)} characters")
-    print(f"Total document length: {len(sample_text.split())} words")
-
-    # Chunking logic (same as in main.py)
-    chunk_size = 10000
-    chunks = []
-    start = 0
 
-    while start < len(sample_text):
-        end = start + chunk_size
+def test_text_chunking_breaks_at_paragraphs():
+    chunks = split_text_into_chunks(SAMPLE_TEXT, chunk_size=10000)
 
-        if end < len(sample_text):
-            # Look for paragraph break
-            paragraph_break = sample_text.rfind("\n\n", start, end)
-            if paragraph_break > start + chunk_size // 2:
-                end = paragraph_break
-            else:
-                # Fall back to sentence break
-                sentence_break = sample_text.rfind(". ", start, end)
-                if sentence_break > start + chunk_size // 2:
-                    end = sentence_break + 1
+    assert len(chunks) > 1
+    assert "".join(chunks) == SAMPLE_TEXT  # nothing dropped or duplicated
+    assert all(len(c) <= 10000 for c in chunks)
+    # Every chunk but the last stops just before a paragraph break, past the half-size mark
+    for chunk, following in zip(chunks, chunks[1:]):
+        assert following.startswith("\n\n")
+        assert len(chunk) > 5000
 
-        chunks.append(sample_text[start:end])
-        start = end
 
-    print(f"\n✓ Document split into {len(chunks)} chunks")
+def test_falls_back_to_sentence_breaks():
+    text = "Mitochondria produce ATP through respiration. " * 500  # no paragraph breaks
+    chunks = split_text_into_chunks(text, chunk_size=2000)
 
-    for i, chunk in enumerate(chunks):
-        word_count = len(chunk.split())
-        print(f"  Chunk {i+1}: {len(chunk)} chars, ~{word_count} words")
+    assert "".join(chunks) == text
+    assert all(c.endswith(".") for c in chunks[:-1])
 
-        # Show first and last 50 chars to verify clean breaks
-        if i < 3:  # Only show details for first 3 chunks
-            print(f"    Starts: {chunk[:50].strip()!r}")
-            print(f"    Ends:   {chunk[-50:].strip()!r}")
 
-    print("\n✓ All chunks created successfully")
-    print(f"✓ Average chunk size: {sum(len(c) for c in chunks) / len(chunks):.0f} characters")
+def test_hard_cut_without_boundaries():
+    text = "A" * 12001
+    chunks = split_text_into_chunks(text, chunk_size=12000)
+    assert [len(c) for c in chunks] == [12000, 1]
 
 
 def test_edge_cases():
-    """Test edge cases"""
-    print("\n--- Testing Edge Cases ---")
-
-    # Empty document
-    try:
-        text = ""
-        if not text or len(text.strip()) < 50:
-            print("✓ Empty document correctly rejected")
-    except:
-        print("✗ Empty document handling failed")
-
-    # Very short document
-    try:
-        text = "This is a short note about Python."
-        if len(text) <= 12000:
-            print("✓ Short document would use single-pass summarization")
-    except:
-        print("✗ Short document handling failed")
-
-    # Medium document (just under threshold)
-    text = "A" * 11999
-    if len(text) <= 12000:
-        print("✓ Medium document (11,999 chars) uses single-pass")
-
-    # Large document (just over threshold)
-    text = "A" * 12001
-    if len(text) > 12000:
-        print("✓ Large document (12,001 chars) uses chunked approach")
-
+    assert split_text_into_chunks("") == []
+    assert split_text_into_chunks("This is a short note about Python.") == ["This is a short note about Python."]
+    assert split_text_into_chunks("A" * 12000) == ["A" * 12000]  # at the limit: single pass
 
-if __name__ == "__main__":
-    print("=" * 60)
-    print("Testing Chunked Summarization Logic")
-    print("=" * 60)
 
-    test_text_chunking()
-    test_edge_cases()
+def test_pack_items_groups_up_to_size():
+    items = [f"card {i}: " + "x" * 40 for i in range(10)]
+    passages = _pack_items(items, size=200)
 
-    print("\n" + "=" * 60)
-    print("All tests passed! ✓")
-    print("=" * 60)
+    assert [line for p in passages for line in p.split("\n")] == items
+    assert all(len(p) <= 200 for p in passages)
+    assert _pack_items(["one very long item" * 20], size=10) == ["one very long item" * 20]
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Locks in the LMS course-matching semantics of CourseMatcher / _match_course.
+"""
+import random
+from types import SimpleNamespace
+
+from benchmarks._legacy_course_matching import reference_match
+from classmate.lms import CourseMatcher, _match_course
+
+
+def course(id, name, code=None):
+    return SimpleNamespace(id=id, name=name, code=code)
+
+
+COURSES = [
+    course("fin", "Corporate Finance", "FINC 313"),
+    course("bio", "Biology", "BIO 101"),
+    course("psy", "Intro to Psychology", "PSYC-240"),
+    course("hist", "World History", None),
+    course("art", "Art", "ART"),
+]
+
+
+def test_exact_normalized_code():
+    assert _match_course("anything", "finc-313", COURSES) == "fin"
+
+
+def test_extracted_code_from_canvas_section_code():
+    assert _match_course("Some Canvas Course", "FINC-313-001-2025SP", COURSES) == "fin"
+    assert _match_course("Quiz 3 PSYC240 due", "", COURSES) == "psy"
+
+
+def test_code_substring_in_text():
+    assert _match_course("Homework for bio 101 section", "", COURSES) == "bio"
+
+
+def test_name_substring_prefers_longest():
+    courses = [course("a", "History"), course("b", "World History")]
+    assert _match_course("World History essay", "", courses) == "b"
+
+
+def test_first_course_wins_on_ties():
+    courses = [course("a", "Calculus", "MATH 101"), course("b", "Calculus II", "MATH 101")]
+    assert _match_course("x", "MATH 101", courses) == "a"
+
+
+def test_earlier_code_substring_beats_later_extracted_code():
+    # "art" (position 0) matches by code substring before "bio" matches by extracted code
+    courses = [course("art", "Art", "ART"), course("bio", "Biology", "BIO 101")]
+    assert _match_course("Start of BIO 101 lab", "", courses) == "art"
+
+
+def test_short_names_and_codes_ignored():
+    courses = [course("x", "Art", "AR")]
+    assert _match_course("Party at the art museum", "", courses) is None
+
+
+def test_no_courses():
+    assert _match_course("FINC 313", "FINC 313", []) is None
+
+
+def test_matcher_add_is_visible_to_later_matches():
+    matcher = CourseMatcher(COURSES[:1])
+    assert matcher.match("CHEM 210 Lab Report", "") is None
+    matcher.add(course("chem", "General Chemistry", "CHEM 210"))
+    assert matcher.match("CHEM 210 Lab Report", "") == "chem"
+
+
+def test_matches_reference_on_random_inputs():
+    rng = random.Random(1234)
+    depts = ["FINC", "BIO", "PSYC", "HIST", "MATH", "CS", "ECON", "ART"]
+    words = ["intro", "to", "finance", "biology", "history", "world", "lab", "quiz", "exam", "art", "data", "-", "/"]
+
+    def rand_code():
+        return f"{rng.choice(depts)}{rng.choice(['', ' ', '-', '_'])}{rng.randint(100, 130)}"
+
+    def rand_text():
+        return " ".join(rng.choice(words + [rand_code()]) for _ in range(rng.randint(0, 6)))
+
+    for _ in range(300):
+        courses = [
+            course(f"c{i}", rand_text() or "x", rng.choice([None, "", rand_code(), rng.choice(depts)]))
+            for i in range(rng.randint(0, 8))
+        ]
+        matcher = CourseMatcher(courses)
+        for _ in range(20):
+            lms_text, lms_code = rand_text(), rng.choice(["", rand_code(), rand_text()])
+            assert matcher.match(lms_text, lms_code) == reference_match(lms_text, lms_code, courses)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Instrumented OpenAI wrapper: counters, batched usage rows, and the admin rollup.
+"""
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+from main import LLMUsage, SessionLocal, app, flush_llm_usage, llm_chat, llm_counters, require_admin
+
+
+def _usage(prompt, completion, cached):
+    return SimpleNamespace(
+        prompt_tokens=prompt, completion_tokens=completion,
+        prompt_tokens_details=SimpleNamespace(cached_tokens=cached),
+    )
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for c in self._chunks:
+            yield c
+
+
+def test_llm_chat_records_usage_and_admin_rollup(monkeypatch):
+    user_id = str(uuid.uuid4())
+    feature = f"test_{uuid.uuid4().hex[:8]}"
+    requests_seen = []
+
+    async def fake_create(**kwargs):
+        requests_seen.append(kwargs)
+        if kwargs.get("stream"):
+            delta = SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="hi"))], usage=None)
+            return FakeStream([delta, SimpleNamespace(choices=[], usage=_usage(1200, 40, 1024))])
+        return SimpleNamespace(choices=[], usage=_usage(500, 100, 0))
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+
+    async def run():
+        await llm_chat(feature, user_id=user_id, model="gpt-4o-mini", messages=[])
+        stream = await llm_chat(feature, user_id=user_id, model="gpt-4o-mini", messages=[], stream=True)
+        return [chunk async for chunk in stream]
+
+    chunks = asyncio.run(run())
+    assert len(chunks) == 1  # usage-only chunk is swallowed
+    assert requests_seen[1]["stream_options"] == {"include_usage": True}
+    assert llm_counters[("llm_requests_total", feature, "gpt-4o-mini", "ok")] == 2
+    assert llm_counters[("llm_cached_tokens_total", feature, "gpt-4o-mini", "ok")] == 1024
+
+    flush_llm_usage()
+    db = SessionLocal()
+    try:
+        assert db.query(LLMUsage).filter(LLMUsage.feature == feature).count() == 2
+    finally:
+        db.close()
+
+    app.dependency_overrides[require_admin] = lambda: SimpleNamespace(id="admin", email="admin@example.com")
+    try:
+        body = TestClient(app).get("/admin/usage").json()
+    finally:
+        app.dependency_overrides.clear()
+    row = next(r for r in body["by_feature"] if r["feature"] == feature)
+    assert row["requests"] == 2
+    assert row["prompt_tokens"] == 1700
+    assert row["cached_tokens"] == 1024
+    assert any(u["user_id"] == user_id and u["requests"] == 2 for u in body["by_user"])
+
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+    metrics = TestClient(app).get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).text
+    assert f'llm_requests_total{{feature="{feature}",model="gpt-4o-mini",status="ok"}} 2' in metrics
+
+
+def test_metrics_require_the_token(monkeypatch):
+    client = TestClient(app)
+    monkeypatch.setattr(main, "METRICS_TOKEN", "")
+    assert client.get("/metrics").status_code == 404
+    monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Parallel LMS sync: fetches overlap, DB changes land in one transaction.
+"""
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from classmate import lms
+from main import Course, Deadline, LMSConnection, SessionLocal, sync_all_connections
+
+
+def _event(uid, summary, when):
+    return {"uid": uid, "summary": summary, "description": "", "location": "", "categories": "", "dt": when}
+
+
+def test_connections_fetch_concurrently_and_commit_once(monkeypatch):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(Course(user_id=user_id, name="Corporate Finance", code="FINC 315"))
+        db.add(LMSConnection(user_id=user_id, provider="ical", ical_url="https://a.example/feed.ics"))
+        db.add(LMSConnection(user_id=user_id, provider="ical", ical_url="https://b.example/feed.ics"))
+        db.add(LMSConnection(user_id=user_id, provider="moodle"))
+        db.commit()
+
+        in_flight = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def fake_fetch(connection):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.2)
+            with lock:
+                in_flight -= 1
+            host = connection.ical_url.split("/")[2]
+            return [_event(f"{host}-1", "FINC 315 Problem Set", datetime(2026, 3, 2, 23, 59))], []
+
+        monkeypatch.setitem(lms.LMS_FETCHERS, "ical", fake_fetch)
+
+        commits = []
+        original_commit = db.commit
+        monkeypatch.setattr(db, "commit", lambda: (commits.append(1), original_commit()))
+
+        synced, errors, breakdown = sync_all_connections(user_id, db)
+
+        assert peak == 2  # both fetches were in flight at once
+        assert len(commits) == 1
+        assert synced == 2
+        assert errors == ["Unknown provider: moodle"]
+        assert [b["provider"] for b in breakdown] == ["ical", "ical", "moodle"]
+        assert all(b["fetch_ms"] >= 0 and b["apply_ms"] >= 0 for b in breakdown)
+
+        deadlines = db.query(Deadline).filter(Deadline.user_id == user_id).all()
+        course = db.query(Course).filter(Course.user_id == user_id).one()
+        assert {d.course_id for d in deadlines} == {course.id}
+
+        # Re-sync upserts by external_id instead of duplicating
+        synced, _, _ = sync_all_connections(user_id, db)
+        assert synced == 2
+        assert db.query(Deadline).filter(Deadline.user_id == user_id).count() == 2
+    finally:
+        db.close()
+
+
+def test_failed_apply_rolls_back_only_that_connection(monkeypatch):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(LMSConnection(user_id=user_id, provider="ical", ical_url="https://good.example/feed.ics"))
+        db.add(LMSConnection(user_id=user_id, provider="ical", ical_url="https://bad.example/feed.ics"))
+        db.add(LMSConnection(user_id=user_id, provider="ical", ical_url="https://late.example/feed.ics"))
+        db.commit()
+
+        def fake_fetch(connection):
+            host = connection.ical_url.split("/")[2]
+            return [_event(f"{host}-1", f"{host} essay", datetime(2026, 3, 2, 23, 59))], []
+
+        apply_ical = lms.LMS_APPLIERS["ical"]
+
+        def flaky_apply(connection, data, user_id, db, matcher, existing_by_ext):
+            count, errors = apply_ical(connection, data, user_id, db, matcher, existing_by_ext)
+            if "bad.example" in connection.ical_url:
+                db.flush()
+                raise RuntimeError("feed went away")
+            return count, errors
+
+        monkeypatch.setitem(lms.LMS_FETCHERS, "ical", fake_fetch)
+        monkeypatch.setitem(lms.LMS_APPLIERS, "ical", flaky_apply)
+
+        synced, errors, breakdown = sync_all_connections(user_id, db)
+
+        assert synced == 2
+        assert errors == ["Error applying ical sync: feed went away"]
+        assert [b["synced_count"] for b in breakdown] == [1, 0, 1]
+    finally:
+        db.close()
+
+    db = SessionLocal()
+    try:
+        titles = {d.title for d in db.query(Deadline).filter(Deadline.user_id == user_id)}
+        assert titles == {"good.example essay", "late.example essay"}
+    finally:
+        db.close()
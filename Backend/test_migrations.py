@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations: one query when current, steps applied once under the lease.
+"""
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import main
+from main import (
+    SCHEMA_MIGRATIONS, SchemaVersion, SessionLocal, _already_applied, acquire_job_lease, current_schema_version,
+    engine, ensure_chat_columns, ensure_indexes, ensure_study_indexes, ensure_unique_user_email_index, release_job_lease,
+    run_migrations,
+)
+
+
+def test_up_to_date_boot_is_one_query():
+    assert current_schema_version() == SCHEMA_MIGRATIONS[-1][0]
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        assert run_migrations() == 0
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert len(statements) == 1
+
+
+def test_pending_step_runs_once_under_the_lease(monkeypatch):
+    calls = []
+    version = SCHEMA_MIGRATIONS[-1][0] + 1
+    monkeypatch.setattr(main, "SCHEMA_MIGRATIONS", SCHEMA_MIGRATIONS + [(version, "test step", lambda: calls.append(1))])
+
+    def other_worker_finishes():
+        time.sleep(0.2)
+        with engine.begin() as conn:
+            conn.execute(SchemaVersion.__table__.insert().values(version=version, name="test step"))
+        release_job_lease(main.MIGRATION_LEASE, "other-worker")
+
+    try:
+        # Another worker holds the lease: we wait for it rather than running the step ourselves
+        assert acquire_job_lease(main.MIGRATION_LEASE, "other-worker", 30)
+        thread = threading.Thread(target=other_worker_finishes)
+        thread.start()
+        assert run_migrations(holder="this-worker", poll_seconds=0.02) == 0
+        thread.join()
+        assert calls == []
+
+        # With the step unrecorded and the lease free, this worker applies it exactly once
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM schema_version WHERE version = :v"), {"v": version})
+        assert run_migrations(holder="this-worker") == 1
+        assert run_migrations(holder="this-worker") == 0
+        assert calls == [1]
+        db = SessionLocal()
+        try:
+            assert db.get(SchemaVersion, version).name == "test step"
+        finally:
+            db.close()
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM schema_version WHERE version = :v"), {"v": version})
+
+
+def _ddl_error(stmt):
+    with pytest.raises(Exception) as excinfo:
+        with engine.begin() as conn:
+            conn.execute(text(stmt))
+    return excinfo.value
+
+
+def test_only_already_applied_ddl_errors_are_tolerated():
+    assert _already_applied(_ddl_error("ALTER TABLE courses ADD COLUMN syllabus_text TEXT"))
+    assert _already_applied(_ddl_error("CREATE INDEX idx_courses_user_id ON courses(user_id)"))
+    assert not _already_applied(_ddl_error("ALTER TABLE no_such_table ADD COLUMN x TEXT"))
+    # Re-running the legacy helpers on a current schema is still a no-op
+    ensure_chat_columns()
+    ensure_indexes()
+    ensure_study_indexes()
+    ensure_unique_user_email_index()
+
+
+def test_failed_step_is_not_recorded_and_retried_next_boot(monkeypatch):
+    calls = []
+    version = SCHEMA_MIGRATIONS[-1][0] + 1
+
+    def flaky_step():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("lock timeout")
+
+    monkeypatch.setattr(main, "SCHEMA_MIGRATIONS", SCHEMA_MIGRATIONS + [(version, "flaky step", flaky_step)])
+    try:
+        assert run_migrations(holder="this-worker") == 0
+        assert current_schema_version() == version - 1
+        assert run_migrations(holder="this-worker") == 1
+        assert current_schema_version() == version
+        assert calls == [1, 1]
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM schema_version WHERE version = :v"), {"v": version})
+
+
+def test_unique_email_index_waits_until_duplicate_accounts_are_merged(monkeypatch, tmp_path, caplog):
+    # A database from before users.email was unique
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id VARCHAR PRIMARY KEY, email VARCHAR)"))
+        conn.execute(text("INSERT INTO users VALUES ('a', 'sam@example.edu'), ('b', 'sam@example.edu')"))
+    monkeypatch.setattr(main, "engine", legacy)
+
+    def has_index():
+        with legacy.begin() as conn:
+            return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'idx_users_email'")).first() is not None
+
+    ensure_unique_user_email_index()
+    assert "Skipped idx_users_email: 1 emails" in caplog.text
+    assert not has_index()
+
+    with legacy.begin() as conn:
+        conn.execute(text("DELETE FROM users WHERE id = 'b'"))
+    ensure_unique_user_email_index()
+    assert has_index()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Nudge job leader election (DB lease) and checkpointed, resumable batches.
+"""
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import main
+from main import (
+    NUDGE_JOB, Deadline, JobLease, JobRun, NudgeFlag, SessionLocal, User, UserProfile, acquire_job_lease,
+    release_job_lease, run_nudge_job,
+)
+
+TODAY = date(2032, 5, 1)
+
+
+def test_lease_is_exclusive_until_it_lapses():
+    name = f"test-job-{uuid.uuid4()}"
+    assert acquire_job_lease(name, "worker-a", 60)
+    assert not acquire_job_lease(name, "worker-b", 60)
+    assert acquire_job_lease(name, "worker-a", 60)  # renewal
+
+    db = SessionLocal()
+    try:
+        db.query(JobLease).filter(JobLease.name == name).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+    finally:
+        db.close()
+    assert acquire_job_lease(name, "worker-b", 60)
+    release_job_lease(name, "worker-a")  # not the holder: no effect
+    assert not acquire_job_lease(name, "worker-a", 60)
+    release_job_lease(name, "worker-b")
+    assert acquire_job_lease(name, "worker-a", 60)
+
+
+def test_crashed_run_resumes_from_checkpoint_without_duplicates(monkeypatch):
+    db = SessionLocal()
+    user_ids = []
+    try:
+        for _ in range(5):
+            user_id = str(uuid.uuid4())
+            email = f"{user_id}@example.com"
+            db.add_all([User(id=user_id, email=email), UserProfile(user_id=user_id, email=email, subscription_tier="pro"),
+                        Deadline(user_id=user_id, date="2032-05-02", title="Problem set")])
+            user_ids.append(user_id)
+        db.commit()
+    finally:
+        db.close()
+
+    def flags():
+        db = SessionLocal()
+        try:
+            return db.query(NudgeFlag).filter(NudgeFlag.user_id.in_(user_ids)).count()
+        finally:
+            db.close()
+
+    real_queue = main._queue_nudge_flags
+    calls = []
+
+    def crash_on_second_batch(db, today, batch):
+        calls.append(batch)
+        if len(calls) == 2:
+            raise RuntimeError("worker killed")
+        return real_queue(db, today, batch)
+
+    monkeypatch.setattr(main, "_queue_nudge_flags", crash_on_second_batch)
+    with pytest.raises(RuntimeError):
+        run_nudge_job("worker-a", TODAY, batch_size=2)
+    first_batch = set(calls[0]) & set(user_ids)
+    assert flags() == len(first_batch)
+
+    monkeypatch.setattr(main, "_queue_nudge_flags", real_queue)
+    run_id = run_nudge_job("worker-b", TODAY, batch_size=2)
+    assert run_id and flags() == 5
+
+    db = SessionLocal()
+    try:
+        run = db.query(JobRun).filter(JobRun.id == run_id).one()
+        assert run.status == "complete" and run.finished_at
+        assert [b.holder for b in run.batch_log][:1] == ["worker-a"] and run.batch_log[-1].holder == "worker-b"
+        assert run.items_processed == sum(b.items for b in run.batch_log) >= 5
+        assert run.rows_written == sum(b.rows_written for b in run.batch_log) >= 5
+        assert all(b.duration_ms >= 0 for b in run.batch_log)
+    finally:
+        db.close()
+
+    # Today's run is done: later polls, from any worker, do nothing
+    assert run_nudge_job("worker-c", TODAY) is None
+    assert flags() == 5
+    assert acquire_job_lease(NUDGE_JOB, "worker-d", 60)
+    release_job_lease(NUDGE_JOB, "worker-d")
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Set-based nudge computation: pro-user filtering, material and existing-flag anti-joins.
+"""
+import uuid
+from datetime import date
+
+from main import (
+    Course, Deadline, FlashcardSet, NudgeFlag, SessionLocal, User, UserProfile, compute_nudge_flags,
+)
+
+TODAY = date(2031, 3, 10)  # far from other tests' deadlines
+
+
+def _user(db, **profile):
+    user_id = str(uuid.uuid4())
+    email = f"{user_id}@example.com"
+    db.add_all([User(id=user_id, email=email), UserProfile(user_id=user_id, email=email, **profile)])
+    return user_id
+
+
+def _course(db, user_id, name):
+    course = Course(user_id=user_id, name=name, code=name[:4].upper())
+    db.add(course)
+    db.flush()
+    return course.id
+
+
+def test_flags_only_pro_users_once_per_deadline_and_course():
+    db = SessionLocal()
+    try:
+        pro = _user(db, subscription_tier="pro")
+        founder = _user(db, founding_member=True)
+        free = _user(db)
+        empty, studied = _course(db, pro, "Chemistry"), _course(db, pro, "History")
+        db.add(FlashcardSet(user_id=pro, course_id=studied, name="Wars"))
+        founder_course = _course(db, founder, "Physics")
+        free_course = _course(db, free, "Art")
+        deadlines = [
+            Deadline(user_id=pro, course_id=empty, date="2031-03-11", title="Lab report"),
+            Deadline(user_id=pro, course_id=empty, date="2031-03-14", title="Midterm"),
+            Deadline(user_id=pro, course_id=studied, date="2031-03-11", title="Essay"),
+            Deadline(user_id=pro, course_id=studied, date="2031-03-11", title="Done", completed=True),
+            Deadline(user_id=pro, course_id=empty, date="2031-03-30", title="Final"),
+            Deadline(user_id=founder, course_id=founder_course, date="2031-03-16", title="Problem set"),
+            Deadline(user_id=free, course_id=free_course, date="2031-03-11", title="Sketch"),
+        ]
+        db.add_all(deadlines)
+        # An undelivered flag suppresses a repeat; a delivered one does not
+        db.add(NudgeFlag(user_id=founder, reason="no_materials", course_id=founder_course, delivered=False))
+        db.commit()
+
+        assert compute_nudge_flags(db, TODAY) == 3
+        flags = db.query(NudgeFlag).filter(NudgeFlag.user_id.in_([pro, founder, free])).all()
+        queued = sorted((f.user_id, f.reason, f.course_id, f.deadline_id) for f in flags if f.deadline_id)
+        assert queued == sorted([
+            (pro, "due_tomorrow", empty, deadlines[0].id),
+            (pro, "due_tomorrow", studied, deadlines[2].id),
+            (pro, "no_materials", empty, deadlines[0].id),  # one per course, earliest deadline
+        ])
+
+        # Re-running is idempotent until the flags are delivered
+        assert compute_nudge_flags(db, TODAY) == 0
+        db.query(NudgeFlag).filter(NudgeFlag.user_id == pro).update({"delivered": True})
+        db.commit()
+        assert compute_nudge_flags(db, TODAY) == 3
+    finally:
+        db.close()
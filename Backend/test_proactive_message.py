@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Proactive opening message: constant-query context assembly and the per-day briefing cache.
+"""
+import uuid
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from main import (
+    ChatConversation, Course, Deadline, FlashcardSet, NudgeFlag, SessionLocal, app, build_proactive_context, engine,
+    get_current_user,
+)
+
+
+def _seed_courses(db, user_id, count, today):
+    for i in range(count):
+        course = Course(user_id=user_id, name=f"Course {i}", code=f"C{i}")
+        db.add(course)
+        db.flush()
+        if i % 2:
+            db.add(FlashcardSet(user_id=user_id, course_id=course.id, name="Notes"))
+        db.add(Deadline(user_id=user_id, course_id=course.id, date=(today + timedelta(days=i % 3)).isoformat(),
+                        title=f"Homework {i}", type="assignment"))
+        db.add(NudgeFlag(user_id=user_id, reason="no_materials", course_id=course.id))
+    db.commit()
+
+
+def test_context_uses_three_queries_whatever_the_course_count():
+    today = date.today()
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    db = SessionLocal()
+    try:
+        for courses in (2, 12):
+            user_id = str(uuid.uuid4())
+            _seed_courses(db, user_id, courses, today)
+            event.listen(engine, "before_cursor_execute", count)
+            try:
+                statements.clear()
+                context, flag_ids = build_proactive_context(db, user_id, today)
+            finally:
+                event.remove(engine, "before_cursor_execute", count)
+            assert len(statements) == 3
+            assert len(flag_ids) == courses
+        assert "- Homework 0 (Course 0) — due today, type: assignment" in context
+        assert "- Homework 1 (Course 1) — due tomorrow" in context
+        assert "Courses with no study materials yet: Course 0, Course 2, Course 4" in context
+        assert "- Course 11 has upcoming deadlines but zero study materials ever created" in context
+    finally:
+        db.close()
+
+
+def test_briefing_is_cached_per_day_until_new_flags(monkeypatch):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        _seed_courses(db, user_id, 2, date.today())
+        course_id = db.query(Course.id).filter(Course.user_id == user_id).first()[0]
+    finally:
+        db.close()
+
+    calls = []
+
+    async def fake_create(**kwargs):
+        calls.append(kwargs["messages"][0]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"Briefing {len(calls)}"))], usage=None)
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        client = TestClient(app)
+        first = client.post("/chat/proactive-message").json()
+        assert first["cached"] is False and first["message"]["content"] == "Briefing 1"
+        assert "Priority flags" in calls[0]
+
+        again = client.post("/chat/proactive-message").json()
+        assert again["cached"] is True and len(calls) == 1
+        assert (again["conversation_id"], again["message"]["id"]) == (first["conversation_id"], first["message"]["id"])
+
+        db = SessionLocal()
+        try:
+            assert db.query(NudgeFlag).filter(NudgeFlag.user_id == user_id, NudgeFlag.delivered == False).count() == 0
+            db.add(NudgeFlag(user_id=user_id, reason="due_tomorrow", course_id=course_id))
+            db.commit()
+        finally:
+            db.close()
+        fresh = client.post("/chat/proactive-message").json()
+        assert fresh["cached"] is False and fresh["message"]["content"] == "Briefing 2"
+        assert "has something due tomorrow" in calls[1]
+
+        # The regenerated briefing is the one reused from now on, not the morning's
+        latest = client.post("/chat/proactive-message").json()
+        assert latest["cached"] is True and len(calls) == 2
+        assert (latest["conversation_id"], latest["message"]["content"]) == (fresh["conversation_id"], "Briefing 2")
+
+        db = SessionLocal()
+        try:
+            assert db.query(ChatConversation).filter(ChatConversation.user_id == user_id).count() == 2
+        finally:
+            db.close()
+    finally:
+        app.dependency_overrides.clear()
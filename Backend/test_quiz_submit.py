@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Quiz answer keys: integer ordering, one-row scoring, and attempt history.
+"""
+import json
+import uuid
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+
+from main import Course, Quiz, QuizAttempt, QuizQuestion, SessionLocal, app, get_current_user, insert_quiz_questions
+
+
+def _client(user_id):
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    return TestClient(app)
+
+
+def test_submit_scores_in_order_and_records_attempts():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Statistics", code="STAT 101")
+        db.add(course)
+        db.flush()
+        quiz = Quiz(user_id=user_id, course_id=course.id, name="Week 3")
+        db.add(quiz)
+        db.flush()
+        ids = insert_quiz_questions(db, user_id, quiz.id, [
+            {"question": f"Q{i}?", "options": ["A) a", "B) b", "C) c", "D) d"], "correct_answer": "ABCD"[i % 4],
+             "explanation": f"because {i}"}
+            for i in range(12)
+        ])
+        db.commit()
+        quiz_id = quiz.id
+    finally:
+        db.close()
+
+    try:
+        client = _client(user_id)
+        fetched = client.get(f"/quizzes/{quiz_id}").json()
+        # Integer order: question 10 comes after question 2
+        assert [q["question"] for q in fetched["questions"]] == [f"Q{i}?" for i in range(12)]
+        assert "correct_answer" not in fetched["questions"][0]
+
+        answers = {qid: "ABCD"[i % 4] for i, qid in enumerate(ids[:9])}
+        answers[ids[9]] = "a"  # question 9's answer is B
+        body = client.post(f"/quizzes/{quiz_id}/submit", json={"answers": answers}).json()
+        assert (body["score"], body["total"], body["percentage"]) == (9, 12, 75)
+        assert [r["question_id"] for r in body["results"]] == ids
+        assert body["results"][2]["explanation"] == "because 2"
+
+        client.post(f"/quizzes/{quiz_id}/submit", json={"answers": {}})
+        history = client.get(f"/quizzes/{quiz_id}/attempts").json()
+        assert sorted(a["percentage"] for a in history) == [0, 75]
+    finally:
+        app.dependency_overrides.clear()
+
+    db = SessionLocal()
+    try:
+        stored = db.query(Quiz).filter(Quiz.id == quiz_id).one()
+        assert len(json.loads(stored.answer_key)) == 12
+        assert db.query(QuizAttempt).filter(QuizAttempt.quiz_id == quiz_id).count() == 2
+
+        # Adding questions drops the cached key so the next read rebuilds it
+        insert_quiz_questions(db, user_id, quiz_id, [{"question": "Q12?", "options": [], "correct_answer": "A"}], start=12)
+        db.commit()
+        db.refresh(stored)
+        assert stored.answer_key is None
+        assert db.query(QuizQuestion).filter(QuizQuestion.quiz_id == quiz_id, QuizQuestion.position == 12).count() == 1
+    finally:
+        db.close()
+
+
+def test_key_built_before_a_concurrent_insert_is_not_cached(monkeypatch):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Genetics", code="BIO 310")
+        db.add(course)
+        db.flush()
+        quiz = Quiz(user_id=user_id, course_id=course.id, name="Streamed")
+        db.add(quiz)
+        db.flush()
+        insert_quiz_questions(db, user_id, quiz.id, [{"question": "Q0?", "options": [], "correct_answer": "A"}])
+        db.commit()
+        quiz_id = quiz.id
+    finally:
+        db.close()
+
+    build = main._build_quiz_answer_key
+
+    def build_then_insert_batch(db, quiz_id):
+        # The streamed generation commits its next batch after the reader built its key
+        key = build(db, quiz_id)
+        writer = SessionLocal()
+        try:
+            insert_quiz_questions(writer, user_id, quiz_id, [{"question": "Q1?", "options": [], "correct_answer": "B"}],
+                                  start=1)
+            writer.commit()
+        finally:
+            writer.close()
+        return key
+
+    monkeypatch.setattr(main, "_build_quiz_answer_key", build_then_insert_batch)
+    try:
+        client = _client(user_id)
+        assert client.get(f"/quizzes/{quiz_id}").json()["question_count"] == 1
+        monkeypatch.setattr(main, "_build_quiz_answer_key", build)
+        assert [q["question"] for q in client.get(f"/quizzes/{quiz_id}").json()["questions"]] == ["Q0?", "Q1?"]
+    finally:
+        app.dependency_overrides.clear()
+
+    db = SessionLocal()
+    try:
+        assert len(json.loads(db.query(Quiz).filter(Quiz.id == quiz_id).one().answer_key)) == 2
+    finally:
+        db.close()
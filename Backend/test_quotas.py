@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Quota counters: atomic check-and-increment under concurrency, windowed resets,
+the pro-tier cache, and reservation refunds for failed generations.
+"""
+import asyncio
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from main import (
+    FREE_AI_GENERATION_LIMIT, FREE_CHAT_MESSAGE_LIMIT, Course, SessionLocal, UserProfile, app, check_tier_limit,
+    consume_chat_message, engine, get_current_user, remember_tier,
+)
+
+
+def _profile(**fields):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(UserProfile(user_id=user_id, email=f"{user_id}@example.com", **fields))
+        db.commit()
+    finally:
+        db.close()
+    return user_id
+
+
+def _usage(user_id):
+    db = SessionLocal()
+    try:
+        profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).one()
+        return profile.ai_generations_used, profile.chat_messages_used
+    finally:
+        db.close()
+
+
+def _attempt(fn):
+    db = SessionLocal()
+    try:
+        fn(db)
+        db.commit()
+        return True
+    except HTTPException as e:
+        assert e.status_code == 403
+        return False
+    finally:
+        db.close()
+
+
+def test_concurrent_requests_never_exceed_limits():
+    user_id = _profile()
+    with ThreadPoolExecutor(16) as pool:
+        generations = list(pool.map(lambda _: _attempt(lambda db: check_tier_limit(db, user_id, "ai_generation")),
+                                    range(FREE_AI_GENERATION_LIMIT + 30)))
+        messages = list(pool.map(lambda _: _attempt(lambda db: consume_chat_message(db, user_id)),
+                                 range(FREE_CHAT_MESSAGE_LIMIT + 15)))
+    assert sum(generations) == FREE_AI_GENERATION_LIMIT
+    assert sum(messages) == FREE_CHAT_MESSAGE_LIMIT
+    assert _usage(user_id) == (FREE_AI_GENERATION_LIMIT, FREE_CHAT_MESSAGE_LIMIT)
+
+
+def test_windows_reset_in_the_same_statement():
+    now = datetime.utcnow()
+    user_id = _profile(ai_generations_used=FREE_AI_GENERATION_LIMIT, ai_generations_reset_at=now - timedelta(days=40),
+                       chat_messages_used=FREE_CHAT_MESSAGE_LIMIT, chat_messages_reset_at=now - timedelta(days=8))
+    assert _attempt(lambda db: check_tier_limit(db, user_id, "ai_generation"))
+    assert _attempt(lambda db: consume_chat_message(db, user_id))
+    assert _usage(user_id) == (1, 1)
+
+    fresh = _profile(chat_messages_used=FREE_CHAT_MESSAGE_LIMIT, chat_messages_reset_at=now - timedelta(days=6))
+    assert not _attempt(lambda db: consume_chat_message(db, fresh))
+
+
+def test_pro_users_are_served_from_cache():
+    user_id = _profile(subscription_tier="pro")
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for _ in range(FREE_AI_GENERATION_LIMIT + 5):
+            assert _attempt(lambda db: check_tier_limit(db, user_id, "ai_generation"))
+        first_call = len(statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert first_call == 2  # the conditional UPDATE that skipped the pro row, then the profile read
+    assert _usage(user_id)[0] == 0
+
+    db = SessionLocal()
+    try:
+        db.query(UserProfile).filter(UserProfile.user_id == user_id).update({"subscription_tier": "free"})
+        db.commit()
+    finally:
+        db.close()
+    remember_tier(user_id, "free")  # what the Stripe webhook does on cancellation
+    assert _attempt(lambda db: check_tier_limit(db, user_id, "ai_generation"))
+    assert _usage(user_id)[0] == 1
+
+
+def test_failed_generation_refunds_its_reservation(monkeypatch):
+    user_id = _profile(ai_generations_used=3, ai_generations_reset_at=datetime.utcnow())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Ecology", code="BIO 150")
+        db.add(course)
+        db.commit()
+        course_id = course.id
+    finally:
+        db.close()
+
+    replies = iter([RuntimeError("model down"), "- Overview\n- Point"])
+
+    async def fake_create(**kwargs):
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=None)
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        client = TestClient(app, raise_server_exceptions=False)
+        upload = {"file": ("notes.txt", ("Food webs link producers and consumers. " * 10).encode(), "text/plain")}
+        assert client.post(f"/courses/{course_id}/summaries", files=upload).status_code == 500
+        assert _usage(user_id)[0] == 3
+        assert client.post(f"/courses/{course_id}/summaries", files=upload).status_code == 200
+        assert _usage(user_id)[0] == 4  # reserved once, settled once
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_streamed_generation_settles_or_refunds_when_the_stream_ends(monkeypatch):
+    user_id = _profile(ai_generations_used=3, ai_generations_reset_at=datetime.utcnow())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Ecology", code="BIO 150")
+        db.add(course)
+        db.commit()
+        course_id = course.id
+    finally:
+        db.close()
+
+    async def stream(text):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+    model_down = []
+
+    async def fake_create(**kwargs):
+        if model_down:
+            raise RuntimeError("model down")
+        return stream('[{"front": "Biome", "back": "A large ecological community"}]')
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        client = TestClient(app)
+        upload = {"file": ("notes.txt", ("Food webs link producers and consumers. " * 10).encode(), "text/plain")}
+        assert '"type": "done"' in client.post(f"/courses/{course_id}/flashcards?stream=true", files=upload).text
+        assert _usage(user_id)[0] == 4
+        model_down.append(True)
+        assert '"type": "error"' in client.post(f"/courses/{course_id}/generate-quiz?stream=true", files=upload).text
+        assert _usage(user_id)[0] == 4
+    finally:
+        app.dependency_overrides.clear()
+
+
+
+def test_timed_out_generation_refunds_its_reservation(monkeypatch):
+    user_id = _profile(ai_generations_used=3, ai_generations_reset_at=datetime.utcnow())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Ecology", code="BIO 150")
+        db.add(course)
+        db.commit()
+        course_id = course.id
+    finally:
+        db.close()
+
+    reserved = []
+
+    async def slow_create(**kwargs):
+        reserved.append(_usage(user_id)[0])
+        await asyncio.sleep(30)
+
+    async def post_with_timeout():
+        upload = {"file": ("notes.txt", ("Food webs link producers and consumers. " * 10).encode(), "text/plain")}
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            # Cancels the request task mid-generation, as the server does when a request is cut off
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.post(f"/courses/{course_id}/summaries", files=upload), timeout=0.5)
+
+    monkeypatch.setattr(main.client.chat.completions, "create", slow_create)
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        asyncio.run(post_with_timeout())
+    finally:
+        app.dependency_overrides.clear()
+    assert reserved == [4]
+    assert _usage(user_id)[0] == 3
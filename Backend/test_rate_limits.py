@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Rate limiting: per-user keys and sliding-window counters shared through the database.
+"""
+import time
+import uuid
+from types import SimpleNamespace
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import SlidingWindowCounterRateLimiter
+
+from main import DatabaseRateLimitStorage, SessionLocal, UserProfile, app, get_current_user, rate_limit_key
+
+
+def _request(user_id=None):
+    request = Request({"type": "http", "client": ("203.0.113.7", 5000), "headers": [], "state": {}})
+    if user_id:
+        request.state.user_id = user_id
+    return request
+
+
+def test_key_is_user_when_authenticated_else_address():
+    assert rate_limit_key(_request("abc")) == "user:abc"
+    assert rate_limit_key(_request()) == "ip:203.0.113.7"
+
+
+def test_workers_share_one_budget():
+    # Two storages stand in for two worker processes pointed at the same database
+    workers = [SlidingWindowCounterRateLimiter(DatabaseRateLimitStorage()) for _ in range(2)]
+    item = parse("5/minute")
+    key = str(uuid.uuid4())
+    granted = [workers[i % 2].hit(item, key) for i in range(10)]
+    assert granted == [True] * 5 + [False] * 5
+    assert workers[1].get_window_stats(item, key).remaining == 0
+    workers[0].clear(item, key)
+    assert workers[1].hit(item, key)
+
+
+def test_sliding_window_matches_memory_storage(monkeypatch):
+    clock = SimpleNamespace(now=1000 * 60 + 30.0)  # halfway through a one-minute window
+    monkeypatch.setattr(time, "time", lambda: clock.now)
+    item = parse("5/minute")
+
+    def replay(storage):
+        limiter = SlidingWindowCounterRateLimiter(storage)
+        key = str(uuid.uuid4())
+        clock.now = 1000 * 60 + 30.0
+        outcomes = [limiter.hit(item, key) for _ in range(6)]
+        clock.now += 60  # the previous window now weighs 0.5, carrying 2.5 of its 5 hits
+        outcomes += [limiter.hit(item, key) for _ in range(4)]
+        clock.now += 90  # two windows on, nothing carries over
+        outcomes += [limiter.hit(item, key) for _ in range(6)]
+        return outcomes
+
+    expected = [True] * 5 + [False] + [True] * 3 + [False] + [True] * 5 + [False]
+    assert replay(DatabaseRateLimitStorage()) == expected
+    assert replay(MemoryStorage()) == expected
+
+
+def test_endpoint_limits_are_per_user():
+    def authenticate(user_id):
+        def override(request: Request):
+            request.state.user_id = user_id
+            return SimpleNamespace(id=user_id, email="s@example.com")
+        app.dependency_overrides[get_current_user] = override
+
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add_all([UserProfile(user_id=u, email=f"{u}@example.com", subscription_tier="pro") for u in (first, second)])
+        db.commit()
+    finally:
+        db.close()
+
+    try:
+        client = TestClient(app)
+        authenticate(first)
+        codes = [client.post("/chat/conversations").status_code for _ in range(11)]
+        assert codes == [200] * 10 + [429]
+        authenticate(second)
+        assert client.post("/chat/conversations").status_code == 200
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Fast startup: heavy SDKs stay unimported until used, and the boot profile is recorded.
+"""
+import os
+import subprocess
+import sys
+
+import main
+
+LAZY_MODULES = ["openai", "pdfplumber", "docx", "stripe", "resend", "icalendar", "sentry_sdk"]
+
+
+def test_import_leaves_heavy_sdks_unloaded():
+    probe = f"import sys, main; print([m for m in {LAZY_MODULES!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", probe], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=os.environ, capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+    assert list(main.BOOT_PROFILE)[:3] == ["imports", "models_and_migrations", "routes"]
+
+
+def test_openai_errors_are_recognized_once_the_sdk_is_loaded():
+    import httpx
+    import openai
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    error = openai.RateLimitError("slow down", response=httpx.Response(429, request=request), body=None)
+    assert main._is_openai_error(error, "RateLimitError")
+    assert main._is_openai_error(error, "APIStatusError")
+    assert not main._is_openai_error(error, "AuthenticationError")
+    assert not main._is_openai_error(ValueError("nope"), "APIStatusError")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tolerant parsing of model JSON output, checked against the malformed-response corpus.
+"""
+import json
+import os
+
+import pytest
+
+from classmate.structured_output import (
+    FLASHCARDS_SCHEMA, JsonArrayStreamParser, _close_truncated_json, parse_json_items, parse_json_response,
+    structured_output,
+)
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "malformed_responses.json")) as f:
+    CORPUS = json.load(f)
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[c["name"] for c in CORPUS])
+def test_corpus_recovery(case):
+    if case["key"] is None:
+        metadata = parse_json_response(case["text"])
+        assert all(k in metadata for k in case["expect_keys"])
+    else:
+        assert len(parse_json_items(case["text"], case["key"])) == case["expect_items"]
+
+
+def test_truncated_json_is_closed_at_last_complete_value():
+    assert json.loads(_close_truncated_json('{"a": 1, "b": [2, 3, {"c": "unfini')) == {"a": 1, "b": [2, 3]}
+    assert json.loads(_close_truncated_json('{"a": {"b": "x", "c"')) == {"a": {"b": "x"}}
+    with pytest.raises(json.JSONDecodeError):
+        parse_json_response("no json here")
+
+
+def test_stream_parser_targets_key_and_structured_format():
+    parser = JsonArrayStreamParser("questions")
+    text = '{"tags": ["a", "b"], "questions": [{"question": "Q1"}, {"question": "Q2"}]}'
+    assert [q["question"] for q in parser.feed(text)] == ["Q1", "Q2"]
+
+    fmt = structured_output("flashcards", FLASHCARDS_SCHEMA)["response_format"]
+    assert fmt["type"] == "json_schema" and fmt["json_schema"]["strict"] is True
+    item = FLASHCARDS_SCHEMA["properties"]["flashcards"]["items"]
+    assert item["required"] == ["front", "back"] and item["additionalProperties"] is False
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate dedup and target-count selection for generated study items.
+"""
+from main import NearDuplicateFilter, select_study_items
+
+
+def _card(front, back):
+    return {"front": front, "back": back}
+
+
+def _question(text, answer, correct="B"):
+    options = ["A) Nucleus", f"B) {answer}", "C) Golgi apparatus", "D) Lysosome"]
+    return {"question": text, "options": options, "correct_answer": correct, "explanation": "See lecture 3."}
+
+
+def test_paraphrased_cards_collapse_but_distinct_ones_survive():
+    groups = [
+        [_card("What is the function of mitochondria?", "Mitochondria produce ATP through cellular respiration.")],
+        [_card("What do mitochondria do?", "They produce ATP through cellular respiration."),
+         _card("What is the function of ribosomes?", "Ribosomes synthesize proteins from mRNA.")],
+        [_card("what is the function of mitochondria?", "Powerhouse of the cell."),
+         _card("Define osmosis.", "Diffusion of water across a semipermeable membrane.")],
+    ]
+    kept = select_study_items("flashcards", groups)
+    assert [c["front"] for c in kept] == [
+        "What is the function of mitochondria?", "What is the function of ribosomes?", "Define osmosis.",
+    ]
+    # A strict threshold only merges near-verbatim copies
+    assert len(select_study_items("flashcards", groups, threshold=0.95)) == 4
+
+
+def test_questions_sharing_options_are_not_merged():
+    kept = select_study_items("quiz", [[
+        _question("Which organelle produces ATP?", "Mitochondria"),
+        _question("Which organelle produces ATP in the cell?", "Mitochondria"),
+        _question("Which organelle synthesizes proteins?", "Ribosome"),
+    ]])
+    assert [q["question"] for q in kept] == ["Which organelle produces ATP?", "Which organelle synthesizes proteins?"]
+
+
+def test_better_scoring_duplicate_wins_and_target_spreads_across_chunks():
+    weak = {"question": "Which organelle produces ATP?", "options": ["A) Mitochondria"], "correct_answer": "A"}
+    strong = _question("Which organelle produces ATP for the cell?", "Mitochondria")
+    assert select_study_items("quiz", [[weak], [strong]]) == [strong]
+
+    terms = [["Allele", "Genotype", "Phenotype"], ["Mitosis", "Meiosis", "Cytokinesis"],
+             ["Osmosis", "Diffusion", "Endocytosis"], ["Enzyme", "Substrate", "Cofactor"]]
+    groups = [[_card(f"Define {t}.", f"{t} explained for chapter {c}.") for t in chapter] for c, chapter in enumerate(terms)]
+    picked = select_study_items("flashcards", groups, target=5)
+    # Round-robin: the first card of every chapter, then the second of chapter 0
+    assert [c["front"] for c in picked] == [
+        "Define Allele.", "Define Genotype.", "Define Mitosis.", "Define Osmosis.", "Define Enzyme.",
+    ]
+
+
+def test_filter_is_incremental():
+    dedup = NearDuplicateFilter(0.5)
+    assert dedup.add("Mitochondria produce ATP via cellular respiration")
+    assert not dedup.add("mitochondria produce ATP through cellular respiration")
+    assert dedup.add("Ribosomes translate mRNA into protein")
+    # All-stopword text can't be shingled, so only exact repeats are caught
+    assert dedup.add("What is it?")
+    assert not dedup.add("what is it?")
+    assert dedup.add("Who is it?")
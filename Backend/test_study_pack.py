@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Study pack: one upload, one completion per chunk, all three artifacts saved.
+"""
+import json
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+from main import (
+    FREE_AI_GENERATION_LIMIT, Course, Flashcard, QuizQuestion, SessionLocal, Summary, UserProfile, app, get_current_user,
+    split_text_into_chunks,
+)
+
+
+def _fake_openai(monkeypatch):
+    calls = []
+
+    async def fake_create(**kwargs):
+        system = kwargs["messages"][0]["content"]
+        calls.append(system)
+        if '"summary"' in system:
+            n = len(calls)
+            content = json.dumps({
+                "summary": f"- Point from section {n}",
+                "flashcards": [{"front": f"Term {n}", "back": "Def"}, {"front": "Shared term", "back": "Def"}],
+                "questions": [{"question": f"Q{n}?", "options": ["A) a", "B) b", "C) c", "D) d"], "correct_answer": "A", "explanation": "x"}],
+            })
+        else:
+            content = "Merged overview\n- Point"
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    return calls
+
+
+def _post_pack(user_id, text):
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Genetics", code="BIO 240")
+        db.add(course)
+        db.commit()
+        course_id = course.id
+    finally:
+        db.close()
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        return TestClient(app).post(f"/courses/{course_id}/study-pack",
+                                    files={"file": ("lecture.txt", text.encode(), "text/plain")})
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_short_document_uses_one_completion(monkeypatch):
+    calls = _fake_openai(monkeypatch)
+    user_id = str(uuid.uuid4())
+    body = _post_pack(user_id, "Mendel's laws describe how alleles segregate during meiosis. " * 20).json()
+
+    assert len(calls) == 1
+    assert body["summary"]["content"] == "- Point from section 1"
+    assert body["flashcard_set"]["card_count"] == 2
+    assert body["quiz"]["question_count"] == 1
+
+    db = SessionLocal()
+    try:
+        assert db.query(Summary).filter(Summary.user_id == user_id).count() == 1
+        assert db.query(Flashcard).filter(Flashcard.flashcard_set_id == body["flashcard_set"]["id"]).count() == 2
+        assert db.query(QuizQuestion).filter(QuizQuestion.quiz_id == body["quiz"]["id"]).count() == 1
+    finally:
+        db.close()
+
+
+def test_long_document_fans_out_per_chunk_and_merges_summary(monkeypatch):
+    calls = _fake_openai(monkeypatch)
+    text = "Crossing over during prophase I increases genetic variation between gametes. " * 1000
+    chunks = split_text_into_chunks(text, chunk_size=12000)
+    body = _post_pack(str(uuid.uuid4()), text).json()
+
+    assert len(calls) == len(chunks) + 1  # one pass per chunk plus the summary merge
+    assert body["summary"]["content"] == "Merged overview\n- Point"
+    # "Shared term" comes back from every chunk but is kept once
+    assert body["flashcard_set"]["card_count"] == len(chunks) + 1
+    assert body["quiz"]["question_count"] == len(chunks)
+
+
+def _free_user(used):
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        db.add(UserProfile(user_id=user_id, email=f"{user_id}@example.edu", subscription_tier="free",
+                           ai_generations_used=used, ai_generations_reset_at=datetime.utcnow()))
+        db.commit()
+    finally:
+        db.close()
+    return user_id
+
+
+def _generations_used(user_id):
+    db = SessionLocal()
+    try:
+        return db.query(UserProfile).filter(UserProfile.user_id == user_id).one().ai_generations_used
+    finally:
+        db.close()
+
+
+def test_free_user_needs_room_for_the_whole_pack(monkeypatch):
+    calls = _fake_openai(monkeypatch)
+    text = "Mendel's laws describe how alleles segregate during meiosis. " * 20
+
+    near_limit = _free_user(FREE_AI_GENERATION_LIMIT - 1)
+    resp = _post_pack(near_limit, text)
+    assert resp.status_code == 403
+    assert resp.json()["detail"]["limit_type"] == "ai_generations"
+    assert calls == []
+    assert _generations_used(near_limit) == FREE_AI_GENERATION_LIMIT - 1
+
+    with_room = _free_user(FREE_AI_GENERATION_LIMIT - 3)
+    assert _post_pack(with_room, text).status_code == 200
+    assert _generations_used(with_room) == FREE_AI_GENERATION_LIMIT
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Spaced-repetition scheduling and the cross-set due queue.
+"""
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from main import (
+    Course, Flashcard, FlashcardSet, SessionLocal, app, get_current_user, insert_flashcards, schedule_review,
+)
+
+
+def _card(**schedule):
+    fields = dict(ease=2.5, interval_days=0, repetitions=0, lapses=0, due_at=None, last_reviewed_at=None, grade=None)
+    return SimpleNamespace(**{**fields, **schedule})
+
+
+def test_sm2_intervals_grow_and_lapses_reset():
+    now = datetime(2026, 1, 1)
+    card = _card()
+    assert [schedule_review(card, "good", now).interval_days for _ in range(3)] == [1, 6, 15.0]
+    assert card.due_at == now + timedelta(days=15) and card.grade == "known" and card.ease == 2.5
+
+    schedule_review(card, "again", now)
+    assert (card.repetitions, card.lapses, card.interval_days) == (0, 1, 0)
+    assert card.due_at == now + timedelta(minutes=10) and card.grade == "learning"
+    assert card.ease == 1.96
+
+    hard = schedule_review(_card(repetitions=3, interval_days=10), "hard", now)
+    easy = schedule_review(_card(repetitions=3, interval_days=10), "easy", now)
+    assert hard.interval_days == 12 and hard.ease == 2.36
+    assert easy.interval_days == 32.5 and easy.ease == 2.6
+    floor = _card(ease=1.3)
+    schedule_review(floor, "again", now)
+    assert floor.ease == 1.3
+
+
+def test_due_queue_spans_sets_and_grading_reschedules():
+    user_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Genetics", code="BIO 240")
+        db.add(course)
+        db.flush()
+        sets = [FlashcardSet(user_id=user_id, course_id=course.id, name=name) for name in ("Week 1", "Week 2")]
+        db.add_all(sets)
+        db.flush()
+        first = insert_flashcards(db, user_id, sets[0].id, [{"front": f"W1 Q{i}", "back": "a"} for i in range(3)])
+        second = insert_flashcards(db, user_id, sets[1].id, [{"front": f"W2 Q{i}", "back": "a"} for i in range(2)])
+        # Stagger due dates: the second set's cards are the most overdue; one card isn't due yet
+        now = datetime.utcnow()
+        for offset, card_id in enumerate(second + first):
+            db.query(Flashcard).filter(Flashcard.id == card_id).update({"due_at": now - timedelta(hours=10 - offset)})
+        db.query(Flashcard).filter(Flashcard.id == first[2]).update({"due_at": now + timedelta(days=2)})
+        db.commit()
+    finally:
+        db.close()
+
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        client = TestClient(app)
+        due = client.get("/study/due").json()["cards"]
+        assert [c["id"] for c in due] == second + first[:2]
+        assert {c["set_name"] for c in due} == {"Week 1", "Week 2"}
+        assert [c["id"] for c in client.get("/study/due?limit=2").json()["cards"]] == second
+
+        graded = client.patch(f"/flashcards/{second[0]}/grade", json={"grade": "good"}).json()
+        assert graded["grade"] == "known" and graded["interval_days"] == 1
+        legacy = client.patch(f"/flashcards/{second[1]}/grade", json={"grade": "learning"}).json()
+        assert legacy["grade"] == "learning" and legacy["interval_days"] == 0
+        assert client.patch(f"/flashcards/{second[1]}/grade", json={"grade": "meh"}).status_code == 400
+
+        assert [c["id"] for c in client.get("/study/due").json()["cards"]] == first[:2]
+    finally:
+        app.dependency_overrides.clear()
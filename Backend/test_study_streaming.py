@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Streaming flashcard/quiz generation: incremental JSON parsing and the SSE endpoints.
+"""
+import json
+import uuid
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+import main
+from main import (
+    STUDY_STREAM_PERSIST_BATCH, Course, Flashcard, FlashcardSet, JsonArrayStreamParser, QuizQuestion,
+    SessionLocal, app, get_current_user,
+)
+
+MATERIAL = "Cellular respiration converts glucose into ATP inside the mitochondria. " * 5
+
+
+def _feed_in_pieces(parser, text, size):
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return items
+
+
+def test_parser_yields_items_across_chunk_boundaries():
+    raw = '```json\n[{"front": "What is ATP?", "back": "Energy [currency], \\"the\\" cell\'s"}, {"front": "Krebs", "back": "cycle"}]\n```'
+    for size in (1, 3, 7, len(raw)):
+        items = _feed_in_pieces(JsonArrayStreamParser(), raw, size)
+        assert items == [
+            {"front": "What is ATP?", "back": 'Energy [currency], "the" cell\'s'},
+            {"front": "Krebs", "back": "cycle"},
+        ]
+
+
+def test_parser_handles_wrapped_quiz_and_skips_malformed_items():
+    raw = json.dumps({"questions": [
+        {"question": "Q1", "options": ["A) x", "B) y"], "correct_answer": "A"},
+    ]})[:-2] + ', {"question": "Q2", "options": [oops]}, {"question": "Q3", "options": []}]}'
+    items = _feed_in_pieces(JsonArrayStreamParser(), raw, 5)
+    assert [q["question"] for q in items] == ["Q1", "Q3"]
+    # Truncated output keeps the items that completed
+    parser = JsonArrayStreamParser()
+    assert parser.feed('[{"front": "a", "back": "b"}, {"front": "c", "ba') == [{"front": "a", "back": "b"}]
+
+
+class FakeStream:
+    def __init__(self, text, size=9):
+        self._pieces = [text[i:i + size] for i in range(0, len(text), size)]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for piece in self._pieces:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))], usage=None)
+
+
+def _events(response):
+    return [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+
+def _post(path, user_id):
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=user_id, email="s@example.com")
+    try:
+        return TestClient(app).post(path, files={"file": ("notes.txt", MATERIAL.encode(), "text/plain")})
+    finally:
+        app.dependency_overrides.clear()
+
+
+def _course(user_id):
+    db = SessionLocal()
+    try:
+        course = Course(user_id=user_id, name="Biology", code="BIO 101")
+        db.add(course)
+        db.commit()
+        return course.id
+    finally:
+        db.close()
+
+
+def test_flashcards_stream_events_and_persists(monkeypatch):
+    user_id = str(uuid.uuid4())
+    course_id = _course(user_id)
+    cards = [{"front": f"Term {i}", "back": f"Definition {i}"} for i in range(STUDY_STREAM_PERSIST_BATCH + 2)]
+    cards.append({"front": "term 0", "back": "duplicate"})
+
+    async def fake_create(**kwargs):
+        assert kwargs["stream"] is True
+        return FakeStream(json.dumps(cards))
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    response = _post(f"/courses/{course_id}/flashcards?stream=true&num_cards=10", user_id)
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = _events(response)
+    assert events[0]["type"] == "started"
+    card_events = [e for e in events if e["type"] == "card"]
+    assert [e["card"]["front"] for e in card_events] == [c["front"] for c in cards[:-1]]
+    assert events[-1]["type"] == "done"
+    assert events[-1]["flashcard_set"]["card_count"] == len(cards) - 1
+
+    db = SessionLocal()
+    try:
+        set_id = events[0]["flashcard_set"]["id"]
+        assert db.query(FlashcardSet).filter(FlashcardSet.id == set_id).count() == 1
+        assert db.query(Flashcard).filter(Flashcard.flashcard_set_id == set_id).count() == len(cards) - 1
+    finally:
+        db.close()
+
+
+def test_quiz_stream_hides_answers_and_cleans_up_on_failure(monkeypatch):
+    user_id = str(uuid.uuid4())
+    course_id = _course(user_id)
+    quiz = {"questions": [
+        {"question": f"Q{i}?", "options": ["A) a", "B) b", "C) c", "D) d"], "correct_answer": "C", "explanation": "because"}
+        for i in range(3)
+    ]}
+
+    async def fake_create(**kwargs):
+        return FakeStream(json.dumps(quiz))
+
+    monkeypatch.setattr(main.client.chat.completions, "create", fake_create)
+    events = _events(_post(f"/courses/{course_id}/generate-quiz?stream=true&num_questions=3", user_id))
+    questions = [e["question"] for e in events if e["type"] == "question"]
+    assert len(questions) == 3
+    assert all("correct_answer" not in q and "explanation" not in q for q in questions)
+    quiz_id = events[-1]["quiz"]["id"]
+
+    db = SessionLocal()
+    try:
+        rows = db.query(QuizQuestion).filter(QuizQuestion.quiz_id == quiz_id).all()
+        assert sorted(r.order_num for r in rows) == ["0", "1", "2"]
+        assert all(r.correct_answer == "C" for r in rows)
+    finally:
+        db.close()
+
+    async def failing_create(**kwargs):
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(main.client.chat.completions, "create", failing_create)
+    events = _events(_post(f"/courses/{course_id}/generate-quiz?stream=true&num_questions=3", user_id))
+    assert events[-1]["type"] == "error"
+    db = SessionLocal()
+    try:
+        assert db.query(main.Quiz).filter(main.Quiz.id == events[0]["quiz"]["id"]).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+The classmate subsystems import on their own: no app, no database file, no heavy SDKs.
+"""
+import os
+import subprocess
+import sys
+
+SUBSYSTEMS = ["auth", "chat_context", "chat_timing", "chunking", "context", "db", "extraction", "llm", "lms", "quotas",
+              "structured_output"]
+HEAVY = ["main", "openai", "pdfplumber", "docx", "stripe", "resend", "icalendar", "sentry_sdk"]
+
+
+def test_subsystems_import_without_side_effects(tmp_path):
+    db_file = tmp_path / "never-created.db"
+    probe = (f"import sys\nfor name in {SUBSYSTEMS!r}: __import__('classmate.' + name)\n"
+             f"print([m for m in {HEAVY!r} if m in sys.modules])")
+    result = subprocess.run([sys.executable, "-c", probe], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=dict(os.environ, DATABASE_URL=f"sqlite:///{db_file}"),
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+    assert not db_file.exists()